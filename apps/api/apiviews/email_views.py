@@ -9,18 +9,14 @@
 from apps.api.serializers import email as eamil_serializers
 from apps.api.viewsets import serializer_error_msg, BaseGenericViewSet
 from utils.paginators import NoPaginatorInspector
-from utils.iprestrict import IPRestrictor
 from core import errors
-from core.taskqueue import submit_task
+from core.taskqueue import submit_task, QueueName
 from apps.app_users.models import Email
-from apps.app_global.configs_manager import IPAccessWhiteListManager
+from apps.app_global.configs_manager import IPAccessWhiteListManager, ModuleIPRestrictor
 
 
-class EmailIPRestrictor(IPRestrictor):
-    def load_ip_rules(self):
-        return IPAccessWhiteListManager.get_module_ip_whitelist(
-            module_name=IPAccessWhiteListManager.ModuleName.EMAIL.value
-        )
+class EmailIPRestrictor(ModuleIPRestrictor):
+    module_name = IPAccessWhiteListManager.ModuleName.EMAIL.value
 
     @staticmethod
     def clear_cache():
@@ -113,7 +109,7 @@ def create(self, request, *args, **kwargs):
         )
         if not is_feint:
             submit_task(Email.do_send_email, kwargs={
-                'email': email, 'save_db': True, 'receivers': receivers, 'fail_silently': True})
+                'email': email, 'save_db': True, 'receivers': receivers, 'fail_silently': True}, queue=QueueName.NOTIFY)
 
         serializer = eamil_serializers.EmailSerializer(instance=email)
         return Response(data=serializer.data)
@@ -7,18 +7,15 @@
 
 from core import errors
 from utils.paginators import NoPaginatorInspector
-from utils.iprestrict import IPRestrictor
-from apps.app_global.configs_manager import IPAccessWhiteListManager
+from apps.app_global.configs_manager import IPAccessWhiteListManager, ModuleIPRestrictor
 from apps.api.viewsets import CustomGenericViewSet
 from apps.api.paginations import DefaultPageNumberPagination
 from apps.app_users.managers import filter_user_queryset
 from apps.app_monitor.models import TotalReqNum
 
 
-class PortalIPRestrictor(IPRestrictor):
-    def load_ip_rules(self):
-        return IPAccessWhiteListManager.get_module_ip_whitelist(
-            module_name=IPAccessWhiteListManager.ModuleName.PORTAL.value)
+class PortalIPRestrictor(ModuleIPRestrictor):
+    module_name = IPAccessWhiteListManager.ModuleName.PORTAL.value
 
     @staticmethod
     def clear_cache():
@@ -1,29 +1,122 @@
+import time
+import logging
+
 from apps.app_alert.models import AlertModel
 from apps.app_alert.models import ResolvedAlertModel
 from apps.app_alert.utils.utils import DateUtils
 from django.forms.models import model_to_dict
-from django.db import transaction
+from django.db import transaction, IntegrityError
+
+
+logger = logging.getLogger(__name__)
 
 
 class AlertStatusFlow(object):
-    def __init__(self):
-        pass
+    """
+    告警状态流转，预结束时间已过的进行中告警归入已恢复队列
+
+    按id顺序分批处理，每批在一个事务中批量插入已恢复告警，按id列表删除进行中告警；
+    批量插入有冲突时整批回滚后逐条归入，冲突的告警保留在进行中，不会丢失；
+    每批完成后记录检查点（最后一条的id），下一批从检查点之后查询
+    """
+    CHUNK_SIZE = 500
+
+    def __init__(self, chunk_size: int = None):
+        self.chunk_size = chunk_size if chunk_size and chunk_size > 0 else self.CHUNK_SIZE
+        self.checkpoint = None   # 已处理完成的最后一条告警的id
+        self.moved_count = 0
+        self.chunk_count = 0
+        self.seconds = 0.0
 
     @classmethod
-    def start(cls):
+    def start(cls, chunk_size: int = None) -> dict:
         """
         遍历所有进行中的告警，当预结束时间小于当前时间时，归入已恢复队列
+
+        :return: 吞吐量统计，stats()
+        """
+        return cls(chunk_size=chunk_size).run()
+
+    def run(self) -> dict:
+        timestamp = DateUtils.timestamp()
+        start_time = time.monotonic()
+        while True:
+            moved_count = self.move_chunk_to_resolved(timestamp=timestamp)
+            if moved_count is None:
+                break
+
+            self.moved_count += moved_count
+            self.chunk_count += 1
+
+        self.seconds = time.monotonic() - start_time
+        stats = self.stats()
+        if self.moved_count > 0:
+            logger.info(f'Alert status flow, moved {stats["moved"]} alerts in {stats["chunks"]} chunks, '
+                        f'{stats["seconds"]:.3f}s, {stats["rate"]:.1f} alerts/s')
+
+        return stats
+
+    def move_chunk_to_resolved(self, timestamp: int):
         """
-        alert_list = AlertModel.objects.filter(end__lt=DateUtils.timestamp())
-        for alert in alert_list:
-            cls.move_to_resolved(alert)
+        一批预结束时间小于timestamp的进行中告警归入已恢复队列
+
+        :return:
+            int     # 本批归入已恢复的告警数
+            None    # 没有需要处理的告警
+        """
+        queryset = AlertModel.objects.filter(end__lt=timestamp).order_by('id')
+        if self.checkpoint is not None:
+            queryset = queryset.filter(id__gt=self.checkpoint)
+
+        try:
+            with transaction.atomic():
+                alerts = list(queryset.select_for_update()[0:self.chunk_size])
+                if not alerts:
+                    return None
+
+                recovery = DateUtils.timestamp()
+                resolved_alerts = [self.build_resolved_alert(obj=obj, recovery=recovery) for obj in alerts]
+                ResolvedAlertModel.objects.bulk_create(resolved_alerts)
+                AlertModel.objects.filter(id__in=[obj.id for obj in alerts]).delete()
+        except IntegrityError:
+            # 已恢复队列中已有相同id的告警，整批回滚，逐条归入，归入失败的告警保留在进行中
+            alerts = list(queryset[0:self.chunk_size])
+            if not alerts:
+                return None
+
+            moved_count = 0
+            for obj in alerts:
+                try:
+                    self.move_to_resolved(obj)
+                    moved_count += 1
+                except IntegrityError as exc:
+                    logger.warning(f'Alert status flow, move alert({obj.id}) to resolved failed, {str(exc)}')
+
+            self.checkpoint = alerts[-1].id
+            return moved_count
+
+        self.checkpoint = alerts[-1].id
+        return len(alerts)
 
     @staticmethod
-    def move_to_resolved(obj):
+    def build_resolved_alert(obj, recovery: int):
         item = model_to_dict(obj)
         item["id"] = obj.id
         item['status'] = AlertModel.AlertStatus.RESOLVED.value
-        item["modification"] = item["recovery"] = DateUtils.timestamp()
+        item["modification"] = item["recovery"] = recovery
+        return ResolvedAlertModel(**item)
+
+    @staticmethod
+    def move_to_resolved(obj):
+        resolved_alert = AlertStatusFlow.build_resolved_alert(obj=obj, recovery=DateUtils.timestamp())
         with transaction.atomic():
-            ResolvedAlertModel.objects.create(**item)
+            resolved_alert.save(force_insert=True)
             obj.delete()
+
+    def stats(self) -> dict:
+        return {
+            'moved': self.moved_count,
+            'chunks': self.chunk_count,
+            'seconds': self.seconds,
+            'rate': self.moved_count / self.seconds if self.seconds > 0 else 0.0
+        }
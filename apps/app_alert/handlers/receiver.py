@@ -4,7 +4,8 @@
 
 from django.utils.translation import gettext as _
 from apps.app_alert.utils.utils import hash_sha1
-from django.db.models import Count
+from django.db import transaction, IntegrityError
+from django.db.models import Count, F
 from apps.app_alert.utils import errors
 from apps.app_alert.models import PreAlertModel
 from apps.app_alert.models import AlertModel
@@ -15,6 +16,7 @@
 
 
 class AlertReceiver(object):
+    BULK_BATCH_SIZE = 500
 
     def __init__(self, data):
         self.timestamp = DateUtils.timestamp()
@@ -131,19 +133,80 @@ def group_by_prepare_type(self, items):
         return prepare_alerts, alerts
 
     def create_or_update(self, model, items):
+        """
+        批量写入告警
+
+        一次IN查询已存在的告警，新告警bulk_create，已存在的告警批量更新end description modification count字段；
+        同一批中指纹重复的告警合并，每条重复告警累加一次条数
+        """
+        merged_items = self.merge_by_fingerprint(items)
+        if not merged_items:
+            return
+
+        try:
+            self._bulk_create_or_update(model=model, merged_items=merged_items)
+        except IntegrityError:
+            # 并发请求已插入了相同指纹的告警，重试时作为已存在的告警更新
+            self._bulk_create_or_update(model=model, merged_items=merged_items)
+
+    def merge_by_fingerprint(self, items):
+        """
+        :return: {
+            fingerprint: (item, repeat_count)
+        }
+        """
+        merged_items = {}
         for item in items:
-            existed_obj = model.objects.filter(fingerprint=item.get(self.fingerprint_field)).first()
-            if existed_obj:  # 如果存在则更新end description modification count字段
-                existed_obj.end = item.get("end")
-                existed_obj.description = item.get("description")
-                existed_obj.modification = self.timestamp
-                existed_obj.count = existed_obj.count + 1
-                existed_obj.save()
+            fingerprint = item.get(self.fingerprint_field)
+            if fingerprint not in merged_items:
+                merged_items[fingerprint] = (dict(item), 1)
                 continue
+
+            merged_item, repeat_count = merged_items[fingerprint]
+            merged_item["end"] = item.get("end")
+            merged_item["description"] = item.get("description")
+            merged_items[fingerprint] = (merged_item, repeat_count + 1)
+
+        return merged_items
+
+    def _bulk_create_or_update(self, model, merged_items: dict):
+        with transaction.atomic():
+            existed = model.objects.filter(
+                fingerprint__in=list(merged_items.keys())).order_by().values_list('id', 'fingerprint', 'description')
+            # 已存在的告警按(end, 累加条数)分组更新，条数用F表达式原子累加；详情有变化的才逐条更新
+            update_groups = {}
+            changed_objs = []
+            existed_fingerprints = set()
+            for obj_id, fingerprint, description in existed:
+                existed_fingerprints.add(fingerprint)
+                item, repeat_count = merged_items[fingerprint]
+                update_groups.setdefault((item.get("end"), repeat_count), []).append(obj_id)
+                if item.get("description") != description:
+                    changed_objs.append(model(id=obj_id, description=item.get("description")))
+
+            for (end, repeat_count), obj_ids in update_groups.items():
+                for i in range(0, len(obj_ids), self.BULK_BATCH_SIZE):
+                    model.objects.filter(id__in=obj_ids[i:i + self.BULK_BATCH_SIZE]).update(
+                        end=end, modification=self.timestamp, count=F('count') + repeat_count)
+
+            if changed_objs:
+                model.objects.bulk_update(changed_objs, fields=['description'], batch_size=self.BULK_BATCH_SIZE)
+
+            create_objs = []
             timestamp = timezone.now().timestamp()
-            item["creation"] = timestamp
-            item["modification"] = int(timestamp)
-            model.objects.create(**item)
+            for fingerprint, (item, repeat_count) in merged_items.items():
+                if fingerprint in existed_fingerprints:
+                    continue
+
+                obj = model(**item)
+                obj.creation = timestamp
+                obj.modification = int(timestamp) if repeat_count == 1 else self.timestamp
+                obj.count = repeat_count
+                obj.enforce_id()
+                create_objs.append(obj)
+
+            if create_objs:
+                model.objects.bulk_create(create_objs, batch_size=self.BULK_BATCH_SIZE)
 
     @staticmethod
     def get_probe_count():
@@ -157,20 +220,20 @@ def pick_inaccessible_website_list(self):
         """
         从预处理表中挑选出所有探针都为异常的网站
         """
-        alerts = []
         results = PreAlertModel.objects.filter(end__gte=self.timestamp).values("summary").annotate(
-            count=Count('summary'))
-        for item in results:
-            summary = item.get("summary")
-            count = item.get("count")
-            if count != self.get_probe_count():
-                continue
-            website_alert = self.generate_website_alert(summary)
-            alerts.append(website_alert)
-        return alerts
+            count=Count('summary')).order_by()
+        probe_count = self.get_probe_count()
+        summaries = [item.get("summary") for item in results if item.get("count") == probe_count]
+        if not summaries:
+            return []
+
+        latest_objs = {}
+        for obj in PreAlertModel.objects.filter(summary__in=summaries):     # 按创建时间倒序，取每个摘要最新的
+            latest_objs.setdefault(obj.summary, obj)
+
+        return [self.generate_website_alert(latest_objs[summary]) for summary in summaries]
 
-    def generate_website_alert(self, item):
-        obj = PreAlertModel.objects.filter(summary=item).first()
+    def generate_website_alert(self, obj: PreAlertModel):
         description = obj.description.split()
         url_hash = description[-2]
         result = dict()
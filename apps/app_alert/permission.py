@@ -1,18 +1,15 @@
 from rest_framework.permissions import BasePermission
 from apps.app_alert.utils.utils import hash_md5
 
-from apps.app_global.configs_manager import IPAccessWhiteListManager
-from utils.iprestrict import IPRestrictor
+from apps.app_global.configs_manager import IPAccessWhiteListManager, ModuleIPRestrictor
 
 
-class AlertAPIIPRestrictor(IPRestrictor):
+class AlertAPIIPRestrictor(ModuleIPRestrictor):
     """
     流量模块 IP 白名单
     """
 
-    def load_ip_rules(self):
-        return IPAccessWhiteListManager.get_module_ip_whitelist(
-            module_name=IPAccessWhiteListManager.ModuleName.ALERT.value)
+    module_name = IPAccessWhiteListManager.ModuleName.ALERT.value
 
     @staticmethod
     def clear_cache():
@@ -38,6 +38,8 @@ class EmailThresholdStrict(object):
         1，一天内给每个邮箱发邮件不超过4封
         2，一小时内每个邮箱发邮件不超过1封
         3，四小时内每个邮箱发邮件不超过2封
+
+    一次查询所有邮箱当天的发送记录，在内存中统计各时间区间的发送次数，发送后更新计数
     """
 
     def __init__(self, timestamp, email_list):
@@ -51,6 +53,7 @@ def __init__(self, timestamp, email_list):
         self.one_range = self.pick_hour_range(self.one_hour_list)
         self.two_range = self.pick_hour_range(self.four_hour_list)
         self.mapping = dict()
+        self.sent_timestamps = dict()   # 每个邮箱当天的发送时间戳集合
 
     def get_day_interval(self):
         today_seven_timestamp = DateUtils.date_to_ts(
@@ -66,15 +69,51 @@ def pick_hour_range(self, rang_list):
                 return _
 
     def start(self):
+        self.sent_timestamps = self.load_sent_timestamps(list(self.email_list), (self.day_start, self.day_end))
         for email in self.email_list:
-            if not self.mapping.get(email):
-                self.mapping[email] = dict()
-            self.mapping[email][(self.day_start, self.day_end)] = \
-                self.search_sent_counts(email, (self.day_start, self.day_end))
-            self.mapping[email][self.one_range] = self.search_sent_counts(email, self.one_range)
-            self.mapping[email][self.two_range] = self.search_sent_counts(email, self.two_range)
+            self.mapping[email] = self.count_sent(self.sent_timestamps.get(email, set()))
         return self.mapping
 
+    def add_sent(self, email, timestamp):
+        """
+        发送邮件后更新计数
+        """
+        timestamps = self.sent_timestamps.setdefault(email, set())
+        timestamps.add(timestamp)
+        self.mapping[email] = self.count_sent(timestamps)
+
+    def count_sent(self, timestamps: set):
+        """
+        :return: {
+            (day_start, day_end): count,    # 当天
+            one_range: count,               # 当前一小时区间
+            two_range: count                # 当前四小时区间
+        }
+        """
+        counts = dict()
+        for _range in [(self.day_start, self.day_end), self.one_range, self.two_range]:
+            counts[_range] = len([ts for ts in timestamps if _range[0] <= ts <= _range[1]])
+        return counts
+
+    @staticmethod
+    def load_sent_timestamps(email_list, _range):
+        """
+        一次查询所有邮箱时间区间内的发送时间戳
+
+        :return: {email: set(timestamp)}
+        """
+        sent_timestamps = dict()
+        if not email_list:
+            return sent_timestamps
+
+        queryset = EmailNotification.objects.filter(
+            email__in=email_list,
+            timestamp__gte=_range[0],
+            timestamp__lte=_range[1]).values_list("email", "timestamp").order_by().distinct()
+        for email, timestamp in queryset:
+            sent_timestamps.setdefault(email, set()).add(timestamp)
+        return sent_timestamps
+
     @staticmethod
     def search_sent_counts(email, _range):
         count = EmailNotification.objects.filter(
@@ -86,13 +125,26 @@ def search_sent_counts(email, _range):
 
 class NotificationSender(object):
     feint = False  # 测试
+    max_send_workers = 4    # 发送邮件的线程数
 
-    def __init__(self, timestamp, monitor_alerts_mapping, filter_mapping):
+    def __init__(self, timestamp, monitor_alerts_mapping, filter_mapping, threshold: EmailThresholdStrict = None):
+        """
+        :param threshold: 发送后更新其发送计数
+        """
         self.timestamp = timestamp
         self.monitor_alerts_mapping = monitor_alerts_mapping
         self.filter_mapping = filter_mapping
+        self.threshold = threshold
 
     def start(self):
+        # 本次所有邮件共用一个有界的发送线程池
+        pool = ThreadPoolExecutor(max_workers=self.max_send_workers)
+        try:
+            self.send_all(pool)
+        finally:
+            pool.shutdown(wait=False)
+
+    def send_all(self, pool):
         for email, alerts in self.monitor_alerts_mapping.items():
             user_sent_mapping = self.filter_mapping.get(email)
             if not self.should_to_send(user_sent_mapping):
@@ -106,16 +158,17 @@ def start(self):
             self.record_notification(alerts)
             # 更新告警的发送时间
             self.update_notification_timestamp(alerts)
+            if self.threshold is not None:
+                self.threshold.add_sent(email, DateUtils.timestamp_round(self.timestamp))
             # # 发送通知
-            pool = ThreadPoolExecutor(max_workers=1)
             pool.submit(self.send_to_monitor, receiver=email, subject=subject, message=message)
-            pool.shutdown(wait=False)
 
     def record_notification(self, alerts):
         """
         记录邮件通知发送
         """
         logger.info("写入邮件通知记录表")
+        objs = []
         for alert in alerts:
             obj = {
                 "alert": alert.get("id"),
@@ -123,7 +176,10 @@ def record_notification(self, alerts):
                 "timestamp": DateUtils.timestamp_round(self.timestamp),
             }
             logger.info(str(obj))
-            EmailNotification.objects.create(**obj)
+            notification = EmailNotification(**obj)
+            notification.enforce_id()
+            objs.append(notification)
+        EmailNotification.objects.bulk_create(objs, ignore_conflicts=True)
 
     def send_to_monitor(self, receiver, subject, message):
         logger.info(message)
@@ -166,20 +222,11 @@ def upper_limit_text(user_sent_mapping):
     def update_notification_timestamp(self, alerts):
         logger.info("更新首次发送时间戳、上次发送时间戳")
         send_timestamp = DateUtils.timestamp_round(self.timestamp)
-        last_id_list = []
-        first_id_list = []
-        for alert in alerts:
-            last_id_list.append(alert.get("id"))
-            first_notification = alert.get("first_notification")
-            if not first_notification:
-                first_id_list.append(alert.get("id"))
-        for alert in alerts:
-            obj = AlertModel.objects.filter(id=alert.get("id")).first()
-            obj.last_notification = send_timestamp
-            if not obj.first_notification:
-                obj.first_notification = send_timestamp
-            obj.save()
-            logger.info(f"{obj.id, obj.first_notification, obj.last_notification}")
+        id_list = [alert.get("id") for alert in alerts]
+        AlertModel.objects.filter(id__in=id_list).update(last_notification=send_timestamp)
+        AlertModel.objects.filter(id__in=id_list, first_notification__isnull=True).update(
+            first_notification=send_timestamp)
+        logger.info(f"{id_list}, {send_timestamp}")
 
     @staticmethod
     def update_sql_format(table, field, value, id_list):
@@ -497,15 +544,17 @@ def run(self):
         alerts = self.generate_alert_email_list(alerts)
         logger.info("根据监控邮箱号进行分组")
         monitor_alerts_mapping = self.group_alert_by_monitor(alerts)
-        filter_mapping = EmailThresholdStrict(
+        threshold = EmailThresholdStrict(
             timestamp=self.timestamp,
             email_list=monitor_alerts_mapping.keys()
-        ).start()
+        )
+        filter_mapping = threshold.start()
         logger.info("发送邮件通知并记录通知")
         NotificationSender(
             timestamp=self.timestamp,
             monitor_alerts_mapping=monitor_alerts_mapping,
-            filter_mapping=filter_mapping
+            filter_mapping=filter_mapping,
+            threshold=threshold
         ).start()
         logger.info(f"结束...{DateUtils.now()}", )
 
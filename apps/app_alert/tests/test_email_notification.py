@@ -0,0 +1,55 @@
+from django.db import connection
+from django.test import TestCase
+
+from apps.app_alert.models import EmailNotification
+from apps.app_alert.scripts.alert_email_notification import EmailThresholdStrict
+from apps.app_alert.utils.utils import DateUtils
+
+
+class EmailThresholdStrictTests(TestCase):
+    def test_sent_counts(self):
+        timestamp = DateUtils.timestamp()
+        emails = [f'user{i}@cnic.cn' for i in range(20)]
+        threshold = EmailThresholdStrict(timestamp=timestamp, email_list=emails)
+        sent_ts_list = [
+            threshold.day_start - 60, threshold.day_start, threshold.one_range[0], threshold.two_range[0],
+            threshold.two_range[1], threshold.day_end, threshold.day_end + 60
+        ]
+        objs = []
+        for i, email in enumerate(emails):
+            for j, ts in enumerate(sent_ts_list[:i % len(sent_ts_list) + 1]):
+                # 同一时间发送的多条告警只算一封邮件
+                for alert in [f'alert{j}', f'alert{j}-2']:
+                    obj = EmailNotification(alert=alert, email=email, timestamp=ts)
+                    obj.enforce_id()
+                    objs.append(obj)
+
+        EmailNotification.objects.bulk_create(objs)
+
+        query_count = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal query_count
+            query_count += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_queries):
+            mapping = threshold.start()
+
+        self.assertEqual(query_count, 1)
+        self.assertEqual(len(mapping), len(emails))
+        for email in emails:
+            counts = mapping[email]
+            self.assertEqual(list(counts.keys()), [
+                (threshold.day_start, threshold.day_end), threshold.one_range, threshold.two_range])
+            for _range, count in counts.items():
+                self.assertEqual(count, threshold.search_sent_counts(email, _range))
+
+        # 发送后更新计数
+        email = emails[0]
+        ts = DateUtils.timestamp_round(timestamp)
+        before = list(mapping[email].values())
+        threshold.add_sent(email, ts)
+        self.assertEqual(list(threshold.mapping[email].values()), [n + 1 for n in before])
+        threshold.add_sent(email, ts)
+        self.assertEqual(list(threshold.mapping[email].values()), [n + 1 for n in before])
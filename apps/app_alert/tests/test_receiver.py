@@ -0,0 +1,172 @@
+
+from django.db import connection
+from django.test.testcases import TransactionTestCase
+
+from apps.app_alert.alert_status_flow import AlertStatusFlow
+from apps.app_alert.handlers.receiver import AlertReceiver
+from apps.app_alert.models import AlertModel, PreAlertModel, ResolvedAlertModel
+from apps.app_alert.utils.utils import DateUtils
+
+
+def build_alert(index: int, description: str = 'description', cluster: str = 'aiops_metric'):
+    return {
+        'labels': {
+            'alertname': 'node down', 'instance': f'10.0.{index // 250}.{index % 250}:9100',
+            'monitor_cluster': cluster, 'severity': 'critical'
+        },
+        'annotations': {
+            'summary': f'node 10.0.{index // 250}.{index % 250} down',
+            'description': description
+        }
+    }
+
+
+def receive_alerts(alerts: list):
+    """
+    :return: query_count
+    """
+    query_count = 0
+
+    def count_queries(execute, sql, params, many, context):
+        nonlocal query_count
+        query_count += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(count_queries):
+        AlertReceiver(alerts).start()
+
+    return query_count
+
+
+class AlertReceiverTests(TransactionTestCase):
+    def test_create_or_update(self):
+        AlertReceiver([build_alert(1), build_alert(2)]).start()
+        self.assertEqual(AlertModel.objects.count(), 2)
+        alert1 = AlertModel.objects.get(summary='node 10.0.0.1 down')
+        self.assertEqual(alert1.count, 1)
+        self.assertEqual(alert1.type, AlertModel.AlertType.METRIC.value)
+        self.assertEqual(alert1.instance, '10.0.0.1:9100')
+
+        # 同一批中重复的告警合并累加，已存在的告警更新
+        receiver = AlertReceiver([
+            build_alert(1, description='desc1'), build_alert(3), build_alert(1, description='desc2'), build_alert(3)])
+        receiver.start()
+        self.assertEqual(AlertModel.objects.count(), 3)
+        alert1.refresh_from_db()
+        self.assertEqual(alert1.count, 3)
+        self.assertEqual(alert1.description, 'desc2')
+        self.assertEqual(alert1.modification, receiver.timestamp)
+        alert2 = AlertModel.objects.get(summary='node 10.0.0.2 down')
+        self.assertEqual(alert2.count, 1)
+        alert3 = AlertModel.objects.get(summary='node 10.0.0.3 down')
+        self.assertEqual(alert3.count, 2)
+        self.assertEqual(PreAlertModel.objects.count(), 0)
+
+    def test_website_alert(self):
+        alert = build_alert(1, description='website down url_hash1 probe1', cluster='webmonitor')
+        AlertReceiver([alert]).start()
+        self.assertEqual(PreAlertModel.objects.count(), 1)
+        # 只有一个探测点，预处理告警直接判定为网站告警
+        website_alert = AlertModel.objects.get(fingerprint='url_hash1')
+        self.assertEqual(website_alert.description, 'website down')
+        self.assertEqual(website_alert.cluster, AlertModel.AlertType.WEBMONITOR.value)
+
+        AlertReceiver([alert]).start()
+        self.assertEqual(PreAlertModel.objects.get().count, 2)
+        self.assertEqual(AlertModel.objects.get(fingerprint='url_hash1').count, 2)
+
+    def test_receiver_benchmark(self):
+        """
+        一次请求的查询数不随告警数增加
+        """
+        query_counts = {}
+        for size in [10, 100, 1000]:
+            AlertModel.objects.all().delete()
+            alerts = [build_alert(i) for i in range(size)]
+            query_count = receive_alerts(alerts)
+            self.assertEqual(AlertModel.objects.count(), size)
+
+            alerts = [build_alert(i) for i in range(size)]
+            update_query_count = receive_alerts(alerts)
+            self.assertEqual(AlertModel.objects.filter(count=2).count(), size)
+            query_counts[size] = (query_count, update_query_count)
+
+        # 查询数只随分批数增加，逐条处理时1000条告警至少需要2000次查询
+        self.assertLess(query_counts[1000][0], 50)
+        self.assertLess(query_counts[1000][1], 10)
+
+
+class AlertStatusFlowTests(TransactionTestCase):
+    @staticmethod
+    def create_alerts(count: int, end: int):
+        alerts = []
+        for i in range(count):
+            alert = AlertModel(
+                fingerprint=f'fingerprint{i}', name='node down', type=AlertModel.AlertType.METRIC.value,
+                instance=f'10.0.0.{i}', cluster='aiops_metric', severity='critical', summary=f'summary{i}',
+                description='description', start=end - 3600, end=end, count=i + 1, creation=end - 3600
+            )
+            alert.enforce_id()
+            alerts.append(alert)
+
+        AlertModel.objects.bulk_create(alerts)
+        return alerts
+
+    def test_move_to_resolved(self):
+        now_ts = DateUtils.timestamp()
+        self.create_alerts(count=5, end=now_ts + 600)
+        alerts = []
+        for i in range(5, 12):
+            alert = AlertModel(
+                fingerprint=f'fingerprint{i}', name='node down', type=AlertModel.AlertType.METRIC.value,
+                instance=f'10.0.0.{i}', cluster='aiops_metric', severity='critical', summary=f'summary{i}',
+                description='description', start=now_ts - 7200, end=now_ts - 10, count=i, creation=now_ts - 7200
+            )
+            alert.save(force_insert=True)
+            alerts.append(alert)
+
+        flow = AlertStatusFlow(chunk_size=3)
+        stats = flow.run()
+        self.assertEqual(stats['moved'], 7)
+        self.assertEqual(stats['chunks'], 3)
+        self.assertEqual(flow.checkpoint, max(a.id for a in alerts))
+        self.assertEqual(AlertModel.objects.count(), 5)
+        self.assertEqual(ResolvedAlertModel.objects.count(), 7)
+        resolved = ResolvedAlertModel.objects.get(id=alerts[0].id)
+        self.assertEqual(resolved.fingerprint, alerts[0].fingerprint)
+        self.assertEqual(resolved.count, alerts[0].count)
+        self.assertEqual(resolved.status, ResolvedAlertModel.AlertStatus.RESOLVED.value)
+        self.assertIsNotNone(resolved.recovery)
+
+        # 已归入的告警再次出现在进行中时，冲突的告警保留在进行中，同一批的其他告警正常归入
+        alert = alerts[0]
+        alert.save(force_insert=True)
+        alert13 = AlertModel(
+            fingerprint='fingerprint13', name='node down', type=AlertModel.AlertType.METRIC.value,
+            instance='10.0.0.13', cluster='aiops_metric', severity='critical', summary='summary13',
+            description='description', start=now_ts - 7200, end=now_ts - 10, count=1, creation=now_ts - 7200
+        )
+        alert13.save(force_insert=True)
+        stats = AlertStatusFlow.start()
+        self.assertEqual(stats['moved'], 1)
+        self.assertEqual(AlertModel.objects.count(), 6)
+        self.assertTrue(AlertModel.objects.filter(id=alert.id).exists())
+        self.assertEqual(ResolvedAlertModel.objects.count(), 8)
+        self.assertTrue(ResolvedAlertModel.objects.filter(id=alert13.id).exists())
+
+    def test_status_flow_benchmark(self):
+        self.create_alerts(count=3000, end=DateUtils.timestamp() - 10)
+        query_count = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal query_count
+            query_count += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_queries):
+            stats = AlertStatusFlow.start()
+
+        self.assertEqual(stats['moved'], 3000)
+        self.assertEqual(ResolvedAlertModel.objects.count(), 3000)
+        self.assertEqual(AlertModel.objects.count(), 0)
+        self.assertLess(query_count, 100)
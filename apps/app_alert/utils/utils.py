@@ -92,11 +92,17 @@ def beijing_timetuple(cls, *args, **kwargs):
 
 
 @retry(stop_max_attempt_number=3)
-def download(*args, **kwargs):
+def download(*args, session=None, **kwargs):
+    """
+    :param session: 发送请求的会话，如core.adapters.sessions.session_pool（按服务地址共享保持连接）；默认每次新建连接
+    """
     if 'timeout' not in kwargs:
         kwargs['timeout'] = (6, 60)
     try:
-        resp = requests.request(*args, **kwargs)
+        if session is None:
+            resp = requests.request(*args, **kwargs)
+        else:
+            resp = session.request(*args, **kwargs)
         if resp.status_code != 200:
             raise errors.APIError()
         return resp
@@ -72,7 +72,8 @@ def new_apply_notice(apply: CouponApply):
             CouponApplyEmailNotifier.thread_send_email,
             kwargs={
                 'subject': subject, 'receivers': receivers, 'message': message
-            }
+            },
+            queue=taskqueue.QueueName.NOTIFY
         )
         return future
 
@@ -110,6 +111,7 @@ def new_status_notice(apply: CouponApply, receivers: list = None):
             CouponApplyEmailNotifier.thread_send_email,
             kwargs={
                 'subject': subject, 'receivers': receivers, 'message': message
-            }
+            },
+            queue=taskqueue.QueueName.NOTIFY
         )
         return future
@@ -10,6 +10,7 @@
 no_slash_router = SimpleRouter(trailing_slash=False)
 no_slash_router.register(r'sales-info', common_views.SalesCustomerServiceViewSet, basename='sales-info')
 no_slash_router.register(r'announcement', announce_views.AnnouncementViewSet, basename='announcement')
+no_slash_router.register(r'taskqueue-stats', common_views.TaskQueueStatsViewSet, basename='taskqueue-stats')
 
 
 urlpatterns = [
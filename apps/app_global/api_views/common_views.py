@@ -1,4 +1,6 @@
-from django.utils.translation import gettext_lazy
+import os
+
+from django.utils.translation import gettext_lazy, gettext as _
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.serializers import Serializer
 from rest_framework.response import Response
@@ -7,6 +9,8 @@
 from utils.paginators import NoPaginatorInspector
 from apps.api.viewsets import NormalGenericViewSet
 from apps.app_global.configs_manager import global_configs
+from core import errors
+from core.taskqueue.queues import task_queues
 
 
 class SalesCustomerServiceViewSet(NormalGenericViewSet):
@@ -36,3 +40,54 @@ def list(self, request, *args, **kwargs):
 
     def get_serializer_class(self):
         return Serializer
+
+
+class TaskQueueStatsViewSet(NormalGenericViewSet):
+    permission_classes = [IsAuthenticated, ]
+    pagination_class = None
+    lookup_field = 'id'
+
+    @swagger_auto_schema(
+        operation_summary=gettext_lazy('后台任务队列统计信息'),
+        paginator_inspectors=[NoPaginatorInspector],
+        manual_parameters=[],
+        responses={
+            200: ''''''
+        }
+    )
+    def list(self, request, *args, **kwargs):
+        """
+        后台任务队列统计信息，当前进程内的，需要联邦管理员权限
+
+            http Code 200 Ok:
+                {
+                  "pid": 1234,
+                  "queues": [
+                    {
+                      "name": "delivery",
+                      "max_workers": 8,
+                      "max_depth": 1000,
+                      "depth": 0,           # 排队的任务数
+                      "in_flight": 1,       # 执行中的任务数
+                      "submitted": 10,      # 提交的任务数
+                      "rejected": 0,        # 队列已满拒绝的任务数
+                      "failed": 0,          # 执行出错的任务数
+                      "wait_time": {        # 排队等待时间，秒
+                        "count": 9,
+                        "avg": 0.001,
+                        "p50": 0.0005,      # 最近任务的中位数
+                        "p99": 0.002,
+                        "histogram": {"le_0.01": 9, "le_0.05": 0, ..., "le_inf": 0}   # 不大于该值的任务数
+                      },
+                      "run_time": {}        # 执行时间，秒，同wait_time
+                    }
+                  ]
+                }
+        """
+        if not request.user.is_federal_admin():
+            return self.exception_response(exc=errors.AccessDenied(message=_('你没有联邦管理员权限')))
+
+        return Response(data={'pid': os.getpid(), 'queues': task_queues.stats()})
+
+    def get_serializer_class(self):
+        return Serializer
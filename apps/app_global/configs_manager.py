@@ -1,10 +1,9 @@
-import ipaddress
 from typing import List, Union, Dict
 
 from django.core.cache import cache as dj_cache
 from django.utils.translation import gettext as _
 
-from utils.iprestrict import convert_iprange, IPRange
+from utils.iprestrict import convert_iprange, IPRange, IPNetwork, IPRestrictor, get_rules_version, new_rules_version
 from apps.app_global.models import GlobalConfig, IPAccessWhiteList
 
 
@@ -74,6 +73,7 @@ def get(self, name: str):
 class IPAccessWhiteListManager(Singleton):
     ModuleName = IPAccessWhiteList.ModuleName
     CACHE_KEY = 'cache_global_api_ip_access_whitelist'
+    VERSION_CACHE_KEY = 'cache_global_api_ip_access_whitelist_version'
 
     @staticmethod
     def get_ip_whitelist_map() -> Dict[str, List[str]]:
@@ -106,11 +106,12 @@ def get_whitelist_map_use_cahce() -> Dict[str, List[str]]:
         if whitelist_map is None:
             whitelist_map = IPAccessWhiteListManager.get_ip_whitelist_map()
             dj_cache.set(IPAccessWhiteListManager.CACHE_KEY, whitelist_map, timeout=60)
+            new_rules_version(cache_key=IPAccessWhiteListManager.VERSION_CACHE_KEY, timeout=60)
 
         return whitelist_map
 
     @staticmethod
-    def get_module_ip_whitelist(module_name: str) -> List[Union[ipaddress.IPv4Network, IPRange]]:
+    def get_module_ip_whitelist(module_name: str) -> List[Union[IPNetwork, IPRange]]:
         ip_whitelist_map = IPAccessWhiteListManager.get_whitelist_map_use_cahce()
         module_whitelist = ip_whitelist_map.get(module_name, [])
         # 所有功能模块白名单
@@ -127,9 +128,17 @@ def get_module_ip_whitelist(module_name: str) -> List[Union[ipaddress.IPv4Networ
 
         return allowed_ips
 
+    @staticmethod
+    def get_rules_version() -> str:
+        """
+        白名单的版本戳，白名单缓存重新加载或清除时变化
+        """
+        return get_rules_version(cache_key=IPAccessWhiteListManager.VERSION_CACHE_KEY, timeout=60)
+
     @staticmethod
     def clear_cache():
         dj_cache.delete(IPAccessWhiteListManager.CACHE_KEY)
+        new_rules_version(cache_key=IPAccessWhiteListManager.VERSION_CACHE_KEY, timeout=60)
 
     @staticmethod
     def add_whitelist_obj(module_name: str, ip_value: str, remark: str = ''):
@@ -140,6 +149,7 @@ def add_whitelist_obj(module_name: str, ip_value: str, remark: str = ''):
             module_name=module_name, ip_value=ip_value, remark=remark
         )
         obj.save(force_insert=True)
+        IPAccessWhiteListManager.clear_cache()
         return obj
 
     @staticmethod
@@ -148,9 +158,28 @@ def get_ip_whitelist_qs():
 
     @staticmethod
     def delete_whitelist(module_name: str, ip_values: List[str]):
-        return IPAccessWhiteList.objects.filter(
+        r = IPAccessWhiteList.objects.filter(
             module_name=module_name, ip_value__in=ip_values
         ).delete()
+        IPAccessWhiteListManager.clear_cache()
+        return r
+
+
+class ModuleIPRestrictor(IPRestrictor):
+    """
+    功能模块IP白名单访问限制，编译的匹配器在进程内缓存，白名单版本变化时重新编译
+    """
+    module_name = None
+
+    @property
+    def matcher_cache_key(self):
+        return f'global_ip_whitelist_{self.module_name}'
+
+    def load_ip_rules(self):
+        return IPAccessWhiteListManager.get_module_ip_whitelist(module_name=self.module_name)
+
+    def get_rules_version(self):
+        return IPAccessWhiteListManager.get_rules_version()
 
 
 global_configs = Configs()
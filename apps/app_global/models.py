@@ -181,7 +181,7 @@ def clean(self):
         except Exception as exc:
             raise ValidationError({'ip_value': str(exc)})
 
-        if isinstance(subnet, ipaddress.IPv4Network):
+        if isinstance(subnet, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
             self.ip_value = str(subnet)
 
         obj = IPAccessWhiteList.objects.exclude(id=self.id).filter(
@@ -1,8 +1,14 @@
+import threading
+from queue import Full
+
 from django.shortcuts import reverse
+from django.test import override_settings
 
 from utils.test import get_or_create_user, MyAPITestCase
 from apps.app_global.models import GlobalConfig
 from apps.app_global.configs_manager import global_configs
+from core.taskqueue import submit_task
+from core.taskqueue.queues import TaskQueue, Priority, QueueName
 
 
 class CommonTests(MyAPITestCase):
@@ -32,3 +38,94 @@ def test_sales_customer(self):
         r = self.client.get(base_url)
         self.assertEqual(r.status_code, 200)
         self.assertEqual(r.data['info'], 'test测试')
+
+    def test_taskqueue_stats(self):
+        queue = TaskQueue(name='test', max_workers=1, max_depth=3, put_timeout=0.05)
+        started = threading.Event()
+        event = threading.Event()
+        order = []
+
+        def append(value):
+            order.append(value)
+
+        def block():
+            started.set()
+            event.wait(timeout=10)
+
+        futures = [queue.submit(block)]
+        self.assertTrue(started.wait(timeout=10))     # 唯一的工作线程开始执行阻塞任务
+        futures.append(queue.submit(append, kwargs={'value': 'low'}, priority=Priority.LOW))
+        futures.append(queue.submit(append, kwargs={'value': 'normal'}))
+        futures.append(queue.submit(append, kwargs={'value': 'high'}, priority=Priority.HIGH))
+        # 队列满时等待put_timeout后拒绝
+        with self.assertRaises(Full):
+            queue.submit(append, kwargs={'value': 'full'})
+
+        stats = queue.stats()
+        self.assertEqual(stats['depth'], 3)
+        self.assertEqual(stats['in_flight'], 1)
+        self.assertEqual(stats['rejected'], 1)
+        event.set()
+        for f in futures:
+            f.result(timeout=10)
+
+        self.assertEqual(order, ['high', 'normal', 'low'])
+        stats = queue.stats()
+        self.assertEqual(stats['depth'], 0)
+        self.assertEqual(stats['in_flight'], 0)
+        self.assertEqual(stats['submitted'], 4)
+        self.assertEqual(stats['run_time']['count'], 4)
+        self.assertEqual(stats['wait_time']['count'], 4)
+        self.assertEqual(sum(stats['run_time']['histogram'].values()), 4)
+
+        # 提交成功返回Future，任务的返回值是结果
+        future = submit_task(append, kwargs={'value': 'default'})
+        self.assertIsNone(future.result(timeout=10))
+        self.assertEqual(order[-1], 'default')
+
+        base_url = reverse('app-global-api:taskqueue-stats-list')
+        r = self.client.get(base_url)
+        self.assertEqual(r.status_code, 401)
+        user1 = get_or_create_user(username='lisi@cnic.cn')
+        self.client.force_login(user1)
+        r = self.client.get(base_url)
+        self.assertEqual(r.status_code, 403)
+
+        user1.set_federal_admin()
+        r = self.client.get(base_url)
+        self.assertEqual(r.status_code, 200)
+        self.assertIn('pid', r.data)
+        queue_stats = {q['name']: q for q in r.data['queues']}
+        self.assertEqual(queue_stats[QueueName.DEFAULT]['submitted'], 1)
+        self.assertKeysIn(['depth', 'in_flight', 'rejected', 'wait_time', 'run_time'], queue_stats[QueueName.DEFAULT])
+
+    @override_settings(TASK_QUEUES={'test-full': {'max_workers': 1, 'max_depth': 1, 'put_timeout': 0}})
+    def test_submit_task_rejected(self):
+        started = threading.Event()
+        event = threading.Event()
+        order = []
+
+        def block():
+            started.set()
+            event.wait(timeout=10)
+
+        def append(value):
+            order.append(value)
+            return value
+
+        try:
+            submit_task(block, queue='test-full')
+            self.assertTrue(started.wait(timeout=10))
+            submit_task(append, kwargs={'value': 'queued'}, queue='test-full')
+            # 队列已满，在当前线程同步执行
+            future = submit_task(append, kwargs={'value': 'sync'}, queue='test-full')
+            self.assertTrue(future.done())
+            self.assertEqual(future.result(), 'sync')
+            self.assertEqual(order, ['sync'])
+            # 不同步执行时抛出错误
+            with self.assertRaises(Full):
+                submit_task(append, kwargs={'value': 'rejected'}, queue='test-full', run_on_reject=False)
+        finally:
+            event.set()
+
+        self.assertNotIn('rejected', order)
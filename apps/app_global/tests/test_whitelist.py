@@ -2,8 +2,10 @@
 
 from django.test import TestCase
 
-from utils.iprestrict import IPRange
+from core import errors
+from utils.iprestrict import IPRange, IPRangeMatcher, convert_iprange
 from apps.app_global.configs_manager import IPAccessWhiteListManager
+from apps.app_screenvis.permissions import ScreenAPIIPRestrictor
 
 
 class IPWhiteListTests(TestCase):
@@ -48,3 +50,72 @@ def test_lock(self):
         IPAccessWhiteListManager.clear_cache()
         ip_wls = IPAccessWhiteListManager.get_module_ip_whitelist(IPAccessWhiteListManager.ModuleName.SCREEN.value)
         self.assertTrue(self.ip_is_allow(allowed_ips=ip_wls, client_ip='159.0.0.1'))
+
+    def test_matcher(self):
+        rules = [convert_iprange(s) for s in [
+            '10.0.0.0/24', '10.0.1.0 - 10.0.1.100', '10.0.0.128/25', '192.168.1.1', '2001:db8::/64',
+            '2001:db8:1::1-2001:db8:1::ff'
+        ]]
+        matcher = IPRangeMatcher(rules)
+        self.assertEqual(len(matcher), 4)   # 10.0.0.0/24和10.0.1.0-100相邻合并，/25被包含
+        for ip, allowed in [
+            ('10.0.0.0', True), ('10.0.0.255', True), ('10.0.1.100', True), ('10.0.1.101', False),
+            ('9.255.255.255', False), ('192.168.1.1', True), ('192.168.1.2', False),
+            ('2001:db8::1', True), ('2001:db8:0:1::', False), ('2001:db8:1::ff', True), ('2001:db8:1::100', False),
+            ('::1', False)
+        ]:
+            self.assertIs(matcher.contains(ipaddress.ip_address(ip)), allowed, msg=ip)
+            self.assertIs(self.ip_is_allow_v46(rules, ip), allowed, msg=ip)
+
+        # 进程内缓存编译的匹配器，白名单变化时重新编译
+        IPAccessWhiteListManager.clear_cache()
+        restrictor = ScreenAPIIPRestrictor()
+        with self.assertRaises(errors.AccessDenied):
+            restrictor.is_restricted(client_ip='159.0.0.1')
+
+        matcher1 = ScreenAPIIPRestrictor().ip_matcher
+        self.assertIs(ScreenAPIIPRestrictor().ip_matcher, matcher1)
+        IPAccessWhiteListManager.add_whitelist_obj(
+            module_name=IPAccessWhiteListManager.ModuleName.SCREEN.value, ip_value='159.0.0.0/24')
+        IPAccessWhiteListManager.add_whitelist_obj(
+            module_name=IPAccessWhiteListManager.ModuleName.SCREEN.value, ip_value='2400:dd01::/32')
+        restrictor = ScreenAPIIPRestrictor()
+        self.assertIsNot(restrictor.ip_matcher, matcher1)
+        self.assertFalse(restrictor.is_restricted(client_ip='159.0.0.1'))
+        self.assertFalse(restrictor.is_restricted(client_ip='2400:dd01:1::1'))
+        with self.assertRaises(errors.AccessDenied):
+            restrictor.is_restricted(client_ip='2400:dd02::1')
+
+        with self.assertRaises(errors.AccessDenied):
+            restrictor.is_restricted(client_ip='invalid')
+
+    @staticmethod
+    def ip_is_allow_v46(allowed_ips: list, client_ip: str):
+        client_ip = ipaddress.ip_address(client_ip)
+        for ip_rule in allowed_ips:
+            if isinstance(ip_rule, IPRange):
+                if ip_rule.start.version == client_ip.version and ip_rule.start <= client_ip <= ip_rule.end:
+                    return True
+            elif ip_rule.version == client_ip.version and client_ip in ip_rule:
+                return True
+
+        return False
+
+    def test_matcher_same_as_linear(self):
+        rules = []
+        for i in range(300):
+            rules.append(ipaddress.IPv4Network(f'{10 + i // 256}.{i % 256}.0.0/24'))
+            rules.append(IPRange(
+                start=ipaddress.IPv6Address(f'2001:db8:{i:x}::1'), end=ipaddress.IPv6Address(f'2001:db8:{i:x}::ff')))
+
+        client_ips = [f'{10 + i // 256}.{i % 256}.0.1' for i in range(0, 300, 10)] + ['223.1.1.1'] * 10
+        # 边界
+        client_ips += ['10.0.0.0', '10.0.0.255', '10.0.1.0', '9.255.255.255', '11.43.0.255', '11.43.1.0']
+        client_ips += ['2001:db8:0::1', '2001:db8:0::ff', '2001:db8:0::100', '2001:db8:12b::ff', '2001:db8:12c::1']
+        client_ips = [ipaddress.ip_address(ip) for ip in client_ips]
+
+        matcher = IPRangeMatcher(rules)
+        matched = [matcher.contains(ip) for ip in client_ips]
+        linear_matched = [self.ip_is_allow_v46(rules, str(ip)) for ip in client_ips]
+        self.assertEqual(matched, linear_matched)
+        self.assertEqual(matched.count(True), 30 + 3 + 3)
@@ -71,9 +71,10 @@ class MeteringServerViewSet(CustomGenericViewSet):
             openapi.Parameter(
                 name='download',
                 in_=openapi.IN_QUERY,
-                type=openapi.TYPE_BOOLEAN,
+                type=openapi.TYPE_STRING,
                 required=False,
-                description=gettext_lazy('查询结果以文件方式下载文件；分页参数无效，不分页返回所有数据')
+                description=gettext_lazy(
+                    '查询结果以csv文件方式流式下载；分页参数无效，不分页返回所有数据；值为“gzip”时下载gzip压缩的文件')
             ),
         ],
         responses={
@@ -714,7 +715,16 @@ class MeteringDiskViewSet(CustomGenericViewSet):
                 required=False,
                 description=gettext_lazy('查询指定用户的计量单，仅以管理员身份查询时使用')
             ),
-        ] + CustomGenericViewSet.PARAMETERS_AS_ADMIN,
+        ] + CustomGenericViewSet.PARAMETERS_AS_ADMIN + [
+            openapi.Parameter(
+                name='download',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                required=False,
+                description=gettext_lazy(
+                    '查询结果以csv文件方式流式下载；分页参数无效，不分页返回所有数据；值为“gzip”时下载gzip压缩的文件')
+            ),
+        ],
         responses={
             200: ''
         }
@@ -61,9 +61,10 @@ class MeteringStorageViewSet(CustomGenericViewSet):
             openapi.Parameter(
                 name='download',
                 in_=openapi.IN_QUERY,
-                type=openapi.TYPE_BOOLEAN,
+                type=openapi.TYPE_STRING,
                 required=False,
-                description=gettext_lazy('查询结果以文件方式下载文件；分页参数无效，不分页返回所有数据')
+                description=gettext_lazy(
+                    '查询结果以csv文件方式流式下载；分页参数无效，不分页返回所有数据；值为“gzip”时下载gzip压缩的文件')
             ),
         ],
         responses={
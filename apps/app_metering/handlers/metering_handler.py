@@ -20,7 +20,9 @@
     MeteringDiskManager, StatementDiskManager, BaseMeteringManager, MeteringMonitorSiteManager
 )
 from apps.app_servers.models import Server, ServerArchive, Disk
-from utils.report_file import CSVFileInMemory, wrap_csv_file_response
+from utils.report_file import (
+    CSVFileInMemory, wrap_csv_file_response, wrap_csv_stream_response, iter_queryset_by_keyset
+)
 from utils import rand_utils
 from utils.decimal_utils import quantize_18_2
 from utils.model import PayType, ResourceType, OwnerType
@@ -99,7 +101,7 @@ def list_server_metering(self, view: CustomGenericViewSet, request):
 
         if download:
             return self.list_server_metering_download(
-                queryset=queryset, date_start=date_start, date_end=date_end
+                queryset=queryset, date_start=date_start, date_end=date_end, gzip=params['gzip']
             )
 
         try:
@@ -166,56 +168,35 @@ def list_server_metering_validate_params(view: CustomGenericViewSet, request) ->
             'service_id': service_id,
             'server_id': server_id,
             'user_id': user_id,
-            'download': download is not None
+            'download': download is not None,
+            'gzip': download == 'gzip'
         }
 
-    def list_server_metering_download(self, queryset, date_start, date_end):
-        count = queryset.count()
-        if count > 100000:
-            exc = errors.ConflictError(message=_('数据量太多'), code='TooManyData')
-            return Response(data=exc.err_data(), status=exc.status_code)
-
-        filename = rand_utils.timestamp14_sn()
-        csv_file = CSVFileInMemory(filename=filename)
-        csv_file.writerow(['#' + _('列举云服务器计量计费明细') + f'[{date_start} - {date_end}]'])
-        csv_file.writerow(['#--------------' + _('数据明细列表') + '---------------'])
-        csv_file.writerow([
-            _('云服务器ID'), _('计费日期'), _('所有者类型'), _('用户名'), _('VO组名'),
-            _('CPU (核*小时)'), _('内存 (Gb*小时数)'), _('系统盘 (Gb*小时)'), _('公网IP (个*小时)'),
-            _('计费总金额'), _('应付总金额')
-        ])
-        per_page = 1000
-        is_end_page = False
-        for number in range(1, math.ceil(count / per_page) + 1):
-            bottom = (number - 1) * per_page
-            top = bottom + per_page
-            if top >= count:
-                top = count
-                is_end_page = True
-
-            meterings = queryset[bottom:top]
-            rows = []
-            for m in meterings:
-                line_items = [
+    @staticmethod
+    def list_server_metering_download(queryset, date_start, date_end, gzip: bool = False):
+        def iter_rows():
+            yield ['#' + _('列举云服务器计量计费明细') + f'[{date_start} - {date_end}]']
+            yield ['#--------------' + _('数据明细列表') + '---------------']
+            yield [
+                _('云服务器ID'), _('计费日期'), _('所有者类型'), _('用户名'), _('VO组名'),
+                _('CPU (核*小时)'), _('内存 (Gb*小时数)'), _('系统盘 (Gb*小时)'), _('公网IP (个*小时)'),
+                _('计费总金额'), _('应付总金额')
+            ]
+            count = 0
+            for m in iter_queryset_by_keyset(queryset, keys=('-creation_time', '-id')):
+                count += 1
+                yield [
                     str(m.server_id), str(m.date), m.get_owner_type_display(), str(m.username),
                     str(m.vo_name), str(m.cpu_hours), str(m.ram_hours), str(m.disk_hours),
                     str(m.public_ip_hours), str(quantize_18_2(m.original_amount)),
                     str(quantize_18_2(m.trade_amount))
                 ]
-                rows.append(line_items)
 
-            csv_file.writerows(rows)
-            if is_end_page:
-                break
+            yield ['#--------------' + _('数据明细列表结束') + '---------------']
+            yield ['#' + _('数据总数') + f': {count}']
+            yield ['#' + _('下载时间') + f': {timezone.now()}']
 
-        csv_file.writerow(['#--------------' + _('数据明细列表结束') + '---------------'])
-        csv_file.writerow(['#' + _('数据总数') + f': {count}'])
-        csv_file.writerow(['#' + _('下载时间') + f': {timezone.now()}'])
-
-        filename = csv_file.filename
-        data = csv_file.to_bytes()
-        csv_file.close()
-        return self._wrap_csv_file_response(filename=filename, data=data)
+        return wrap_csv_stream_response(filename=rand_utils.timestamp14_sn(), rows=iter_rows(), gzip=gzip)
 
     def list_aggregation_by_server(self, view: CustomGenericViewSet, request):
         """
@@ -1039,7 +1020,7 @@ def list_bucket_metering(self, view: CustomGenericViewSet, request):
 
         if download:
             return self.list_bucket_metering_download(
-                queryset=queryset, date_start=date_start, date_end=date_end
+                queryset=queryset, date_start=date_start, date_end=date_end, gzip=params['gzip']
             )
         try:
             meterings = view.paginate_queryset(queryset)
@@ -1048,53 +1029,31 @@ def list_bucket_metering(self, view: CustomGenericViewSet, request):
         except Exception as exc:
             return view.exception_response(exc)
 
-    def list_bucket_metering_download(self, queryset, date_start, date_end):
-        count = queryset.count()
-        if count > 100000:
-            exc = errors.ConflictError(message=_('数据量太多'), code='TooManyData')
-            return Response(data=exc.err_data(), status=exc.status_code)
-
-        filename = rand_utils.timestamp14_sn()
-        csv_file = CSVFileInMemory(filename=filename)
-        csv_file.writerow(['#' + _('列对象存储计量计费明细') + f'[{date_start} - {date_end}]'])
-        csv_file.writerow(['#--------------' + _('数据明细列表') + '---------------'])
-        csv_file.writerow([
-            _('存储桶ID'), _('计费日期'), _('用户名'),
-            _('存储容量 (GiB*Hours)'),
-            _('计费总金额'), _('应付总金额')
-        ])
-        per_page = 1000
-        is_end_page = False
-        for number in range(1, math.ceil(count / per_page) + 1):
-            bottom = (number - 1) * per_page
-            top = bottom + per_page
-            if top >= count:
-                top = count
-                is_end_page = True
-
-            meterings = queryset[bottom:top]
-            rows = []
-            for m in meterings:
-                line_items = [
+    @staticmethod
+    def list_bucket_metering_download(queryset, date_start, date_end, gzip: bool = False):
+        def iter_rows():
+            yield ['#' + _('列对象存储计量计费明细') + f'[{date_start} - {date_end}]']
+            yield ['#--------------' + _('数据明细列表') + '---------------']
+            yield [
+                _('存储桶ID'), _('计费日期'), _('用户名'),
+                _('存储容量 (GiB*Hours)'),
+                _('计费总金额'), _('应付总金额')
+            ]
+            count = 0
+            for m in iter_queryset_by_keyset(queryset, keys=('-creation_time', '-id')):
+                count += 1
+                yield [
                     str(m.storage_bucket_id), str(m.date), str(m.username),
                     str(f'{m.storage: .2f}'),
                     str(quantize_18_2(m.original_amount)),
                     str(quantize_18_2(m.trade_amount))
                 ]
-                rows.append(line_items)
 
-            csv_file.writerows(rows)
-            if is_end_page:
-                break
+            yield ['#--------------' + _('数据明细列表结束') + '---------------']
+            yield ['#' + _('数据总数') + f': {count}']
+            yield ['#' + _('下载时间') + f': {timezone.now()}']
 
-        csv_file.writerow(['#--------------' + _('数据明细列表结束') + '---------------'])
-        csv_file.writerow(['#' + _('数据总数') + f': {count}'])
-        csv_file.writerow(['#' + _('下载时间') + f': {timezone.now()}'])
-
-        filename = csv_file.filename
-        data = csv_file.to_bytes()
-        csv_file.close()
-        return self._wrap_csv_file_response(filename=filename, data=data)
+        return wrap_csv_stream_response(filename=rand_utils.timestamp14_sn(), rows=iter_rows(), gzip=gzip)
 
     @staticmethod
     def _wrap_csv_file_response(filename: str, data):
@@ -1154,7 +1113,8 @@ def list_bucket_metering_validate_params(view: CustomGenericViewSet, request) ->
             'service_id': service_id,
             'bucket_id': bucket_id,
             'user_id': user_id,
-            'download': download is not None
+            'download': download is not None,
+            'gzip': download == 'gzip'
         }
 
     def list_aggregation_by_bucket(self, view: CustomGenericViewSet, request):
@@ -1512,6 +1472,11 @@ def list_disk_metering(self, view: CustomGenericViewSet, request):
                 date_end=date_end
             )
 
+        if params['download']:
+            return self.list_disk_metering_download(
+                queryset=queryset, date_start=date_start, date_end=date_end, gzip=params['gzip']
+            )
+
         try:
             meterings = view.paginate_queryset(queryset)
             serializer = view.get_serializer(instance=meterings, many=True)
@@ -1519,12 +1484,36 @@ def list_disk_metering(self, view: CustomGenericViewSet, request):
         except Exception as exc:
             return view.exception_response(exc)
 
+    @staticmethod
+    def list_disk_metering_download(queryset, date_start, date_end, gzip: bool = False):
+        def iter_rows():
+            yield ['#' + _('列举云硬盘计量计费明细') + f'[{date_start} - {date_end}]']
+            yield ['#--------------' + _('数据明细列表') + '---------------']
+            yield [
+                _('云硬盘ID'), _('计费日期'), _('所有者类型'), _('用户名'), _('VO组名'),
+                _('容量 (GiB*小时)'), _('计费总金额'), _('应付总金额')
+            ]
+            count = 0
+            for m in iter_queryset_by_keyset(queryset, keys=('-creation_time', '-id')):
+                count += 1
+                yield [
+                    str(m.disk_id), str(m.date), m.get_owner_type_display(), str(m.username),
+                    str(m.vo_name), str(m.size_hours), str(quantize_18_2(m.original_amount)),
+                    str(quantize_18_2(m.trade_amount))
+                ]
+
+            yield ['#--------------' + _('数据明细列表结束') + '---------------']
+            yield ['#' + _('数据总数') + f': {count}']
+            yield ['#' + _('下载时间') + f': {timezone.now()}']
+
+        return wrap_csv_stream_response(filename=rand_utils.timestamp14_sn(), rows=iter_rows(), gzip=gzip)
+
     def list_disk_metering_validate_params(self, view: CustomGenericViewSet, request) -> dict:
         service_id = request.query_params.get('service_id', None)
         disk_id = request.query_params.get('disk_id', None)
         vo_id = request.query_params.get('vo_id', None)
         user_id = request.query_params.get('user_id', None)
-        # download = request.query_params.get('download', None)
+        download = request.query_params.get('download', None)
 
         now_date = timezone.now().date()
 
@@ -1561,7 +1550,8 @@ def list_disk_metering_validate_params(self, view: CustomGenericViewSet, request
             'service_id': service_id,
             'disk_id': disk_id,
             'user_id': user_id,
-            # 'download': download is not None
+            'download': download is not None,
+            'gzip': download == 'gzip'
         }
 
     @staticmethod
@@ -1,10 +1,12 @@
 import time
+import math
 from datetime import datetime, timedelta, date
 from functools import wraps
 from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
 
 from django.utils import timezone
-from django.db import close_old_connections
+from django.db import close_old_connections, connection, transaction
 
 from apps.app_servers.models import Server, ServerArchive, ServerBase, Disk, DiskChangeLog
 from apps.app_metering.models import MeteringServer, MeteringObjectStorage, MeteringDisk, MeteringMonitorWebsite
@@ -16,6 +18,7 @@
 from apps.app_users.models import UserProfile
 from apps.app_storage.models import Bucket
 from apps.app_storage.adapter import inputs
+from apps.app_storage.adapter.stats_collector import BucketStatsCollector
 from apps.app_storage import request
 from core import errors
 
@@ -52,6 +55,177 @@ def __init__(self, metering_date: date = None, raise_exception: bool = False):
         self.end_datetime = end_datetime
         self.start_datetime = start_datetime
         self.raise_exception = raise_exception
+        self.metered_ids = None     # 计量日已计量资源id集合，分片计量时各分片共享
+        self._usernames = {}    # 用户名缓存，{user_id: username}
+        self._vo_names = {}     # vo组名缓存，{vo_id: vo_name}
+
+    # 分片计量时，资源循环标识列表，按顺序逐个循环
+    shard_loop_names = ()
+
+    def load_metered_ids(self) -> set:
+        """
+        查询计量日已计量的资源id集合
+        """
+        raise NotImplementedError('`load_metered_ids()` must be implemented.')
+
+    def get_metered_ids(self) -> set:
+        if self.metered_ids is None:
+            self.metered_ids = self.load_metered_ids()
+
+        return self.metered_ids
+
+    def get_loop_queryset(self, loop_name: str):
+        """
+        资源循环的查询集，按创建时间正序排序，用于划分分片
+        """
+        raise NotImplementedError('`get_loop_queryset()` must be implemented.')
+
+    def metering_loop_range(self, loop_name: str, gte_creation_time=None, lt_creation_time=None):
+        """
+        计量创建时间在 [gte_creation_time, lt_creation_time) 区间内的资源
+        """
+        raise NotImplementedError('`metering_loop_range()` must be implemented.')
+
+    def merge_counts(self, other):
+        """
+        合并分片计量器的计数
+        """
+        raise NotImplementedError('`merge_counts()` must be implemented.')
+
+    def print_summary(self):
+        raise NotImplementedError('`print_summary()` must be implemented.')
+
+    def get_username(self, user_id: str) -> str:
+        if user_id not in self._usernames:
+            user = UserProfile.objects.filter(id=user_id).first()
+            self._usernames[user_id] = user.username if user else ''
+
+        return self._usernames[user_id]
+
+    def get_vo_name(self, vo_id: str) -> str:
+        if vo_id not in self._vo_names:
+            vo = VirtualOrganization.objects.filter(id=vo_id).first()
+            self._vo_names[vo_id] = vo.name if vo else ''
+
+        return self._vo_names[vo_id]
+
+    @staticmethod
+    def bulk_create_meterings(model, meterings: list) -> bool:
+        """
+        批量插入计量记录，一条失败（比如已存在唯一约束冲突）时全部回滚
+
+        :return:
+            True    # 批量插入成功
+            False   # 失败，需要逐条插入
+        """
+        if not meterings:
+            return True
+
+        for mt in meterings:
+            mt.enforce_id()
+
+        try:
+            with transaction.atomic():
+                model.objects.bulk_create(meterings)
+        except Exception as exc:
+            return False
+
+        return True
+
+
+def split_creation_time_ranges(queryset, shards: int) -> list:
+    """
+    按数量把查询集划分为创建时间区间，各区间资源数目大致均等；创建时间相同的资源在同一个区间
+
+    :param queryset: 按创建时间正序排序的查询集
+    :param shards: 分片数
+    :return:
+        [(gte_creation_time, lt_creation_time),]     # None表示不限
+    """
+    count = queryset.count()
+    if count == 0:
+        return []
+
+    shards = max(shards, 1)
+    step = math.ceil(count / shards)
+    bounds = []
+    for offset in range(step, count, step):
+        ct = queryset.values_list('creation_time', flat=True)[offset]
+        if not bounds or ct > bounds[-1]:
+            bounds.append(ct)
+
+    ranges = []
+    gte_time = None
+    for b in bounds:
+        ranges.append((gte_time, b))
+        gte_time = b
+
+    ranges.append((gte_time, None))
+    return ranges
+
+
+class ShardedMeasurer:
+    """
+    分片并行计量
+
+    资源按创建时间划分为多个分片，每个分片由一个计量器实例在线程池中计量，线程各自使用独立的数据库连接；
+    计量日已计量资源id集合预先一次查询，各分片共享，中断后重新执行会跳过已计量的资源，从中断处继续
+    """
+
+    def __init__(
+            self, measurer_class, metering_date: date = None, raise_exception: bool = False,
+            shards: int = 8, max_workers: int = 4, measurer_kwargs: dict = None
+    ):
+        """
+        :param measurer_class: 计量器类，ServerMeasurer、DiskMeasurer、StorageMeasurer
+        :param shards: 每个资源循环划分的分片数
+        :param max_workers: 并行计量的线程数
+        :param measurer_kwargs: 计量器类的其他参数
+        """
+        self.measurer_class = measurer_class
+        self.metering_date = metering_date
+        self.raise_exception = raise_exception
+        self.shards = shards
+        self.max_workers = max_workers
+        self.measurer_kwargs = measurer_kwargs or {}
+        self.measurer = self.new_measurer()
+
+    def new_measurer(self):
+        return self.measurer_class(
+            metering_date=self.metering_date, raise_exception=self.raise_exception, **self.measurer_kwargs)
+
+    def run(self):
+        measurer = self.measurer
+        print(f'{self.measurer_class.__name__} sharded metering start, '
+              f'{measurer.start_datetime} - {measurer.end_datetime}')
+        if measurer.end_datetime >= timezone.now():
+            print('Exit, metering time invalid.')
+            return
+
+        measurer.metered_ids = measurer.load_metered_ids()
+        for loop_name in measurer.shard_loop_names:
+            ranges = split_creation_time_ranges(measurer.get_loop_queryset(loop_name), shards=self.shards)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [
+                    executor.submit(self._metering_shard, loop_name, gte_time, lt_time) for gte_time, lt_time in ranges
+                ]
+                for f in futures:
+                    measurer.merge_counts(f.result())
+
+            print(f'Metering loop "{loop_name}" in {len(ranges)} shards done.')
+
+        measurer.print_summary()
+
+    def _metering_shard(self, loop_name: str, gte_creation_time, lt_creation_time):
+        shard_measurer = self.new_measurer()
+        shard_measurer.metered_ids = self.measurer.metered_ids
+        try:
+            shard_measurer.metering_loop_range(
+                loop_name=loop_name, gte_creation_time=gte_creation_time, lt_creation_time=lt_creation_time)
+        finally:
+            connection.close()
+
+        return shard_measurer
 
 
 class ServerMeasurer(BaseMeasurer):
@@ -69,6 +243,9 @@ def __init__(self, metering_date: date = None, raise_exception: bool = False):
         self._metering_server_count = 0  # 计量云主机计数
         self._metering_archieve_count = 0  # 计量归档云主机计数
         self._new_count = 0  # 新产生计量账单计数
+        self._change_logs = None  # 一页server计量日内的变更记录，{server_id: [ServerArchive]}
+
+    shard_loop_names = ('server', 'archive')
 
     def run(self, raise_exception: bool = None):
         print(f'Server metering start, {self.start_datetime} - {self.end_datetime}')
@@ -79,25 +256,53 @@ def run(self, raise_exception: bool = None):
         if raise_exception is not None:
             self.raise_exception = raise_exception
 
+        self.metered_ids = self.load_metered_ids()
         # 顺序先server后archive，因为数据库数据流向从server到archive
         self.metering_loop(loop_server=True)
         self.metering_loop(loop_server=False)
+        self.print_summary()
+
+    def print_summary(self):
         print(f'Metering {self._metering_server_count} servers, {self._metering_archieve_count} archieves, '
               f'all {self._metering_archieve_count + self._metering_server_count}, '
               f'new produce {self._new_count} metering bill.')
 
-    def metering_loop(self, loop_server):
-        last_creatition_time = None
+    def merge_counts(self, other):
+        self._metering_server_count += other._metering_server_count
+        self._metering_archieve_count += other._metering_archieve_count
+        self._new_count += other._new_count
+
+    def load_metered_ids(self) -> set:
+        metering_date = self.start_datetime.date()
+        qs = MeteringServer.objects.filter(date=metering_date).values_list('server_id', flat=True)
+        return set(qs)
+
+    def get_loop_queryset(self, loop_name: str):
+        if loop_name == 'server':
+            return self.get_servers_queryset(end_datetime=self.end_datetime)
+
+        return self.get_archives_queryset(start_datetime=self.start_datetime)
+
+    def metering_loop_range(self, loop_name: str, gte_creation_time=None, lt_creation_time=None):
+        self.metering_loop(
+            loop_server=(loop_name == 'server'),
+            gte_creation_time=gte_creation_time, lt_creation_time=lt_creation_time
+        )
+
+    def metering_loop(self, loop_server, gte_creation_time=None, lt_creation_time=None):
+        last_creatition_time = gte_creation_time
         last_id = ''
         continuous_error_count = 0  # 连续错误计数
         while True:
             try:
                 if loop_server:
                     servers = self.get_servers(
-                        gte_creation_time=last_creatition_time, end_datetime=self.end_datetime)
+                        gte_creation_time=last_creatition_time, end_datetime=self.end_datetime,
+                        lt_creation_time=lt_creation_time)
                 else:
                     servers = self.get_archives(
-                        gte_creation_time=last_creatition_time, start_datetime=self.start_datetime)
+                        gte_creation_time=last_creatition_time, start_datetime=self.start_datetime,
+                        lt_creation_time=lt_creation_time)
 
                 if len(servers) == 0:
                     break
@@ -106,13 +311,10 @@ def metering_loop(self, loop_server):
                 if servers[len(servers) - 1].id == last_id:
                     break
 
-                for s in servers:
-                    if s.id == last_id:
-                        continue
-
-                    self.metering_server_or_archive(s)
-                    last_creatition_time = s.creation_time
-                    last_id = s.id
+                objs = [s for s in servers if s.id != last_id]
+                self.metering_servers_or_archives(objs)
+                last_creatition_time = objs[-1].creation_time
+                last_id = objs[-1].id
 
                 continuous_error_count = 0
             except Exception as e:
@@ -126,11 +328,44 @@ def metering_loop(self, loop_server):
 
                 time.sleep(continuous_error_count / 100)  # 10ms - 1000ms
 
+    def metering_servers_or_archives(self, objs: list):
+        """
+        计量一页server或归档server，新的计量记录批量插入
+        """
+        server_ids = [obj.server_id if isinstance(obj, ServerArchive) else obj.id for obj in objs]
+        self.prefetch_change_logs(server_ids=server_ids)
+        items = []
+        for obj in objs:
+            item = self._build_server_or_archive_metering(obj)
+            if item is not None:
+                items.append(item)
+
+        meterings = [mt for mt, _, _ in items]
+        if self.bulk_create_meterings(model=MeteringServer, meterings=meterings):
+            self._new_count += len(meterings)
+            self.get_metered_ids().update(mt.server_id for mt in meterings)
+            return
+
+        for metering, total_hours, trade_amount in items:
+            self._save_metering(metering=metering, total_hours=total_hours, trade_amount=trade_amount)
+
     def metering_server_or_archive(self, obj):
+        item = self._build_server_or_archive_metering(obj)
+        if item is None:
+            return None
+
+        metering, total_hours, trade_amount = item
+        return self._save_metering(metering=metering, total_hours=total_hours, trade_amount=trade_amount)
+
+    def _build_server_or_archive_metering(self, obj):
+        """
+        :return:
+            None    # 不需要计量，或者已计量
+            (MeteringServer(), total_hours, trade_amount)     # 未保存的计量记录
+        """
         if obj.creation_time >= self.end_datetime:
             return None
 
-        metering_date = self.start_datetime.date()
         if isinstance(obj, Server):
             server_id = obj.id
             meter_end = self.end_datetime
@@ -142,9 +377,8 @@ def metering_server_or_archive(self, obj):
         else:
             return None
 
-        metering = self.server_metering_exists(metering_date=metering_date, server_id=server_id)
-        if metering is not None:
-            return metering
+        if server_id in self.get_metered_ids():
+            return None
 
         return self._metering_one_server_or_archive(
             server_or_archive=obj, server_id=server_id, server_start_time=obj.start_time, server_meter_end=meter_end)
@@ -190,7 +424,7 @@ def _metering_one_server_or_archive(
         else:
             trade_amount = None
 
-        metering = self.save_server_or_archive_metering_record(
+        metering = self.build_server_or_archive_metering_record(
             server_or_archive=server_or_archive,
             ip_hours=ip_hours,
             cpu_hours=cpu_hours,
@@ -199,7 +433,7 @@ def _metering_one_server_or_archive(
             trade_amount=trade_amount,
             total_hours=total_hours
         )
-        return metering
+        return metering, total_hours, trade_amount
 
     def _server_delta_hours(self, server_or_archive: ServerBase, meter_end: datetime):
         """
@@ -239,12 +473,28 @@ def save_server_or_archive_metering_record(
 
         :raises: Exception
         """
+        metering = self.build_server_or_archive_metering_record(
+            server_or_archive=server_or_archive, ip_hours=ip_hours, cpu_hours=cpu_hours,
+            ram_gb_hours=ram_gb_hours, disk_gb_hours=disk_gb_hours, trade_amount=trade_amount, total_hours=total_hours
+        )
+        return self._save_metering(metering=metering, total_hours=total_hours, trade_amount=trade_amount)
+
+    def build_server_or_archive_metering_record(
+            self, server_or_archive: ServerBase, ip_hours, cpu_hours, ram_gb_hours, disk_gb_hours,
+            trade_amount: Decimal, total_hours: float
+    ):
+        """
+        构建server或归档server计量日期的资源使用量记录，未保存
+
+        :return:
+            MeteringServer()
+        """
         if isinstance(server_or_archive, ServerArchive):
             server_id = server_or_archive.server_id
         else:
             server_id = server_or_archive.id
 
-        return self.save_metering_record(
+        return self.build_metering_record(
             server_base=server_or_archive, service_id=server_or_archive.service_id, server_id=server_id,
             vo_id=server_or_archive.vo_id, user_id=server_or_archive.user_id,
             ip_hours=ip_hours, cpu_hours=cpu_hours, ram_gb_hours=ram_gb_hours, disk_gb_hours=disk_gb_hours,
@@ -265,6 +515,25 @@ def save_metering_record(
 
         :raises: Exception
         """
+        metering = self.build_metering_record(
+            server_base=server_base, service_id=service_id, server_id=server_id, vo_id=vo_id, user_id=user_id,
+            ip_hours=ip_hours, cpu_hours=cpu_hours, ram_gb_hours=ram_gb_hours, disk_gb_hours=disk_gb_hours,
+            trade_amount=trade_amount, total_hours=total_hours
+        )
+        return self._save_metering(metering=metering, total_hours=total_hours, trade_amount=trade_amount)
+
+    def build_metering_record(
+            self, server_base: ServerBase,
+            service_id, server_id, vo_id, user_id,
+            ip_hours, cpu_hours, ram_gb_hours, disk_gb_hours,
+            trade_amount: Decimal, total_hours: float
+    ):
+        """
+        构建server计量日期的资源使用量记录，未保存
+
+        :return:
+            MeteringServer()
+        """
         metering_date = self.start_datetime.date()
         metering = MeteringServer(
             service_id=service_id,
@@ -281,23 +550,25 @@ def save_metering_record(
             metering.vo_id = vo_id
             metering.owner_type = MeteringServer.OwnerType.VO.value
             metering.user_id = ''
-            vo = VirtualOrganization.objects.filter(id=vo_id).first()
-            vo_name = vo.name if vo else ''
-            metering.vo_name = vo_name
+            metering.vo_name = self.get_vo_name(vo_id)
         else:
             metering.vo_id = ''
             metering.owner_type = MeteringServer.OwnerType.USER.value
             metering.user_id = user_id
-            user = UserProfile.objects.filter(id=user_id).first()
-            username = user.username if user else ''
-            metering.username = username
+            metering.username = self.get_username(user_id)
 
         self.metering_bill_amount(_metering=metering, hours=total_hours, auto_commit=False, trade_amount=trade_amount)
+        return metering
+
+    def _save_metering(self, metering: MeteringServer, total_hours: float, trade_amount: Decimal):
+        """
+        :raises: Exception
+        """
         try:
             metering.save(force_insert=True)
             self._new_count += 1
         except Exception as e:
-            _metering = self.server_metering_exists(metering_date=metering_date, server_id=server_id)
+            _metering = self.server_metering_exists(metering_date=metering.date, server_id=metering.server_id)
             if _metering is None:
                 raise e
             if _metering.original_amount != metering.original_amount:
@@ -306,6 +577,7 @@ def save_metering_record(
 
             metering = _metering
 
+        self.get_metered_ids().add(metering.server_id)
         return metering
 
     def metering_one_server_change_type_hours(self, server_id, server_start_time: datetime, _type: str):
@@ -319,10 +591,7 @@ def metering_one_server_change_type_hours(self, server_id, server_start_time: da
         total_hours = 0.0
 
         meter_end_time = min(server_start_time, self.end_datetime)
-        archives = ServerArchive.objects.filter(
-            server_id=server_id, archive_type=_type,
-            start_time__lt=meter_end_time, deleted_time__gt=self.start_datetime
-        ).all()
+        archives = self.get_server_change_logs(server_id=server_id, _type=_type, meter_end_time=meter_end_time)
         for archive in archives:
             start = max(self.start_datetime, archive.start_time)
             end = min(meter_end_time, archive.deleted_time)
@@ -337,6 +606,35 @@ def metering_one_server_change_type_hours(self, server_id, server_start_time: da
 
         return total_hours, ip_hours, cpu_hours, ram_gb_hours, disk_gb_hours
 
+    def prefetch_change_logs(self, server_ids: list):
+        """
+        一次查询多个server计量日内可能需要计量的变更记录（修改配置、按量付费转包年包月），按server id分组缓存
+        """
+        change_logs = {sid: [] for sid in server_ids}
+        archives = ServerArchive.objects.filter(
+            server_id__in=server_ids,
+            archive_type__in=[ServerArchive.ArchiveType.REBUILD.value, ServerArchive.ArchiveType.POST2PRE.value],
+            start_time__lt=self.end_datetime, deleted_time__gt=self.start_datetime
+        ).all()
+        for archive in archives:
+            change_logs[archive.server_id].append(archive)
+
+        self._change_logs = change_logs
+
+    def get_server_change_logs(self, server_id, _type: str, meter_end_time: datetime):
+        """
+        server计量日内 meter_end_time 之前的变更记录，优先使用预先查询缓存的
+        """
+        if self._change_logs is not None and server_id in self._change_logs:
+            return [
+                a for a in self._change_logs[server_id] if a.archive_type == _type and a.start_time < meter_end_time
+            ]
+
+        return ServerArchive.objects.filter(
+            server_id=server_id, archive_type=_type,
+            start_time__lt=meter_end_time, deleted_time__gt=self.start_datetime
+        ).all()
+
     def metering_one_server_rebuild_hours(self, server_id, server_start_time: datetime):
         """
         从计量日的开始时间 到 server start_time之前 这段时间内 可能存在server修改配置的记录 需要计量
@@ -373,14 +671,18 @@ def get_server_metering_hours(server: ServerBase, hours: float):
         return ip_hours, cpu_hours, ram_gb_hours, disk_gb_hours
 
     @staticmethod
-    def get_servers_queryset(end_datetime, gte_creation_time=None):
+    def get_servers_queryset(end_datetime, gte_creation_time=None, lt_creation_time=None):
         """
         查询server查询集, 按创建时间正序排序
         * 创建时间在计量周期结束时间之前的都可能需要计量
         * 不能用 start_time 做为查询条件，start_time是根据资源变更变动的，可能不在计量周期内，但是可能在变更记录有资源用量需要计量
         :param end_datetime: 计量日结束时间点
         :param gte_creation_time: 大于等于创建时间，用于断点续查
+        :param lt_creation_time: 小于创建时间，用于分片
         """
+        if lt_creation_time is not None:
+            end_datetime = min(end_datetime, lt_creation_time)
+
         lookups = {
             'creation_time__lt': end_datetime,
             'task_status': Server.TASK_CREATED_OK
@@ -392,18 +694,20 @@ def get_servers_queryset(end_datetime, gte_creation_time=None):
         return queryset
 
     @wrap_close_old_connections
-    def get_servers(self, gte_creation_time, end_datetime, limit: int = 100):
-        queryset = self.get_servers_queryset(gte_creation_time=gte_creation_time, end_datetime=end_datetime)
+    def get_servers(self, gte_creation_time, end_datetime, limit: int = 100, lt_creation_time=None):
+        queryset = self.get_servers_queryset(
+            gte_creation_time=gte_creation_time, end_datetime=end_datetime, lt_creation_time=lt_creation_time)
         return queryset[0:limit]
 
     @staticmethod
-    def get_archives_queryset(start_datetime, gte_creation_time=None):
+    def get_archives_queryset(start_datetime, gte_creation_time=None, lt_creation_time=None):
         """
         查询归档的server查询集, 按创建时间正序排序
         * 删除时间在计量周期之内的server
         * 不能用 start_time 做为查询条件，start_time是根据资源变更变动的，可能不在计量周期内，但是可能在变更记录有资源用量需要计量
         :param start_datetime: 计量日开始时间点
         :param gte_creation_time: 大于等于创建时间，用于断点续查
+        :param lt_creation_time: 小于创建时间，用于分片
         """
         lookups = {
             'deleted_time__gt': start_datetime,
@@ -412,14 +716,17 @@ def get_archives_queryset(start_datetime, gte_creation_time=None):
         }
         if gte_creation_time is not None:
             lookups['creation_time__gte'] = gte_creation_time
+        if lt_creation_time is not None:
+            lookups['creation_time__lt'] = lt_creation_time
 
         return ServerArchive.objects.filter(**lookups).order_by('creation_time', 'id')
 
     @wrap_close_old_connections
-    def get_archives(self, start_datetime, gte_creation_time=None, limit: int = 100):
+    def get_archives(self, start_datetime, gte_creation_time=None, limit: int = 100, lt_creation_time=None):
         queryset = self.get_archives_queryset(
             start_datetime=start_datetime,
-            gte_creation_time=gte_creation_time
+            gte_creation_time=gte_creation_time,
+            lt_creation_time=lt_creation_time
         )
         return queryset[0:limit]
 
@@ -460,16 +767,21 @@ class StorageMeasurer(BaseMeasurer):
     对象存储计量
     """
 
-    def __init__(self, metering_date: date = None, raise_exception: bool = False):
+    def __init__(self, metering_date: date = None, raise_exception: bool = False, async_stats: bool = False):
         """
         :param metering_date: 指定计量日期
         :param raise_exception: True 发生错误直接抛出
+        :param async_stats: True(每页桶的统计信息并发异步预查询)
         """
         super().__init__(metering_date=metering_date, raise_exception=raise_exception)
         self.price_mgr = PriceManager()
+        self.async_stats = async_stats
         self._metering_bucket_count = 0  # 计量的桶的数目 这里暂时不用考虑归档的桶
         self._new_count = 0  # 新产生的计量账单的数目
         self._error_http_count = 0   # 请求桶容量的错误的数目
+        self._bucket_stats = {}     # 一页桶预查询的统计信息，{bucket_id: BucketStatsOutput}
+
+    shard_loop_names = ('bucket',)
 
     def run(self, raise_exception: bool = None):
         print(f'Storage Metering start, {self.start_datetime} - {self.end_datetime}')
@@ -480,29 +792,47 @@ def run(self, raise_exception: bool = None):
         if raise_exception is not None:
             self.raise_exception = raise_exception
 
+        self.metered_ids = self.load_metered_ids()
         self.metering_loop()
+        self.print_summary()
 
+    def print_summary(self):
         print(f'Metering {self._metering_bucket_count} buckets, new produce {self._new_count} metering bill，'
               f'Error http request about bucket {self._error_http_count}.')
 
-    def metering_loop(self):
-        last_creation_time = None
+    def merge_counts(self, other):
+        self._metering_bucket_count += other._metering_bucket_count
+        self._new_count += other._new_count
+        self._error_http_count += other._error_http_count
+
+    def load_metered_ids(self) -> set:
+        metering_date = self.start_datetime.date()
+        qs = MeteringObjectStorage.objects.filter(date=metering_date).values_list('storage_bucket_id', flat=True)
+        return set(qs)
+
+    def get_loop_queryset(self, loop_name: str):
+        return self.get_buckets_queryset()
+
+    def metering_loop_range(self, loop_name: str, gte_creation_time=None, lt_creation_time=None):
+        self.metering_loop(gte_creation_time=gte_creation_time, lt_creation_time=lt_creation_time)
+
+    def metering_loop(self, gte_creation_time=None, lt_creation_time=None):
+        last_creation_time = gte_creation_time
         last_id = ''
         continuous_error_count = 0
         while True:
             try:
-                buckets = self.get_buckets(gte_creation_time=last_creation_time)
+                buckets = self.get_buckets(gte_creation_time=last_creation_time, lt_creation_time=lt_creation_time)
                 if len(buckets) == 0:
                     break
                 # 多个creation_time 的数据相同时，会查询到多个数据 (计量过的也会重复查询到)
                 if buckets[len(buckets) - 1].id == last_id:
                     break
-                for b in buckets:
-                    if b.id == last_id:
-                        continue
-                    self.metering_bucket(b)
-                    last_creation_time = b.creation_time
-                    last_id = b.id
+
+                objs = [b for b in buckets if b.id != last_id]
+                self.metering_buckets(objs)
+                last_creation_time = objs[-1].creation_time
+                last_id = objs[-1].id
 
                 continuous_error_count = 0
             except Exception as e:
@@ -516,15 +846,53 @@ def metering_loop(self):
 
                 time.sleep(continuous_error_count / 100)  # 10ms - 1000ms
 
+    def metering_buckets(self, buckets: list):
+        """
+        计量一页桶，新的计量记录批量插入
+        """
+        if self.async_stats:
+            self.prefetch_bucket_stats(buckets=buckets)
+
+        items = []
+        for bucket in buckets:
+            self._metering_bucket_count += 1
+            item = self._build_bucket_metering(bucket=bucket)
+            if item is not None:
+                items.append(item)
+
+        meterings = [mt for mt, _ in items]
+        if self.bulk_create_meterings(model=MeteringObjectStorage, meterings=meterings):
+            self._new_count += len(meterings)
+            self.get_metered_ids().update(mt.storage_bucket_id for mt in meterings)
+            return
+
+        for metering, hours in items:
+            self._save_metering(metering=metering, hours=hours)
+
     def metering_bucket(self, obj):
         self._metering_bucket_count += 1
         return self.metering_one_bucket(bucket=obj)
 
     def metering_one_bucket(self, bucket: Bucket):
         metering_date = self.start_datetime.date()
-        metering = self.bucket_metering_exists(metering_date=metering_date, bucket_id=bucket.id)
-        if metering is not None:
-            return metering
+        if bucket.id in self.get_metered_ids():
+            return self.bucket_metering_exists(metering_date=metering_date, bucket_id=bucket.id)
+
+        item = self._build_bucket_metering(bucket=bucket)
+        if item is None:
+            return None
+
+        metering, hours = item
+        return self._save_metering(metering=metering, hours=hours)
+
+    def _build_bucket_metering(self, bucket: Bucket):
+        """
+        :return:
+            None    # 不需要计量，或者已计量
+            (MeteringObjectStorage(), hours)     # 未保存的计量记录
+        """
+        if bucket.id in self.get_metered_ids():
+            return None
         '''
         这里和云主机的区别在于 没有start_time 的字段
         需要统计的是 桶中的对象的size大小
@@ -547,10 +915,12 @@ def metering_one_bucket(self, bucket: Bucket):
             return None
 
         storage_size_gib = storage_size_byte / 1024**3
-        metering = self.save_bucket_metering_record(
-            bucket=bucket, storage_gib_hours=storage_size_gib * hours, storage_byte=storage_size_byte, hours=hours
+        metering = self.build_metering_record(
+            service=bucket.service, user_id=bucket.user_id, storage_bucket_id=bucket.id,
+            bucket_name=bucket.name, creation_time=bucket.creation_time,
+            storage_gib_hours=storage_size_gib * hours, storage_byte=storage_size_byte, hours=hours
         )
-        return metering
+        return metering, hours
 
     def save_bucket_metering_record(self, bucket: Bucket, storage_gib_hours, storage_byte: int, hours: float):
         return self.save_metering_record(
@@ -567,12 +937,25 @@ def save_metering_record(
            创建当前日期的桶的计量记录
            :return MeteringObjectStorage
         """
+        metering = self.build_metering_record(
+            service=service, user_id=user_id, storage_bucket_id=storage_bucket_id, bucket_name=bucket_name,
+            creation_time=creation_time, storage_gib_hours=storage_gib_hours, storage_byte=storage_byte, hours=hours
+        )
+        return self._save_metering(metering=metering, hours=hours)
+
+    def build_metering_record(
+            self, service, user_id, storage_bucket_id, bucket_name, creation_time, storage_gib_hours,
+            storage_byte: int, hours: float
+    ):
+        """
+           构建当前日期的桶的计量记录，未保存
+           :return MeteringObjectStorage
+        """
         metering_date = self.start_datetime.date()
-        username = UserProfile.objects.filter(id=user_id).first()
         metering = MeteringObjectStorage(
             service=service,
             user_id=user_id,
-            username=username,
+            username=self.get_username(user_id),
             storage_bucket_id=storage_bucket_id,
             bucket_name=bucket_name,
             date=metering_date,
@@ -582,18 +965,22 @@ def save_metering_record(
             storage_byte=storage_byte
         )
         self.metering_bill_amount(_metering=metering, hours=hours, auto_commit=False)
+        return metering
 
+    def _save_metering(self, metering: MeteringObjectStorage, hours: float):
         try:
             metering.save(force_insert=True)
             self._new_count += 1
         except Exception as e:
-            _metering = self.bucket_metering_exists(bucket_id=storage_bucket_id, metering_date=metering_date)
+            _metering = self.bucket_metering_exists(
+                bucket_id=metering.storage_bucket_id, metering_date=metering.date)
             if _metering is None:
                 raise e
             if _metering.original_amount != metering.original_amount:
                 self.metering_bill_amount(_metering=_metering, hours=hours, auto_commit=True)
             metering = _metering
 
+        self.get_metered_ids().add(metering.storage_bucket_id)
         return metering
 
     @staticmethod
@@ -617,23 +1004,30 @@ def metering_bill_amount(self, _metering: MeteringObjectStorage, hours: float, a
 
         return _metering
 
-    @staticmethod
-    def get_bucket_metering_size(bucket: Bucket):
+    def prefetch_bucket_stats(self, buckets: list):
+        """
+        并发异步查询一页桶的统计信息
+        """
+        buckets = [
+            b for b in buckets if b.id not in self.get_metered_ids() and b.creation_time < self.end_datetime
+        ]
+        try:
+            self._bucket_stats = BucketStatsCollector().collect(buckets=buckets)
+        except Exception as exc:
+            self._bucket_stats = {}
+            print(f'Error prefetch buckets stats, {str(exc)}')
+
+    def get_bucket_metering_size(self, bucket: Bucket):
         """
+        预查询的桶统计信息有效时直接使用，否则同步请求
+
         :return:
             None    # 桶记录和对象存储服务中桶数据可能不一致, 不计费
             int     # ok
         """
-        bucket_name = bucket.name
-        bucket_service = bucket.service
-        params = inputs.BucketStatsInput(bucket_name=bucket_name)
-        try:
-            r = request.request_service(service=bucket_service, method='bucket_stats', params=params)
-        except errors.APIException as exc:
-            if exc.code in ['Adapter.NoSuchBucket', 'Adapter.AuthenticationFailed', 'Adapter.AccessDenied']:
-                raise exc
-            else:
-                r = request.request_service(service=bucket_service, method='bucket_stats', params=params)
+        r = self._bucket_stats.pop(bucket.id, None)
+        if r is None or not r.ok:
+            r = self.request_bucket_stats(bucket=bucket)
 
         # 桶记录和对象存储服务中桶数据可能不一致
         if r.username and r.username != bucket.user.username:
@@ -649,9 +1043,23 @@ def get_bucket_metering_size(bucket: Bucket):
 
         return r.bucket_size_byte
 
+    @staticmethod
+    def request_bucket_stats(bucket: Bucket):
+        """
+        :raises: APIException
+        """
+        params = inputs.BucketStatsInput(bucket_name=bucket.name)
+        try:
+            return request.request_service(service=bucket.service, method='bucket_stats', params=params)
+        except errors.APIException as exc:
+            if exc.code in ['Adapter.NoSuchBucket', 'Adapter.AuthenticationFailed', 'Adapter.AccessDenied']:
+                raise exc
+            else:
+                return request.request_service(service=bucket.service, method='bucket_stats', params=params)
+
     @wrap_close_old_connections
-    def get_buckets(self, gte_creation_time, limit: int = 100):
-        queryset = self.get_buckets_queryset(gte_creation_time=gte_creation_time)
+    def get_buckets(self, gte_creation_time, limit: int = 100, lt_creation_time=None):
+        queryset = self.get_buckets_queryset(gte_creation_time=gte_creation_time, lt_creation_time=lt_creation_time)
         return queryset[0:limit]
 
     @staticmethod
@@ -659,14 +1067,17 @@ def bucket_metering_exists(bucket_id, metering_date: date):
         return MeteringObjectStorage.objects.filter(date=metering_date, storage_bucket_id=bucket_id).first()
 
     @staticmethod
-    def get_buckets_queryset(gte_creation_time=None):
+    def get_buckets_queryset(gte_creation_time=None, lt_creation_time=None):
         """
         查询bucket的集合， 按照创建的时间 以及 id 正序排序
         :param gte_creation_time: 大于等于给定的创建时间，用于断点查询
+        :param lt_creation_time: 小于给定的创建时间，用于分片
         """
         lookups = {}
         if gte_creation_time is not None:
             lookups['creation_time__gte'] = gte_creation_time
+        if lt_creation_time is not None:
+            lookups['creation_time__lt'] = lt_creation_time
 
         queryset = Bucket.objects.select_related('service').filter(**lookups).order_by('creation_time', 'id')
         return queryset
@@ -683,6 +1094,9 @@ def __init__(self, metering_date: date = None, raise_exception: bool = False):
         self._metering_normal_disk_count = 0  # 计量正常云硬盘计数
         self._metering_deleted_disk_count = 0  # 计量已删除云硬盘计数
         self._new_count = 0  # 新产生计量账单计数
+        self._change_logs = None  # 一页disk计量日内的变更记录，{disk_id: [DiskChangeLog]}
+
+    shard_loop_names = ('normal', 'deleted')
 
     def run(self, raise_exception: bool = None):
         print(f'Disk metering start, {self.start_datetime} - {self.end_datetime}')
@@ -693,31 +1107,59 @@ def run(self, raise_exception: bool = None):
         if raise_exception is not None:
             self.raise_exception = raise_exception
 
+        self.metered_ids = self.load_metered_ids()
         self.loop_normal_disks()
         self.loop_deleted_disks()
+        self.print_summary()
+
+    def print_summary(self):
         print(f'Metering {self._metering_normal_disk_count} normal disks, '
               f'{self._metering_deleted_disk_count} deleted disks, '
               f'all {self._metering_normal_disk_count + self._metering_deleted_disk_count}, '
               f'new produce {self._new_count} metering bill.')
 
+    def merge_counts(self, other):
+        self._metering_normal_disk_count += other._metering_normal_disk_count
+        self._metering_deleted_disk_count += other._metering_deleted_disk_count
+        self._new_count += other._new_count
+
+    def load_metered_ids(self) -> set:
+        metering_date = self.start_datetime.date()
+        qs = MeteringDisk.objects.filter(date=metering_date).values_list('disk_id', flat=True)
+        return set(qs)
+
+    def get_loop_queryset(self, loop_name: str):
+        if loop_name == 'normal':
+            return self.get_normal_disk_queryset(end_datetime=self.end_datetime)
+
+        return self.get_deleted_disk_queryset(start_datetime=self.start_datetime)
+
+    def metering_loop_range(self, loop_name: str, gte_creation_time=None, lt_creation_time=None):
+        self._metering_loop(
+            loop_normal_disk=(loop_name == 'normal'),
+            gte_creation_time=gte_creation_time, lt_creation_time=lt_creation_time
+        )
+
     def loop_normal_disks(self):
         self._metering_loop(loop_normal_disk=True)
 
     def loop_deleted_disks(self):
         self._metering_loop(loop_normal_disk=False)
 
-    def _metering_loop(self, loop_normal_disk=False):
-        last_creatition_time = None
+    def _metering_loop(self, loop_normal_disk=False, gte_creation_time=None, lt_creation_time=None):
+        last_creatition_time = gte_creation_time
         last_id = ''
         continuous_error_count = 0
         while True:
             try:
                 if loop_normal_disk:
                     disks = self.get_normal_disks(
-                        gte_creation_time=last_creatition_time, end_datetime=self.end_datetime)
+                        gte_creation_time=last_creatition_time, end_datetime=self.end_datetime,
+                        lt_creation_time=lt_creation_time)
                 else:
                     disks = self.get_deleted_disks(
-                        gte_creation_time=last_creatition_time, start_datetime=self.start_datetime)
+                        gte_creation_time=last_creatition_time, start_datetime=self.start_datetime,
+                        lt_creation_time=lt_creation_time)
 
                 if len(disks) == 0:
                     break
@@ -726,13 +1168,10 @@ def _metering_loop(self, loop_normal_disk=False):
                 if disks[len(disks) - 1].id == last_id:
                     break
 
-                for dk in disks:
-                    if dk.id == last_id:
-                        continue
-
-                    self.metering_disk(dk)
-                    last_creatition_time = dk.creation_time
-                    last_id = dk.id
+                objs = [dk for dk in disks if dk.id != last_id]
+                self.metering_disks(objs)
+                last_creatition_time = objs[-1].creation_time
+                last_id = objs[-1].id
 
                 continuous_error_count = 0
             except Exception as e:
@@ -746,7 +1185,38 @@ def _metering_loop(self, loop_normal_disk=False):
 
                 time.sleep(continuous_error_count / 100)  # 10ms - 1000ms
 
+    def metering_disks(self, disks: list):
+        """
+        计量一页disk，新的计量记录批量插入
+        """
+        self.prefetch_change_logs(disk_ids=[dk.id for dk in disks])
+        meterings = []
+        for dk in disks:
+            metering = self._build_disk_metering(dk)
+            if metering is not None:
+                meterings.append(metering)
+
+        if self.bulk_create_meterings(model=MeteringDisk, meterings=meterings):
+            self._new_count += len(meterings)
+            self.get_metered_ids().update(mt.disk_id for mt in meterings)
+            return
+
+        for metering in meterings:
+            self._save_metering(metering=metering)
+
     def metering_disk(self, disk: Disk):
+        metering = self._build_disk_metering(disk)
+        if metering is None:
+            return None
+
+        return self._save_metering(metering=metering)
+
+    def _build_disk_metering(self, disk: Disk):
+        """
+        :return:
+            None    # 不需要计量，或者已计量
+            MeteringDisk()     # 未保存的计量记录
+        """
         if disk.creation_time >= self.end_datetime:
             return None
 
@@ -758,10 +1228,8 @@ def metering_disk(self, disk: Disk):
             meter_end = self.end_datetime
 
         disk_id = disk.id
-        metering_date = self.start_datetime.date()
-        metering = self.disk_metering_exists(metering_date=metering_date, disk_id=disk_id)
-        if metering is not None:
-            return metering
+        if disk_id in self.get_metered_ids():
+            return None
 
         delta_hours, need_other = self._disk_delta_hours(disk=disk, meter_end=meter_end)
         size_gib_hours = disk.size * delta_hours
@@ -779,10 +1247,9 @@ def metering_disk(self, disk: Disk):
             original_amount += must_pay_amount
             trade_amount += must_pay_amount
 
-        metering = self.save_disk_metering_record(
+        return self.build_disk_metering_record(
             disk=disk, size_gib_hours=size_gib_hours, original_amount=original_amount, trade_amount=trade_amount
         )
-        return metering
 
     def _disk_delta_hours(self, disk: Disk, meter_end: datetime):
         need_other = False  # 是否需要计量其他可能存在的用量
@@ -815,6 +1282,15 @@ def save_disk_metering_record(
 
         :raises: Exception
         """
+        metering = self.build_disk_metering_record(
+            disk=disk, size_gib_hours=size_gib_hours, original_amount=original_amount, trade_amount=trade_amount)
+        return self._save_metering(metering=metering)
+
+    def build_disk_metering_record(
+            self, disk: Disk, size_gib_hours: float, original_amount: Decimal, trade_amount: Decimal) -> MeteringDisk:
+        """
+        构建disk计量日期的资源使用量记录，未保存
+        """
         metering_date = self.start_datetime.date()
         metering = MeteringDisk(
             service_id=disk.service_id,
@@ -830,38 +1306,45 @@ def save_disk_metering_record(
             metering.vo_id = disk.vo_id
             metering.owner_type = OwnerType.VO.value
             metering.user_id = ''
-            vo = VirtualOrganization.objects.filter(id=disk.vo_id).first()
-            vo_name = vo.name if vo else ''
-            metering.vo_name = vo_name
+            metering.vo_name = self.get_vo_name(disk.vo_id)
         else:
             metering.vo_id = ''
             metering.owner_type = OwnerType.USER.value
             metering.user_id = disk.user_id
-            user = UserProfile.objects.filter(id=disk.user_id).first()
-            username = user.username if user else ''
-            metering.username = username
+            metering.username = self.get_username(disk.user_id)
 
+        return metering
+
+    def _save_metering(self, metering: MeteringDisk) -> MeteringDisk:
+        """
+        :raises: Exception
+        """
         try:
             metering.save(force_insert=True)
             self._new_count += 1
         except Exception as e:
-            _metering = self.disk_metering_exists(metering_date=metering_date, disk_id=disk.id)
+            _metering = self.disk_metering_exists(metering_date=metering.date, disk_id=metering.disk_id)
             if _metering is None:
                 raise e
 
             metering = _metering
 
+        self.get_metered_ids().add(metering.disk_id)
         return metering
 
     @staticmethod
-    def get_normal_disk_queryset(end_datetime, gte_creation_time=None):
+    def get_normal_disk_queryset(end_datetime, gte_creation_time=None, lt_creation_time=None):
         """
         查询正常的disk查询集, 按创建时间正序排序
 
         * 不能用 start_time 做为查询条件，start_time是根据资源变更变动的，可能不在计量周期内，但是可能在变更记录有资源用量需要计量
         :param end_datetime: 计量日结束时间点
         :param gte_creation_time: 大于等于创建时间，用于断点续查
+        :param lt_creation_time: 小于创建时间，用于分片
         """
+        if lt_creation_time is not None:
+            end_datetime = min(end_datetime, lt_creation_time)
+
         lookups = {
             'creation_time__lt': end_datetime,
             'task_status': Disk.TaskStatus.OK.value,
@@ -874,18 +1357,20 @@ def get_normal_disk_queryset(end_datetime, gte_creation_time=None):
         return queryset
 
     @wrap_close_old_connections
-    def get_normal_disks(self, gte_creation_time, end_datetime, limit: int = 100):
-        queryset = self.get_normal_disk_queryset(gte_creation_time=gte_creation_time, end_datetime=end_datetime)
+    def get_normal_disks(self, gte_creation_time, end_datetime, limit: int = 100, lt_creation_time=None):
+        queryset = self.get_normal_disk_queryset(
+            gte_creation_time=gte_creation_time, end_datetime=end_datetime, lt_creation_time=lt_creation_time)
         return queryset[0:limit]
 
     @staticmethod
-    def get_deleted_disk_queryset(start_datetime, gte_creation_time=None):
+    def get_deleted_disk_queryset(start_datetime, gte_creation_time=None, lt_creation_time=None):
         """
         查询已删除的disk查询集, 按创建时间正序排序
 
         * 不能用 start_time 做为查询条件，start_time是根据资源变更变动的，可能不在计量周期内，但是可能在变更记录有资源用量需要计量
         :param start_datetime: 计量日开始时间点
         :param gte_creation_time: 大于等于创建时间，用于断点续查
+        :param lt_creation_time: 小于创建时间，用于分片
         """
         lookups = {
             'deleted_time__gt': start_datetime,
@@ -894,14 +1379,17 @@ def get_deleted_disk_queryset(start_datetime, gte_creation_time=None):
         }
         if gte_creation_time is not None:
             lookups['creation_time__gte'] = gte_creation_time
+        if lt_creation_time is not None:
+            lookups['creation_time__lt'] = lt_creation_time
 
         return Disk.objects.filter(**lookups).order_by('creation_time', 'id')
 
     @wrap_close_old_connections
-    def get_deleted_disks(self, start_datetime, gte_creation_time=None, limit: int = 100):
+    def get_deleted_disks(self, start_datetime, gte_creation_time=None, limit: int = 100, lt_creation_time=None):
         queryset = self.get_deleted_disk_queryset(
             start_datetime=start_datetime,
-            gte_creation_time=gte_creation_time
+            gte_creation_time=gte_creation_time,
+            lt_creation_time=lt_creation_time
         )
         return queryset[0:limit]
 
@@ -927,11 +1415,7 @@ def metering_one_disk_change_type_hours(self, disk_id, disk_start_time: datetime
         size_gb_hours = 0
 
         meter_end_time = min(disk_start_time, self.end_datetime)
-        disk_changes = DiskChangeLog.objects.filter(
-            disk_id=disk_id, log_type=_type,
-            start_time__lt=meter_end_time, change_time__gt=self.start_datetime
-        ).all()
-
+        disk_changes = self.get_disk_change_logs(disk_id=disk_id, _type=_type, meter_end_time=meter_end_time)
         for disk in disk_changes:
             start = max(self.start_datetime, disk.start_time)
             end = min(meter_end_time, disk.change_time)
@@ -941,6 +1425,37 @@ def metering_one_disk_change_type_hours(self, disk_id, disk_start_time: datetime
 
         return size_gb_hours
 
+    def prefetch_change_logs(self, disk_ids: list):
+        """
+        一次查询多个disk计量日内可能需要计量的变更记录，按disk id分组缓存
+        """
+        change_logs = {did: [] for did in disk_ids}
+        disk_changes = DiskChangeLog.objects.filter(
+            disk_id__in=disk_ids, log_type=DiskChangeLog.LogType.POST2PRE.value,
+            start_time__lt=self.end_datetime, change_time__gt=self.start_datetime
+        ).all()
+        for dc in disk_changes:
+            change_logs[dc.disk_id].append(dc)
+
+        self._change_logs = change_logs
+
+    def get_disk_change_logs(self, disk_id, _type: str, meter_end_time: datetime):
+        """
+        disk计量日内 meter_end_time 之前的变更记录，优先使用预先查询缓存的
+        """
+        if (
+            self._change_logs is not None and disk_id in self._change_logs
+            and _type == DiskChangeLog.LogType.POST2PRE.value
+        ):
+            return [
+                dc for dc in self._change_logs[disk_id] if dc.start_time < meter_end_time
+            ]
+
+        return DiskChangeLog.objects.filter(
+            disk_id=disk_id, log_type=_type,
+            start_time__lt=meter_end_time, change_time__gt=self.start_datetime
+        ).all()
+
     def metering_one_disk_post2pre_hours(self, disk_id, disk_start_time: datetime):
         """
         从计量日的开始时间 到 min(disk_start_time, 计量日期截止时间)之前 这段时间内 可能存在disk按量转包年包月变更的记录 需要计量
@@ -1,4 +1,7 @@
 from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
 
 from apps.app_metering.models import (
     PaymentStatus, DailyStatementServer, DailyStatementObjectStorage, DailyStatementDisk, DailyStatementMonitorWebsite
@@ -6,13 +9,78 @@
 from apps.app_metering.payment import MeteringPaymentManager
 
 
-class PayMeteringServer:
-    def __init__(self, app_id: str, pay_date: date = None):
+class BatchPayMixin:
+    """
+    按支付人（用户或vo组）分组批量扣费，不同支付人的账单在线程池中并行扣费，线程各自使用独立的数据库连接
+
+    批量扣费未成功的账单再逐个扣费，结果与逐个扣费一致
+    """
+    pay_subject = ''
+    max_workers = 4
+
+    def get_remark(self, bill) -> str:
+        raise NotImplementedError('get_remark')
+
+    def do_pay_one_bill(self, bill) -> bool:
+        raise NotImplementedError('do_pay_one_bill')
+
+    def do_pay_bills(self, bills: list):
+        """
+        :return:
+            (success_count, failed_count)
+        """
+        payer_bills = {}
+        for bill in bills:
+            payer_bills.setdefault((bill.is_owner_type_user(), bill.get_owner_id()), []).append(bill)
+
+        success_count = failed_count = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for ok_count, fail_count in executor.map(self.do_pay_payer_bills, payer_bills.values()):
+                success_count += ok_count
+                failed_count += fail_count
+
+        return success_count, failed_count
+
+    def do_pay_payer_bills(self, bills: list):
+        """
+        批量扣费一个支付人的账单
+
+        :return:
+            (success_count, failed_count)
+        """
+        try:
+            try:
+                failed = MeteringPaymentManager().pay_owner_daily_statement_bills(
+                    daily_statements=bills, app_id=self.app_id, subject=self.pay_subject,
+                    executor='metering', get_remark=self.get_remark, required_enough_balance=False
+                )
+                retry_bills = [b for b in bills if b.id in failed]
+            except Exception as exc:
+                retry_bills = bills
+
+            failed_count = 0
+            for bill in retry_bills:
+                if not self.do_pay_one_bill(bill=bill):
+                    failed_count += 1
+
+            return len(bills) - failed_count, failed_count
+        finally:
+            connection.close()
+
+
+class PayMeteringServer(BatchPayMixin):
+    pay_subject = '云服务器按量计费'
+
+    def __init__(self, app_id: str, pay_date: date = None, batch: bool = False, max_workers: int = 4):
         """
         :param pay_date: 指定只扣费那个计费日的云主机日结算单
+        :param batch: True(按支付人分组批量并行扣费)
+        :param max_workers: 批量扣费并行的线程数
         """
         self.app_id = app_id
         self.pay_date = pay_date
+        self.batch = batch
+        self.max_workers = max_workers
         self.count = 0
         self.success_count = 0
         self.failed_count = 0
@@ -36,14 +104,20 @@ def run(self):
             if m_length == 0:
                 break
 
-            for m in meterings:
-                ok = self.do_pay_one_bill(bill=m)
-                if ok:
-                    self.success_count += 1
-                else:
-                    self.failed_count += 1
-
-                last_creation_time = m.creation_time
+            if self.batch:
+                ok_count, fail_count = self.do_pay_bills(bills=list(meterings))
+                self.success_count += ok_count
+                self.failed_count += fail_count
+                last_creation_time = meterings[m_length - 1].creation_time
+            else:
+                for m in meterings:
+                    ok = self.do_pay_one_bill(bill=m)
+                    if ok:
+                        self.success_count += 1
+                    else:
+                        self.failed_count += 1
+
+                    last_creation_time = m.creation_time
 
             print(f'扣费 {m_length} 云主机日结算单.')
 
@@ -66,18 +140,21 @@ def get_metering_queryset(self):
 
         return queryset
 
+    def get_remark(self, bill) -> str:
+        return f'server, {bill.date}'
+
     def do_pay_one_bill(self, bill: DailyStatementServer):
         pay_mgr = MeteringPaymentManager()
-        remark = f'server, {bill.date}'
+        remark = self.get_remark(bill)
         try:
             pay_mgr.pay_daily_statement_bill(
-                daily_statement=bill, app_id=self.app_id, subject='云服务器按量计费',
+                daily_statement=bill, app_id=self.app_id, subject=self.pay_subject,
                 executor='metering', remark=remark, required_enough_balance=False
             )
         except Exception as exc:
             try:
                 pay_mgr.pay_daily_statement_bill(
-                    daily_statement=bill, app_id=self.app_id, subject='云服务器按量计费',
+                    daily_statement=bill, app_id=self.app_id, subject=self.pay_subject,
                     executor='metering', remark=remark, required_enough_balance=False
                 )
             except Exception as exc:
@@ -87,14 +164,20 @@ def do_pay_one_bill(self, bill: DailyStatementServer):
         return True
 
 
-class PayMeteringObjectStorage:
-    def __init__(self, app_id: str, pay_date: date = None):
+class PayMeteringObjectStorage(BatchPayMixin):
+    pay_subject = '对象存储计费'
+
+    def __init__(self, app_id: str, pay_date: date = None, batch: bool = False, max_workers: int = 4):
         """
         :param app_id 支付的app
         :param pay_date 指定只扣费那个计费日的对象存储结算单
+        :param batch: True(按支付人分组批量并行扣费)
+        :param max_workers: 批量扣费并行的线程数
         """
         self.app_id = app_id
         self.pay_date = pay_date
+        self.batch = batch
+        self.max_workers = max_workers
         self.count = 0
         self.success_count = 0
         self.fail_count = 0
@@ -118,14 +201,20 @@ def run(self):
             if m_length == 0:
                 break
 
-            for m in meterings:
-                ok = self.do_pay_one_bill(bill=m)
-                if ok:
-                    self.success_count += 1
-                else:
-                    self.fail_count += 1
-
-                last_creation_time = m.creation_time
+            if self.batch:
+                ok_count, fail_count = self.do_pay_bills(bills=list(meterings))
+                self.success_count += ok_count
+                self.fail_count += fail_count
+                last_creation_time = meterings[m_length - 1].creation_time
+            else:
+                for m in meterings:
+                    ok = self.do_pay_one_bill(bill=m)
+                    if ok:
+                        self.success_count += 1
+                    else:
+                        self.fail_count += 1
+
+                    last_creation_time = m.creation_time
 
             print(f'扣费 {m_length} 对象存储日结算单')
 
@@ -149,18 +238,21 @@ def get_metering_queryset(self):
 
         return queryset
 
+    def get_remark(self, bill) -> str:
+        return f'ObjectStorage, {bill.date}'
+
     def do_pay_one_bill(self, bill: DailyStatementObjectStorage):
         pay_mgr = MeteringPaymentManager()
-        remark = f'ObjectStorage, {bill.date}'
+        remark = self.get_remark(bill)
         try:
             pay_mgr.pay_daily_statement_bill(
-                daily_statement=bill, app_id=self.app_id, subject='对象存储计费',
+                daily_statement=bill, app_id=self.app_id, subject=self.pay_subject,
                 executor='metering', remark=remark, required_enough_balance=False
             )
         except Exception as exc:
             try:
                 pay_mgr.pay_daily_statement_bill(
-                    daily_statement=bill, app_id=self.app_id, subject='对象存储计费',
+                    daily_statement=bill, app_id=self.app_id, subject=self.pay_subject,
                     executor='metering', remark=remark, required_enough_balance=False
                 )
             except Exception as exc:
@@ -169,13 +261,19 @@ def do_pay_one_bill(self, bill: DailyStatementObjectStorage):
         return True
 
 
-class PayMeteringDisk:
-    def __init__(self, app_id: str, pay_date: date = None):
+class PayMeteringDisk(BatchPayMixin):
+    pay_subject = '云硬盘按量计费'
+
+    def __init__(self, app_id: str, pay_date: date = None, batch: bool = False, max_workers: int = 4):
         """
         :param pay_date: 指定只扣费那个计费日的云硬盘日结算单
+        :param batch: True(按支付人分组批量并行扣费)
+        :param max_workers: 批量扣费并行的线程数
         """
         self.app_id = app_id
         self.pay_date = pay_date
+        self.batch = batch
+        self.max_workers = max_workers
         self.count = 0
         self.success_count = 0
         self.failed_count = 0
@@ -199,14 +297,20 @@ def run(self):
             if m_length == 0:
                 break
 
-            for m in meterings:
-                ok = self.do_pay_one_bill(bill=m)
-                if ok:
-                    self.success_count += 1
-                else:
-                    self.failed_count += 1
-
-                last_creation_time = m.creation_time
+            if self.batch:
+                ok_count, fail_count = self.do_pay_bills(bills=list(meterings))
+                self.success_count += ok_count
+                self.failed_count += fail_count
+                last_creation_time = meterings[m_length - 1].creation_time
+            else:
+                for m in meterings:
+                    ok = self.do_pay_one_bill(bill=m)
+                    if ok:
+                        self.success_count += 1
+                    else:
+                        self.failed_count += 1
+
+                    last_creation_time = m.creation_time
 
             print(f'扣费 {m_length} 云硬盘日结算单.')
 
@@ -229,18 +333,21 @@ def get_disk_statement_queryset(self):
 
         return queryset
 
+    def get_remark(self, bill) -> str:
+        return f'disk, {bill.date}'
+
     def do_pay_one_bill(self, bill: DailyStatementDisk):
         pay_mgr = MeteringPaymentManager()
-        remark = f'disk, {bill.date}'
+        remark = self.get_remark(bill)
         try:
             pay_mgr.pay_daily_statement_bill(
-                daily_statement=bill, app_id=self.app_id, subject='云硬盘按量计费',
+                daily_statement=bill, app_id=self.app_id, subject=self.pay_subject,
                 executor='metering', remark=remark, required_enough_balance=False
             )
         except Exception as exc:
             try:
                 pay_mgr.pay_daily_statement_bill(
-                    daily_statement=bill, app_id=self.app_id, subject='云硬盘按量计费',
+                    daily_statement=bill, app_id=self.app_id, subject=self.pay_subject,
                     executor='metering', remark=remark, required_enough_balance=False
                 )
             except Exception as exc:
@@ -250,13 +357,19 @@ def do_pay_one_bill(self, bill: DailyStatementDisk):
         return True
 
 
-class PayMeteringWebsite:
-    def __init__(self, app_id: str, pay_date: date = None):
+class PayMeteringWebsite(BatchPayMixin):
+    pay_subject = '站点监控按量计费'
+
+    def __init__(self, app_id: str, pay_date: date = None, batch: bool = False, max_workers: int = 4):
         """
         :param pay_date: 指定只扣费那个计费日的站点监控日结算单
+        :param batch: True(按支付人分组批量并行扣费)
+        :param max_workers: 批量扣费并行的线程数
         """
         self.app_id = app_id
         self.pay_date = pay_date
+        self.batch = batch
+        self.max_workers = max_workers
         self.count = 0
         self.success_count = 0
         self.failed_count = 0
@@ -280,14 +393,20 @@ def run(self):
             if m_length == 0:
                 break
 
-            for m in meterings:
-                ok = self.do_pay_one_bill(bill=m)
-                if ok:
-                    self.success_count += 1
-                else:
-                    self.failed_count += 1
-
-                last_creation_time = m.creation_time
+            if self.batch:
+                ok_count, fail_count = self.do_pay_bills(bills=list(meterings))
+                self.success_count += ok_count
+                self.failed_count += fail_count
+                last_creation_time = meterings[m_length - 1].creation_time
+            else:
+                for m in meterings:
+                    ok = self.do_pay_one_bill(bill=m)
+                    if ok:
+                        self.success_count += 1
+                    else:
+                        self.failed_count += 1
+
+                    last_creation_time = m.creation_time
 
             print(f'扣费 {m_length} 站点监控日结算单.')
 
@@ -309,18 +428,21 @@ def get_site_statement_queryset(self):
 
         return queryset
 
+    def get_remark(self, bill) -> str:
+        return f'website monitor, {bill.date}'
+
     def do_pay_one_bill(self, bill: DailyStatementMonitorWebsite):
         pay_mgr = MeteringPaymentManager()
-        remark = f'website monitor, {bill.date}'
+        remark = self.get_remark(bill)
         try:
             pay_mgr.pay_daily_statement_bill(
-                daily_statement=bill, app_id=self.app_id, subject='站点监控按量计费',
+                daily_statement=bill, app_id=self.app_id, subject=self.pay_subject,
                 executor='metering', remark=remark, required_enough_balance=False
             )
         except Exception as exc:
             try:
                 pay_mgr.pay_daily_statement_bill(
-                    daily_statement=bill, app_id=self.app_id, subject='站点监控按量计费',
+                    daily_statement=bill, app_id=self.app_id, subject=self.pay_subject,
                     executor='metering', remark=remark, required_enough_balance=False
                 )
             except Exception as exc:
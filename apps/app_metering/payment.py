@@ -1,11 +1,15 @@
 from decimal import Decimal
+from typing import List, Callable
 
 from django.utils.translation import gettext as _
 from django.db import transaction
 
 from core import errors
+from utils.model import OwnerType
 from apps.app_metering.models import PaymentStatus, DailyStatementBase
+from apps.app_wallet.models import PayAppService, PaymentHistory, CashCoupon, CashCouponPaymentHistory, TransactionBill
 from apps.app_wallet.managers.payment import PaymentManager
+from apps.app_wallet.managers.cash_coupon import CashCouponManager
 
 
 class MeteringPaymentManager:
@@ -110,3 +114,131 @@ def _pay_daily_statement_bill(
             raise exc
         except Exception as exc:
             raise errors.Error.from_error(exc)
+
+    def pay_owner_daily_statement_bills(
+            self, daily_statements: List[DailyStatementBase], app_id: str, subject: str,
+            executor: str, get_remark: Callable[[DailyStatementBase], str], required_enough_balance: bool = True
+    ):
+        """
+        批量支付同一个支付人（用户或vo组）的多个计量计费账单
+
+        在一个事务中，支付人的账户和资源券只加锁查询一次，按账单顺序在内存中逐个扣款，
+        支付记录、资源券扣款记录和交易流水批量写入，扣款结果与逐个账单支付一致
+
+        :param daily_statements: 同一支付人的DailyStatementBase子类对象，按支付顺序
+        :param get_remark: 返回账单支付记录备注信息的函数
+        :return:
+            {daily_statement_id: Error}     # 未支付的账单和错误，其他账单已支付
+        :raises: Error     # 批量写入错误，事务回滚，所有账单都未支付
+        """
+        if not daily_statements:
+            return {}
+
+        model = type(daily_statements[0])
+        failed = {}
+        with transaction.atomic():
+            bills = model.objects.select_for_update().in_bulk([s.id for s in daily_statements])
+            app_service_ids = {s.get_pay_app_service_id() for s in daily_statements}
+            app_services = PayAppService.objects.in_bulk([i for i in app_service_ids if i])
+            exists_order_ids = set(PaymentHistory.objects.filter(
+                order_id__in=list(bills.keys()), app_id=app_id).values_list('order_id', flat=True))
+
+            payer = None  # (account, coupons, payer_id, payer_name, payer_type)
+            paid_bills = []
+            pay_historys = []
+            cc_historys = []
+            tbills = []
+            for statement in daily_statements:
+                bill = bills.get(statement.id)
+                try:
+                    if bill is None:
+                        raise errors.Error(message=_('账单不存在'))
+
+                    remark = get_remark(bill)
+                    self._pre_payment_bill_inspect(daily_statement=bill, remark=remark)
+                    if bill.payable_amount == Decimal('0'):
+                        bill.payment_history_id = ''
+                        bill.trade_amount = Decimal('0')
+                        bill.payment_status = PaymentStatus.PAID.value
+                        paid_bills.append(bill)
+                        continue
+
+                    app_service_id = statement.get_pay_app_service_id()
+                    app_service = app_services.get(app_service_id)
+                    if app_service is None:
+                        raise errors.ConflictError(
+                            message=_('无效的app_service_id，指定的APP子服务不存在'), code='InvalidAppServiceId'
+                        )
+                    if app_service.app_id != app_id:
+                        raise errors.ConflictError(
+                            message=_('无效的app_service_id，指定的APP子服务不属于你的APP'), code='InvalidAppServiceId'
+                        )
+                    if bill.id in exists_order_ids:
+                        raise errors.ConflictError(
+                            message=_('已存在订单编号为%(value)s的交易记录') % {'value': bill.id}, code='OrderIdExist'
+                        )
+
+                    if payer is None:
+                        payer = self._get_payer_account_coupons(bill=bill)
+
+                    account, coupons, payer_id, payer_name, payer_type = payer
+                    usable_coupons, unusable_coupons = CashCouponManager.sorting_usable_coupons(
+                        coupons=coupons, app_service_id=app_service_id, order_id=bill.id
+                    )
+                    pay_history, ccphs, tbill = self.payment.build_payment_records(
+                        account=account, usable_coupons=usable_coupons, payer_id=payer_id, payer_name=payer_name,
+                        payer_type=payer_type, app_id=app_id, subject=subject, amounts=bill.payable_amount,
+                        executor=executor, remark=remark, order_id=bill.id, app_service_id=app_service_id,
+                        instance_id='', only_coupon=False, required_enough_balance=required_enough_balance
+                    )
+                except errors.Error as exc:
+                    failed[statement.id] = exc
+                    continue
+                except Exception as exc:
+                    failed[statement.id] = errors.Error.from_error(exc)
+                    continue
+
+                pay_historys.append(pay_history)
+                cc_historys += ccphs
+                tbills.append(tbill)
+                bill.payment_history_id = pay_history.id
+                bill.trade_amount = -(pay_history.amounts + pay_history.coupon_amount)
+                bill.payment_status = PaymentStatus.PAID.value
+                paid_bills.append(bill)
+
+            try:
+                if payer is not None:
+                    account = payer[0]
+                    account.save(update_fields=['balance'])
+
+                deducted_coupons = {ccph.cash_coupon.id: ccph.cash_coupon for ccph in cc_historys}
+                CashCoupon.objects.bulk_update(list(deducted_coupons.values()), fields=['balance'])
+                PaymentHistory.objects.bulk_create(pay_historys)
+                CashCouponPaymentHistory.objects.bulk_create(cc_historys)
+                TransactionBill.objects.bulk_create(tbills)
+                model.objects.bulk_update(paid_bills, fields=['payment_history_id', 'trade_amount', 'payment_status'])
+            except Exception as exc:
+                raise errors.Error(message=_('计量计费账单批量支付时错误.') + str(exc))
+
+        return failed
+
+    def _get_payer_account_coupons(self, bill: DailyStatementBase):
+        """
+        加锁查询账单支付人的账户和所有有效资源券
+
+        :return:
+            (account, coupons, payer_id, payer_name, payer_type)
+        """
+        owner_id = bill.get_owner_id()
+        if bill.is_owner_type_user():
+            coupons = CashCouponManager().get_user_cash_coupons(
+                user_id=owner_id, coupon_ids=None, select_for_update=True
+            )
+            account = self.payment.get_user_point_account(user_id=owner_id, select_for_update=True)
+            return account, coupons, owner_id, account.user.username, OwnerType.USER.value
+
+        coupons = CashCouponManager().get_vo_cash_coupons(
+            vo_id=owner_id, coupon_ids=None, select_for_update=True
+        )
+        account = self.payment.get_vo_point_account(vo_id=owner_id, select_for_update=True)
+        return account, coupons, owner_id, account.vo.name, OwnerType.VO.value
@@ -1,8 +1,10 @@
 from datetime import timedelta, date
 from decimal import Decimal
+from functools import reduce
+import operator
 
 from django.utils import timezone
-from django.db.models import Sum
+from django.db.models import Sum, Q, Case, When, Value, F, CharField
 from django.db import transaction
 
 from apps.app_metering.models import (
@@ -15,6 +17,12 @@
 
 
 class BaseGeneratorStatement:
+    # 计量记录是否区分所有者类型（用户和vo组）
+    has_owner_type = False
+    # 计量记录是否按服务单元分组聚合
+    group_by_service = True
+    # 每个事务批量处理的日结算单数
+    chunk_size = 500
 
     def __init__(self, statement_date: date = None, raise_exception: bool = False):
         """
@@ -31,210 +39,207 @@ def __init__(self, statement_date: date = None, raise_exception: bool = False):
 
         self.statement_date = statement_date.date()
         self.raise_exception = raise_exception
-
-
-class GenerateDailyStatementServer(BaseGeneratorStatement):
-
-    def __init__(self, statement_date: date = None, raise_exception: bool = False):
-        """
-        :param statement_date: 日结算单日期
-        :param raise_exception: True(发生错误直接抛出退出)
-        """
-        super().__init__(statement_date=statement_date, raise_exception=raise_exception)
         self._user_daily_statement_count = 0  # 用户日结算单计数
         self._vo_daily_statement_count = 0  # VO组日结算单计数
         self._new_count = 0  # 新产生的日结算单计数
 
-    def run(self, raise_exception: bool = None):
-        print(f'generate {self.statement_date} daily statement start: ')
-        if self.statement_date >= timezone.now().date():
-            print('Exit, date invalid')
-            return
-
-        if raise_exception is not None:
-            self.raise_exception = raise_exception
+    def get_statement_metering_queryset(self):
+        """
+        日结算单需要聚合的计量记录查询集
+        """
+        raise NotImplementedError('`get_statement_metering_queryset()` must be implemented.')
 
-        # 用户的日结算单
-        self.generate_user_daily_statement()
-        # VO组的日结算单
-        self.generate_vo_daily_statement()
+    def get_daily_statement_queryset(self):
+        """
+        日结算单日期的所有日结算单
+        """
+        raise NotImplementedError('`get_daily_statement_queryset()` must be implemented.')
 
-        print(f'generate {self._user_daily_statement_count} user daily statements,',
-              f'generate {self._vo_daily_statement_count} vo daily statements,',
-              f'all {self._user_daily_statement_count + self._vo_daily_statement_count}.\n',
-              f'new generate {self._new_count} daily statements.')
+    def build_daily_statement_record(
+            self, service_id, original_amount, payable_amount, owner_type: str, owner_id: str, owner_name: str
+    ):
+        """
+        构建日结算单记录，未保存
+        """
+        raise NotImplementedError('`build_daily_statement_record()` must be implemented.')
 
-    def generate_user_daily_statement(self):
+    def generate_daily_statements(self):
         """
-        生成用户的日结算单
+        一次分组聚合所有计量记录，分批在事务中批量创建或更新日结算单，并批量更新计量记录的日结算单id
         """
-        user_id_qs = self.get_users()
-        for u in user_id_qs:  # 每个user：按服务单元聚合
-            user_id = u['user_id']
-            if not user_id:
-                continue
+        metering_qs = self.get_statement_metering_queryset()
+        rows = self.aggregate_owner_meterings(metering_qs)
 
-            user = UserProfile.objects.filter(id=user_id).first()
-            if user is None:
-                continue
+        # 已存在的日结算单，多个时和按创建时间倒序的第一个一致
+        statements = {}
+        for st in self.get_daily_statement_queryset():
+            statements.setdefault(self._statement_key(st), st)
 
-            # 该用户当天所有的计量记录
-            user_meterings = self.get_user_metering_queryset(user_id=user.id)
-            # 按服务单元聚合
-            agg_meterings = self.aggregate_metering_server(user_meterings)
-            for agg_metering in agg_meterings:
-                self.save_user_daily_statement_record(
-                    user=user, agg_metering=agg_metering, user_meterings=user_meterings
-                )
+        for i in range(0, len(rows), self.chunk_size):
+            self._generate_chunk_statements(
+                rows=rows[i:i + self.chunk_size], statements=statements, metering_qs=metering_qs)
 
-    def generate_vo_daily_statement(self):
-        """
-        生成vo组的日结算单
-        """
-        vo_id_qs = self.get_vos()
-        for v in vo_id_qs:  # 每个vo：按服务单元聚合
-            vo_id = v['vo_id']
-            if not vo_id:
+    def _generate_chunk_statements(self, rows: list, statements: dict, metering_qs):
+        user_ids = [owner_id for owner_type, owner_id, _ in rows if owner_type == OwnerType.USER.value]
+        vo_ids = [owner_id for owner_type, owner_id, _ in rows if owner_type == OwnerType.VO.value]
+        owner_names = {
+            OwnerType.USER.value: dict(UserProfile.objects.filter(id__in=user_ids).values_list('id', 'username')),
+            OwnerType.VO.value: dict(VirtualOrganization.objects.filter(id__in=vo_ids).values_list('id', 'name'))
+        }
+
+        new_statements = []
+        update_statements = []
+        changed = []    # [(owner_type, owner_id, service_id, daily_statement)]
+        for owner_type, owner_id, row in rows:
+            if owner_id not in owner_names[owner_type]:     # 用户或vo组不存在
                 continue
 
-            vo = VirtualOrganization.objects.filter(id=vo_id).first()
-            if vo is None:
+            service_id = row.get('service_id')
+            daily_statement = statements.get((owner_type, owner_id, service_id))
+            if daily_statement is None:
+                daily_statement = self.build_daily_statement_record(
+                    service_id=service_id, original_amount=row['st_original_amount'],
+                    payable_amount=row['payable_amount'], owner_type=owner_type, owner_id=owner_id,
+                    owner_name=owner_names[owner_type][owner_id]
+                )
+                daily_statement.enforce_id()
+                new_statements.append(daily_statement)
+            elif (
+                row['st_original_amount'] == daily_statement.original_amount
+                and row['payable_amount'] == daily_statement.payable_amount
+            ):  # 金额一致
                 continue
+            else:   # 金额不一致, 更新
+                daily_statement.original_amount = row['st_original_amount']
+                daily_statement.payable_amount = row['payable_amount']
+                update_statements.append(daily_statement)
 
-            # 该vo组当天所有的计量记录
-            vo_meterings = self.get_vo_metering_queryset(vo_id=vo.id)
-            # 按服务单元聚合
-            agg_meterings = self.aggregate_metering_server(vo_meterings)
-            for agg_metering in agg_meterings:
-                self.save_vo_daily_statement_record(vo=vo, agg_metering=agg_metering, vo_meterings=vo_meterings)
+            changed.append((owner_type, owner_id, service_id, daily_statement))
 
-    def get_metering_queryset(self):
-        """
-        获取statement_date当天所有后付费metering_server记录
-        """
-        lookups = {
-            'date': self.statement_date,
-            'pay_type': PayType.POSTPAID.value
-        }
+        if not changed:
+            return
 
-        return MeteringServer.objects.filter(**lookups)
+        model = self.get_daily_statement_queryset().model
+        with transaction.atomic():
+            if new_statements:
+                model.objects.bulk_create(new_statements)
+            if update_statements:
+                model.objects.bulk_update(update_statements, fields=['original_amount', 'payable_amount'])
 
-    def get_vos(self):
-        """
-        获得所有vo组
-        """
-        queryset = self.get_metering_queryset()
-        return queryset.filter(owner_type=OwnerType.VO.value).values('vo_id').order_by('vo_id').distinct()
+            # 更新计量记录的daily_statement_id字段
+            whens = []
+            for owner_type, owner_id, service_id, daily_statement in changed:
+                q = self._metering_owner_q(owner_type=owner_type, owner_id=owner_id, service_id=service_id)
+                whens.append(When(q, then=Value(daily_statement.id)))
 
-    def get_users(self):
-        """
-        获得所有用户
-        """
-        queryset = self.get_metering_queryset()
-        return queryset.filter(owner_type=OwnerType.USER.value).values(
-            'user_id').order_by('user_id').distinct()
+            metering_qs.filter(reduce(operator.or_, [w.condition for w in whens])).update(
+                daily_statement_id=Case(*whens, default=F('daily_statement_id'), output_field=CharField())
+            )
 
-    def get_vo_metering_queryset(self, vo_id):
-        """
-        获得某个vo组的计量记录
-        """
-        queryset = self.get_metering_queryset()
-        return queryset.filter(vo_id=vo_id, owner_type=OwnerType.VO.value)
+        self._new_count += len(new_statements)
+        for owner_type, _, _, daily_statement in changed:
+            statements[self._statement_key(daily_statement)] = daily_statement
+            if owner_type == OwnerType.VO.value:
+                self._vo_daily_statement_count += 1
+            else:
+                self._user_daily_statement_count += 1
 
-    def get_user_metering_queryset(self, user_id):
+    def aggregate_owner_meterings(self, metering_qs) -> list:
         """
-        获得某个用户的计量记录
+        计量记录按所有者（和服务单元）分组聚合，每种所有者类型一次查询
+
+        :return:
+            [(owner_type, owner_id, {'service_id': x, 'st_original_amount': x, 'payable_amount': x})]
         """
-        queryset = self.get_metering_queryset()
-        return queryset.filter(user_id=user_id, owner_type=OwnerType.USER.value)
+        if self.has_owner_type:
+            owners = [(OwnerType.USER.value, 'user_id'), (OwnerType.VO.value, 'vo_id')]
+        else:
+            owners = [(OwnerType.USER.value, 'user_id')]
+
+        rows = []
+        for owner_type, owner_field in owners:
+            qs = metering_qs
+            if self.has_owner_type:
+                qs = qs.filter(owner_type=owner_type)
+
+            group_fields = [owner_field, 'service_id'] if self.group_by_service else [owner_field]
+            agg_rows = qs.values(*group_fields).annotate(
+                st_original_amount=Sum('original_amount'),
+                payable_amount=Sum('trade_amount')
+            ).order_by(*group_fields)
+            for row in agg_rows:
+                owner_id = row[owner_field]
+                if owner_id:
+                    rows.append((owner_type, owner_id, row))
+
+        return rows
 
     @staticmethod
-    def aggregate_metering_server(queryset):
-        """
-        按服务单元聚合        
-        """
-        queryset = queryset.values('service_id').annotate(
-            st_original_amount=Sum('original_amount'),
-            payable_amount=Sum('trade_amount')
-        ).order_by('service_id')
-
-        return queryset
-
-    def save_user_daily_statement_record(self, user: UserProfile, agg_metering, user_meterings):
-        st_date = self.statement_date
-        # 插入新的日结算单前先判断是否已经存在
-        daily_statement = self.user_daily_statement_exists(
-            statement_date=st_date, service_id=agg_metering['service_id'], user_id=user.id)
-        # 已存在
-        if daily_statement is not None:
-            # 金额一致
-            if (
-                    agg_metering['st_original_amount'] == daily_statement.original_amount
-                    and agg_metering['payable_amount'] == daily_statement.payable_amount
-            ):
-                return daily_statement
+    def _statement_key(daily_statement):
+        owner_type = getattr(daily_statement, 'owner_type', OwnerType.USER.value)
+        owner_id = daily_statement.vo_id if owner_type == OwnerType.VO.value else daily_statement.user_id
+        return owner_type, owner_id, getattr(daily_statement, 'service_id', None)
+
+    def _metering_owner_q(self, owner_type: str, owner_id: str, service_id):
+        if owner_type == OwnerType.VO.value:
+            q = Q(owner_type=OwnerType.VO.value, vo_id=owner_id)
+        else:
+            q = Q(user_id=owner_id)
+            if self.has_owner_type:
+                q &= Q(owner_type=OwnerType.USER.value)
 
-        with transaction.atomic():
-            if daily_statement is None:
-                # 不存在, 插入新的日结算单记录
-                daily_statement = self.save_daily_statement_record(
-                    service_id=agg_metering['service_id'], original_amount=agg_metering['st_original_amount'],
-                    payable_amount=agg_metering['payable_amount'],
-                    user_id=user.id, username=user.username,
-                )
-            else:  # 金额一致, 更新
-                self.update_daily_statement_amount(agg_metering=agg_metering, daily_statement=daily_statement)
+        if self.group_by_service:
+            q &= Q(service_id=service_id)
 
-            self._user_daily_statement_count += 1
-            # 更新计量记录metering_server的daily_statement_id字段
-            self.update_metering_server(meterings=user_meterings, daily_statement=daily_statement)
+        return q
 
-        return daily_statement
 
-    def save_vo_daily_statement_record(self, vo: VirtualOrganization, agg_metering, vo_meterings):
-        st_date = self.statement_date
-        # 插入新的日结算单前先判断是否已经存在
-        daily_statement = self.vo_daily_statement_exists(
-            statement_date=st_date, service_id=agg_metering['service_id'], vo_id=vo.id)
-        # 已存在
-        if daily_statement is not None:
-            # 金额一致
-            if (
-                    agg_metering['st_original_amount'] == daily_statement.original_amount
-                    and agg_metering['payable_amount'] == daily_statement.payable_amount
-            ):
-                return daily_statement
+class GenerateDailyStatementServer(BaseGeneratorStatement):
+    has_owner_type = True
 
-        with transaction.atomic():
-            if daily_statement is None:
-                # 不存在, 插入新的日结算单记录
-                daily_statement = self.save_daily_statement_record(
-                    service_id=agg_metering['service_id'], original_amount=agg_metering['st_original_amount'],
-                    payable_amount=agg_metering['payable_amount'],
-                    vo_id=vo.id, vo_name=vo.name,
-                )
-            else:
-                self.update_daily_statement_amount(agg_metering=agg_metering, daily_statement=daily_statement)
+    def run(self, raise_exception: bool = None):
+        print(f'generate {self.statement_date} daily statement start: ')
+        if self.statement_date >= timezone.now().date():
+            print('Exit, date invalid')
+            return
 
-            self._vo_daily_statement_count += 1
-            # 更新计量记录metering_server的daily_statement_id字段
-            self.update_metering_server(meterings=vo_meterings, daily_statement=daily_statement)
+        if raise_exception is not None:
+            self.raise_exception = raise_exception
 
-        return daily_statement
+        # 用户和VO组的日结算单
+        self.generate_daily_statements()
 
-    def save_daily_statement_record(
-            self, service_id, original_amount, payable_amount,
-            user_id: str = None, username: str = None,
-            vo_id: str = None, vo_name: str = None,
-    ):
+        print(f'generate {self._user_daily_statement_count} user daily statements,',
+              f'generate {self._vo_daily_statement_count} vo daily statements,',
+              f'all {self._user_daily_statement_count + self._vo_daily_statement_count}.\n',
+              f'new generate {self._new_count} daily statements.')
+
+    def get_statement_metering_queryset(self):
+        return self.get_metering_queryset()
+
+    def get_daily_statement_queryset(self):
+        return DailyStatementServer.objects.filter(date=self.statement_date)
+
+    def get_metering_queryset(self):
         """
-        创建日结算单记录
+        获取statement_date当天所有后付费metering_server记录
         """
-        st_date = self.statement_date
+        lookups = {
+            'date': self.statement_date,
+            'pay_type': PayType.POSTPAID.value
+        }
+
+        return MeteringServer.objects.filter(**lookups)
 
+    def build_daily_statement_record(
+            self, service_id, original_amount, payable_amount, owner_type: str, owner_id: str, owner_name: str
+    ):
+        """
+        构建日结算单记录，未保存
+        """
         daily_statement = DailyStatementServer(
             service_id=service_id,
-            date=st_date,
+            date=self.statement_date,
             original_amount=original_amount,
             payable_amount=payable_amount,
             trade_amount=0,
@@ -242,35 +247,17 @@ def save_daily_statement_record(
             payment_history_id=''
         )
 
-        if user_id is not None:
-            daily_statement.user_id = user_id
-            daily_statement.username = username
+        if owner_type == OwnerType.USER.value:
+            daily_statement.user_id = owner_id
+            daily_statement.username = owner_name
             daily_statement.owner_type = OwnerType.USER.value
-        elif vo_id is not None:
-            daily_statement.vo_id = vo_id
-            daily_statement.vo_name = vo_name
+        else:
+            daily_statement.vo_id = owner_id
+            daily_statement.vo_name = owner_name
             daily_statement.owner_type = OwnerType.VO.value
 
-        try:
-            daily_statement.save(force_insert=True)
-            self._new_count += 1
-        except Exception as e:
-            raise e
-
         return daily_statement
 
-    @staticmethod
-    def update_metering_server(meterings, daily_statement):
-        for metering in meterings:
-            if metering.service_id == daily_statement.service_id:
-                metering.set_daily_statement_id(daily_statement_id=daily_statement.id)
-
-    @staticmethod
-    def update_daily_statement_amount(agg_metering, daily_statement):
-        daily_statement.original_amount = agg_metering['st_original_amount']
-        daily_statement.payable_amount = agg_metering['payable_amount']
-        daily_statement.save(update_fields=['original_amount', 'payable_amount'])
-
     @staticmethod
     def user_daily_statement_exists(statement_date: date, service_id, user_id: str):
         return DailyStatementServer.objects.filter(
@@ -287,16 +274,6 @@ def vo_daily_statement_exists(statement_date: date, service_id, vo_id: str):
 
 
 class GenerateDailyStatementObjectStorage(BaseGeneratorStatement):
-
-    def __init__(self, statement_date: date = None, raise_exception: bool = False):
-        """
-        :param statement_date: 日结算账单日期
-        :param raise_exception: True(发生错误直接抛出异常)
-        """
-        super().__init__(statement_date=statement_date, raise_exception=raise_exception)
-        self._user_daily_statement_count = 0
-        self._new_count = 0
-
     def run(self, raise_exception: bool = None):
         print(f'generate {self.statement_date} daily statement start: ')
         if self.statement_date >= timezone.now().date():
@@ -307,39 +284,16 @@ def run(self, raise_exception: bool = None):
             self.raise_exception = raise_exception
 
         # 用户的日结算单
-        self.generate_user_daily_statement()
+        self.generate_daily_statements()
 
         print(f'generate {self._user_daily_statement_count} user daily statements,',
               f'new generate {self._new_count} daily statements.')
 
-    def generate_user_daily_statement(self):
-        """
-        生成用户的日结算单
-        """
-        user_id_qs = self.get_users()
-        for u in user_id_qs:
-            user_id = u['user_id']
-            if not user_id:
-                continue
-            user = UserProfile.objects.filter(id=user_id).first()
-            if user is None:
-                continue
-
-            user_meterings = self.get_user_metering_queryset(user_id=user.id)
+    def get_statement_metering_queryset(self):
+        return self.get_metering_queryset()
 
-            agg_meterings = self.aggregate_metering_storage(user_meterings)
-
-            for agg_metering in agg_meterings:
-                self.save_user_daily_statement_record(
-                    user=user, agg_metering=agg_metering, user_meterings=user_meterings
-                )
-
-    def get_users(self):
-        """
-        获得所有用户
-        """
-        queryset = self.get_metering_queryset()
-        return queryset.values('user_id').order_by('user_id').distinct()
+    def get_daily_statement_queryset(self):
+        return DailyStatementObjectStorage.objects.filter(date=self.statement_date)
 
     def get_metering_queryset(self):
         """
@@ -350,113 +304,33 @@ def get_metering_queryset(self):
         }
         return MeteringObjectStorage.objects.filter(**lookups)
 
-    def get_user_metering_queryset(self, user_id):
-        """
-        获取某个用户的计量记录
-        """
-        queryset = self.get_metering_queryset()
-        return queryset.filter(user_id=user_id)
-
-    @staticmethod
-    def aggregate_metering_storage(queryset):
-        """
-        根据服务单元进行聚合
-        """
-        queryset = queryset.values('service_id').annotate(
-            st_original_amount=Sum('original_amount'),
-            payable_amount=Sum('trade_amount')
-        ).order_by('service_id')
-
-        return queryset
-
-    def save_user_daily_statement_record(self, user: UserProfile, agg_metering, user_meterings):
-        st_date = self.statement_date
-        # 插入新的日期之前需要判断是否已经存在了
-        daily_statement = self.user_daily_statement_exists(
-            statement_date=st_date, service_id=agg_metering['service_id'], user_id=user.id)
-
-        if daily_statement is not None:
-            if (
-                    agg_metering['st_original_amount'] == daily_statement.original_amount
-                    and agg_metering['payable_amount'] == daily_statement.payable_amount
-            ):
-                return daily_statement
-
-        with transaction.atomic():
-            if daily_statement is None:
-                daily_statement = self.save_daily_statement_record(
-                    service_id=agg_metering['service_id'], original_amount=agg_metering['st_original_amount'],
-                    payable_amount=agg_metering['payable_amount'],
-                    user_id=user.id, username=user.username,
-                )
-            else:
-                self.update_daily_statement_amount(agg_metering=agg_metering, daily_statement=daily_statement)
-
-            self._user_daily_statement_count += 1
-            # 更新计量记录的daily_statement_id 字段
-            self.update_metering_storage(meterings=user_meterings, daily_statement=daily_statement)
-
-        return daily_statement
-
-    @staticmethod
-    def update_metering_storage(meterings, daily_statement):
-        for metering in meterings:
-            if metering.service_id == daily_statement.service_id:
-                metering.set_daily_statement_id(daily_statement_id=daily_statement.id)
-
     @staticmethod
     def user_daily_statement_exists(statement_date: date, service_id, user_id: str):
         return DailyStatementObjectStorage.objects.filter(
             date=statement_date, user_id=user_id, service_id=service_id
         ).first()
 
-    @staticmethod
-    def update_daily_statement_amount(agg_metering, daily_statement):
-        daily_statement.original_amount = agg_metering['st_original_amount']
-        daily_statement.payable_amount = agg_metering['payable_amount']
-        daily_statement.save(update_fields=['original_amount', 'payable_amount'])
-
-    def save_daily_statement_record(
-            self, service_id, original_amount, payable_amount,
-            user_id: str = None, username: str = None,
+    def build_daily_statement_record(
+            self, service_id, original_amount, payable_amount, owner_type: str, owner_id: str, owner_name: str
     ):
         """
-        创建日结算单
+        构建日结算单，未保存
         """
-        st_date = self.statement_date
-
-        daily_statement = DailyStatementObjectStorage(
+        return DailyStatementObjectStorage(
             service_id=service_id,
-            date=st_date,
+            date=self.statement_date,
             original_amount=original_amount,
             payable_amount=payable_amount,
             trade_amount=0,
             payment_status=PaymentStatus.UNPAID.value,
-            payment_history_id=''
+            payment_history_id='',
+            user_id=owner_id,
+            username=owner_name
         )
 
-        if user_id is not None:
-            daily_statement.user_id = user_id
-            daily_statement.username = username
-        try:
-            daily_statement.save(force_insert=True)
-            self._new_count += 1
-        except Exception as e:
-            raise e
-
-        return daily_statement
-
 
 class DiskDailyStatementGenerater(BaseGeneratorStatement):
-    def __init__(self, statement_date: date = None, raise_exception: bool = False):
-        """
-        :param statement_date: 日结算单日期
-        :param raise_exception: True(发生错误直接抛出退出)
-        """
-        super().__init__(statement_date=statement_date, raise_exception=raise_exception)
-        self._user_daily_statement_count = 0  # 用户日结算单计数
-        self._vo_daily_statement_count = 0  # VO组日结算单计数
-        self._new_count = 0  # 新产生的日结算单计数
+    has_owner_type = True
 
     def run(self, raise_exception: bool = None):
         print(f'Disk generate {self.statement_date} daily statement start: ')
@@ -467,59 +341,19 @@ def run(self, raise_exception: bool = None):
         if raise_exception is not None:
             self.raise_exception = raise_exception
 
-        # 用户的日结算单
-        self.generate_user_disk_statement()
-        # VO组的日结算单
-        self.generate_vo_disk_statement()
+        # 用户和VO组的日结算单
+        self.generate_daily_statements()
 
         print(f'generate {self._user_daily_statement_count} user disk daily statements,',
               f'generate {self._vo_daily_statement_count} vo disk daily statements,',
               f'all {self._user_daily_statement_count + self._vo_daily_statement_count}.\n',
               f'new generate {self._new_count} disk daily statements.')
 
-    def generate_user_disk_statement(self):
-        """
-        生成用户的日结算单
-        """
-        user_id_qs = self.get_users()
-        for u in user_id_qs:  # 每个user：按服务单元聚合
-            user_id = u['user_id']
-            if not user_id:
-                continue
-
-            user = UserProfile.objects.filter(id=user_id).first()
-            if user is None:
-                continue
-
-            # 该用户当天所有的计量记录
-            user_meterings = self.get_user_metering_queryset(user_id=user.id)
-            # 按服务单元聚合
-            agg_meterings = self.aggregate_metering_disk(user_meterings)
-            for agg_metering in agg_meterings:
-                self.save_user_disk_statement_record(
-                    user=user, agg_metering=agg_metering, user_meterings=user_meterings
-                )
-
-    def generate_vo_disk_statement(self):
-        """
-        生成vo组的日结算单
-        """
-        vo_id_qs = self.get_vos()
-        for v in vo_id_qs:  # 每个vo：按服务单元聚合
-            vo_id = v['vo_id']
-            if not vo_id:
-                continue
-
-            vo = VirtualOrganization.objects.filter(id=vo_id).first()
-            if vo is None:
-                continue
+    def get_statement_metering_queryset(self):
+        return self.get_disk_metering_queryset()
 
-            # 该vo组当天所有的计量记录
-            vo_meterings = self.get_vo_metering_queryset(vo_id=vo.id)
-            # 按服务单元聚合
-            agg_meterings = self.aggregate_metering_disk(vo_meterings)
-            for agg_metering in agg_meterings:
-                self.save_vo_disk_statement_record(vo=vo, agg_metering=agg_metering, vo_meterings=vo_meterings)
+    def get_daily_statement_queryset(self):
+        return DailyStatementDisk.objects.filter(date=self.statement_date)
 
     def get_disk_metering_queryset(self):
         """
@@ -532,122 +366,15 @@ def get_disk_metering_queryset(self):
 
         return MeteringDisk.objects.filter(**lookups)
 
-    def get_vos(self):
-        """
-        获得所有vo组
-        """
-        queryset = self.get_disk_metering_queryset()
-        return queryset.filter(owner_type=OwnerType.VO.value).values('vo_id').order_by('vo_id').distinct()
-
-    def get_users(self):
-        """
-        获得所有用户
-        """
-        queryset = self.get_disk_metering_queryset()
-        return queryset.filter(owner_type=OwnerType.USER.value).values(
-            'user_id').order_by('user_id').distinct()
-
-    def get_vo_metering_queryset(self, vo_id):
-        """
-        获得某个vo组的计量记录
-        """
-        queryset = self.get_disk_metering_queryset()
-        return queryset.filter(vo_id=vo_id, owner_type=OwnerType.VO.value)
-
-    def get_user_metering_queryset(self, user_id):
-        """
-        获得某个用户的计量记录
-        """
-        queryset = self.get_disk_metering_queryset()
-        return queryset.filter(user_id=user_id, owner_type=OwnerType.USER.value)
-
-    @staticmethod
-    def aggregate_metering_disk(queryset):
-        """
-        按服务单元聚合
-        """
-        queryset = queryset.values('service_id').annotate(
-            st_original_amount=Sum('original_amount'),
-            payable_amount=Sum('trade_amount')
-        ).order_by('service_id')
-
-        return queryset
-
-    def save_user_disk_statement_record(self, user: UserProfile, agg_metering, user_meterings):
-        st_date = self.statement_date
-        # 插入新的日结算单前先判断是否已经存在
-        daily_statement = self.user_disk_statement_exists(
-            statement_date=st_date, service_id=agg_metering['service_id'], user_id=user.id)
-        # 已存在
-        if daily_statement is not None:
-            # 金额一致
-            if (
-                    agg_metering['st_original_amount'] == daily_statement.original_amount
-                    and agg_metering['payable_amount'] == daily_statement.payable_amount
-            ):
-                return daily_statement
-
-        with transaction.atomic():
-            if daily_statement is None:
-                # 不存在, 插入新的日结算单记录
-                daily_statement = self.save_daily_statement_record(
-                    service_id=agg_metering['service_id'], original_amount=agg_metering['st_original_amount'],
-                    payable_amount=agg_metering['payable_amount'],
-                    user_id=user.id, username=user.username,
-                )
-            else:  # 金额一致, 更新
-                self.update_disk_statement_amount(agg_metering=agg_metering, daily_statement=daily_statement)
-
-            self._user_daily_statement_count += 1
-            # 更新计量记录metering_disk的daily_statement_id字段
-            self.update_disk_metering_dsid(meterings=user_meterings, daily_statement=daily_statement)
-
-        return daily_statement
-
-    def save_vo_disk_statement_record(self, vo: VirtualOrganization, agg_metering, vo_meterings):
-        st_date = self.statement_date
-        # 插入新的日结算单前先判断是否已经存在
-        daily_statement = self.vo_disk_statement_exists(
-            statement_date=st_date, service_id=agg_metering['service_id'], vo_id=vo.id)
-        # 已存在
-        if daily_statement is not None:
-            # 金额一致
-            if (
-                    agg_metering['st_original_amount'] == daily_statement.original_amount
-                    and agg_metering['payable_amount'] == daily_statement.payable_amount
-            ):
-                return daily_statement
-
-        with transaction.atomic():
-            if daily_statement is None:
-                # 不存在, 插入新的日结算单记录
-                daily_statement = self.save_daily_statement_record(
-                    service_id=agg_metering['service_id'], original_amount=agg_metering['st_original_amount'],
-                    payable_amount=agg_metering['payable_amount'],
-                    vo_id=vo.id, vo_name=vo.name,
-                )
-            else:
-                self.update_disk_statement_amount(agg_metering=agg_metering, daily_statement=daily_statement)
-
-            self._vo_daily_statement_count += 1
-            # 更新计量记录metering_disk的daily_statement_id字段
-            self.update_disk_metering_dsid(meterings=vo_meterings, daily_statement=daily_statement)
-
-        return daily_statement
-
-    def save_daily_statement_record(
-            self, service_id, original_amount, payable_amount,
-            user_id: str = None, username: str = None,
-            vo_id: str = None, vo_name: str = None,
+    def build_daily_statement_record(
+            self, service_id, original_amount, payable_amount, owner_type: str, owner_id: str, owner_name: str
     ):
         """
-        创建日结算单记录
+        构建日结算单记录，未保存
         """
-        st_date = self.statement_date
-
         daily_statement = DailyStatementDisk(
             service_id=service_id,
-            date=st_date,
+            date=self.statement_date,
             original_amount=original_amount,
             payable_amount=payable_amount,
             trade_amount=0,
@@ -655,35 +382,17 @@ def save_daily_statement_record(
             payment_history_id=''
         )
 
-        if user_id is not None:
-            daily_statement.user_id = user_id
-            daily_statement.username = username
+        if owner_type == OwnerType.USER.value:
+            daily_statement.user_id = owner_id
+            daily_statement.username = owner_name
             daily_statement.owner_type = OwnerType.USER.value
-        elif vo_id is not None:
-            daily_statement.vo_id = vo_id
-            daily_statement.vo_name = vo_name
+        else:
+            daily_statement.vo_id = owner_id
+            daily_statement.vo_name = owner_name
             daily_statement.owner_type = OwnerType.VO.value
 
-        try:
-            daily_statement.save(force_insert=True)
-            self._new_count += 1
-        except Exception as e:
-            raise e
-
         return daily_statement
 
-    @staticmethod
-    def update_disk_metering_dsid(meterings, daily_statement):
-        for metering in meterings:
-            if metering.service_id == daily_statement.service_id:
-                metering.set_daily_statement_id(daily_statement_id=daily_statement.id)
-
-    @staticmethod
-    def update_disk_statement_amount(agg_metering, daily_statement):
-        daily_statement.original_amount = agg_metering['st_original_amount']
-        daily_statement.payable_amount = agg_metering['payable_amount']
-        daily_statement.save(update_fields=['original_amount', 'payable_amount'])
-
     @staticmethod
     def user_disk_statement_exists(statement_date: date, service_id, user_id: str) -> DailyStatementDisk:
         return DailyStatementDisk.objects.filter(
@@ -700,14 +409,7 @@ def vo_disk_statement_exists(statement_date: date, service_id, vo_id: str) -> Da
 
 
 class WebsiteMonitorStatementGenerater(BaseGeneratorStatement):
-    def __init__(self, statement_date: date = None, raise_exception: bool = False):
-        """
-        :param statement_date: 日结算单日期
-        :param raise_exception: True(发生错误直接抛出退出)
-        """
-        super().__init__(statement_date=statement_date, raise_exception=raise_exception)
-        self._user_daily_statement_count = 0  # 用户日结算单计数
-        self._new_count = 0  # 新产生的日结算单计数
+    group_by_service = False
 
     def run(self, raise_exception: bool = None):
         print(f'Monitor website generate {self.statement_date} daily statement start: ')
@@ -719,32 +421,16 @@ def run(self, raise_exception: bool = None):
             self.raise_exception = raise_exception
 
         # 用户的日结算单
-        self.generate_user_disk_statement()
+        self.generate_daily_statements()
 
         print(f'generate {self._user_daily_statement_count} user website daily statements,',
               f'new generate {self._new_count} website daily statements.')
 
-    def generate_user_disk_statement(self):
-        """
-        生成用户的日结算单
-        """
-        user_id_qs = self.get_users()
-        for u in user_id_qs:  # 每个user：按服务单元聚合
-            user_id = u['user_id']
-            if not user_id:
-                continue
+    def get_statement_metering_queryset(self):
+        return self.get_website_metering_queryset()
 
-            user = UserProfile.objects.filter(id=user_id).first()
-            if user is None:
-                continue
-
-            # 该用户当天所有的计量记录
-            user_meterings = self.get_user_metering_queryset(user_id=user.id)
-            # 按服务单元聚合
-            agg_metering = self.aggregate_site_metering(user_meterings)
-            self.save_user_site_statement(
-                user_id=user.id, username=user.username, agg_metering=agg_metering, user_meterings=user_meterings
-            )
+    def get_daily_statement_queryset(self):
+        return DailyStatementMonitorWebsite.objects.filter(date=self.statement_date)
 
     def get_website_metering_queryset(self):
         """
@@ -756,102 +442,23 @@ def get_website_metering_queryset(self):
 
         return MeteringMonitorWebsite.objects.filter(**lookups)
 
-    def get_users(self):
-        """
-        获得所有用户
-        """
-        queryset = self.get_website_metering_queryset()
-        return queryset.values('user_id').order_by('user_id').distinct()
-
-    def get_user_metering_queryset(self, user_id):
-        """
-        获得某个用户的计量记录
-        """
-        queryset = self.get_website_metering_queryset()
-        return queryset.filter(user_id=user_id)
-
-    @staticmethod
-    def aggregate_site_metering(queryset):
-        """
-        按用户聚合
-        """
-        queryset = queryset.aggregate(
-            original_amount=Sum('original_amount', default=Decimal('0.00')),
-            payable_amount=Sum('trade_amount', default=Decimal('0.00'))
-        )
-
-        return queryset
-
-    def save_user_site_statement(self, user_id: str, username: str, agg_metering, user_meterings):
-        st_date = self.statement_date
-        # 插入新的日结算单前先判断是否已经存在
-        daily_statement = self.user_site_statement_exists(
-            statement_date=st_date, user_id=user_id)
-        # 已存在
-        if daily_statement is not None:
-            # 金额一致
-            if (
-                    agg_metering['original_amount'] == daily_statement.original_amount
-                    and agg_metering['payable_amount'] == daily_statement.payable_amount
-            ):
-                return daily_statement
-
-        with transaction.atomic():
-            if daily_statement is None:
-                # 不存在, 插入新的日结算单记录
-                daily_statement = self.save_daily_statement_record(
-                    statement_date=st_date,
-                    original_amount=agg_metering['original_amount'],
-                    payable_amount=agg_metering['payable_amount'],
-                    user_id=user_id, username=username,
-                )
-                self._new_count += 1
-            else:  # 金额不一致, 更新
-                self.update_site_statement_amount(agg_metering=agg_metering, daily_statement=daily_statement)
-
-            self._user_daily_statement_count += 1
-            # 更新计量记录的daily_statement_id字段
-            self.update_site_metering_dsid(meterings=user_meterings, daily_statement=daily_statement)
-
-        return daily_statement
-
-    @staticmethod
-    def save_daily_statement_record(
-            statement_date: date, original_amount, payable_amount,
-            user_id: str = None, username: str = None
+    def build_daily_statement_record(
+            self, service_id, original_amount, payable_amount, owner_type: str, owner_id: str, owner_name: str
     ):
         """
-        创建日结算单记录
+        构建日结算单记录，未保存
         """
-        daily_statement = DailyStatementMonitorWebsite(
-            date=statement_date,
+        return DailyStatementMonitorWebsite(
+            date=self.statement_date,
             original_amount=original_amount,
             payable_amount=payable_amount,
             trade_amount=Decimal('0.00'),
             payment_status=PaymentStatus.UNPAID.value,
             payment_history_id='',
-            user_id=user_id,
-            username=username
+            user_id=owner_id,
+            username=owner_name
         )
 
-        try:
-            daily_statement.save(force_insert=True)
-        except Exception as e:
-            raise e
-
-        return daily_statement
-
-    @staticmethod
-    def update_site_metering_dsid(meterings, daily_statement):
-        for metering in meterings:
-            metering.set_daily_statement_id(daily_statement_id=daily_statement.id)
-
-    @staticmethod
-    def update_site_statement_amount(agg_metering, daily_statement):
-        daily_statement.original_amount = agg_metering['original_amount']
-        daily_statement.payable_amount = agg_metering['payable_amount']
-        daily_statement.save(update_fields=['original_amount', 'payable_amount'])
-
     @staticmethod
     def user_site_statement_exists(statement_date: date, user_id: str) -> DailyStatementMonitorWebsite:
         return DailyStatementMonitorWebsite.objects.filter(
@@ -2,6 +2,8 @@
 from datetime import date, datetime, timedelta, time
 
 from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.utils import timezone
 
 from utils.test import get_or_create_user, get_or_create_service, get_or_create_organization
@@ -265,6 +267,47 @@ def _test_post2pre_server_test(self, test_deleted: bool):
 
         self.do_assert_disk(now=now, disk1=disk1, disk2=disk2, disk1_hours=6)
 
+    def _create_post2pre_disks(self, num: int, yesterday_start: datetime):
+        disks = []
+        for i in range(num):
+            disk = create_disk_metadata(
+                service_id=self.service.id, azone_id='1', pay_type=PayType.POSTPAID.value,
+                classification=Disk.Classification.PERSONAL.value, user_id=self.user.id, vo_id=None,
+                disk_size=10 + i, start_time=yesterday_start - timedelta(days=1),
+                creation_time=yesterday_start - timedelta(days=1), task_status=Disk.TaskStatus.OK.value
+            )
+            post2pre_log_time = yesterday_start + timedelta(hours=6)
+            DiskChangeLog.add_change_log_for_disk(
+                disk=disk, log_type=DiskChangeLog.LogType.POST2PRE.value,
+                change_time=post2pre_log_time, change_user=self.user.username, save_db=True)
+            disk.start_time = post2pre_log_time
+            disk.pay_type = PayType.PREPAID.value
+            disk.save(update_fields=['start_time', 'pay_type'])
+            disks.append(disk)
+
+        return disks
+
+    def test_change_logs_query_count(self):
+        yesterday_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+        query_counts = []
+        for num in [5, 50]:
+            Disk.objects.all().delete()
+            DiskChangeLog.objects.all().delete()
+            MeteringDisk.objects.all().delete()
+            disks = self._create_post2pre_disks(num=num, yesterday_start=yesterday_start)
+            measurer = DiskMeasurer(raise_exception=True)
+            with CaptureQueriesContext(connection) as ctx:
+                measurer.run()
+
+            query_counts.append(len(ctx.captured_queries))
+            self.assertEqual(MeteringDisk.objects.count(), num)
+            for disk in disks:
+                metering = measurer.disk_metering_exists(metering_date=yesterday_start.date(), disk_id=disk.id)
+                self.assertEqual(up_int(metering.size_hours), up_int(disk.size * 24))
+
+        # 一页内变更记录一次查询，查询次数和云硬盘数量无关
+        self.assertEqual(query_counts[0], query_counts[1])
+
 
 class MeteringPaymentManagerTests(TransactionTestCase):
     def setUp(self):
@@ -1,3 +1,4 @@
+import gzip
 from decimal import Decimal
 from urllib import parse
 from datetime import date, timedelta
@@ -19,6 +20,7 @@
 from apps.app_servers.models import Server, ServerArchive, Disk, ServiceConfig
 from apps.app_servers.tests.test_disk import create_disk_metadata
 from apps.app_users.models import UserProfile
+from utils.report_file import iter_queryset_by_keyset
 
 
 class MeteringServerTests(MyAPITransactionTestCase):
@@ -334,6 +336,29 @@ def test_list_metering(self):
         r = self.client.get(f'{base_url}?{query}')
         self.assertIs(r.streaming, True)
         self.assertEqual(r.status_code, 200)
+        lines = b''.join(r.streaming_content).decode('utf-8').splitlines()
+        data_lines = [line for line in lines[3:] if not line.startswith('#')]
+        self.assertEqual(len(data_lines), 6)
+        self.assertIn('#数据总数: 6', lines)
+
+        query = parse.urlencode(query={
+            'date_start': '2022-02-01', 'date_end': '2022-04-06', 'as-admin': '', 'download': 'gzip'
+        })
+        r = self.client.get(f'{base_url}?{query}')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r['Content-Type'], 'application/gzip')
+        self.assertTrue(r['Content-Disposition'].endswith('.csv.gz'))
+        gz_lines = gzip.decompress(b''.join(r.streaming_content)).decode('utf-8').splitlines()
+        self.assertEqual(gz_lines[0:-1], lines[0:-1])   # 最后一行是下载时间
+
+        # 键集分页，creation_time相同的行按id分页
+        MeteringServer.objects.update(creation_time=timezone.now())
+        qs = MeteringServer.objects.all()
+        ids = [m.id for m in iter_queryset_by_keyset(qs, keys=('-creation_time', '-id'), per_page=2)]
+        self.assertEqual(ids, list(qs.order_by('-creation_time', '-id').values_list('id', flat=True)))
+        self.assertEqual(len(ids), 6)
+        ids = [m.id for m in iter_queryset_by_keyset(qs, keys=('creation_time', 'id'), per_page=4)]
+        self.assertEqual(ids, list(qs.order_by('creation_time', 'id').values_list('id', flat=True)))
 
     def test_aggregate_metering_by_uuid(self):
         server = Server(
@@ -2568,6 +2593,18 @@ def test_list_metering(self):
         self.assertEqual(r.data["count"], 1)
         self.assertEqual(len(r.data['results']), 1)
 
+        # param 'download'
+        query = parse.urlencode(query={
+            'date_start': '2022-02-01', 'date_end': '2022-04-06', 'as-admin': '', 'vo_id': self.vo.id,
+            'service_id': self.service2.id, 'download': ''
+        })
+        r = self.client.get(f'{base_url}?{query}')
+        self.assertEqual(r.status_code, 200)
+        self.assertIs(r.streaming, True)
+        lines = b''.join(r.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(len([line for line in lines[3:] if not line.startswith('#')]), 1)
+        self.assertIn('#数据总数: 1', lines)
+
     def test_detail_metering(self):
         user2 = get_or_create_user(username='tom@cnic.cn')
         disk1 = create_disk_metadata(
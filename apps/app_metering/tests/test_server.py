@@ -1,7 +1,9 @@
 from decimal import Decimal
-from datetime import datetime, timedelta, time, timezone as dt_timezone
+from datetime import date, datetime, timedelta, time, timezone as dt_timezone
 
 from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.utils import timezone as dj_timezone
 from django.urls import reverse
 
@@ -16,7 +18,7 @@
 from apps.app_order.models import Order
 from apps.app_order.managers import OrderManager, ServerConfig, OrderPaymentManager
 from apps.app_wallet.models import CashCoupon, PaymentHistory, PayAppService, PayApp
-from apps.app_metering.measurers import ServerMeasurer
+from apps.app_metering.measurers import ServerMeasurer, ShardedMeasurer
 from apps.app_metering.models import MeteringServer, PaymentStatus, DailyStatementServer
 from apps.app_metering.payment import MeteringPaymentManager
 from apps.app_metering.statement_generators import GenerateDailyStatementServer
@@ -325,6 +327,42 @@ def _rebuild_post2pre_server_test(self, test_archive: bool):
 
         self.do_assert_server(now=now, server1=server1, server2=server2, server1_hours=6)
 
+    def test_sharded_metering(self):
+        now = dj_timezone.now()
+        server1, server2, server3, server4 = self.init_data_only_server(now)
+        ago_time = now - timedelta(days=3)
+        for i in range(10):
+            server = create_server_metadata(
+                service=self.service, user=self.user, vcpu=i + 1, ram=2, disk_size=50, public_ip=bool(i % 2),
+                start_time=ago_time + timedelta(hours=i), creation_time=ago_time + timedelta(hours=i),
+                pay_type=PayType.POSTPAID.value
+            )
+            if i % 3 == 0:
+                server_id = server.id
+                ok = server.do_archive(archive_user=self.user)
+                self.assertIs(ok, True)
+                server.id = server_id
+
+        def metering_values():
+            return sorted(MeteringServer.objects.values_list(
+                'server_id', 'owner_type', 'user_id', 'username', 'vo_id', 'vo_name', 'pay_type',
+                'cpu_hours', 'ram_hours', 'disk_hours', 'public_ip_hours', 'original_amount', 'trade_amount'
+            ))
+
+        ServerMeasurer(raise_exception=True).run()
+        serial_values = metering_values()
+        self.assertEqual(len(serial_values), 12)
+        MeteringServer.objects.all().delete()
+
+        ShardedMeasurer(measurer_class=ServerMeasurer, raise_exception=True, shards=4, max_workers=2).run()
+        self.assertEqual(metering_values(), serial_values)
+
+        # 重复执行，已计量的不会重复计量
+        measurer = ShardedMeasurer(measurer_class=ServerMeasurer, raise_exception=True, shards=3, max_workers=1)
+        measurer.run()
+        self.assertEqual(measurer.measurer._new_count, 0)
+        self.assertEqual(metering_values(), serial_values)
+
 
 class MeteringPaymentManagerTests(TransactionTestCase):
     def setUp(self):
@@ -1179,6 +1217,34 @@ def test_daily_statement(self, st_date: str = '2022-01-01'):
         self.assertEqual(daily_statement3.original_amount, original_amount)
         self.assertEqual(daily_statement3.payable_amount, payable_amount)
 
+    def test_daily_statement_query_count(self):
+        st_date = date(year=2022, month=1, day=1)
+        query_counts = []
+        for num in [3, 30]:
+            MeteringServer.objects.all().delete()
+            DailyStatementServer.objects.all().delete()
+            for idx in range(num):
+                user = UserProfile(id=f'qc-user{num}-{idx}', username=f'qc-user{num}-{idx}')
+                user.save(force_insert=True)
+                for service in [self.service, self.service2]:
+                    create_metering_server_metadata(
+                        service=service, server_id=f'{service.id}-{user.id}', date_=st_date,
+                        owner_type=OwnerType.USER.value, user_id=user.id, username=user.username,
+                        original_amount=Decimal('1.1'), trade_amount=Decimal('1.11'), pay_type=PayType.POSTPAID.value
+                    )
+
+            with CaptureQueriesContext(connection) as ctx:
+                GenerateDailyStatementServer(statement_date=st_date, raise_exception=True).run()
+
+            query_counts.append(len(ctx.captured_queries))
+            self.assertEqual(DailyStatementServer.objects.count(), num * 2)
+            for st in DailyStatementServer.objects.all():
+                self.assertEqual(st.original_amount, Decimal('1.1'))
+                self.assertEqual(MeteringServer.objects.filter(daily_statement_id=st.id).count(), 1)
+
+        # 查询次数和用户数量无关
+        self.assertEqual(query_counts[0], query_counts[1])
+
 
 class ServerStatementTests(MyAPITransactionTestCase):
     def setUp(self):
@@ -16,7 +16,9 @@
 from apps.app_metering.payment import MeteringPaymentManager
 from apps.app_metering.pay_metering import PayMeteringWebsite
 from apps.app_users.models import UserProfile
-from apps.app_wallet.models import PayApp, PayAppService, PaymentHistory, CashCoupon
+from apps.app_wallet.models import (
+    PayApp, PayAppService, PaymentHistory, CashCoupon, CashCouponPaymentHistory, TransactionBill
+)
 from core import errors
 from apps.app_service.models import OrgDataCenter
 
@@ -765,3 +767,77 @@ def test_script_pay(self):
 
         user2_pointaccount.refresh_from_db()
         self.assertEqual(user2_pointaccount.balance, Decimal('50') - Decimal('66.88'))
+
+    def test_script_batch_pay(self):
+        """
+        批量扣费与逐个扣费结果一致
+        """
+        app_id = self.app.id
+        now_time = timezone.now()
+        user_bills = {}
+        for user in [self.user1, self.user2]:
+            bills = []
+            for days, amount in [(3, '123.45'), (2, '0'), (1, '66.88'), (0, '88.8')]:
+                bill = create_site_statement_record(
+                    statement_date=(now_time - timedelta(days=days)).date(),
+                    original_amount=Decimal('100'), payable_amount=Decimal(amount),
+                    user_id=user.id, username=user.username
+                )
+                bills.append(bill)
+
+            for face_value, app_service_id in [
+                ('50', self.site_version_ins.pay_app_service_id), ('100', self.site_version_ins.pay_app_service_id),
+                ('33', self.app_service2.id)
+            ]:
+                CashCoupon(
+                    face_value=Decimal(face_value), balance=Decimal(face_value),
+                    effective_time=now_time - timedelta(days=1), expiration_time=now_time + timedelta(days=10),
+                    app_service_id=app_service_id, status=CashCoupon.Status.AVAILABLE.value,
+                    owner_type=OwnerType.USER.value, user_id=user.id, vo_id=None
+                ).save(force_insert=True)
+
+            user_bills[user.id] = bills
+
+        mgr = PayMeteringWebsite(app_id=app_id, batch=True)
+        for bill in user_bills[self.user1.id]:
+            self.assertTrue(mgr.do_pay_one_bill(bill=bill))
+
+        failed = MeteringPaymentManager().pay_owner_daily_statement_bills(
+            daily_statements=user_bills[self.user2.id], app_id=app_id, subject=mgr.pay_subject,
+            executor='metering', get_remark=mgr.get_remark, required_enough_balance=False
+        )
+        self.assertEqual(failed, {})
+        success_count, failed_count = mgr.do_pay_bills(bills=user_bills[self.user2.id])
+        self.assertEqual(success_count, 0)
+        self.assertEqual(failed_count, 4)   # 已支付
+
+        def ledger(user):
+            rows = []
+            for bill in user_bills[user.id]:
+                bill.refresh_from_db()
+                row = [bill.payment_status, bill.trade_amount]
+                if bill.payment_history_id:
+                    ph = PaymentHistory.objects.get(id=bill.payment_history_id)
+                    tbill = TransactionBill.objects.get(trade_id=ph.id)
+                    ccphs = CashCouponPaymentHistory.objects.filter(
+                        payment_history_id=ph.id).order_by('cash_coupon__face_value')
+                    row += [
+                        ph.payment_method, ph.amounts, ph.coupon_amount, ph.payable_amounts, ph.remark, ph.subject,
+                        tbill.amounts, tbill.coupon_amount, tbill.after_balance, tbill.trade_amounts,
+                        [(c.cash_coupon.face_value, c.amounts, c.before_payment, c.after_payment) for c in ccphs]
+                    ]
+                rows.append(row)
+
+            coupons = CashCoupon.objects.filter(user_id=user.id).order_by('face_value')
+            user.userpointaccount.refresh_from_db()
+            return rows, [c.balance for c in coupons], user.userpointaccount.balance
+
+        rows1, coupon_balances1, balance1 = ledger(self.user1)
+        rows2, coupon_balances2, balance2 = ledger(self.user2)
+        self.assertEqual(rows1, rows2)
+        self.assertEqual(coupon_balances1, coupon_balances2)
+        self.assertEqual(coupon_balances2, [Decimal('33'), Decimal('0'), Decimal('0')])
+        self.assertEqual(balance1, balance2)
+        self.assertEqual(balance2, Decimal('150') - Decimal('123.45') - Decimal('66.88') - Decimal('88.8'))
+        self.assertEqual(PaymentHistory.objects.count(), 6)
+        self.assertEqual(TransactionBill.objects.count(), 6)
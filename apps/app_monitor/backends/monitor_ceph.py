@@ -5,6 +5,8 @@
 import aiohttp
 
 from core import errors
+from core.adapters.async_sessions import async_session_pool
+from core.prom_cache import prom_query_cache
 
 
 class ExpressionQuery:
@@ -74,9 +76,16 @@ def query_range_tag(self, endpoint_url: str, tag_tmpl: str, job: str, start: int
         :return:
         """
         expression_query = self.query_builder.render_expression(tmpl=tag_tmpl, job=job)
-        api_url = self._build_query_range_api(
-            endpoint_url=endpoint_url, expression_query=expression_query, start=start, end=end, step=step)
-        return self._request_query_api(api_url)
+        def fetch(fetch_start: int, fetch_end: int):
+            api_url = self._build_query_range_api(
+                endpoint_url=endpoint_url, expression_query=expression_query, start=fetch_start, end=fetch_end,
+                step=step)
+            return self._request_query_api(api_url)
+
+        return prom_query_cache.query_range(
+            endpoint_url=endpoint_url, params={'query': expression_query}, start=start, end=end, step=step,
+            fetch=fetch
+        )
 
     def _request_query_api(self, url: str):
         """
@@ -123,7 +132,10 @@ def query_tag(self, endpoint_url: str, tag_tmpl: str, job: str):
         """
         expression_query = self.query_builder.render_expression(tmpl=tag_tmpl, job=job)
         api_url = self._build_query_api(endpoint_url=endpoint_url, expression_query=expression_query)
-        return self._request_query_api(url=api_url)
+        return prom_query_cache.query(
+            endpoint_url=endpoint_url, params={'query': expression_query},
+            fetch=lambda: self._request_query_api(url=api_url)
+        )
 
     async def async_query_tag(self, endpoint_url: str, tag_tmpl: str, job: str):
         """
@@ -131,7 +143,10 @@ async def async_query_tag(self, endpoint_url: str, tag_tmpl: str, job: str):
         """
         expression_query = self.query_builder.render_expression(tmpl=tag_tmpl, job=job)
         api_url = self._build_query_api(endpoint_url=endpoint_url, expression_query=expression_query)
-        return await self.async_request_query_api(url=api_url)
+        return await prom_query_cache.async_query(
+            endpoint_url=endpoint_url, params={'query': expression_query},
+            fetch=lambda: self.async_request_query_api(url=api_url)
+        )
 
     @staticmethod
     async def async_request_query_api(url: str):
@@ -139,7 +154,7 @@ async def async_request_query_api(url: str):
         :raises: Error
         """
         try:
-            async with aiohttp.ClientSession() as client:
+            async with async_session_pool.session(url) as client:
                 r = await client.get(url=url, timeout=aiohttp.ClientTimeout(sock_connect=5, total=30))
                 await r.read()
         except aiohttp.ClientConnectionError:
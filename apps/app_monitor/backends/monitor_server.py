@@ -6,6 +6,8 @@
 from string import Template
 
 from core import errors
+from core.adapters.async_sessions import async_session_pool
+from core.prom_cache import prom_query_cache
 
 
 class ExpressionQuery:
@@ -103,7 +105,10 @@ def query_tag(self, endpoint_url: str, tag_tmpl: str, job: str):
         """
         expression_query = self.query_builder.render_expression(tmpl=tag_tmpl, job=job)
         api_url = self._build_query_api(endpoint_url=endpoint_url)
-        return self._request_query_api(url=api_url, expression_query=expression_query)
+        return prom_query_cache.query(
+            endpoint_url=endpoint_url, params={'query': expression_query},
+            fetch=lambda: self._request_query_api(url=api_url, expression_query=expression_query)
+        )
 
     async def async_query_tag(self, endpoint_url: str, tag_tmpl: str, job: str):
         """
@@ -113,7 +118,10 @@ async def async_query_tag(self, endpoint_url: str, tag_tmpl: str, job: str):
         api_url = self._build_query_api(endpoint_url=endpoint_url)
         query = parse.urlencode(query={'query': expression_query})
         api_url = f'{api_url}?{query}'
-        return await self.async_request_query_api(url=api_url)
+        return await prom_query_cache.async_query(
+            endpoint_url=endpoint_url, params={'query': expression_query},
+            fetch=lambda: self.async_request_query_api(url=api_url)
+        )
 
     @staticmethod
     async def async_request_query_api(url: str):
@@ -121,7 +129,7 @@ async def async_request_query_api(url: str):
         :raises: Error
         """
         try:
-            async with aiohttp.ClientSession() as client:
+            async with async_session_pool.session(url) as client:
                 r = await client.get(url=url, timeout=aiohttp.ClientTimeout(sock_connect=5, total=30))
                 await r.read()
         except aiohttp.ClientConnectionError:
@@ -6,6 +6,8 @@
 import aiohttp
 
 from core import errors
+from core.adapters.async_sessions import async_session_pool
+from core.prom_cache import prom_query_cache
 
 
 class ExpressionQuery:
@@ -104,7 +106,10 @@ def query_tag(self, endpoint_url: str, tag_tmpl: str, job: str):
         """
         expression_query = self.query_builder.expression(query_temp=tag_tmpl, job=job)
         api_url = self._build_query_api(endpoint_url=endpoint_url, expression_query=expression_query)
-        return self._request_query_api(url=api_url)
+        return prom_query_cache.query(
+            endpoint_url=endpoint_url, params={'query': expression_query},
+            fetch=lambda: self._request_query_api(url=api_url)
+        )
 
     async def async_query_tag(self, endpoint_url: str, tag_tmpl: str, job: str):
         """
@@ -112,7 +117,10 @@ async def async_query_tag(self, endpoint_url: str, tag_tmpl: str, job: str):
         """
         expression_query = self.query_builder.expression(query_temp=tag_tmpl, job=job)
         api_url = self._build_query_api(endpoint_url=endpoint_url, expression_query=expression_query)
-        return await self.async_request_query_api(url=api_url)
+        return await prom_query_cache.async_query(
+            endpoint_url=endpoint_url, params={'query': expression_query},
+            fetch=lambda: self.async_request_query_api(url=api_url)
+        )
 
     @staticmethod
     async def async_request_query_api(url: str):
@@ -120,7 +128,7 @@ async def async_request_query_api(url: str):
         :raises: Error
         """
         try:
-            async with aiohttp.ClientSession() as client:
+            async with async_session_pool.session(url) as client:
                 r = await client.get(url=url, timeout=aiohttp.ClientTimeout(sock_connect=5, total=30))
                 await r.read()
         except aiohttp.ClientConnectionError:
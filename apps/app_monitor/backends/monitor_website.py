@@ -2,6 +2,7 @@
 from urllib import parse
 
 from core import errors
+from core.prom_cache import prom_query_cache
 from apps.app_monitor.models import MonitorProvider
 
 
@@ -70,8 +71,7 @@ def http_status_code(self, provider: MonitorProvider, mntr_label: str, url: str)
         :raises: Error
         """
         expression_query = ExpressionQuery().build_http_status_code_query(url=url, mntr_label=mntr_label)
-        api_url = self._build_query_api(endpoint_url=provider.endpoint_url, expression_query=expression_query)
-        return self._request_query_api(api_url)
+        return self._query(endpoint_url=provider.endpoint_url, expression_query=expression_query)
 
     def http_status_code_period(self, provider: MonitorProvider, mntr_label: str, url: str):
         """
@@ -87,8 +87,7 @@ def http_status_code_period(self, provider: MonitorProvider, mntr_label: str, ur
         ]
         """
         expression_query = ExpressionQuery().build_http_status_code_query(url=url, mntr_label=mntr_label) + '[5m]'
-        api_url = self._build_query_api(endpoint_url=provider.endpoint_url, expression_query=expression_query)
-        return self._request_query_api(api_url)
+        return self._query(endpoint_url=provider.endpoint_url, expression_query=expression_query)
 
     def duration_seconds(self, provider: MonitorProvider, mntr_label: str, url: str):
         """
@@ -106,8 +105,7 @@ def duration_seconds(self, provider: MonitorProvider, mntr_label: str, url: str)
         :raises: Error
         """
         expression_query = ExpressionQuery().build_duration_seconds_query(url=url, mntr_label=mntr_label)
-        api_url = self._build_query_api(endpoint_url=provider.endpoint_url, expression_query=expression_query)
-        return self._request_query_api(api_url)
+        return self._query(endpoint_url=provider.endpoint_url, expression_query=expression_query)
 
     def duration_seconds_period(self, provider: MonitorProvider, mntr_label: str, url: str):
         """
@@ -124,8 +122,7 @@ def duration_seconds_period(self, provider: MonitorProvider, mntr_label: str, ur
         ]
         """
         expression_query = ExpressionQuery().build_duration_seconds_query(url=url, mntr_label=mntr_label) + '[5m]'
-        api_url = self._build_query_api(endpoint_url=provider.endpoint_url, expression_query=expression_query)
-        return self._request_query_api(api_url)
+        return self._query(endpoint_url=provider.endpoint_url, expression_query=expression_query)
 
     def success(self, provider: MonitorProvider, mntr_label: str, url: str):
         """
@@ -143,8 +140,7 @@ def success(self, provider: MonitorProvider, mntr_label: str, url: str):
         :raises: Error
         """
         expression_query = ExpressionQuery().build_success_query(url=url, mntr_label=mntr_label)
-        api_url = self._build_query_api(endpoint_url=provider.endpoint_url, expression_query=expression_query)
-        return self._request_query_api(api_url)
+        return self._query(endpoint_url=provider.endpoint_url, expression_query=expression_query)
 
     def success_period(self, provider: MonitorProvider, mntr_label: str, url: str):
         """
@@ -161,8 +157,7 @@ def success_period(self, provider: MonitorProvider, mntr_label: str, url: str):
         ]
         """
         expression_query = ExpressionQuery().build_success_query(url=url, mntr_label=mntr_label) + '[5m]'
-        api_url = self._build_query_api(endpoint_url=provider.endpoint_url, expression_query=expression_query)
-        return self._request_query_api(api_url)
+        return self._query(endpoint_url=provider.endpoint_url, expression_query=expression_query)
 
     def http_duration_seconds(self, provider: MonitorProvider, mntr_label: str, url: str):
         """
@@ -180,8 +175,7 @@ def http_duration_seconds(self, provider: MonitorProvider, mntr_label: str, url:
         :raises: Error
         """
         expression_query = ExpressionQuery().build_http_duration_seconds_query(url=url, mntr_label=mntr_label)
-        api_url = self._build_query_api(endpoint_url=provider.endpoint_url, expression_query=expression_query)
-        return self._request_query_api(api_url)
+        return self._query(endpoint_url=provider.endpoint_url, expression_query=expression_query)
 
     def http_duration_seconds_period(self, provider: MonitorProvider, mntr_label: str, url: str):
         """
@@ -198,8 +192,7 @@ def http_duration_seconds_period(self, provider: MonitorProvider, mntr_label: st
         ]
         """
         expression_query = ExpressionQuery().build_http_duration_seconds_query(url=url, mntr_label=mntr_label) + '[5m]'
-        api_url = self._build_query_api(endpoint_url=provider.endpoint_url, expression_query=expression_query)
-        return self._request_query_api(api_url)
+        return self._query(endpoint_url=provider.endpoint_url, expression_query=expression_query)
 
     def http_status_code_range(
             self, provider: MonitorProvider, mntr_label: str, url: str, start: int, end: int, step: int
@@ -217,9 +210,8 @@ def http_status_code_range(
         :raises: Error
         """
         expression_query = ExpressionQuery().build_http_status_code_query(url=url, mntr_label=mntr_label)
-        api_url = self._build_query_range_api(endpoint_url=provider.endpoint_url, expression_query=expression_query,
-                                              start=start, end=end, step=step)
-        return self._request_query_api(api_url)
+        return self._query_range(
+            endpoint_url=provider.endpoint_url, expression_query=expression_query, start=start, end=end, step=step)
 
     def duration_seconds_range(
             self, provider: MonitorProvider, mntr_label: str, url: str, start: int, end: int, step: int
@@ -237,9 +229,8 @@ def duration_seconds_range(
         :raises: Error
         """
         expression_query = ExpressionQuery().build_duration_seconds_query(url=url, mntr_label=mntr_label)
-        api_url = self._build_query_range_api(endpoint_url=provider.endpoint_url, expression_query=expression_query,
-                                              start=start, end=end, step=step)
-        return self._request_query_api(api_url)
+        return self._query_range(
+            endpoint_url=provider.endpoint_url, expression_query=expression_query, start=start, end=end, step=step)
 
     def success_range(self, provider: MonitorProvider, mntr_label: str, url: str, start: int, end: int, step: int):
         """
@@ -256,9 +247,8 @@ def success_range(self, provider: MonitorProvider, mntr_label: str, url: str, st
         ]
         """
         expression_query = ExpressionQuery().build_success_query(url=url, mntr_label=mntr_label)
-        api_url = self._build_query_range_api(
+        return self._query_range(
             endpoint_url=provider.endpoint_url, expression_query=expression_query, start=start, end=end, step=step)
-        return self._request_query_api(api_url)
 
     def http_duration_seconds_range(
             self, provider: MonitorProvider, mntr_label: str, url: str, start: int, end: int, step: int
@@ -278,9 +268,37 @@ def http_duration_seconds_range(
         :raises: Error
         """
         expression_query = ExpressionQuery().build_http_duration_seconds_query(url=url, mntr_label=mntr_label)
-        api_url = self._build_query_range_api(endpoint_url=provider.endpoint_url, expression_query=expression_query,
-                                              start=start, end=end, step=step)
-        return self._request_query_api(api_url)
+        return self._query_range(
+            endpoint_url=provider.endpoint_url, expression_query=expression_query, start=start, end=end, step=step)
+
+    def _query(self, endpoint_url: str, expression_query: str):
+        """
+        即时查询，结果短时缓存
+
+        :raises: Error
+        """
+        api_url = self._build_query_api(endpoint_url=endpoint_url, expression_query=expression_query)
+        return prom_query_cache.query(
+            endpoint_url=endpoint_url, params={'query': expression_query},
+            fetch=lambda: self._request_query_api(api_url)
+        )
+
+    def _query_range(self, endpoint_url: str, expression_query: str, start: int, end: int, step: int):
+        """
+        范围查询，时间窗口按步长对齐，缓存的历史数据只查询新的数据点
+
+        :raises: Error
+        """
+        def fetch(fetch_start: int, fetch_end: int):
+            api_url = self._build_query_range_api(
+                endpoint_url=endpoint_url, expression_query=expression_query, start=fetch_start, end=fetch_end,
+                step=step)
+            return self._request_query_api(api_url)
+
+        return prom_query_cache.query_range(
+            endpoint_url=endpoint_url, params={'query': expression_query}, start=start, end=end, step=step,
+            fetch=fetch
+        )
 
     def _request_query_api(self, url: str):
         """
@@ -1,5 +1,6 @@
 import time
 from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
 
 from django.utils.translation import gettext as _
 from django.db.models import TextChoices
@@ -451,7 +452,8 @@ def list_duration_distribution(view: CustomGenericViewSet, request):
         except errors.Error as exc:
             return view.exception_response(exc)
 
-        is_query_all = True if len(site_urls) > 10 else False
+        is_query_all = True if len(site_urls) > mw_mgr.SITE_URLS_FILTER_MAX else False
+        query_site_urls = None if is_query_all else site_urls
 
         if detection_point_id:
             point = mw_mgr.get_detection_ponit(dp_id=detection_point_id)
@@ -459,21 +461,12 @@ def list_duration_distribution(view: CustomGenericViewSet, request):
         else:
             detection_points = mw_mgr.get_detection_ponits(enable=True)
 
-        dp_map_data = {}
-        for dp in detection_points.values():
-            try:
-                mntr_label = dp.get_mntr_label()
-                if is_query_all:
-                    res = mw_mgr.query_duration_avg(
-                        provider=dp.provider, mntr_label=mntr_label, start=start, end=end, site_urls=None, group='web')
-                else:
-                    res = mw_mgr.query_duration_avg(
-                        provider=dp.provider, mntr_label=mntr_label, start=start, end=end,
-                        site_urls=site_urls, group='web')
-            except Exception as exc:
-                res = []
-
-            dp_map_data[dp.id] = res
+        dp_map_data = MonitorWebsiteHandler._query_detection_points(
+            detection_points=detection_points,
+            query_func=lambda provider, mntr_label: mw_mgr.query_duration_avg(
+                provider=provider, mntr_label=mntr_label, start=start, end=end, site_urls=query_site_urls,
+                group='web')
+        )
 
         interval_map = {
             ">3s": (3,),
@@ -484,16 +477,41 @@ def list_duration_distribution(view: CustomGenericViewSet, request):
             "50ms-100ms": (0.05, 0.1),
             "<50ms": (0, 0.05)
         }
+        only_site_urls = set(site_urls)
         stat_map = {}
         for k, data in dp_map_data.items():
             r = MonitorWebsiteHandler._duration_interval_statistics(
-                data=data, interval_map=interval_map, only_site_urls=site_urls)
+                data=data, interval_map=interval_map, only_site_urls=only_site_urls)
             stat_map[k] = r
 
         return Response(data=stat_map)
 
     @staticmethod
-    def _duration_interval_statistics(data: list, interval_map: dict, only_site_urls: list = None):
+    def _query_detection_points(detection_points: dict, query_func) -> dict:
+        """
+        并发查询多个探测点的监控数据，查询失败的探测点数据为空
+
+        :param query_func: query_func(provider, mntr_label) -> list
+        :return: {dp_id: list}
+        """
+        # 探测点的数据查询服务在当前线程中取出，查询线程中不访问数据库
+        items = [(dp.id, dp.provider, dp.get_mntr_label()) for dp in detection_points.values()]
+
+        def query(item):
+            dp_id, provider, mntr_label = item
+            try:
+                return dp_id, query_func(provider, mntr_label)
+            except Exception as exc:
+                return dp_id, []
+
+        if len(items) <= 1:
+            return dict(map(query, items))
+
+        with ThreadPoolExecutor(max_workers=min(len(items), 8)) as pool:
+            return dict(pool.map(query, items))
+
+    @staticmethod
+    def _duration_interval_statistics(data: list, interval_map: dict, only_site_urls: set = None):
         """
         统计一个探针网站监控群的延迟分布情况
         如果指定 only_site_urls，只统计 only_site_urls 内的
@@ -524,20 +542,22 @@ def _duration_interval_statistics(data: list, interval_map: dict, only_site_urls
             "<50ms": 0
         }
         """
-        ret = {k: 0 for k in interval_map.keys()}  # 各区间初始值
+        if only_site_urls and not isinstance(only_site_urls, (set, frozenset)):
+            only_site_urls = set(only_site_urls)
+
+        intervals = [(k, v[0], None if len(v) == 1 else v[1]) for k, v in interval_map.items()]
+        counts = [0] * len(intervals)  # 各区间初始值
         for item in data:
-            value = float(item['value'][1])
             if only_site_urls and item['metric']['url'] not in only_site_urls:
                 continue
 
-            for k, v in interval_map.items():
-                start, end = (v[0], None) if len(v) == 1 else (v[0], v[1])
-                status = start < value if end is None else start <= value <= end
-                if status is True:
-                    ret[k] += 1
+            value = float(item['value'][1])
+            for i, (k, start, end) in enumerate(intervals):
+                if (start < value) if end is None else (start <= value <= end):
+                    counts[i] += 1
                     break
 
-        return ret
+        return {k: counts[i] for i, (k, start, end) in enumerate(intervals)}
 
     @staticmethod
     def http_status_overview(view: CustomGenericViewSet, request):
@@ -554,34 +574,27 @@ def http_status_overview(view: CustomGenericViewSet, request):
         dp_map_data = {}
         site_urls_len = len(site_urls)
         if site_urls_len > 0:
-            is_query_all = True if site_urls_len > 10 else False
+            is_query_all = True if site_urls_len > mw_mgr.SITE_URLS_FILTER_MAX else False
+            query_site_urls = None if is_query_all else site_urls
             if detection_point_id:
                 point = mw_mgr.get_detection_ponit(dp_id=detection_point_id)
                 detection_points = {detection_point_id: point}
             else:
                 detection_points = mw_mgr.get_detection_ponits(enable=True)
 
-            for dp in detection_points.values():
-                try:
-                    mntr_label = dp.get_mntr_label()
-                    if is_query_all:
-                        res = mw_mgr.query_http_status_code(
-                            provider=dp.provider, mntr_label=mntr_label, timestamp=now_st, site_urls=None)
-                    else:
-                        res = mw_mgr.query_http_status_code(
-                            provider=dp.provider, mntr_label=mntr_label, timestamp=now_st, site_urls=site_urls)
-                except Exception as exc:
-                    res = []
-
-                dp_map_data[dp.id] = res
+            dp_map_data = MonitorWebsiteHandler._query_detection_points(
+                detection_points=detection_points,
+                query_func=lambda provider, mntr_label: mw_mgr.query_http_status_code(
+                    provider=provider, mntr_label=mntr_label, timestamp=now_st, site_urls=query_site_urls)
+            )
 
         ret = MonitorWebsiteHandler._website_status_counting(
-            data=dp_map_data, only_site_urls=site_urls)
+            data=dp_map_data, only_site_urls=set(site_urls))
 
         return Response(data=ret)
 
     @staticmethod
-    def _website_status_counting(data: dict, only_site_urls: list = None):
+    def _website_status_counting(data: dict, only_site_urls: set = None):
         """
         根据传入的探针的探测数据结果（可能是一个探针或多个探针）
         统计正常的个数，异常的个数
@@ -608,6 +621,9 @@ def _website_status_counting(data: dict, only_site_urls: list = None):
             "invalid_urls": ["xxx"]
         }
         """
+        if only_site_urls and not isinstance(only_site_urls, (set, frozenset)):
+            only_site_urls = set(only_site_urls)
+
         valids = set()
         invalids = set()
         for probe_id, values in data.items():
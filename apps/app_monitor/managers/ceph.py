@@ -4,6 +4,7 @@
 from django.utils.translation import gettext_lazy, gettext as _
 
 from core import errors
+from core.adapters.async_sessions import async_session_pool
 from apps.app_monitor.utils import build_thanos_provider
 from apps.app_monitor.serializers import MonitorJobCephSerializer
 from apps.app_monitor.models import MonitorJobCeph
@@ -95,7 +96,7 @@ def query_together(self, monitor_unit: MonitorJobCeph):
                 unit=monitor_unit, endpoint_url=provider.endpoint_url, tag=tag, tag_tmpl=self.v1_tag_tmpl_map[tag]
             ) for tag in tags
         ]
-        results = asyncio.run(self.do_async_requests(tasks))
+        results = async_session_pool.run_sync(self.do_async_requests(tasks))
         data = {}
         errs = {}
         for r in results:
@@ -236,7 +237,7 @@ def async_query_together_v2(self, monitor_unit: MonitorJobCeph):
                 unit=monitor_unit, endpoint_url=provider.endpoint_url, tag=tag, tag_tmpl=self.v2_tag_tmpl_map[tag]
             ) for tag in tags
         ]
-        results = asyncio.run(self.do_async_requests(tasks))
+        results = async_session_pool.run_sync(self.do_async_requests(tasks))
         data = {}
         errs = {}
         for r in results:
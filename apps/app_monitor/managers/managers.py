@@ -1,3 +1,4 @@
+import re
 import math
 from urllib.parse import urlsplit
 
@@ -123,6 +124,8 @@ def request_data(self, provider: MonitorProvider, tag: str, job: str):
 
 class MonitorWebsiteManager:
     CACHE_KEY_DETECTION_POINT = 'monitor_website_detection_ponit_list'
+    URL_MATCHER_MAX_LENGTH = 4000       # 一个url正则匹配选择器的最大长度，url多时分成多个查询
+    SITE_URLS_FILTER_MAX = 500          # 查询时按url过滤的最多url数，超过时查询全部，结果在本地过滤
 
     backend = MonitorWebsiteQueryAPI()
 
@@ -710,7 +713,7 @@ def query_duration_avg(
             group: str = 'web'
     ):
         """
-        site_urls: 指定要查询的url，当url数量在10以内可以用此参数
+        site_urls: 指定要查询的url，用正则匹配选择器过滤，url多时分成多个查询
         group: in [web, tcp]
         [
             {
@@ -735,25 +738,23 @@ def query_duration_avg(
         if minutes <= 0:
             minutes = 1
 
-        if site_urls:
-            site_querys = []
-            for url in site_urls:
-                query = f'avg_over_time(probe_duration_seconds{{group="{group}",monitor="{mntr_label}",' \
-                        f'url="{url}"}}[{minutes}m])'
-                site_querys.append(query)
-
-            query = ' or '.join(site_querys)
-        else:
+        if not site_urls:
             query = f'avg_over_time(probe_duration_seconds{{group="{group}",monitor="{mntr_label}"}}[{minutes}m])'
+            return self.backend.raw_query(provider=provider, params={'query': query, 'time': end})
 
-        return self.backend.raw_query(
-            provider=provider, params={'query': query, 'time': end})
+        results = []
+        for matcher in self.build_url_matchers(site_urls):
+            query = f'avg_over_time(probe_duration_seconds{{group="{group}",monitor="{mntr_label}",' \
+                    f'{matcher}}}[{minutes}m])'
+            results += self.backend.raw_query(provider=provider, params={'query': query, 'time': end})
+
+        return results
 
     def query_http_status_code(
             self, provider: MonitorProvider, mntr_label: str, timestamp: int, site_urls: list = None
     ):
         """
-        site_urls: 指定要查询的url，当url数量在10以内可以用此参数
+        site_urls: 指定要查询的url，用正则匹配选择器过滤，url多时分成多个查询
 
         [
             {
@@ -765,18 +766,43 @@ def query_http_status_code(
             },
         ]
         """
-        if site_urls:
-            site_querys = []
-            for url in site_urls:
-                query = f'probe_http_status_code{{group="web",monitor="{mntr_label}",url="{url}"}}'
-                site_querys.append(query)
-
-            query = ' or '.join(site_querys)
-        else:
+        if not site_urls:
             query = f'probe_http_status_code{{group="web",monitor="{mntr_label}"}}'
+            return self.backend.raw_query(provider=provider, params={'query': query, 'time': timestamp})
+
+        results = []
+        for matcher in self.build_url_matchers(site_urls):
+            query = f'probe_http_status_code{{group="web",monitor="{mntr_label}",{matcher}}}'
+            results += self.backend.raw_query(provider=provider, params={'query': query, 'time': timestamp})
+
+        return results
+
+    @staticmethod
+    def build_url_matchers(site_urls: list, max_length: int = None) -> list:
+        """
+        url列表转换为url标签的正则匹配选择器，按选择器长度分成多个
+
+        :return: ['url=~"https://a\\\\.cn/|https://b\\\\.cn/"', ...]
+        """
+        max_length = max_length if max_length else MonitorWebsiteManager.URL_MATCHER_MAX_LENGTH
+        matchers = []
+        patterns = []
+        length = 0
+        for url in sorted(set(site_urls)):
+            # PromQL正则完全匹配，字符串中的反斜杠和双引号需要转义
+            p = re.escape(url).replace('\\', '\\\\').replace('"', '\\"')
+            if patterns and length + len(p) + 1 > max_length:
+                matchers.append('url=~"' + '|'.join(patterns) + '"')
+                patterns = []
+                length = 0
+
+            patterns.append(p)
+            length += len(p) + 1
+
+        if patterns:
+            matchers.append('url=~"' + '|'.join(patterns) + '"')
 
-        return self.backend.raw_query(
-            provider=provider, params={'query': query, 'time': timestamp})
+        return matchers
 
     @staticmethod
     def get_site_user_emails(url_hash: str):
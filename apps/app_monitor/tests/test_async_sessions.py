@@ -0,0 +1,122 @@
+import json
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from django.test import SimpleTestCase
+
+from core.adapters.async_sessions import AsyncSessionPool, async_session_pool
+from apps.app_monitor.backends.monitor_server import MonitorServerQueryAPI
+
+
+class StubPrometheusHandler(BaseHTTPRequestHandler):
+    """
+    模拟Prometheus查询接口，支持保持连接，记录客户端连接
+    """
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    connections = set()
+    query_count = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        StubPrometheusHandler.connections.add(self.client_address)
+        StubPrometheusHandler.query_count += 1
+        content = json.dumps({'status': 'success', 'data': {'resultType': 'vector', 'result': []}}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class AsyncSessionPoolTests(SimpleTestCase):
+    tags = ['tag1', 'tag2', 'tag3', 'tag4', 'tag5', 'tag6']
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubPrometheusHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        host, port = self.server.server_address
+        self.endpoint_url = f'http://{host}:{port}'
+        StubPrometheusHandler.connections = set()
+        StubPrometheusHandler.query_count = 0
+        self.round = 0
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    async def query_tags(self):
+        # 每轮查询不同的PromQL，不命中查询结果缓存
+        api = MonitorServerQueryAPI()
+        self.round += 1
+        tasks = [
+            api.async_query_tag(endpoint_url=self.endpoint_url, tag_tmpl='up{job="$job"}', job=f'{tag}-{self.round}')
+            for tag in self.tags
+        ]
+        return await asyncio.gather(*tasks)
+
+    def test_pool_reuse_connections(self):
+        rounds = 10
+        # 每次查询创建新的会话
+        for _ in range(rounds):
+            results = asyncio.run(self.query_tags())
+            self.assertEqual(results, [[]] * len(self.tags))
+        temp_conns = len(StubPrometheusHandler.connections)
+        self.assertEqual(StubPrometheusHandler.query_count, rounds * len(self.tags))
+        self.assertEqual(temp_conns, rounds * len(self.tags))
+
+        # 共享会话，多次请求之间复用连接
+        StubPrometheusHandler.connections = set()
+        StubPrometheusHandler.query_count = 0
+        new_sessions = async_session_pool.stats()['new_sessions']
+        for _ in range(rounds):
+            results = async_session_pool.run_sync(self.query_tags())
+            self.assertEqual(results, [[]] * len(self.tags))
+        pool_conns = len(StubPrometheusHandler.connections)
+        self.assertEqual(StubPrometheusHandler.query_count, rounds * len(self.tags))
+        self.assertLessEqual(pool_conns, len(self.tags))
+        self.assertEqual(async_session_pool.stats()['new_sessions'], new_sessions + 1)
+
+        # 多线程共用事件循环和会话
+        threads = [threading.Thread(target=async_session_pool.run_sync, args=(self.query_tags(),)) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(StubPrometheusHandler.query_count, (rounds + 4) * len(self.tags))
+        self.assertEqual(async_session_pool.stats()['new_sessions'], new_sessions + 1)
+
+    def test_run_sync_and_close(self):
+        pool = AsyncSessionPool(limit=2)
+
+        async def query():
+            async with pool.session(f'{self.endpoint_url}/api/v1/query') as client:
+                r = await client.get(f'{self.endpoint_url}/api/v1/query?query=up')
+                return await r.json()
+
+        async def nested():
+            coro = query()
+            try:
+                pool.run_sync(coro)
+            except RuntimeError:
+                return 'error'
+
+        self.assertEqual(pool.run_sync(query())['status'], 'success')
+        self.assertEqual(pool.stats()['sessions'], 1)
+        self.assertEqual(pool.run_sync(nested()), 'error')
+        # 其他事件循环中使用临时会话
+        self.assertEqual(asyncio.run(query())['status'], 'success')
+        self.assertEqual(pool.stats()['temp_sessions'], 1)
+
+        thread = pool._thread
+        pool.close()
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(pool.stats()['sessions'], 0)
+        # 关闭后再使用时重新启动
+        self.assertEqual(pool.run_sync(query())['status'], 'success')
+        self.assertEqual(pool.stats()['new_sessions'], 2)
+        pool.close()
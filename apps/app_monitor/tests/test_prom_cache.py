@@ -0,0 +1,222 @@
+import json
+import time
+import threading
+from unittest import mock
+from urllib import parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from django.test import SimpleTestCase
+
+from core import errors
+from core.prom_cache import PromQueryCache, prom_query_cache
+from apps.app_monitor.backends.monitor_ceph import MonitorCephQueryAPI
+
+
+class StubQueryHandler(BaseHTTPRequestHandler):
+    """
+    模拟Prometheus查询接口，数据点的值由时间戳计算，记录收到的查询
+    """
+    requests = []
+
+    def log_message(self, format, *args):
+        pass
+
+    @staticmethod
+    def build_values(start: int, end: int, step: int, instance: str):
+        return [[ts, f'{instance}{ts % 97}'] for ts in range(start, end + 1, step)]
+
+    def do_GET(self):
+        r = parse.urlsplit(self.path)
+        params = dict(parse.parse_qsl(r.query))
+        StubQueryHandler.requests.append((r.path, params))
+        if 'error' in params.get('query', ''):
+            status_code = 400
+            data = {'status': 'error', 'errorType': 'bad_data', 'error': 'parse error'}
+        elif r.path.endswith('/query_range'):
+            start, end, step = int(params['start']), int(params['end']), int(params['step'])
+            status_code = 200
+            data = {'status': 'success', 'data': {'resultType': 'matrix', 'result': [
+                {'metric': {'instance': ins}, 'values': self.build_values(start, end, step, ins)} for ins in 'ab'
+            ]}}
+        else:
+            status_code = 200
+            data = {'status': 'success', 'data': {'resultType': 'vector', 'result': [
+                {'metric': {'instance': 'a'}, 'value': [time.time(), '1']}
+            ]}}
+
+        content = json.dumps(data).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class PromQueryCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubQueryHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        host, port = self.server.server_address
+        self.endpoint_url = f'http://{host}:{port}'
+        StubQueryHandler.requests = []
+        prom_query_cache.clear()
+        self.live_ttl = prom_query_cache.live_ttl
+        self.api = MonitorCephQueryAPI()
+
+    def tearDown(self):
+        prom_query_cache.live_ttl = self.live_ttl
+        prom_query_cache.clear()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def query_range(self, start: int, end: int, step: int = 60, tag_tmpl: str = 'up{job="$job"}'):
+        return self.api.query_range_tag(
+            endpoint_url=self.endpoint_url, tag_tmpl=tag_tmpl, job='job1', start=start, end=end, step=step)
+
+    def assert_range_result(self, result, start: int, end: int, step: int = 60):
+        self.assertEqual(result, [
+            {'metric': {'instance': ins}, 'values': StubQueryHandler.build_values(start, end, step, ins)}
+            for ins in 'ab'
+        ])
+
+    def test_history_window(self):
+        end = int(time.time()) - 3600
+        end -= end % 60
+        start = end - 3600
+        stats = prom_query_cache.stats()
+        self.assert_range_result(self.query_range(start=start + 10, end=end + 10), start=start, end=end)
+        self.assertEqual(len(StubQueryHandler.requests), 1)
+        self.assertEqual(StubQueryHandler.requests[0][1]['start'], str(start))
+
+        # 同一步长内的请求命中缓存，返回的结果可以修改
+        result = self.query_range(start=start + 50, end=end + 50)
+        self.assert_range_result(result, start=start, end=end)
+        result[0].pop('metric')
+        self.assert_range_result(self.query_range(start=start, end=end), start=start, end=end)
+        # 缓存时间段内的子时间段
+        self.assert_range_result(self.query_range(start=start + 600, end=end - 600), start=start + 600, end=end - 600)
+        self.assertEqual(len(StubQueryHandler.requests), 1)
+        # 不同步长、PromQL
+        self.query_range(start=start, end=end, step=120)
+        self.query_range(start=start, end=end, tag_tmpl='node_load1{job="$job"}')
+        self.assertEqual(len(StubQueryHandler.requests), 3)
+
+        new_stats = prom_query_cache.stats()
+        self.assertEqual(new_stats['hit'] - stats['hit'], 3)
+        self.assertEqual(new_stats['miss'] - stats['miss'], 3)
+
+    def test_live_window(self):
+        now = int(time.time())
+        start = now - 3600
+        self.assert_range_result(self.query_range(start=start, end=now), start=start - start % 60, end=now - now % 60)
+        self.query_range(start=start, end=now)
+        self.assertEqual(len(StubQueryHandler.requests), 1)
+
+        # 最新时间段过期后只查询缓存之后的数据点
+        prom_query_cache.live_ttl = 0
+        partial_hit = prom_query_cache.stats()['partial_hit']
+        start += 120
+        end = now + 120
+        result = self.query_range(start=start, end=end)
+        self.assert_range_result(result, start=start - start % 60, end=end - end % 60)
+        self.assertEqual(len(StubQueryHandler.requests), 2)
+        self.assertEqual(prom_query_cache.stats()['partial_hit'], partial_hit + 1)
+        fetch_start = int(StubQueryHandler.requests[1][1]['start'])
+        self.assertGreater(fetch_start, start)
+        self.assertLessEqual(fetch_start, now)
+
+        # 查询时间段开始时间在缓存之前，重新查询
+        self.query_range(start=start - 3600, end=end)
+        self.assertEqual(StubQueryHandler.requests[2][1]['start'], str(start - 3600 - start % 60))
+
+    def test_instant_and_error(self):
+        r1 = self.api.query_tag(endpoint_url=self.endpoint_url, tag_tmpl='up{job="$job"}', job='job1')
+        r2 = self.api.query_tag(endpoint_url=self.endpoint_url, tag_tmpl='up{job="$job"}', job='job1')
+        self.assertEqual(r1, r2)
+        self.assertEqual(len(StubQueryHandler.requests), 1)
+
+        # 查询失败不缓存
+        for _ in range(2):
+            with self.assertRaises(errors.Error):
+                self.query_range(start=1000, end=2000, tag_tmpl='error{job="$job"}')
+        self.assertEqual(len(StubQueryHandler.requests), 3)
+
+    def test_live_points_before_start(self):
+        """
+        请求开始时间在已完成时间之后时，之前缓存的未完成数据点重新查询，不会作为已完成的数据点返回
+        """
+        cache = PromQueryCache(live_ttl=0, live_delay=60)
+        now = [1000]
+        calls = []
+
+        def fetch(start, end):
+            calls.append((start, end))
+            return [{'metric': {}, 'values': [[ts, str(now[0])] for ts in range(start, end + 1, 15)]}]
+
+        def query_range(start, end):
+            return cache.query_range(endpoint_url='http://127.0.0.1', params={'query': 'up'}, start=start, end=end,
+                                     step=15, fetch=fetch)[0]['values']
+
+        with mock.patch('core.prom_cache.time.time', lambda: now[0]):
+            query_range(start=0, end=990)
+            now[0] = 1100
+            query_range(start=975, end=1095)
+            self.assertEqual(calls[1], (945, 1095))
+            values = dict(query_range(start=0, end=1020))
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(values[930], '1000')
+        self.assertEqual(values[945], '1100')
+        self.assertEqual(values[960], '1100')
+
+    def test_lru(self):
+        cache = PromQueryCache(max_size=2)
+        calls = []
+
+        def fetch(start, end):
+            calls.append((start, end))
+            return [{'metric': {}, 'values': [[ts, '1'] for ts in range(start, end + 1, 10)]}]
+
+        for q in ['q1', 'q2', 'q1', 'q3', 'q2']:
+            cache.query_range(endpoint_url='http://127.0.0.1', params={'query': q}, start=100, end=200, step=10,
+                              fetch=fetch)
+
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(cache.stats(), {'hit': 1, 'partial_hit': 0, 'miss': 4, 'size': 2, 'points': 22})
+
+    def test_max_points(self):
+        # 每个查询11个数据点，最多缓存2个查询的数据点
+        cache = PromQueryCache(max_size=100, max_points=25)
+        calls = []
+
+        def fetch(start, end):
+            calls.append((start, end))
+            return [{'metric': {}, 'values': [[ts, '1'] for ts in range(start, end + 1, 10)]}]
+
+        def query_range(q, start=100, end=200):
+            return cache.query_range(endpoint_url='http://127.0.0.1', params={'query': q}, start=start, end=end,
+                                     step=10, fetch=fetch)
+
+        for q in ['q1', 'q2', 'q3', 'q1']:
+            query_range(q)
+
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(cache.stats()['size'], 2)
+        self.assertEqual(cache.stats()['points'], 22)
+        query_range('q3')
+        self.assertEqual(len(calls), 4)
+
+        # 数据点数超过限制的查询不缓存
+        query_range('big', start=100, end=400)
+        query_range('big', start=100, end=400)
+        self.assertEqual(len(calls), 6)
+        self.assertEqual(cache.stats()['points'], 22)
+
+        # 即时查询按结果的序列数计数
+        for i in range(30):
+            cache.query(endpoint_url='http://127.0.0.1', params={'query': f'up{i}'}, fetch=lambda: [{'value': 1}])
+
+        self.assertLessEqual(cache.stats()['points'], 25)
+        cache.clear()
+        self.assertEqual(cache.stats()['points'], 0)
@@ -0,0 +1,171 @@
+import re
+import json
+import time
+import threading
+from unittest import mock
+from urllib import parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from django.urls import reverse
+from django.utils import timezone
+from django.core.cache import cache as django_cache
+
+from core.prom_cache import prom_query_cache
+from apps.app_monitor.models import MonitorProvider, MonitorWebsite, WebsiteDetectionPoint
+from apps.app_monitor.managers import MonitorWebsiteManager
+from apps.app_monitor.handlers.monitor_website import MonitorWebsiteHandler
+from utils.test import get_or_create_user, MyAPITestCase
+
+
+class StubWebsiteQueryHandler(BaseHTTPRequestHandler):
+    """
+    模拟网站监控Prometheus查询接口，返回所有站点的数据
+
+    记录收到的查询和同时处理中的最多请求数；每个请求等待同时处理中的请求数曾达到server.expect_in_flight后再返回，
+    查询是并发的时不用等待超时
+    """
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        params = dict(parse.parse_qsl(parse.urlsplit(self.path).query))
+        with server.cond:
+            server.querys.append(params['query'])
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            server.cond.notify_all()
+            server.cond.wait_for(lambda: server.max_in_flight >= server.expect_in_flight, timeout=5)
+
+        is_duration = params['query'].startswith('avg_over_time')
+        result = []
+        for i, url in enumerate(server.site_urls):
+            if is_duration:
+                value = str((i % 50) / 10)
+            else:
+                value = '200' if i % 2 == 0 else '500'
+
+            result.append({'metric': {'url': url}, 'value': [time.time(), value]})
+
+        content = json.dumps({'status': 'success', 'data': {'resultType': 'vector', 'result': result}}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+        with server.cond:
+            server.in_flight -= 1
+
+
+class StubWebsiteQueryServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cond = threading.Condition()
+        self.site_urls = []
+        self.querys = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.expect_in_flight = 1
+
+
+class WebsiteOverviewTests(MyAPITestCase):
+    site_count = 50
+    dp_count = 5
+
+    def setUp(self):
+        self.server = StubWebsiteQueryServer(('127.0.0.1', 0), StubWebsiteQueryHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        host, port = self.server.server_address
+        self.provider = MonitorProvider(name='stub', endpoint_url=f'http://{host}:{port}')
+        self.provider.save(force_insert=True)
+        self.user = get_or_create_user(password='password')
+
+        nt = timezone.now()
+        websites = []
+        for i in range(self.site_count):
+            site = MonitorWebsite(
+                name=f'site{i}', scheme='https://', hostname=f'site{i}.example.cn', uri='/', user=self.user,
+                creation=nt, modification=nt
+            )
+            site.enforce_id()
+            site.url_hash = site.calculate_url_hash()
+            websites.append(site)
+
+        MonitorWebsite.objects.bulk_create(websites)
+        # 其他用户的站点
+        self.server.site_urls = [w.full_url for w in websites] + [f'https://other{i}.example.cn/' for i in range(10)]
+
+        for i in range(self.dp_count):
+            WebsiteDetectionPoint(
+                name=f'dp{i}', name_en=f'dp{i}', creation=nt, modification=nt, enable=True,
+                provider=self.provider, mntr_label=f'label{i}'
+            ).save(force_insert=True)
+
+        django_cache.delete(MonitorWebsiteManager.CACHE_KEY_DETECTION_POINT)
+        prom_query_cache.clear()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_status_overview(self):
+        self.client.force_login(self.user)
+        self.server.expect_in_flight = self.dp_count
+        # 站点多时查询全部，各探测点并发查询
+        with mock.patch.object(MonitorWebsiteManager, 'SITE_URLS_FILTER_MAX', self.site_count - 1):
+            r = self.client.get(reverse('monitor-api:website-status-overview'))
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.data['total'], self.site_count)
+        self.assertEqual(r.data['invalid'], self.site_count // 2)
+        self.assertEqual(r.data['valid'], self.site_count // 2)
+        self.assertNotIn('https://other1.example.cn/', r.data['invalid_urls'])
+        self.assertEqual(len(self.server.querys), self.dp_count)
+        self.assertNotIn('url=~', self.server.querys[0])
+        self.assertEqual(self.server.max_in_flight, self.dp_count)
+
+    def test_duration_distribution(self):
+        self.client.force_login(self.user)
+        self.server.expect_in_flight = self.dp_count
+        now_ts = int(time.time())
+        query = parse.urlencode(query={'start': now_ts - 3600, 'end': now_ts})
+        r = self.client.get(f"{reverse('monitor-api:website-duration-distribution')}?{query}")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(r.data), self.dp_count)
+        for dp_id, stat in r.data.items():
+            self.assertEqual(sum(stat.values()), self.site_count)
+            self.assertEqual(stat['>3s'], self.site_count // 50 * 19)
+            self.assertEqual(stat['<50ms'], self.site_count // 50)
+
+        self.assertEqual(self.server.max_in_flight, self.dp_count)
+
+        # 按url集合过滤
+        data = [{'metric': {'url': url}, 'value': [0, '0.2']} for url in self.server.site_urls]
+        stat = MonitorWebsiteHandler._duration_interval_statistics(
+            data=data, interval_map={'<1s': (0, 1)}, only_site_urls=set(self.server.site_urls[0:self.site_count]))
+        self.assertEqual(stat, {'<1s': self.site_count})
+
+    def test_url_matchers(self):
+        urls = ['https://a.cn/', 'https://b.cn/x?y=1&z=(2)', 'http://c.cn/"q"', 'https://a.cn/']
+        matchers = MonitorWebsiteManager.build_url_matchers(urls)
+        self.assertEqual(len(matchers), 1)
+        self.assertTrue(matchers[0].startswith('url=~"'))
+        # PromQL字符串还原为正则，完全匹配
+        pattern = matchers[0][len('url=~"'):-1].replace('\\"', '"').replace('\\\\', '\\')
+        for url in urls:
+            self.assertIsNotNone(re.fullmatch(pattern, url))
+        self.assertIsNone(re.fullmatch(pattern, 'https://aacn/'))
+        self.assertIsNone(re.fullmatch(pattern, 'https://a.cn/x'))
+
+        many_urls = [f'https://site{i}.example.cn/' for i in range(200)]
+        matchers = MonitorWebsiteManager.build_url_matchers(many_urls, max_length=2000)
+        self.assertGreater(len(matchers), 1)
+        self.assertTrue(all(len(m) <= 2000 + len('url=~""') for m in matchers))
+
+        # 站点少时按url过滤查询
+        MonitorWebsiteManager().query_http_status_code(
+            provider=self.provider, mntr_label='label0', timestamp=int(time.time()), site_urls=urls)
+        self.assertEqual(len(self.server.querys), 1)
+        self.assertIn('url=~', self.server.querys[0])
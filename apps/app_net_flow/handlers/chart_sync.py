@@ -0,0 +1,91 @@
+from django.db import transaction
+from django.utils import timezone as dj_timezone
+
+from apps.app_net_flow.models import ChartModel
+from apps.app_net_flow.models import Menu2Chart
+
+
+class ChartSyncer:
+    """
+    EasyOPS端口流量图表同步到ChartModel
+
+    已有图表一次查询加载到内存，和爬取的图表按（device_ip, port_name）比较差异，
+    在一个事务中批量创建新图表、批量更新有变化的图表、一次删除不存在的图表和它们的组元素关系
+    """
+    BATCH_SIZE = 500
+
+    def __init__(self, batch_size: int = None):
+        self.batch_size = batch_size if batch_size and batch_size > 0 else self.BATCH_SIZE
+        self.field_names = {
+            f.attname for f in ChartModel._meta.concrete_fields
+            if not f.primary_key and f.name not in ['creation', 'modification']
+        }
+
+    @staticmethod
+    def get_key(device_ip, port_name):
+        return f'{device_ip}_{port_name}'
+
+    def clean_item(self, item: dict) -> dict:
+        """
+        只保留图表模型的字段
+        """
+        return {k: v for k, v in item.items() if k in self.field_names}
+
+    def diff(self, chart_list: list):
+        """
+        :return: (new_charts, changed_charts, update_fields, stale_ids)
+        """
+        exists_map = {self.get_key(c.device_ip, c.port_name): c for c in ChartModel.objects.all()}
+        new_charts = []
+        changed_charts = []
+        update_fields = set()
+        seen_keys = set()
+        for item in chart_list:
+            data = self.clean_item(item)
+            key = self.get_key(data.get('device_ip'), data.get('port_name'))
+            if key in seen_keys:
+                continue
+
+            seen_keys.add(key)
+            chart = exists_map.get(key)
+            if chart is None:
+                chart = ChartModel(**data)
+                chart.enforce_id()
+                new_charts.append(chart)
+                continue
+
+            changed = False
+            for name, value in data.items():
+                if getattr(chart, name) != value:
+                    setattr(chart, name, value)
+                    update_fields.add(name)
+                    changed = True
+
+            if changed:
+                changed_charts.append(chart)
+
+        stale_ids = [c.id for k, c in exists_map.items() if k not in seen_keys]
+        return new_charts, changed_charts, update_fields, stale_ids
+
+    def sync(self, chart_list: list) -> dict:
+        """
+        :return: {'created': int, 'updated': int, 'deleted': int}
+        """
+        new_charts, changed_charts, update_fields, stale_ids = self.diff(chart_list)
+        with transaction.atomic():
+            if new_charts:
+                ChartModel.objects.bulk_create(new_charts, batch_size=self.batch_size)
+
+            if changed_charts:
+                now = dj_timezone.now()
+                for chart in changed_charts:
+                    chart.modification = now
+
+                ChartModel.objects.bulk_update(
+                    changed_charts, fields=sorted(update_fields) + ['modification'], batch_size=self.batch_size)
+
+            if stale_ids:
+                Menu2Chart.objects.filter(chart_id__in=stale_ids).delete()
+                ChartModel.objects.filter(id__in=stale_ids).delete()
+
+        return {'created': len(new_charts), 'updated': len(changed_charts), 'deleted': len(stale_ids)}
@@ -1,31 +1,48 @@
 import json
 import re
-from apps.app_alert.utils.utils import download
-from apps.app_alert.utils.utils import DateUtils
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 from django.conf import settings
 
+from core.adapters.sessions import session_pool
+from apps.app_alert.utils import utils
+from apps.app_alert.utils.utils import DateUtils
+from apps.app_net_flow.handlers.traffic_cache import TrafficCache, traffic_cache
+
+
+def download(*args, **kwargs):
+    """
+    请求使用按服务地址共享的保持连接
+    """
+    return utils.download(*args, session=session_pool, **kwargs)
+
 
 class EasyOPSAccount(object):
     DOMAIN = settings.EASY_OPS.get('DOMAIN')
 
-    def __init__(self):
+    def __init__(self, domain: str = None):
+        self.domain = domain if domain else self.DOMAIN
         self.token = ''
         self.expire = 0
+        self._lock = threading.Lock()
 
     def get_headers(self):
         if self.expire > DateUtils.timestamp():
             return {'Authorization': self.token}
 
-        else:
-            self.token = self._get_token()
-            self.expire = DateUtils.timestamp() + 600
+        with self._lock:    # 多线程并发请求时只获取一次token
+            if self.expire <= DateUtils.timestamp():
+                self.token = self._get_token()
+                self.expire = DateUtils.timestamp() + 600
+
         return {'Authorization': self.token}
 
     def _get_token(self):
         """
         获取token
         """
-        url = f'{self.DOMAIN}/api/v3/auth/login'
+        url = f'{self.domain}/api/v3/auth/login'
         data = {
             "username": settings.EASY_OPS.get('USERNAME'),
             "password": settings.EASY_OPS.get('PASSWORD')
@@ -42,8 +59,18 @@ def _get_token(self):
 
 class EasyOPS(object):
     DOMAIN = settings.EASY_OPS.get('DOMAIN')
+    DEFAULT_CRAWL_WORKERS = 8
+
+    def __init__(self, domain: str = None, account: EasyOPSAccount = None, max_workers: int = None):
+        """
+        :param max_workers: 并发获取菜单下图表的线程数，默认settings.NETFLOW_EASYOPS_CRAWL_WORKERS
+        """
+        self.domain = domain if domain else self.DOMAIN
+        self.account = account if account else easyops_account
+        if max_workers is None:
+            max_workers = getattr(settings, 'NETFLOW_EASYOPS_CRAWL_WORKERS', self.DEFAULT_CRAWL_WORKERS)
 
-    def __init__(self):
+        self.max_workers = max(max_workers, 1)
         self._chart_id_set = set()
         self._chart_list = list()
 
@@ -52,8 +79,8 @@ def crawler_easyops_chart_list(self):
         return self._chart_list
 
     def _get_menu_id_list(self):
-        url = f'{self.DOMAIN}/api/v3/model-factory/tree/nodes-contain-instance-by-relation-end/uplink/port'
-        resp = download(method='get', url=url, headers=easyops_account.get_headers())
+        url = f'{self.domain}/api/v3/model-factory/tree/nodes-contain-instance-by-relation-end/uplink/port'
+        resp = download(method='get', url=url, headers=self.account.get_headers())
         return self._parse_menu(resp)
 
     @staticmethod
@@ -63,13 +90,25 @@ def _parse_menu(resp):
         return menu_id_list
 
     def _get_chart_list(self):
+        """
+        有界线程池并发获取各菜单下的图表，按菜单顺序合并去重，结果和顺序获取时一致
+        """
         menu_list = self._get_menu_id_list()
-        for menu_id in menu_list:
-            self._get_sub_chart_list(menu_id=menu_id)
+        if self.max_workers <= 1 or len(menu_list) <= 1:
+            for menu_id in menu_list:
+                self._get_sub_chart_list(menu_id=menu_id)
+            return
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(menu_list))) as pool:
+            for resp in pool.map(self._download_sub_chart_list, menu_list):
+                self._parse_chart_list(resp)
+
+    def _download_sub_chart_list(self, menu_id):
+        url = f'{self.domain}/api/v3/mrtg/mrtg/instance-ports-in-tree-node/{menu_id}'
+        return download(method='get', url=url, headers=self.account.get_headers())
 
     def _get_sub_chart_list(self, menu_id):
-        url = f'{self.DOMAIN}/api/v3/mrtg/mrtg/instance-ports-in-tree-node/{menu_id}'
-        resp = download(method='get', url=url, headers=easyops_account.get_headers())
+        resp = self._download_sub_chart_list(menu_id=menu_id)
         return self._parse_chart_list(resp)
 
     def _parse_chart_list(self, resp):
@@ -85,11 +124,29 @@ def _parse_chart_list(self, resp):
                 self._chart_id_set.add(unique_str)
                 self._chart_list.append(item)
 
-    def traffic(self, chart, metrics_ids, start, end):
+    def traffic(self, chart, metrics_ids, start, end, cache: TrafficCache = None):
         """
         获取 流量图表
+
+        时间窗口按步长对齐后查询，相同的查询共用短时缓存，并发的相同查询只请求一次上游；返回的数据不能修改
+
+        :param cache: 流量查询缓存，默认进程内共享的缓存
+        """
+        if cache is None:
+            cache = traffic_cache
+
+        start, end, step = cache.align_window(start=start, end=end)
+        key = cache.build_key(chart=[self.domain, chart], metrics_ids=metrics_ids, start=start, end=end)
+        return cache.get_or_fetch(
+            key=key, ttl=step,
+            fetch=lambda: self.download_traffic(chart=chart, metrics_ids=metrics_ids, start=start, end=end)
+        )
+
+    def download_traffic(self, chart, metrics_ids, start, end):
+        """
+        从上游获取 流量图表
         """
-        url = f'{self.DOMAIN}/api/v3/mrtg/mrtg/device-ports-traffic'
+        url = f'{self.domain}/api/v3/mrtg/mrtg/device-ports-traffic'
         data = {
             "ports": [
                 chart,
@@ -100,7 +157,7 @@ def traffic(self, chart, metrics_ids, start, end):
             "end_time": end,
             "start_time": start
         }
-        resp = download(method='post', url=url, json=data, headers=easyops_account.get_headers())
+        resp = download(method='post', url=url, json=data, headers=self.account.get_headers())
         return self.traffic_parser(resp=resp)
 
     @staticmethod
@@ -0,0 +1,161 @@
+import time
+import json
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+from django.conf import settings
+
+
+class _Flight:
+    """
+    一次进行中的上游查询，相同查询的并发请求等待它的结果
+    """
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.exc = None
+
+
+class TrafficCache:
+    """
+    端口流量查询短时缓存，进程内所有线程共享
+
+    * 查询时间窗口按步长对齐，同一步长内的刷新请求是相同的查询
+    * 单飞：相同查询同时只有一个线程请求上游，其他线程等待后共用结果，查询失败不缓存
+    * 有界LRU，缓存时间和步长相同
+    * 缓存的结果多个请求共用，不能修改
+    """
+    DEFAULT_MAX_SIZE = 1024
+    # (时间窗口长度上限，步长)，秒
+    STEPS = (
+        (6 * 3600, 60),
+        (24 * 3600, 300),
+        (7 * 24 * 3600, 1800),
+    )
+    MAX_STEP = 7200
+
+    def __init__(self, max_size: int = None):
+        """
+        :param max_size: 最多缓存的查询数，默认settings.NETFLOW_TRAFFIC_CACHE_SIZE
+        """
+        if max_size is None:
+            max_size = getattr(settings, 'NETFLOW_TRAFFIC_CACHE_SIZE', self.DEFAULT_MAX_SIZE)
+
+        self.max_size = max(max_size, 0)
+        self._items = OrderedDict()     # {key: (expire, result)}
+        self._flights = {}              # {key: _Flight}
+        self._lock = threading.Lock()
+        self.hit_count = 0
+        self.miss_count = 0
+        self.coalesced_count = 0
+
+    @classmethod
+    def get_step(cls, start: int, end: int) -> int:
+        window = end - start
+        for max_window, step in cls.STEPS:
+            if window <= max_window:
+                return step
+
+        return cls.MAX_STEP
+
+    @classmethod
+    def align_window(cls, start: int, end: int):
+        """
+        时间窗口按步长向下对齐
+
+        :return: (start, end, step)
+        """
+        start = int(start)
+        end = int(end)
+        step = cls.get_step(start=start, end=end)
+        return start - start % step, end - end % step, step
+
+    @staticmethod
+    def build_key(chart: dict, metrics_ids, start: int, end: int) -> str:
+        return json.dumps([chart, metrics_ids, start, end], sort_keys=True, default=str)
+
+    def get(self, key: str):
+        """
+        :return: (True, result) or (False, None)
+        """
+        item = self._items.get(key)
+        if item is None:
+            return False, None
+
+        expire, result = item
+        if expire <= time.monotonic():
+            self._items.pop(key, None)
+            return False, None
+
+        self._items.move_to_end(key)
+        return True, result
+
+    def set(self, key: str, result, ttl: float):
+        if self.max_size <= 0 or ttl <= 0:
+            return
+
+        self._items[key] = (time.monotonic() + ttl, result)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def get_or_fetch(self, key: str, ttl: float, fetch: Callable):
+        """
+        获取缓存的查询结果，没有时查询上游，相同查询的并发请求只查询一次
+
+        :param fetch: 查询上游的函数
+        :raises: 查询函数抛出的错误
+        """
+        with self._lock:
+            ok, result = self.get(key)
+            if ok:
+                self.hit_count += 1
+                return result
+
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced_count += 1
+                leader = False
+            else:
+                flight = self._flights[key] = _Flight()
+                self.miss_count += 1
+                leader = True
+
+        if not leader:
+            flight.event.wait()
+            if flight.exc is not None:
+                raise flight.exc
+
+            return flight.result
+
+        try:
+            flight.result = fetch()
+        except Exception as exc:
+            flight.exc = exc
+            raise exc
+        finally:
+            with self._lock:
+                if flight.exc is None:
+                    self.set(key, flight.result, ttl=ttl)
+
+                self._flights.pop(key, None)
+
+            flight.event.set()
+
+        return flight.result
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> dict:
+        return {
+            'hit': self.hit_count,
+            'miss': self.miss_count,
+            'coalesced': self.coalesced_count,
+            'size': len(self._items)
+        }
+
+
+traffic_cache = TrafficCache()
@@ -4,6 +4,7 @@
 
 import os
 import sys
+import time
 from django import setup
 from pathlib import Path
 
@@ -14,10 +15,9 @@
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_site.settings')
 setup()
 
-from apps.app_net_flow.models import ChartModel
-from apps.app_net_flow.models import Menu2Chart
 from apps.app_global.task_locks import netflow_update_element_lock
 from apps.app_net_flow.handlers.easyops import EasyOPS
+from apps.app_net_flow.handlers.chart_sync import ChartSyncer
 from django.utils import timezone as dj_timezone
 from datetime import timedelta
 from apps.app_alert.utils.utils import DateUtils
@@ -28,25 +28,13 @@
 
 def update_elements():
     logger.info(f"当前时间：{DateUtils.now()}")
+    start = time.time()
     chart_list = EasyOPS().crawler_easyops_chart_list()
-    element_set = set()
-    for item in chart_list:
-        obj, created = ChartModel.objects.update_or_create(
-            device_ip=item.get("device_ip"),
-            port_name=item.get("port_name"),
-            defaults=item
-        )
-        element_set.add(f'{item.get("device_ip")}_{item.get("port_name")}')
-        logger.info(obj)
-        logger.info(created)
-
-    queryset = ChartModel.objects.all()
-    for item in queryset:
-        ip_port = f'{item.device_ip}_{item.port_name}'
-        if ip_port not in element_set:
-            menu2chart_queryset = Menu2Chart.objects.filter(chart=item)
-            menu2chart_queryset.delete()
-            item.delete()
+    crawl_seconds = time.time() - start
+    stats = ChartSyncer().sync(chart_list)
+    logger.info(
+        f"图表数：{len(chart_list)}，新建：{stats['created']}，更新：{stats['updated']}，删除：{stats['deleted']}，"
+        f"爬取耗时：{crawl_seconds:.3f}s，同步耗时：{time.time() - start - crawl_seconds:.3f}s")
 
 
 def run_task_use_lock():
@@ -0,0 +1,126 @@
+import re
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from django.db import connection
+from django.test.testcases import TransactionTestCase
+
+from apps.app_net_flow.models import ChartModel, MenuModel, Menu2Chart
+from apps.app_net_flow.handlers.easyops import EasyOPS, EasyOPSAccount
+from apps.app_net_flow.handlers.chart_sync import ChartSyncer
+
+
+class StubEasyOPSHandler(BaseHTTPRequestHandler):
+    """
+    模拟EasyOPS接口，每个菜单下 charts_per_menu 个图表，相邻菜单有重复的图表
+    """
+    delay = 0.02
+    menu_num = 50
+    charts_per_menu = 60
+    login_count = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, data):
+        time.sleep(self.delay)
+        body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        StubEasyOPSHandler.login_count += 1
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        self.reply({'data': 'token'})
+
+    def do_GET(self):
+        if self.path.endswith('/uplink/port'):
+            self.reply({'data': [{'id': f'menu{i}', 'name': f'menu{i}'} for i in range(self.menu_num)]})
+            return
+
+        m = re.search(r'/instance-ports-in-tree-node/menu(\d+)$', self.path)
+        if m is None:
+            self.send_error(404)
+            return
+
+        menu_index = int(m.group(1))
+        start = menu_index * (self.charts_per_menu - 10)
+        self.reply({'data': [
+            {
+                'if_index': i, 'device_ip': f'10.0.{i // 250}.{i % 250}', 'port_name': f'port{i}',
+                'instance_name': f'instance{i}', 'if_alias': f'alias{i}', 'band_width': 1000
+            } for i in range(start, start + self.charts_per_menu)
+        ]})
+
+
+class EasyOPSChartSyncTests(TransactionTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubEasyOPSHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        host, port = self.server.server_address
+        self.domain = f'http://{host}:{port}'
+        StubEasyOPSHandler.login_count = 0
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def crawl(self, max_workers: int):
+        easyops = EasyOPS(domain=self.domain, account=EasyOPSAccount(domain=self.domain), max_workers=max_workers)
+        start = time.monotonic()
+        chart_list = easyops.crawler_easyops_chart_list()
+        return chart_list, time.monotonic() - start
+
+    def test_crawl(self):
+        chart_list, seq_seconds = self.crawl(max_workers=1)
+        chart_list2, seconds = self.crawl(max_workers=8)
+        num = (StubEasyOPSHandler.menu_num - 1) * (StubEasyOPSHandler.charts_per_menu - 10) + \
+            StubEasyOPSHandler.charts_per_menu
+        self.assertEqual(len(chart_list), num)
+        self.assertEqual(chart_list2, chart_list)
+        self.assertNotIn('if_index', chart_list[0])
+        self.assertEqual(StubEasyOPSHandler.login_count, 2)
+        self.assertLess(seconds, seq_seconds)
+
+    def test_sync(self):
+        chart_list, _ = self.crawl(max_workers=8)
+        syncer = ChartSyncer()
+        self.assertEqual(syncer.sync(chart_list), {'created': len(chart_list), 'updated': 0, 'deleted': 0})
+        self.assertEqual(ChartModel.objects.count(), len(chart_list))
+        chart = ChartModel.objects.get(device_ip='10.0.0.1', port_name='port1')
+        self.assertEqual(chart.instance_name, 'instance1')
+        self.assertEqual(chart.band_width, 1000)
+
+        # 没有变化
+        self.assertEqual(syncer.sync(chart_list), {'created': 0, 'updated': 0, 'deleted': 0})
+
+        # 修改，删除，新增
+        menu = MenuModel.objects.create(name='全部')
+        stale_chart = ChartModel.objects.get(device_ip='10.0.0.0', port_name='port0')
+        Menu2Chart(menu=menu, chart=stale_chart).save(force_insert=True)
+        Menu2Chart(menu=menu, chart=chart).save(force_insert=True)
+        chart_list = [dict(item) for item in chart_list[1:]]
+        chart_list[0]['if_alias'] = 'new alias'
+        chart_list[1]['band_width'] = 2000
+        chart_list.append({'device_ip': '192.168.0.1', 'port_name': 'port', 'instance_name': 'new', 'unknown': 1})
+
+        queries = []
+        with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+            stats = syncer.sync(chart_list)
+
+        self.assertEqual(stats, {'created': 1, 'updated': 2, 'deleted': 1})
+        self.assertLess(len(queries), 20)
+        self.assertEqual(ChartModel.objects.count(), len(chart_list))
+        self.assertFalse(ChartModel.objects.filter(id=stale_chart.id).exists())
+        self.assertEqual(list(Menu2Chart.objects.values_list('chart_id', flat=True)), [chart.id])
+        chart.refresh_from_db()
+        self.assertEqual(chart.if_alias, 'new alias')
+        self.assertEqual(ChartModel.objects.get(port_name='port2').band_width, 2000)
+        self.assertEqual(ChartModel.objects.get(device_ip='192.168.0.1').instance_name, 'new')
@@ -0,0 +1,111 @@
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from django.test import SimpleTestCase
+
+from apps.app_net_flow.handlers.easyops import EasyOPS, EasyOPSAccount
+from apps.app_net_flow.handlers.traffic_cache import TrafficCache
+
+
+class StubTrafficHandler(BaseHTTPRequestHandler):
+    """
+    模拟EasyOPS登录和端口流量查询接口
+    """
+    delay = 0.3
+    login_count = 0
+    traffic_count = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length))
+        if self.path.endswith('/auth/login'):
+            StubTrafficHandler.login_count += 1
+            data = {'data': 'token'}
+        else:
+            StubTrafficHandler.traffic_count += 1
+            time.sleep(self.delay)
+            data = {'data': {'start': body['start_time'], 'end': body['end_time'], 'metrics': body['metrics_ids']}}
+
+        content = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class TrafficCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubTrafficHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        host, port = self.server.server_address
+        domain = f'http://{host}:{port}'
+        StubTrafficHandler.login_count = 0
+        StubTrafficHandler.traffic_count = 0
+        self.cache = TrafficCache(max_size=2)
+        self.easyops = EasyOPS(domain=domain, account=EasyOPSAccount(domain=domain))
+        self.chart = {'id': 'chart1', 'device_ip': '10.0.0.1', 'port_name': 'port1'}
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def traffic(self, start, end, metrics_ids=None):
+        return self.easyops.traffic(
+            chart=self.chart, metrics_ids=metrics_ids or ['in', 'out'], start=start, end=end, cache=self.cache)
+
+    def test_coalesce(self):
+        end = 1700000000
+        start = end - 3600
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            results = list(pool.map(lambda i: self.traffic(start=start + i, end=end + i), range(20)))
+
+        self.assertEqual(StubTrafficHandler.traffic_count, 1)
+        self.assertEqual(StubTrafficHandler.login_count, 1)
+        aligned_start, aligned_end, step = TrafficCache.align_window(start, end)
+        self.assertEqual(step, 60)
+        for r in results:
+            self.assertEqual(r, {'data': {'start': aligned_start, 'end': aligned_end, 'metrics': ['in', 'out']}})
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['miss'], 1)
+        self.assertEqual(stats['hit'] + stats['coalesced'], 19)
+        self.assertGreater(stats['coalesced'], 0)
+
+        # 同一步长内命中缓存
+        self.traffic(start=aligned_start + 59, end=aligned_end + 59)
+        self.assertEqual(StubTrafficHandler.traffic_count, 1)
+        # 下一个步长、不同查询字段
+        self.traffic(start=aligned_start + 60, end=aligned_end + 60)
+        self.traffic(start=start, end=end, metrics_ids=['in'])
+        self.assertEqual(StubTrafficHandler.traffic_count, 3)
+        # LRU淘汰
+        self.assertEqual(self.cache.stats()['size'], 2)
+        self.traffic(start=start, end=end)
+        self.assertEqual(StubTrafficHandler.traffic_count, 4)
+
+    def test_ttl_and_error(self):
+        self.assertEqual(TrafficCache.align_window(1000, 1000 + 2 * 24 * 3600)[2], 1800)
+        self.assertEqual(TrafficCache.align_window(0, 30 * 24 * 3600)[2], TrafficCache.MAX_STEP)
+
+        calls = []
+        self.assertEqual(self.cache.get_or_fetch('key', ttl=0.2, fetch=lambda: calls.append(1) or 'v'), 'v')
+        self.assertEqual(self.cache.get_or_fetch('key', ttl=0.2, fetch=lambda: calls.append(1) or 'v'), 'v')
+        self.assertEqual(len(calls), 1)
+        time.sleep(0.25)
+        self.cache.get_or_fetch('key', ttl=0.2, fetch=lambda: calls.append(1) or 'v')
+        self.assertEqual(len(calls), 2)
+
+        def fail():
+            raise Exception('upstream error')
+
+        with self.assertRaises(Exception):
+            self.cache.get_or_fetch('error', ttl=10, fetch=fail)
+        self.assertEqual(self.cache.get_or_fetch('error', ttl=10, fetch=lambda: 'ok'), 'ok')
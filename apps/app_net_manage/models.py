@@ -126,7 +126,7 @@ def clean(self):
         except Exception as exc:
             raise ValidationError({'ip_value': str(exc)})
 
-        if isinstance(subnet, ipaddress.IPv4Network):
+        if isinstance(subnet, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
             self.ip_value = str(subnet)
 
         obj = NetIPAccessWhiteList.objects.exclude(id=self.id).filter(ip_value=self.ip_value).first()
@@ -1,15 +1,16 @@
-import ipaddress
 from typing import List, Union
 
 from django.core.cache import cache as dj_cache
 
-from utils.iprestrict import IPRestrictor, convert_iprange, IPRange
+from utils.iprestrict import IPRestrictor, convert_iprange, IPRange, IPNetwork, get_rules_version, new_rules_version
 from apps.app_net_manage.models import NetIPAccessWhiteList
 from rest_framework.permissions import BasePermission
 
 
 class NetIPRestrictor(IPRestrictor):
     CACHE_KEY = 'cache_net_manage_api_ip_access_whitelist'
+    VERSION_CACHE_KEY = 'cache_net_manage_api_ip_access_whitelist_version'
+    matcher_cache_key = 'net_manage_ip_whitelist'
 
     @staticmethod
     def get_whitelist_use_cahce() -> List[str]:
@@ -17,10 +18,11 @@ def get_whitelist_use_cahce() -> List[str]:
         if whitelist is None:
             whitelist = [i.ip_value for i in NetIPAccessWhiteList.objects.all()]
             dj_cache.set(NetIPRestrictor.CACHE_KEY, whitelist, timeout=60)
+            new_rules_version(cache_key=NetIPRestrictor.VERSION_CACHE_KEY, timeout=60)
 
         return whitelist
 
-    def get_ip_whitelist_rules(self) -> List[Union[ipaddress.IPv4Network, IPRange]]:
+    def get_ip_whitelist_rules(self) -> List[Union[IPNetwork, IPRange]]:
         ip_whitelist = self.get_whitelist_use_cahce()
         allowed_ips = []
         for ip_rule in ip_whitelist:
@@ -34,9 +36,13 @@ def get_ip_whitelist_rules(self) -> List[Union[ipaddress.IPv4Network, IPRange]]:
     def load_ip_rules(self):
         return self.get_ip_whitelist_rules()
 
+    def get_rules_version(self):
+        return get_rules_version(cache_key=NetIPRestrictor.VERSION_CACHE_KEY, timeout=60)
+
     @staticmethod
     def clear_cache():
         dj_cache.delete(NetIPRestrictor.CACHE_KEY)
+        new_rules_version(cache_key=NetIPRestrictor.VERSION_CACHE_KEY, timeout=60)
 
     @staticmethod
     def add_ip_rule(ip_value: str, remark: str = ''):
@@ -0,0 +1,297 @@
+import os
+import hashlib
+import tempfile
+import threading
+
+from django.conf import settings
+from django.db import connection
+
+from apps.app_global.models import GlobalConfig
+from apps.app_probe.models import ProbeMonitorWebsite
+
+
+class BlackboxConfigWriter:
+    """
+    prometheus blackbox http/tcp 配置文件写入器
+
+    监控任务的增删改只更新内存中的任务索引，并标记需要更新的配置文件；在防抖时间窗口结束时统一渲染一次配置文件，
+    写入临时文件后重命名替换配置文件，配置文件内容没有变化时不写入，也不重新加载prometheus配置。
+    """
+    HTTP = 'http'
+    TCP = 'tcp'
+    TYPES = (HTTP, TCP)
+    LOCAL_IP = '127.0.0.1:9115'
+    DEFAULT_DEBOUNCE_SECONDS = 2
+
+    TEMPLATE_NAMES = {
+        HTTP: GlobalConfig.ConfigName.PROMETHEUS_BLACKBOX_HTTP.value,
+        TCP: GlobalConfig.ConfigName.PROMETHEUS_BLACKBOX_TCP.value
+    }
+
+    def __init__(self, path_http: str, path_tcp: str, reload_func=None, debounce_seconds: float = None,
+                 load_from_db: bool = True, logger=None):
+        """
+        :param reload_func: 重新加载prometheus配置的函数
+        :param debounce_seconds: 防抖时间，秒，<=0时立即写入；None时使用配置项PROBE_BLACKBOX_CONFIG_DEBOUNCE
+        :param load_from_db: True(写入前从数据库重新加载任务索引，多进程共用配置文件时需要)；False(只使用内存中的任务索引)
+        """
+        self.paths = {self.HTTP: path_http, self.TCP: path_tcp}
+        self.reload_func = reload_func
+        self.debounce_seconds = debounce_seconds
+        self.load_from_db = load_from_db
+        self.logger = logger
+
+        self.targets = {self.HTTP: {}, self.TCP: {}}   # {blackbox_type: {url_hash: url}}
+        self.dirty_types = set()
+        self.write_count = 0
+        self.reload_count = 0
+        self._lock = threading.RLock()
+        self._timer = None
+
+    @classmethod
+    def get_blackbox_type(cls, url: str):
+        if url.startswith('http'):
+            return cls.HTTP
+        elif url.startswith('tcp'):
+            return cls.TCP
+
+        return None
+
+    def get_debounce_seconds(self):
+        if self.debounce_seconds is not None:
+            return self.debounce_seconds
+
+        return getattr(settings, 'PROBE_BLACKBOX_CONFIG_DEBOUNCE', self.DEFAULT_DEBOUNCE_SECONDS)
+
+    def add_targets(self, tasks: list):
+        """
+        批量添加监控任务
+
+        :param tasks: [{'url_hash': 'xx', 'url': 'xx'}]
+        :raises: Exception
+        """
+        return self.update_targets(add_tasks=tasks)
+
+    def remove_targets(self, tasks: list):
+        """
+        批量删除监控任务
+
+        :param tasks: [{'url_hash': 'xx', 'url': 'xx'}]
+        :raises: Exception
+        """
+        return self.update_targets(remove_tasks=tasks)
+
+    def update_targets(self, add_tasks: list = None, remove_tasks: list = None):
+        """
+        批量删除和添加监控任务，在防抖时间窗口结束时写入配置文件
+
+        :raises: Exception
+        """
+        with self._lock:
+            for task in remove_tasks or []:
+                for blackbox_type, targets in self.targets.items():
+                    if targets.pop(task['url_hash'], None) is not None:
+                        self.dirty_types.add(blackbox_type)
+
+                blackbox_type = self.get_blackbox_type(task['url'])
+                if blackbox_type:
+                    self.dirty_types.add(blackbox_type)
+
+            for task in add_tasks or []:
+                blackbox_type = self.get_blackbox_type(task['url'])
+                for _type, targets in self.targets.items():
+                    if _type != blackbox_type and targets.pop(task['url_hash'], None) is not None:
+                        self.dirty_types.add(_type)
+
+                if blackbox_type:
+                    self.targets[blackbox_type][task['url_hash']] = task['url']
+                    self.dirty_types.add(blackbox_type)
+
+        return self.schedule_flush()
+
+    def set_targets(self, tasks: list):
+        """
+        替换全部的监控任务
+        """
+        with self._lock:
+            self.targets = self.build_targets(tasks)
+            self.dirty_types.update(self.TYPES)
+
+        return self.schedule_flush()
+
+    def refresh(self, blackbox_types=TYPES):
+        """
+        立即重新写入配置文件，比如配置文件模板修改后
+        """
+        with self._lock:
+            self.dirty_types.update(blackbox_types)
+
+        return self.flush()
+
+    @classmethod
+    def build_targets(cls, tasks):
+        targets = {cls.HTTP: {}, cls.TCP: {}}
+        for task in tasks:
+            blackbox_type = cls.get_blackbox_type(task['url'])
+            if blackbox_type:
+                targets[blackbox_type][task['url_hash']] = task['url']
+
+        return targets
+
+    def load_targets(self):
+        tasks = ProbeMonitorWebsite.objects.values('url_hash', 'url')
+        self.targets = self.build_targets(tasks)
+
+    def schedule_flush(self):
+        """
+        :return:
+            True    # 配置文件已更新
+            False   # 配置文件没有变化
+            None    # 等待防抖时间窗口结束后写入
+        :raises: Exception
+        """
+        debounce_seconds = self.get_debounce_seconds()
+        if debounce_seconds <= 0:
+            return self.flush()
+
+        with self._lock:
+            self.get_templates(self.dirty_types)    # 配置文件模板不存在时立即报错
+            if self._timer is None:
+                self._timer = threading.Timer(debounce_seconds, self._timer_flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+        return None
+
+    def _timer_flush(self):
+        try:
+            self.flush()
+        except Exception as exc:
+            if self.logger:
+                self.logger.error(f'写入prometheus blackbox配置文件错误：{str(exc)}')
+        finally:
+            connection.close()
+
+    def flush(self):
+        """
+        写入需要更新的配置文件，有配置文件变化时重新加载prometheus配置
+
+        :return:
+            True    # 配置文件已更新
+            False   # 配置文件没有变化
+        :raises: Exception
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            blackbox_types = self.dirty_types
+            self.dirty_types = set()
+            if not blackbox_types:
+                return False
+
+            changed = False
+            try:
+                if self.load_from_db:
+                    self.load_targets()
+
+                templates = self.get_templates(blackbox_types)
+                for blackbox_type in sorted(blackbox_types):
+                    content = self.render(blackbox_type=blackbox_type, template=templates[blackbox_type])
+                    if self.write_if_changed(path=self.paths[blackbox_type], content=content):
+                        changed = True
+            except Exception as exc:
+                self.dirty_types.update(blackbox_types)
+                raise exc
+
+        if changed:
+            self.reload()
+
+        return changed
+
+    @classmethod
+    def get_templates(cls, blackbox_types) -> dict:
+        """
+        :raises: Exception
+        """
+        names = [cls.TEMPLATE_NAMES[t] for t in blackbox_types]
+        name_values = dict(GlobalConfig.objects.filter(name__in=names).values_list('name', 'value'))
+        templates = {}
+        for blackbox_type in blackbox_types:
+            value = name_values.get(cls.TEMPLATE_NAMES[blackbox_type])
+            if not value:
+                raise Exception(f'未找到 "promtheus blackbox {blackbox_type} 配置文件模板"内容')
+
+            templates[blackbox_type] = value
+
+        return templates
+
+    def render(self, blackbox_type: str, template: str):
+        """
+        渲染配置文件内容，按url_hash排序，保证任务不变时内容不变
+        """
+        template = template.replace('\r\n', '\n').replace('\r', '\n')  # Windows, MacOS
+        lines = ['scrape_configs:\n']
+        targets = self.targets[blackbox_type]
+        for url_hash in sorted(targets.keys()):
+            url = targets[url_hash]
+            if blackbox_type == self.HTTP:
+                yml = template.format(url_hash=url_hash, url=url, local_ip=self.LOCAL_IP)
+            else:
+                yml = template.format(tcp_hash=url_hash, tcp_url=url, local_ip=self.LOCAL_IP)
+
+            lines.append(yml + '\n\n')  # 最后留空行
+
+        return ''.join(lines)
+
+    def write_if_changed(self, path: str, content: str):
+        """
+        内容和当前配置文件不同时写入临时文件，然后重命名替换配置文件
+
+        每次都和磁盘上的文件比较，多进程写同一个配置文件时，不会因为进程内记录的旧内容误判
+
+        :return:
+            True    # 已写入
+            False   # 内容没有变化
+        """
+        data = content.encode('utf-8')
+        if self.get_file_hash(path) == hashlib.sha256(data).hexdigest():
+            return False
+
+        dir_path = os.path.dirname(path)
+        os.makedirs(dir_path, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dir_path, prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except Exception as exc:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise exc
+
+        self.write_count += 1
+        return True
+
+    @staticmethod
+    def get_file_hash(path: str):
+        """
+        :return:
+            str     # 文件内容的sha256
+            None    # 文件不存在
+        """
+        try:
+            with open(path, 'rb') as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        except FileNotFoundError:
+            return None
+
+    def reload(self):
+        if self.reload_func is not None:
+            self.reload_func()
+            self.reload_count += 1
@@ -1,12 +1,35 @@
 import os
+import threading
 
 from apps.app_probe.models import ProbeDetails, ProbeMonitorWebsite
+from apps.app_probe.handlers.config_writer import BlackboxConfigWriter
 from core import errors
 from core.loggers import config_script_logger
 from apps.app_global.models import GlobalConfig
 
 probe_logger = config_script_logger(name='app-probe-handler', filename='app_probe.log')
 
+_blackbox_config_writer = None
+_blackbox_config_writer_lock = threading.Lock()
+
+
+def get_blackbox_config_writer() -> BlackboxConfigWriter:
+    """
+    进程内共用的blackbox配置文件写入器，合并防抖时间窗口内的任务变化
+    """
+    global _blackbox_config_writer
+
+    if _blackbox_config_writer is None:
+        with _blackbox_config_writer_lock:
+            if _blackbox_config_writer is None:
+                handler = ProbeHandlers()
+                _blackbox_config_writer = BlackboxConfigWriter(
+                    path_http=handler.path_http, path_tcp=handler.path_tcp,
+                    reload_func=ProbeHandlers.reload_prometheus_config, logger=probe_logger
+                )
+
+    return _blackbox_config_writer
+
 
 class ProbeHandlers:
 
@@ -88,14 +111,9 @@ def add_probe_website(self, task: dict):
         except Exception as e:
             raise errors.Error(message=f'创建探针网站监控任务错误：{str(e)}')
 
-        if task['url'].startswith('http'):
-            need_update_blackbox_type = 'http'
-        else:
-            need_update_blackbox_type = 'tcp'
-
         try:
-            self.update_prometheus_blackbox_http_tcp(blackbox_type=need_update_blackbox_type)
-        except errors.Error as e:
+            get_blackbox_config_writer().add_targets(tasks=[task])
+        except Exception as e:
             probe_logger.error(msg=f'添加探针信息后重新加载prometheus配置文件时错误：{str(e)}')
             raise e
 
@@ -117,14 +135,9 @@ def delete_probe_website(self, task: dict):
         except Exception as e:
             raise errors.Error(message=f'删除探针网站监控任务错误：{str(e)}')
 
-        if task['url'].startswith('http'):
-            need_update_blackbox_type = 'http'
-        else:
-            need_update_blackbox_type = 'tcp'
-
         try:
-            self.update_prometheus_blackbox_http_tcp(blackbox_type=need_update_blackbox_type)
-        except errors.Error as e:
+            get_blackbox_config_writer().remove_targets(tasks=[{'url_hash': obj.url_hash, 'url': obj.url}])
+        except Exception as e:
             probe_logger.error(msg=f'删除探针信息后重新加载prometheus配置文件时错误：{str(e)}')
             raise e
 
@@ -153,6 +166,7 @@ def update_probe_website(self, task: dict, newtask: dict):
         except Exception as e:
             raise errors.BadRequest(message=str(e))
 
+        old_task = {'url_hash': obj.url_hash, 'url': obj.url}
         update_fields_list = []
         if newtask['url'] and newtask['url'] != obj.url:
             obj.url = newtask['url']
@@ -174,14 +188,10 @@ def update_probe_website(self, task: dict, newtask: dict):
         if update_fields_list:
             obj.save(update_fields=update_fields_list)
 
-            if newtask['url'].startswith('http'):
-                need_update_blackbox_type = 'http'
-            else:
-                need_update_blackbox_type = 'tcp'
-
             try:
-                self.update_prometheus_blackbox_http_tcp(blackbox_type=need_update_blackbox_type)
-            except errors.Error as e:
+                get_blackbox_config_writer().update_targets(
+                    add_tasks=[{'url_hash': obj.url_hash, 'url': obj.url}], remove_tasks=[old_task])
+            except Exception as e:
                 probe_logger.error(msg=f'更新探针信息后重新加载prometheus配置文件时错误：{str(e)}')
                 raise e
 
@@ -247,55 +257,6 @@ def write_prometheus_config_node(self, path, prometheus_base_node_yml):
         except Exception as e:
             raise Exception(f'写入prometheus_exporter_node.yml文件时错误：{str(e)}')
 
-    @staticmethod
-    def write_probe_http_config(website, prometheus_blackbox_http_yml, path_http):
-        """
-        :param website: url 数据
-        :param prometheus_blackbox_http_yml:  http 模板
-        :param path_http: prometheus http 配置文件路径
-        """
-
-        os.makedirs(os.path.dirname(path_http), exist_ok=True)
-
-        with open(path_http, mode='w') as f:
-            f.write('scrape_configs:' + '\n')
-            for line in website:
-
-                if line.url.startswith('http'):
-                    yml_http = prometheus_blackbox_http_yml.format(url_hash=line.url_hash, url=line.url,
-                                                                   local_ip='127.0.0.1:9115')
-
-                    config = yml_http.replace('\r\n', '\n')  # Windows
-                    yml_http = config.replace('\r', '\n')  # MacOS
-                    f.write(yml_http + '\n\n')  # 最后留空行
-
-        return
-
-    @staticmethod
-    def write_probe_tcp_config(website, prometheus_blackbox_tcp_yml, path_tcp):
-        """
-        :param website: url 数据
-        :param prometheus_blackbox_tcp_yml:  http 模板
-        :param path_tcp: prometheus tcp 配置文件路径
-        """
-
-        os.makedirs(os.path.dirname(path_tcp), exist_ok=True)
-
-        with open(path_tcp, mode='w') as f:
-            f.write('scrape_configs:' + '\n')
-
-            for line in website:
-
-                if line.url.startswith('tcp'):
-                    yml_tcp = prometheus_blackbox_tcp_yml.format(tcp_hash=line.url_hash, tcp_url=line.url,
-                                                                 local_ip='127.0.0.1:9115')
-
-                    config = yml_tcp.replace('\r\n', '\n')  # Windows
-                    yml_tcp = config.replace('\r', '\n')  # MacOS
-                    f.write(yml_tcp + '\n\n')
-
-        return
-
     def update_prometheus_exporter_node_yml(self, obj: GlobalConfig = None):
         """更新 prometheus exorpter node """
 
@@ -395,51 +356,24 @@ def update_prometheus_yml(self, obj: GlobalConfig = None):
 
         self.reload_prometheus_config()
 
-    def update_prometheus_blackbox_http_yml(self):
-        """更新 prometheus http """
-        website_qs = self.get_probe_monitor_website()  # 数据集
-
-        if not website_qs:
-            return
-
-        yml_template = GlobalConfig.objects.filter(name=GlobalConfig.ConfigName.PROMETHEUS_BLACKBOX_HTTP.value).first()
-        if not yml_template or not yml_template.value:
-            raise Exception(f'未找到 "promtheus blackbox http 配置文件模板"内容')
-
-        try:
-            self.write_probe_http_config(website=website_qs, prometheus_blackbox_http_yml=yml_template.value,
-                                         path_http=self.path_http)
-        except Exception as e:
-            raise Exception(f'写入prometheus_blackbox_http.yml文件时错误:{str(e)}')
-
-        self.reload_prometheus_config()
-
-    def update_prometheus_blackbox_tcp_yml(self):
-        """更新 prometheus tcp """
-        website_qs = self.get_probe_monitor_website()  # 数据集
-
-        if not website_qs:
-            return
-
-        yml_template = GlobalConfig.objects.filter(name=GlobalConfig.ConfigName.PROMETHEUS_BLACKBOX_TCP.value).first()
-        if not yml_template or not yml_template.value:
-            raise Exception(f'未找到 "promtheus blackbox tcp 配置文件模板"内容')
-
-        try:
-            self.write_probe_tcp_config(website=website_qs, prometheus_blackbox_tcp_yml=yml_template.value,
-                                        path_tcp=self.path_tcp)
-        except Exception as e:
-            raise Exception(f'写入prometheus_blackbox_http.yml文件时错误:{str(e)}')
+    @staticmethod
+    def update_prometheus_blackbox_http_tcp(blackbox_type):
+        """
+        重新写入 prometheus blackbox http 或 tcp 配置文件
 
-        self.reload_prometheus_config()
+        :param blackbox_type: http or tcp
+        :raises: Exception
+        """
+        return get_blackbox_config_writer().refresh(blackbox_types=[blackbox_type])
 
-    def update_prometheus_blackbox_http_tcp(self, blackbox_type):
-        """"""
+    @staticmethod
+    def update_prometheus_blackbox_all():
+        """
+        重新写入 prometheus blackbox http 和 tcp 配置文件，只重新加载一次prometheus配置
 
-        if blackbox_type == "http":
-            return self.update_prometheus_blackbox_http_yml()
-        else:
-            return self.update_prometheus_blackbox_tcp_yml()
+        :raises: Exception
+        """
+        return get_blackbox_config_writer().refresh(blackbox_types=BlackboxConfigWriter.TYPES)
 
     def update_prometheus_service_url(self):
         """prometheus 服务地址更新 """
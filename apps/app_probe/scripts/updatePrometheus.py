@@ -8,6 +8,8 @@
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "django_site.settings")
 setup()
 
+from django.db import transaction
+
 from apps.app_probe.models import ProbeDetails, ProbeMonitorWebsite
 from apps.app_probe.handlers.handlers import ProbeHandlers
 
@@ -41,28 +43,56 @@ def get_website_task(task_list_url):
 def get_task_data(task_list_url, next_task_list_url):
     """获取任务数据"""
     init_data = []
-    ProbeMonitorWebsite.objects.all().delete()  # 清空数据表
 
     while True:
 
         data, next_flag, next_marker = get_website_task(task_list_url=next_task_list_url)
-
-        for task in data:
-            try:
-                ProbeMonitorWebsite.objects.create(
-                    url_hash=task['url_hash'],
-                    is_tamper_resistant=task['is_tamper_resistant'],
-                    url=task['url'],
-                )
-            except Exception as e:
-                probe_logger.error(f'添加任务 url 信息有误，路径：{next_task_list_url}；错误信息： {str(e)}')
+        if data is None:
+            raise Exception(f'查询任务信息有误，路径：{next_task_list_url}')
 
         init_data = init_data + data  # 合并数据
 
         if next_flag:
             next_task_list_url = f'{task_list_url}?marker={next_marker}'
         else:
-            return init_data
+            break
+
+    sync_task_data(tasks=init_data)
+    return init_data
+
+
+def sync_task_data(tasks: list):
+    """
+    任务数据与数据表比较，批量添加、更新和删除有变化的任务
+    """
+    task_map = {task['url_hash']: task for task in tasks}
+    exists_map = {obj.url_hash: obj for obj in ProbeMonitorWebsite.objects.all()}
+
+    delete_ids = [obj.id for url_hash, obj in exists_map.items() if url_hash not in task_map]
+    create_objs = []
+    update_objs = []
+    for url_hash, task in task_map.items():
+        obj = exists_map.get(url_hash)
+        if obj is None:
+            create_objs.append(ProbeMonitorWebsite(
+                url_hash=task['url_hash'],
+                is_tamper_resistant=task['is_tamper_resistant'],
+                url=task['url'],
+            ))
+        elif obj.url != task['url'] or obj.is_tamper_resistant != task['is_tamper_resistant']:
+            obj.url = task['url']
+            obj.is_tamper_resistant = task['is_tamper_resistant']
+            update_objs.append(obj)
+
+    with transaction.atomic():
+        if delete_ids:
+            ProbeMonitorWebsite.objects.filter(id__in=delete_ids).delete()
+        if update_objs:
+            ProbeMonitorWebsite.objects.bulk_update(update_objs, fields=['url', 'is_tamper_resistant'], batch_size=500)
+        if create_objs:
+            ProbeMonitorWebsite.objects.bulk_create(create_objs, batch_size=500)
+
+    probe_logger.info(f'同步任务，添加{len(create_objs)}，更新{len(update_objs)}，删除{len(delete_ids)}')
 
 
 def get_zk_website_task(web_version_url, web_task_list_url):
@@ -95,11 +125,16 @@ def get_zk_website_task(web_version_url, web_task_list_url):
             return
 
     if obj.version != version:
+        try:
+            get_task_data(task_list_url=task_list_url, next_task_list_url=next_task_list_url)
+        except Exception as e:
+            probe_logger.error(f'同步任务信息有误：{str(e)}')
+            return
+
+        # 任务同步成功后再更新版本号，同步失败时下次重新同步
         obj.version = version
         obj.save(update_fields=['version'])
 
-        get_task_data(task_list_url=task_list_url, next_task_list_url=next_task_list_url)
-
         update_prometheus_config()
 
     return
@@ -107,8 +142,7 @@ def get_zk_website_task(web_version_url, web_task_list_url):
 def update_prometheus_config():
 
     try:
-        ProbeHandlers().update_prometheus_blackbox_http_tcp(blackbox_type='http')
-        ProbeHandlers().update_prometheus_blackbox_http_tcp(blackbox_type='tcp')
+        ProbeHandlers.update_prometheus_blackbox_all()
     except Exception as e:
         probe_logger.error(f'重新加载prometheus服务配置有误：{str(e)}')
 
@@ -1,4 +1,5 @@
 from django.urls import reverse
+from django.test.utils import override_settings
 
 from apps.app_global.models import GlobalConfig
 from utils.test import get_or_create_user, MyAPITestCase
@@ -55,6 +56,7 @@
 """
 
 
+@override_settings(PROBE_BLACKBOX_CONFIG_DEBOUNCE=0)
 class ProbeTestClass(MyAPITestCase):
 
     def setUp(self):
@@ -0,0 +1,155 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from django.test.testcases import TransactionTestCase
+
+from apps.app_global.models import GlobalConfig
+from apps.app_probe.models import ProbeMonitorWebsite
+from apps.app_probe.handlers.handlers import ProbeHandlers
+from apps.app_probe.handlers.config_writer import BlackboxConfigWriter
+from .test_app_probe import prometheus_blackbox_http, prometheus_blackbox_tcp
+
+
+class StubPrometheusHandler(BaseHTTPRequestHandler):
+    """
+    模拟prometheus重新加载配置接口
+    """
+    reload_count = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if self.path == '/-/reload':
+            StubPrometheusHandler.reload_count += 1
+
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class BlackboxConfigWriterTests(TransactionTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubPrometheusHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        host, port = self.server.server_address
+        StubPrometheusHandler.reload_count = 0
+
+        GlobalConfig.objects.filter(name__startswith='prometheus').delete()
+        GlobalConfig.objects.create(name='prometheus_service_url', value=f'http://{host}:{port}')
+        GlobalConfig.objects.create(name='prometheus_blackbox_http', value=prometheus_blackbox_http)
+        GlobalConfig.objects.create(name='prometheus_blackbox_tcp', value=prometheus_blackbox_tcp)
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.path_http = os.path.join(self.temp_dir, 'prometheus_blackbox_http.yml')
+        self.path_tcp = os.path.join(self.temp_dir, 'prometheus_blackbox_tcp.yml')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def new_writer(self, debounce_seconds: float = 0, load_from_db: bool = False):
+        return BlackboxConfigWriter(
+            path_http=self.path_http, path_tcp=self.path_tcp, reload_func=ProbeHandlers.reload_prometheus_config,
+            debounce_seconds=debounce_seconds, load_from_db=load_from_db
+        )
+
+    @staticmethod
+    def read_file(path):
+        with open(path) as f:
+            return f.read()
+
+    def test_batch_add_remove(self):
+        writer = self.new_writer()
+        http_tasks = [{'url_hash': f'hash{i}', 'url': f'https://test{i}.cn/'} for i in range(5)]
+        tcp_tasks = [{'url_hash': f'tcphash{i}', 'url': f'tcp://test{i}.cn:22'} for i in range(3)]
+        self.assertIs(writer.add_targets(http_tasks + tcp_tasks), True)
+        self.assertEqual(writer.write_count, 2)
+        self.assertEqual(StubPrometheusHandler.reload_count, 1)
+
+        http_content = self.read_file(self.path_http)
+        self.assertTrue(http_content.startswith('scrape_configs:\n'))
+        self.assertEqual(http_content.count('job_name'), 5)
+        self.assertIn("- job_name: 'hash0'", http_content)
+        self.assertIn("- 'https://test4.cn/'", http_content)
+        tcp_content = self.read_file(self.path_tcp)
+        self.assertEqual(tcp_content.count('job_name'), 3)
+        self.assertIn('url: tcp://test2.cn:22', tcp_content)
+        # 临时文件已重命名
+        self.assertEqual(sorted(os.listdir(self.temp_dir)),
+                         ['prometheus_blackbox_http.yml', 'prometheus_blackbox_tcp.yml'])
+
+        # 内容没有变化，不写入不重新加载
+        self.assertIs(writer.add_targets(http_tasks[0:2]), False)
+        self.assertEqual(writer.write_count, 2)
+        self.assertEqual(StubPrometheusHandler.reload_count, 1)
+
+        # 新的写入器和已有文件内容相同
+        writer2 = self.new_writer()
+        self.assertIs(writer2.set_targets(http_tasks + tcp_tasks), False)
+        self.assertEqual(writer2.write_count, 0)
+        self.assertEqual(StubPrometheusHandler.reload_count, 1)
+
+        # 删除只更新http配置文件
+        self.assertIs(writer.remove_targets(http_tasks[0:2]), True)
+        self.assertEqual(writer.write_count, 3)
+        self.assertEqual(StubPrometheusHandler.reload_count, 2)
+        http_content = self.read_file(self.path_http)
+        self.assertEqual(http_content.count('job_name'), 3)
+        self.assertNotIn("'hash0'", http_content)
+        self.assertEqual(self.read_file(self.path_tcp), tcp_content)
+
+        # http改为tcp
+        writer.update_targets(
+            add_tasks=[{'url_hash': 'hash4', 'url': 'tcp://test4.cn:22'}],
+            remove_tasks=[{'url_hash': 'hash4', 'url': 'https://test4.cn/'}])
+        self.assertEqual(self.read_file(self.path_http).count('job_name'), 2)
+        self.assertEqual(self.read_file(self.path_tcp).count('job_name'), 4)
+        self.assertEqual(StubPrometheusHandler.reload_count, 3)
+
+        # 配置文件被其他进程改写后，内容和磁盘上的文件比较，重新写入
+        tcp_content = self.read_file(self.path_tcp)
+        with open(self.path_tcp, 'w') as f:
+            f.write('scrape_configs:\n')
+
+        self.assertIs(writer.add_targets([{'url_hash': 'hash4', 'url': 'tcp://test4.cn:22'}]), True)
+        self.assertEqual(self.read_file(self.path_tcp), tcp_content)
+        self.assertEqual(StubPrometheusHandler.reload_count, 4)
+
+    def test_debounce(self):
+        writer = self.new_writer(debounce_seconds=0.3)
+        for i in range(200):
+            self.assertIsNone(writer.add_targets([{'url_hash': f'hash{i}', 'url': f'https://test{i}.cn/'}]))
+
+        self.assertFalse(os.path.exists(self.path_http))
+        deadline = time.time() + 5
+        while StubPrometheusHandler.reload_count < 1 and time.time() < deadline:
+            time.sleep(0.05)
+
+        self.assertEqual(writer.write_count, 1)
+        self.assertEqual(StubPrometheusHandler.reload_count, 1)
+        self.assertEqual(self.read_file(self.path_http).count('job_name'), 200)
+        self.assertFalse(os.path.exists(self.path_tcp))
+
+        # 模板不存在时立即报错
+        GlobalConfig.objects.filter(name='prometheus_blackbox_tcp').delete()
+        with self.assertRaises(Exception):
+            writer.add_targets([{'url_hash': 'tcphash', 'url': 'tcp://test.cn:22'}])
+
+    def test_load_from_db(self):
+        ProbeMonitorWebsite.objects.bulk_create([
+            ProbeMonitorWebsite(url_hash=f'hash{i}', url=f'https://test{i}.cn/') for i in range(10)
+        ])
+        writer = self.new_writer(load_from_db=True)
+        self.assertIs(writer.refresh(), True)
+        self.assertEqual(self.read_file(self.path_http).count('job_name'), 10)
+        self.assertEqual(self.read_file(self.path_tcp), 'scrape_configs:\n')
+        self.assertEqual(StubPrometheusHandler.reload_count, 1)
+        self.assertIs(writer.refresh(), False)
+        self.assertEqual(StubPrometheusHandler.reload_count, 1)
@@ -2,6 +2,7 @@
 import datetime
 from datetime import timedelta
 
+from django.db import connection
 from django.utils import timezone
 from django.test.testcases import TransactionTestCase
 from django.core import mail
@@ -16,6 +17,7 @@
 )
 from apps.app_wallet.models import PayApp, PayAppService, CashCoupon
 from apps.app_storage.models import ObjectsService, Bucket, BucketArchive
+from apps.app_users.models import UserProfile, Email
 from apps.app_vo.models import VirtualOrganization, VoMember
 from apps.app_report.models import MonthlyReport, BucketMonthlyReport
 from apps.app_report.workers.report_generator import (
@@ -1053,14 +1055,144 @@ def test_monthly_report(self):
 
         # 邮件
         self.assertEqual(len(mail.outbox), 0)
+        # 发件箱中其他待发送的月度报表邮件
+        other_email = Email.build_save_email(
+            subject='test', receivers=['other@cnic.cn'], message='test', tag=Email.Tag.MONTH.value, queued=True)
+        # 只发送指定用户的邮件
+        MonthlyReportNotifier(report_data=mrg.report_period_date, log_stdout=True).send_monthly_report_to_username(
+            username=self.user1.username)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.user1.username])
+        other_email.refresh_from_db()
+        self.assertEqual(other_email.status, Email.Status.WAIT.value)
+
         MonthlyReportNotifier(report_data=mrg.report_period_date, log_stdout=True).run()
-        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(len(mail.outbox), 3)
+        other_email.refresh_from_db()
+        self.assertEqual(other_email.status, Email.Status.SUCCESS.value)
         u1_report.refresh_from_db()
         self.assertIsInstance(u1_report.notice_time, datetime.datetime)
         u2_report: MonthlyReport = MonthlyReport.objects.filter(
             report_date=self.report_period_date, user_id=self.user2.id, owner_type=OwnerType.USER.value).first()
         self.assertIsInstance(u2_report.notice_time, datetime.datetime)
 
+    @staticmethod
+    def get_reports_values():
+        """
+        :return: (
+            {(owner_type, user_id, vo_id): {field: value}},    # 月度报表
+            {bucket_id: {field: value}}     # 存储桶月度报表
+        )
+        """
+        fields = [f.attname for f in MonthlyReport._meta.concrete_fields if f.attname not in (
+            'id', 'creation_time', 'notice_time')]
+        reports = {}
+        for r in MonthlyReport.objects.values(*fields):
+            reports[(r['owner_type'], r['user_id'], r['vo_id'])] = r
+
+        b_fields = [f.attname for f in BucketMonthlyReport._meta.concrete_fields if f.attname not in (
+            'id', 'creation_time')]
+        bucket_reports = {r['bucket_id']: r for r in BucketMonthlyReport.objects.values(*b_fields)}
+        return reports, bucket_reports
+
+    def test_monthly_report_batch(self):
+        self.user1.date_joined = self.report_period_start_time
+        self.user1.save(update_fields=['date_joined'])
+        self.user2.date_joined = self.report_period_start_time - timedelta(days=6)
+        self.user2.save(update_fields=['date_joined'])
+        self.vo1.creation_time = self.report_period_start_time + timedelta(days=8)
+        self.vo1.save(update_fields=['creation_time'])
+        self.vo2.creation_time = self.report_period_start_time + timedelta(days=20)
+        self.vo2.save(update_fields=['creation_time'])
+
+        self.init_order_data()
+        self.init_server_metering_data()
+        self.init_server_daily_statement()
+        self.init_bucket_data()
+        self.init_storage_daily_statement()
+        self.init_coupons()
+        self.init_disk_metering_data()
+        self.init_disk_daily_statement()
+        self.init_site_metering_data()
+        self.init_site_statement_data()
+        self.init_vm_snapshot_data()
+        self.init_scan_data()
+
+        MonthlyReportGenerator(limit=1, log_stdout=True).run(check_time=False)
+        self.assertEqual(4, MonthlyReport.objects.count())
+        self.assertEqual(4, BucketMonthlyReport.objects.count())
+        reports, bucket_reports = self.get_reports_values()
+
+        # 批量模式生成的报表与逐个生成的一致
+        MonthlyReport.objects.all().delete()
+        BucketMonthlyReport.objects.all().delete()
+        mrg = MonthlyReportGenerator(limit=1, log_stdout=True, batch=True)
+        mrg.run(check_time=False)
+        self.assertEqual(mrg.new_create_report_count, 4)
+        self.assertEqual(mrg.failed_create_report_count, 0)
+        batch_reports, batch_bucket_reports = self.get_reports_values()
+        self.assertEqual(reports, batch_reports)
+        self.assertEqual(bucket_reports, batch_bucket_reports)
+
+        # 已生成的不重复生成，未生成完成的重新生成
+        MonthlyReport.objects.filter(user_id=self.user1.id).update(is_reported=False, server_count=0)
+        MonthlyReport.objects.filter(vo_id=self.vo1.id).update(is_reported=False, server_count=0)
+        mrg = MonthlyReportGenerator(limit=3, log_stdout=True, batch=True)
+        mrg.run(check_time=False)
+        self.assertEqual(mrg.new_create_report_count, 2)
+        self.assertEqual(mrg.already_report_count, 2)
+        batch_reports, batch_bucket_reports = self.get_reports_values()
+        self.assertEqual(reports, batch_reports)
+        self.assertEqual(bucket_reports, batch_bucket_reports)
+
+    def test_monthly_report_batch_benchmark(self):
+        """
+        逐个生成和批量模式生成的查询数
+        """
+        user_count = 300
+        start_time = self.report_period_start_time - timedelta(days=30)
+        users = []
+        for i in range(user_count):
+            user = UserProfile(username=f'bench{i}@cnic.cn', is_active=True,
+                               date_joined=start_time + timedelta(seconds=i))
+            user.id = f'bench-user-{i}'
+            users.append(user)
+
+        UserProfile.objects.bulk_create(users, batch_size=500)
+        UserProfile.objects.filter(id__in=[self.user1.id, self.user2.id]).update(is_active=False)
+        VirtualOrganization.objects.filter(id__in=[self.vo1.id, self.vo2.id]).update(deleted=True)
+        meterings = []
+        for i, user in enumerate(users):
+            for d in range(3):
+                meterings.append(MeteringServer(
+                    id=f'bench-ms-{i}-{d}', cpu_hours=float(d), ram_hours=float(i % 7), public_ip_hours=0,
+                    disk_hours=float(d + 3), trade_amount=Decimal(f'{d}.12'), original_amount=Decimal(f'{i % 5}.3'),
+                    service_id=None, server_id=f'bench-server{i}', date=self.report_period_start + timedelta(days=d),
+                    user_id=user.id, owner_type=OwnerType.USER.value
+                ))
+
+        MeteringServer.objects.bulk_create(meterings, batch_size=500)
+
+        results = {}
+        for batch in [False, True]:
+            MonthlyReport.objects.all().delete()
+            mrg = MonthlyReportGenerator(limit=500, log_stdout=False, batch=batch)
+            query_count = 0
+
+            def count_queries(execute, sql, params, many, context):
+                nonlocal query_count
+                query_count += 1
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(count_queries):
+                mrg.run(check_time=False)
+
+            self.assertEqual(mrg.new_create_report_count, user_count)
+            results[batch] = (query_count, self.get_reports_values())
+
+        self.assertEqual(results[False][1], results[True][1])
+        self.assertLess(results[True][0] * 100, results[False][0])
+
     def test_last_target_day_date(self):
         for day in range(1, 28):
             start_date = datetime.date(year=2023, month=5, day=day)
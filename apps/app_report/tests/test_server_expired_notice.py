@@ -1,4 +1,5 @@
 from datetime import timedelta
+from unittest import mock
 
 from django.utils import timezone
 from django.test.testcases import TransactionTestCase
@@ -8,6 +9,8 @@
 from utils.test import get_or_create_user
 from apps.app_vo.models import VirtualOrganization, VoMember
 from apps.app_servers.models import Server
+from apps.app_users.models import Email
+from apps.app_users.email_outbox import EmailOutbox
 from apps.app_report.workers.server_notifier import (
     ServerNotifier
 )
@@ -253,3 +256,27 @@ def test_server_expired(self):
 
         ServerNotifier(is_update_server_email_time=True, filter_out_notified=False).run(after_days=7)
         self.assertEqual(len(mail.outbox), 27 + 6)
+
+    def test_notice_time_after_sent(self):
+        """
+        邮件发送成功后才设置云主机的通知时间，发送失败的下次通知时重新通知
+        """
+        self.init_users_and_vo()
+        with mock.patch.object(
+            EmailOutbox, 'send_over_connection', lambda _self, emails: [(e, 'smtp down', False) for e in emails]
+        ):
+            ServerNotifier(is_update_server_email_time=True, filter_out_notified=True).run(after_days=0)
+
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(Email.objects.filter(status=Email.Status.FAILED.value).count(), 5)
+        self.assertFalse(Server.objects.filter(email_lasttime__isnull=False).exists())
+
+        ServerNotifier(is_update_server_email_time=True, filter_out_notified=True).run(after_days=0)
+        self.assertEqual(len(mail.outbox), 5)
+        self.server1.refresh_from_db()
+        self.assertIsNotNone(self.server1.email_lasttime)
+        self.server5_vo5.refresh_from_db()
+        self.assertIsNotNone(self.server5_vo5.email_lasttime)
+
+        ServerNotifier(is_update_server_email_time=True, filter_out_notified=True).run(after_days=0)
+        self.assertEqual(len(mail.outbox), 5)
@@ -5,10 +5,10 @@
 from django.db.models import Sum, Count, Q
 from django.db import transaction
 from django.template.loader import get_template
-from django.core.mail import send_mail
 from django.conf import settings
 
 from apps.app_users.models import UserProfile, Email
+from apps.app_users.email_outbox import EmailOutbox
 from apps.app_vo.models import VirtualOrganization, VoMember
 from apps.app_metering.managers import (
     MeteringServerManager, MeteringStorageManager, StatementStorageManager, StatementServerManager,
@@ -86,8 +86,16 @@ def hours_to_days(hours: float) -> float:
 
 
 class MonthlyReportGenerator:
-    def __init__(self, report_data: datetime.date = None, log_stdout: bool = False, limit: int = 1000):
+    BULK_CREATE_BATCH_SIZE = 500
+
+    def __init__(
+            self, report_data: datetime.date = None, log_stdout: bool = False, limit: int = 1000, batch: bool = False
+    ):
+        """
+        :param batch: True(批量模式，每项指标一次分组聚合查询出所有用户或vo的数据，按limit分批批量插入报表)
+        """
         self.limit = limit if limit > 0 else 1000      # 每次从数据库获取vo和user的数量
+        self.batch = batch
         self.logger = config_script_logger(
             name='script_monthly_report_logger', filename='monthly_report.log', stdout=log_stdout)
 
@@ -123,8 +131,12 @@ def run(self, check_time=True):
                 self.logger.error(f'Exit，生成月度报表的当前时间{nt} 必须在月度报表周期时间{self.report_period_end_time}之后。')
                 return None
 
-        self.generate_vos_report()
-        self.generate_users_report()
+        if self.batch:
+            self.generate_vos_report_batch()
+            self.generate_users_report_batch()
+        else:
+            self.generate_vos_report()
+            self.generate_users_report()
 
         exit_str = f'Exit, new generate count {self.new_create_report_count},' \
                    f'failed count {self.failed_create_report_count}, already exists count {self.already_report_count};'
@@ -229,6 +241,316 @@ def generate_vos_report(self):
 
         self.logger.warning('End VO monthly report generate.')
 
+    def generate_users_report_batch(self):
+        """
+        批量模式生成用户月度报表
+        """
+        self.logger.warning('Start user monthly report batch generate.')
+        try:
+            period_data = self.load_period_data(owner_type=OwnerType.USER.value)
+        except Exception as exc:
+            self.logger.error(f'Load period data error, {str(exc)}, try to generate one by one.')
+            self.generate_users_report()
+            return
+
+        last_joined_time = None
+        while True:
+            try:
+                users = list(self.get_users(limit=self.limit, time_joined_gt=last_joined_time,
+                                            date_joined_lt=self.report_period_end_time))
+                if len(users) <= 0:
+                    break
+
+                last_joined_time = users[-1].date_joined
+                self.generate_owners_report_batch(
+                    owners=users, owner_type=OwnerType.USER.value, period_data=period_data)
+            except Exception as exc:
+                self.logger.error(f'error, {str(exc)}')
+
+        self.logger.warning('End user monthly report batch generate.')
+
+    def generate_vos_report_batch(self):
+        """
+        批量模式生成vo月度报表
+        """
+        self.logger.warning('Start VO monthly report batch generate.')
+        try:
+            period_data = self.load_period_data(owner_type=OwnerType.VO.value)
+        except Exception as exc:
+            self.logger.error(f'Load period data error, {str(exc)}, try to generate one by one.')
+            self.generate_vos_report()
+            return
+
+        last_creation_time = None
+        while True:
+            try:
+                vos = list(self.get_vos(limit=self.limit, creation_time_gt=last_creation_time,
+                                        creation_time_lt=self.report_period_end_time))
+                if len(vos) <= 0:
+                    break
+
+                last_creation_time = vos[-1].creation_time
+                self.generate_owners_report_batch(
+                    owners=vos, owner_type=OwnerType.VO.value, period_data=period_data)
+            except Exception as exc:
+                self.logger.error(f'error, {str(exc)}')
+
+        self.logger.warning('End VO monthly report batch generate.')
+
+    def generate_owners_report_batch(self, owners: list, owner_type: str, period_data: dict):
+        """
+        为一批用户或vo生成月度报表，已生成的跳过，未生成完成的删除后重新生成，报表批量插入；
+        批量插入失败时逐个生成
+        """
+        is_user = owner_type == OwnerType.USER.value
+        owner_field = 'user_id' if is_user else 'vo_id'
+        owner_ids = [o.id for o in owners]
+        try:
+            with transaction.atomic():
+                exists_reports = MonthlyReport.objects.filter(
+                    report_date=self.report_period_date, owner_type=owner_type, **{f'{owner_field}__in': owner_ids}
+                ).values_list(owner_field, 'is_reported')
+                reported_ids = set()
+                unreported_ids = set()
+                for owner_id, is_reported in exists_reports:
+                    if is_reported:
+                        reported_ids.add(owner_id)
+                    else:
+                        unreported_ids.add(owner_id)
+
+                if unreported_ids:
+                    if is_user:
+                        BucketMonthlyReport.objects.filter(
+                            report_date=self.report_period_date, user_id__in=unreported_ids).delete()
+
+                    MonthlyReport.objects.filter(
+                        report_date=self.report_period_date, owner_type=owner_type,
+                        **{f'{owner_field}__in': unreported_ids}
+                    ).delete()
+
+                new_owners = [o for o in owners if o.id not in reported_ids]
+                if is_user:
+                    bucket_reports = self.build_users_bucket_reports(users=new_owners, period_data=period_data)
+                    month_reports = [self.build_user_report_from_period_data(
+                        user=u, period_data=period_data) for u in new_owners]
+                else:
+                    bucket_reports = []
+                    month_reports = [self.build_vo_report_from_period_data(
+                        vo=vo, period_data=period_data) for vo in new_owners]
+
+                BucketMonthlyReport.objects.bulk_create(bucket_reports, batch_size=self.BULK_CREATE_BATCH_SIZE)
+                MonthlyReport.objects.bulk_create(month_reports, batch_size=self.BULK_CREATE_BATCH_SIZE)
+        except Exception as exc:
+            self.logger.error(f'Batch generate monthly report error, {str(exc)}, try to generate one by one.')
+            self.generate_owners_report_one_by_one(owners=owners, owner_type=owner_type)
+            return
+
+        self.already_report_count += len(reported_ids)
+        self.new_create_report_count += len(month_reports)
+
+    def generate_owners_report_one_by_one(self, owners: list, owner_type: str):
+        for owner in owners:
+            try:
+                if owner_type == OwnerType.USER.value:
+                    created, report = self.generate_report_for_user(
+                        user=owner, report_date=self.report_period_date,
+                        report_period_start=self.report_period_start,
+                        report_period_end=self.report_period_end,
+                        report_period_start_time=self.report_period_start_time,
+                        report_period_end_time=self.report_period_end_time
+                    )
+                else:
+                    created, report = self.generate_report_for_vo(
+                        vo=owner, report_date=self.report_period_date,
+                        report_period_start=self.report_period_start,
+                        report_period_end=self.report_period_end,
+                        report_period_start_time=self.report_period_start_time,
+                        report_period_end_time=self.report_period_end_time
+                    )
+            except Exception as exc:
+                self.failed_create_report_count += 1
+                self.logger.error(f'Generate monthly report for {owner_type}(id={owner.id}) error, {str(exc)}')
+                continue
+
+            if created:
+                self.new_create_report_count += 1
+            else:
+                self.already_report_count += 1
+
+    @staticmethod
+    def empty_aggs(aggs: dict) -> dict:
+        """
+        没有数据时的聚合结果，与aggregate()查询空数据集时的结果一致
+        """
+        return {k: a.default if a.default is not None else a.empty_result_set_value for k, a in aggs.items()}
+
+    @staticmethod
+    def group_by_owner(queryset, fields: list, aggs: dict) -> dict:
+        """
+        按分组字段聚合查询
+
+        :param fields: 分组字段，第一个是所有者字段
+        :return:
+            {owner_id: agg}               # 一个分组字段
+            {(owner_id, field2): agg}     # 多个分组字段
+        """
+        result = {}
+        for item in queryset.values(*fields).annotate(**aggs).order_by():
+            key = tuple(item.pop(f) for f in fields)
+            result[key[0] if len(key) == 1 else key] = item
+
+        return result
+
+    def load_period_data(self, owner_type: str) -> dict:
+        """
+        批量模式，报表周期内所有用户或vo的各项指标，每项指标一次分组聚合查询
+        """
+        if owner_type == OwnerType.USER.value:
+            owner_field = 'user_id'
+            snapshot_classification = ServerSnapshot.Classification.PERSONAL.value
+        else:
+            owner_field = 'vo_id'
+            snapshot_classification = ServerSnapshot.Classification.VO.value
+
+        date_start, date_end = self.report_period_start, self.report_period_end
+        start_time, end_time = self.report_period_start_time, self.report_period_end_time
+        paid = PaymentStatus.PAID.value
+        sum_trade_amount = {'total_trade_amount': Sum('trade_amount')}
+        data = {
+            # 云主机
+            'server': self.group_by_owner(
+                MeteringServerManager().filter_server_metering_queryset(
+                    date_start=date_start, date_end=date_end).filter(owner_type=owner_type),
+                fields=[owner_field], aggs=self.server_metering_aggs()),
+            'server_postpaid': self.group_by_owner(
+                StatementServerManager().filter_statement_server_queryset(
+                    payment_status=paid, date_start=date_start, date_end=date_end).filter(owner_type=owner_type),
+                fields=[owner_field], aggs=sum_trade_amount),
+            # 云硬盘
+            'disk': self.group_by_owner(
+                MeteringDiskManager().filter_disk_metering_queryset(
+                    date_start=date_start, date_end=date_end).filter(owner_type=owner_type),
+                fields=[owner_field], aggs=self.disk_metering_aggs()),
+            'disk_postpaid': self.group_by_owner(
+                StatementDiskManager().filter_statement_disk_queryset(
+                    payment_status=paid, date_start=date_start, date_end=date_end).filter(owner_type=owner_type),
+                fields=[owner_field], aggs=sum_trade_amount),
+            # 云主机、云硬盘、快照、安全扫描订购预付费金额
+            'prepaid': self.group_by_owner(
+                Order.objects.filter(
+                    owner_type=owner_type, payment_time__gte=start_time, payment_time__lte=end_time,
+                    status=Order.Status.PAID.value, pay_type=PayType.PREPAID.value,
+                    resource_type__in=[ResourceType.VM.value, ResourceType.DISK.value,
+                                       ResourceType.VM_SNAPSHOT.value, ResourceType.SCAN.value]
+                ), fields=[owner_field, 'resource_type'], aggs={'total_pay_amount': Sum('pay_amount')}),
+            # 月度云主机快照数
+            'snapshot': self.group_by_owner(
+                ServerSnapshot.objects.filter(classification=snapshot_classification).filter(
+                    Q(creation_time__lte=end_time, deleted=False) |
+                    Q(creation_time__lte=end_time, deleted_time__gte=start_time, deleted=True)
+                ), fields=[owner_field], aggs={'snapshot_count': Count('id')})
+        }
+        if owner_type != OwnerType.USER.value:
+            return data
+
+        # 对象存储
+        storage_meter_qs = MeteringStorageManager().filter_obs_metering_queryset(
+            date_start=date_start, date_end=date_end)
+        data['storage'] = self.group_by_owner(
+            storage_meter_qs, fields=['user_id'], aggs=self.storage_metering_aggs())
+        data['storage_postpaid'] = self.group_by_owner(
+            StatementStorageManager().filter_statement_storage_queryset(
+                payment_status=paid, date_start=date_start, date_end=date_end),
+            fields=['user_id'], aggs=sum_trade_amount)
+        # 存储桶
+        user_buckets = {}
+        bucket_aggs = storage_meter_qs.values('user_id', 'storage_bucket_id').annotate(
+            **self.bucket_metering_aggs()).order_by()
+        for ba in bucket_aggs:
+            user_buckets.setdefault(ba.pop('user_id'), []).append(ba)
+
+        data['bucket'] = user_buckets
+        # 站点监控
+        data['site'] = self.group_by_owner(
+            MeteringMonitorSiteManager().filter_metering_queryset(date_start=date_start, date_end=date_end),
+            fields=['user_id'], aggs=self.site_metering_aggs())
+        data['site_paid'] = self.group_by_owner(
+            MeteringMonitorSiteManager().filter_statement_queryset(
+                payment_status=paid, date_start=date_start, date_end=date_end),
+            fields=['user_id'], aggs=sum_trade_amount)
+        # 安全扫描任务数
+        data['scan'] = self.group_by_owner(
+            VtTask.objects.filter(create_time__gte=start_time, create_time__lte=end_time),
+            fields=['user_id', 'type'], aggs={'count': Count('id')})
+        return data
+
+    def _owner_server_disk_snapshot_report(self, owner_id: str, period_data: dict):
+        """
+        :return: (server_report, disk_report, snap_report)
+        """
+        def get_prepaid(resource_type: str):
+            return period_data['prepaid'].get((owner_id, resource_type), {}).get('total_pay_amount')
+
+        server_report = self.server_report_from_aggs(
+            server_m_agg=period_data['server'].get(owner_id) or self.empty_aggs(self.server_metering_aggs()),
+            server_postpaid_amount=period_data['server_postpaid'].get(owner_id, {}).get('total_trade_amount'),
+            server_prepaid_amount=get_prepaid(ResourceType.VM.value)
+        )
+        disk_report = self.disk_report_from_aggs(
+            disk_m_agg=period_data['disk'].get(owner_id) or self.empty_aggs(self.disk_metering_aggs()),
+            disk_postpaid_amount=period_data['disk_postpaid'].get(owner_id, {}).get('total_trade_amount'),
+            disk_prepaid_amount=get_prepaid(ResourceType.DISK.value)
+        )
+        snap_report = {
+            'snapshot_count': period_data['snapshot'].get(owner_id, {}).get('snapshot_count', 0),
+            'total_pay_amount': get_prepaid(ResourceType.VM_SNAPSHOT.value) or Decimal('0.00')
+        }
+        return server_report, disk_report, snap_report
+
+    def build_user_report_from_period_data(self, user: UserProfile, period_data: dict):
+        server_report, disk_report, snap_report = self._owner_server_disk_snapshot_report(
+            owner_id=user.id, period_data=period_data)
+        scan_counts = period_data['scan']
+        return self.build_user_month_report(
+            user_id=user.id, username=user.username, report_date=self.report_period_date,
+            report_period_start_time=self.report_period_start_time,
+            report_period_end_time=self.report_period_end_time,
+            storage_meter_agg=period_data['storage'].get(user.id) or self.empty_aggs(self.storage_metering_aggs()),
+            storage_postpaid_amount=period_data['storage_postpaid'].get(user.id, {}).get('total_trade_amount'),
+            server_report=server_report, disk_report=disk_report,
+            site_meter_agg=period_data['site'].get(user.id) or self.empty_aggs(self.site_metering_aggs()),
+            site_paid_amount=period_data['site_paid'].get(user.id, {}).get('total_trade_amount') or Decimal('0.00'),
+            snap_report=snap_report,
+            scan_web_count=scan_counts.get((user.id, VtTask.TaskType.WEB.value), {}).get('count', 0),
+            scan_host_count=scan_counts.get((user.id, VtTask.TaskType.HOST.value), {}).get('count', 0),
+            scan_prepaid_amount=period_data['prepaid'].get(
+                (user.id, ResourceType.SCAN.value), {}).get('total_pay_amount')
+        )
+
+    def build_vo_report_from_period_data(self, vo: VirtualOrganization, period_data: dict):
+        server_report, disk_report, snap_report = self._owner_server_disk_snapshot_report(
+            owner_id=vo.id, period_data=period_data)
+        return self.build_vo_month_report(
+            vo_id=vo.id, vo_name=vo.name, report_date=self.report_period_date,
+            report_period_start_time=self.report_period_start_time,
+            report_period_end_time=self.report_period_end_time,
+            server_report=server_report, disk_report=disk_report, snap_report=snap_report
+        )
+
+    def build_users_bucket_reports(self, users: list, period_data: dict):
+        user_buckets = period_data['bucket']
+        bucket_ids = [ba['storage_bucket_id'] for u in users for ba in user_buckets.get(u.id, [])]
+        if not bucket_ids:
+            return []
+
+        bkts = self._get_buckets_with_service(bucket_ids=bucket_ids)
+        return [
+            self.build_bucket_report(
+                user_id=u.id, username=u.username, report_date=self.report_period_date,
+                bucket_agg=ba, bucket=bkts.get(ba['storage_bucket_id'], None)
+            ) for u in users for ba in user_buckets.get(u.id, [])
+        ]
+
     def generate_report_for_user_by_name(self, username: str):
         user = UserProfile.objects.filter(username=username).first()
         if user is None:
@@ -294,12 +616,7 @@ def _generate_report_for_user(
         storage_meter_qs = MeteringStorageManager().filter_obs_metering_queryset(
             date_start=report_period_start, date_end=report_period_end, user_id=user.id
         )
-        storage_meter_agg = storage_meter_qs.aggregate(
-            total_storage=Sum('storage'),
-            total_original_amount=Sum('original_amount'),
-            total_trade_amount=Sum('trade_amount'),
-            bucket_count=Count('storage_bucket_id', distinct=True)
-        )
+        storage_meter_agg = storage_meter_qs.aggregate(**MonthlyReportGenerator.storage_metering_aggs())
         # 对象存储日结算单
         state_storage_agg = StatementStorageManager().filter_statement_storage_queryset(
             date_start=report_period_start, date_end=report_period_end,
@@ -325,13 +642,7 @@ def _generate_report_for_user(
         # 站点监控
         site_meter_agg = MeteringMonitorSiteManager().filter_metering_queryset(
             date_start=report_period_start, date_end=report_period_end, user_id=user.id
-        ).aggregate(
-            total_hours=Sum('hours', default=0),
-            total_tamper_hours=Sum('hours', filter=Q(tamper_resistant_count__gt=0), default=0),
-            total_original_amount=Sum('original_amount', default=Decimal('0.00')),
-            total_trade_amount=Sum('trade_amount', default=Decimal('0.00')),
-            website_count=Count('website_id', distinct=True)
-        )
+        ).aggregate(**MonthlyReportGenerator.site_metering_aggs())
         # 站点监控日结算单
         site_state_agg = MeteringMonitorSiteManager().filter_statement_queryset(
             date_start=report_period_start, date_end=report_period_end,
@@ -362,6 +673,51 @@ def _generate_report_for_user(
             user_id=user.id, type=VtTask.TaskType.HOST.value,
             create_time__gte=report_period_start_time, create_time__lte=report_period_end_time).count()
 
+        month_report = MonthlyReportGenerator.build_user_month_report(
+            user_id=user.id, username=user.username, report_date=report_date,
+            report_period_start_time=report_period_start_time, report_period_end_time=report_period_end_time,
+            storage_meter_agg=storage_meter_agg, storage_postpaid_amount=state_storage_agg['total_trade_amount'],
+            server_report=server_report, disk_report=disk_report,
+            site_meter_agg=site_meter_agg, site_paid_amount=site_state_agg['total_trade_amount'],
+            snap_report=snap_report, scan_web_count=scan_web_count, scan_host_count=scan_host_count,
+            scan_prepaid_amount=scan_order_agg['total_pay_amount']
+        )
+        month_report.save(force_insert=True)
+        return month_report
+
+    @staticmethod
+    def storage_metering_aggs():
+        return {
+            'total_storage': Sum('storage'),
+            'total_original_amount': Sum('original_amount'),
+            'total_trade_amount': Sum('trade_amount'),
+            'bucket_count': Count('storage_bucket_id', distinct=True)
+        }
+
+    @staticmethod
+    def site_metering_aggs():
+        return {
+            'total_hours': Sum('hours', default=0),
+            'total_tamper_hours': Sum('hours', filter=Q(tamper_resistant_count__gt=0), default=0),
+            'total_original_amount': Sum('original_amount', default=Decimal('0.00')),
+            'total_trade_amount': Sum('trade_amount', default=Decimal('0.00')),
+            'website_count': Count('website_id', distinct=True)
+        }
+
+    @staticmethod
+    def build_user_month_report(
+            user_id: str, username: str, report_date: datetime.date,
+            report_period_start_time: datetime.datetime, report_period_end_time: datetime.datetime,
+            storage_meter_agg: dict, storage_postpaid_amount, server_report: dict, disk_report: dict,
+            site_meter_agg: dict, site_paid_amount, snap_report: dict,
+            scan_web_count: int, scan_host_count: int, scan_prepaid_amount
+    ):
+        """
+        用户月度报表对象，未保存到数据库
+
+        :param storage_meter_agg: 对象存储计量聚合数据
+        :param site_meter_agg: 站点监控计量聚合数据
+        """
         month_report = MonthlyReport(
             creation_time=timezone.now(),
             report_date=report_date,
@@ -369,8 +725,8 @@ def _generate_report_for_user(
             period_end_time=report_period_end_time,
             is_reported=True,
             notice_time=None,
-            user_id=user.id,
-            username=user.username,
+            user_id=user_id,
+            username=username,
             vo_id=None,
             vo_name='',
             owner_type=OwnerType.USER.value
@@ -380,8 +736,32 @@ def _generate_report_for_user(
         month_report.storage_days = hours_to_days(storage_meter_agg['total_storage'])
         month_report.storage_original_amount = storage_meter_agg['total_original_amount'] or Decimal('0.00')
         month_report.storage_payable_amount = storage_meter_agg['total_trade_amount'] or Decimal('0.00')
-        month_report.storage_postpaid_amount = state_storage_agg['total_trade_amount'] or Decimal('0.00')
+        month_report.storage_postpaid_amount = storage_postpaid_amount or Decimal('0.00')
+
+        # 云主机、云硬盘、云主机快照
+        MonthlyReportGenerator.set_server_disk_snapshot_report(
+            month_report=month_report, server_report=server_report, disk_report=disk_report, snap_report=snap_report)
+        # 站点监控
+        month_report.site_count = site_meter_agg['website_count']
+        month_report.site_tamper_days = site_meter_agg['total_tamper_hours'] / 24
+        month_report.site_days = site_meter_agg['total_hours'] / 24
+        month_report.site_original_amount = site_meter_agg['total_original_amount']
+        month_report.site_payable_amount = site_meter_agg['total_trade_amount']
+        month_report.site_paid_amount = site_paid_amount
 
+        # 安全扫描
+        month_report.scan_web_count = scan_web_count
+        month_report.scan_host_count = scan_host_count
+        month_report.scan_prepaid_amount = scan_prepaid_amount or Decimal('0.00')
+        month_report.enforce_id()
+        return month_report
+
+    @staticmethod
+    def set_server_disk_snapshot_report(
+            month_report: MonthlyReport, server_report: dict, disk_report: dict, snap_report: dict):
+        """
+        月度报表的云主机、云硬盘和云主机快照数据
+        """
         # 云主机
         month_report.server_cpu_days = server_report['server_cpu_days']
         month_report.server_ram_days = server_report['server_ram_days']
@@ -400,24 +780,10 @@ def _generate_report_for_user(
         month_report.disk_payable_amount = disk_report['disk_payable_amount']
         month_report.disk_postpaid_amount = disk_report['disk_postpaid_amount']
         month_report.disk_prepaid_amount = disk_report['disk_prepaid_amount']
-        # 站点监控
-        month_report.site_count = site_meter_agg['website_count']
-        month_report.site_tamper_days = site_meter_agg['total_tamper_hours'] / 24
-        month_report.site_days = site_meter_agg['total_hours'] / 24
-        month_report.site_original_amount = site_meter_agg['total_original_amount']
-        month_report.site_payable_amount = site_meter_agg['total_trade_amount']
-        month_report.site_paid_amount = site_state_agg['total_trade_amount']
 
         # 云主机快照
         month_report.s_snapshot_count = snap_report['snapshot_count']
         month_report.s_snapshot_prepaid_amount = snap_report['total_pay_amount']
-        # 安全扫描
-        month_report.scan_web_count = scan_web_count
-        month_report.scan_host_count = scan_host_count
-        month_report.scan_prepaid_amount = scan_order_agg['total_pay_amount'] or Decimal('0.00')
-
-        month_report.save(force_insert=True)
-        return month_report
 
     @staticmethod
     def get_vo_or_user_disk_report(
@@ -435,12 +801,7 @@ def get_vo_or_user_disk_report(
         disk_meter_qs = MeteringDiskManager().filter_disk_metering_queryset(
             user_id=user_id, vo_id=vo_id, date_start=report_period_start, date_end=report_period_end
         )
-        disk_m_agg = disk_meter_qs.aggregate(
-            total_size_hours=Sum('size_hours'),
-            total_original_amount=Sum('original_amount'),
-            total_trade_amount=Sum('trade_amount'),
-            disk_count=Count('disk_id', distinct=True)
-        )
+        disk_m_agg = disk_meter_qs.aggregate(**MonthlyReportGenerator.disk_metering_aggs())
 
         # 云硬盘日结算单
         state_disk_agg = StatementDiskManager().filter_statement_disk_queryset(
@@ -466,6 +827,25 @@ def get_vo_or_user_disk_report(
             total_pay_amount=Sum('pay_amount')
         )
 
+        return MonthlyReportGenerator.disk_report_from_aggs(
+            disk_m_agg=disk_m_agg, disk_postpaid_amount=state_disk_agg['total_trade_amount'],
+            disk_prepaid_amount=order_agg['total_pay_amount']
+        )
+
+    @staticmethod
+    def disk_metering_aggs():
+        return {
+            'total_size_hours': Sum('size_hours'),
+            'total_original_amount': Sum('original_amount'),
+            'total_trade_amount': Sum('trade_amount'),
+            'disk_count': Count('disk_id', distinct=True)
+        }
+
+    @staticmethod
+    def disk_report_from_aggs(disk_m_agg: dict, disk_postpaid_amount, disk_prepaid_amount):
+        """
+        由云硬盘计量聚合数据、日结算单金额和预付费金额整理云硬盘月度报表数据
+        """
         total_size_hours = disk_m_agg['total_size_hours']
         if total_size_hours:
             disk_size_days = total_size_hours / 24
@@ -480,11 +860,9 @@ def get_vo_or_user_disk_report(
         if not disk_payable_amount:
             disk_payable_amount = Decimal('0.00')
 
-        disk_postpaid_amount = state_disk_agg['total_trade_amount']
         if not disk_postpaid_amount:
             disk_postpaid_amount = Decimal('0.00')
 
-        disk_prepaid_amount = order_agg['total_pay_amount']
         if not disk_prepaid_amount:
             disk_prepaid_amount = Decimal('0.00')
 
@@ -576,16 +954,29 @@ def get_vo_or_user_server_report(
         ).aggregate(
             total_pay_amount=Sum('pay_amount')
         )
-        server_m_agg = server_meter_qs.aggregate(
-            total_cpu_hours=Sum('cpu_hours'),
-            total_ram_hours=Sum('ram_hours'),
-            total_disk_hours=Sum('disk_hours'),
-            total_public_ip_hours=Sum('public_ip_hours'),
-            total_original_amount=Sum('original_amount'),
-            total_trade_amount=Sum('trade_amount'),
-            server_count=Count('server_id', distinct=True)
+        server_m_agg = server_meter_qs.aggregate(**MonthlyReportGenerator.server_metering_aggs())
+        return MonthlyReportGenerator.server_report_from_aggs(
+            server_m_agg=server_m_agg, server_postpaid_amount=state_server_agg['total_trade_amount'],
+            server_prepaid_amount=server_order_agg['total_pay_amount']
         )
 
+    @staticmethod
+    def server_metering_aggs():
+        return {
+            'total_cpu_hours': Sum('cpu_hours'),
+            'total_ram_hours': Sum('ram_hours'),
+            'total_disk_hours': Sum('disk_hours'),
+            'total_public_ip_hours': Sum('public_ip_hours'),
+            'total_original_amount': Sum('original_amount'),
+            'total_trade_amount': Sum('trade_amount'),
+            'server_count': Count('server_id', distinct=True)
+        }
+
+    @staticmethod
+    def server_report_from_aggs(server_m_agg: dict, server_postpaid_amount, server_prepaid_amount):
+        """
+        由云主机计量聚合数据、日结算单金额和预付费金额整理云主机月度报表数据
+        """
         return {
             'server_cpu_days': hours_to_days(server_m_agg['total_cpu_hours']),
             'server_ram_days': hours_to_days(server_m_agg['total_ram_hours']),
@@ -594,8 +985,8 @@ def get_vo_or_user_server_report(
             'server_count': server_m_agg['server_count'] or 0,
             'server_original_amount': server_m_agg['total_original_amount'] or Decimal('0.00'),
             'server_payable_amount': server_m_agg['total_trade_amount'] or Decimal('0.00'),
-            'server_postpaid_amount': state_server_agg['total_trade_amount'] or Decimal('0.00'),
-            'server_prepaid_amount': server_order_agg['total_pay_amount'] or Decimal('0.00')
+            'server_postpaid_amount': server_postpaid_amount or Decimal('0.00'),
+            'server_prepaid_amount': server_prepaid_amount or Decimal('0.00')
         }
 
     def generate_report_for_vo(
@@ -656,6 +1047,23 @@ def _generate_report_for_vo(
             report_period_start_time=report_period_start_time, report_period_end_time=report_period_end_time
         )
 
+        month_report = MonthlyReportGenerator.build_vo_month_report(
+            vo_id=vo.id, vo_name=vo.name, report_date=report_date,
+            report_period_start_time=report_period_start_time, report_period_end_time=report_period_end_time,
+            server_report=server_report, disk_report=disk_report, snap_report=snap_report
+        )
+        month_report.save(force_insert=True)
+        return month_report
+
+    @staticmethod
+    def build_vo_month_report(
+            vo_id: str, vo_name: str, report_date: datetime.date,
+            report_period_start_time: datetime.datetime, report_period_end_time: datetime.datetime,
+            server_report: dict, disk_report: dict, snap_report: dict
+    ):
+        """
+        vo月度报表对象，未保存到数据库
+        """
         month_report = MonthlyReport(
             creation_time=timezone.now(),
             report_date=report_date,
@@ -665,28 +1073,13 @@ def _generate_report_for_vo(
             notice_time=None,
             user_id=None,
             username='',
-            vo_id=vo.id,
-            vo_name=vo.name,
+            vo_id=vo_id,
+            vo_name=vo_name,
             owner_type=OwnerType.VO.value
         )
-        # 云主机
-        month_report.server_cpu_days = server_report['server_cpu_days']
-        month_report.server_ram_days = server_report['server_ram_days']
-        month_report.server_disk_days = server_report['server_disk_days']
-        month_report.server_ip_days = server_report['server_ip_days']
-        month_report.server_count = server_report['server_count']
-        month_report.server_original_amount = server_report['server_original_amount']
-        month_report.server_payable_amount = server_report['server_payable_amount']
-        month_report.server_prepaid_amount = server_report['server_prepaid_amount']
-        month_report.server_postpaid_amount = server_report['server_postpaid_amount']
-
-        # 云硬盘
-        month_report.disk_count = disk_report['disk_count']
-        month_report.disk_size_days = disk_report['disk_size_days']
-        month_report.disk_original_amount = disk_report['disk_original_amount']
-        month_report.disk_payable_amount = disk_report['disk_payable_amount']
-        month_report.disk_postpaid_amount = disk_report['disk_postpaid_amount']
-        month_report.disk_prepaid_amount = disk_report['disk_prepaid_amount']
+        # 云主机、云硬盘、云主机快照
+        MonthlyReportGenerator.set_server_disk_snapshot_report(
+            month_report=month_report, server_report=server_report, disk_report=disk_report, snap_report=snap_report)
 
         # 对象存储
         month_report.bucket_count = 0
@@ -701,15 +1094,11 @@ def _generate_report_for_vo(
         month_report.site_original_amount = Decimal('0.00')
         month_report.site_payable_amount = Decimal('0.00')
         month_report.site_paid_amount = Decimal('0.00')
-        # 云主机快照
-        month_report.s_snapshot_count = snap_report['snapshot_count']
-        month_report.s_snapshot_prepaid_amount = snap_report['total_pay_amount']
         # 安全扫描
         month_report.scan_web_count = 0
         month_report.scan_host_count = 0
         month_report.scan_prepaid_amount = Decimal('0.00')
-
-        month_report.save(force_insert=True)
+        month_report.enforce_id()
         return month_report
 
     @staticmethod
@@ -749,9 +1138,7 @@ def do_user_bucket_reports(
             date_start=report_period_start, date_end=report_period_end, user_id=user.id
         )
         b_anno_qs = b_meter_qs.values('storage_bucket_id').annotate(
-            total_storage_hours=Sum('storage'),
-            total_original_amount=Sum('original_amount'),
-            total_trade_amount=Sum('trade_amount')
+            **MonthlyReportGenerator.bucket_metering_aggs()
         ).order_by()
 
         bucket_ids = [b['storage_bucket_id'] for b in b_anno_qs]
@@ -760,34 +1147,52 @@ def do_user_bucket_reports(
 
         bkts = MonthlyReportGenerator._get_buckets_with_service(bucket_ids=bucket_ids)
 
-        bucket_reports = []
-        for ba in b_anno_qs:
-            bkt_id = ba['storage_bucket_id']
-            bkt = bkts.get(bkt_id, None)
-            service_id = service_name = bucket_name = ''
-            if bkt:
-                service_id = bkt['service__id'] or ''
-                service_name = bkt['service__name'] or ''
-                bucket_name = bkt['name'] or ''
-
-            bmr = BucketMonthlyReport(
-                creation_time=timezone.now(),
-                report_date=report_date,
-                user_id=user.id,
-                username=user.username,
-                service_id=service_id,
-                service_name=service_name,
-                bucket_id=bkt_id,
-                bucket_name=bucket_name,
-                storage_days=hours_to_days(ba['total_storage_hours']),
-                original_amount=ba['total_original_amount'] or Decimal('0.00'),
-                payable_amount=ba['total_trade_amount'] or Decimal('0.00')
-            )
-            bmr.enforce_id()
-            bucket_reports.append(bmr)
-
+        bucket_reports = [
+            MonthlyReportGenerator.build_bucket_report(
+                user_id=user.id, username=user.username, report_date=report_date,
+                bucket_agg=ba, bucket=bkts.get(ba['storage_bucket_id'], None)
+            ) for ba in b_anno_qs
+        ]
         return True, BucketMonthlyReport.objects.bulk_create(bucket_reports)
 
+    @staticmethod
+    def bucket_metering_aggs():
+        return {
+            'total_storage_hours': Sum('storage'),
+            'total_original_amount': Sum('original_amount'),
+            'total_trade_amount': Sum('trade_amount')
+        }
+
+    @staticmethod
+    def build_bucket_report(user_id: str, username: str, report_date: datetime.date, bucket_agg: dict, bucket: dict):
+        """
+        存储桶月度报表对象，未保存到数据库
+
+        :param bucket_agg: 存储桶计量聚合数据
+        :param bucket: 存储桶和服务单元信息，_get_buckets_with_service()返回的数据项
+        """
+        service_id = service_name = bucket_name = ''
+        if bucket:
+            service_id = bucket['service__id'] or ''
+            service_name = bucket['service__name'] or ''
+            bucket_name = bucket['name'] or ''
+
+        bmr = BucketMonthlyReport(
+            creation_time=timezone.now(),
+            report_date=report_date,
+            user_id=user_id,
+            username=username,
+            service_id=service_id,
+            service_name=service_name,
+            bucket_id=bucket_agg['storage_bucket_id'],
+            bucket_name=bucket_name,
+            storage_days=hours_to_days(bucket_agg['total_storage_hours']),
+            original_amount=bucket_agg['total_original_amount'] or Decimal('0.00'),
+            payable_amount=bucket_agg['total_trade_amount'] or Decimal('0.00')
+        )
+        bmr.enforce_id()
+        return bmr
+
     @staticmethod
     def get_users(limit: int, time_joined_gt=None, date_joined_lt=None):
         qs = UserProfile.objects.filter(
@@ -858,7 +1263,15 @@ def __init__(self, report_data: datetime.date = None, log_stdout: bool = False,
     def run(self):
         self.logger.warning(f"Start send Email for user's monthly report: {self.report_period_date}")
         send_ok_count = self.do_loop_email()
-        self.logger.warning(f"End send email for user's monthly report，Send {send_ok_count} email ok.")
+        self.logger.warning(f"End queue email for user's monthly report，Queue {send_ok_count} email ok.")
+        stats = self.send_queued_emails()
+        self.logger.warning(f"End send email for user's monthly report，Send {stats['sent']} email ok.")
+
+    def send_queued_emails(self):
+        """
+        通过发件箱批量发送待发送的月度报表邮件
+        """
+        return EmailOutbox(logger=self.logger).drain(tag=Email.Tag.MONTH.value)
 
     def do_loop_email(self):
         last_joined_time = None
@@ -887,7 +1300,7 @@ def do_loop_email(self):
                             self.logger.error(f'Send email monthly report for user({user.username}), {str(exc)}')
 
                     last_joined_time = user.date_joined
-                    if ok is True:
+                    if isinstance(ok, Email):
                         send_ok_count += 1
                         print(f'Ok email to {user.username}')
             except Exception as exc:
@@ -903,7 +1316,10 @@ def send_monthly_report_to_username(self, username: str, report_date=None):
         if report_date is None:
             report_date = self.report_period_date
 
-        self.send_monthly_report_to_user(user=user, report_date=report_date)
+        email = self.send_monthly_report_to_user(user=user, report_date=report_date)
+        if isinstance(email, Email):
+            # 只发送此用户的邮件，不发送发件箱中其他待发送的月度报表邮件
+            EmailOutbox(logger=self.logger).drain(email_ids=[email.id])
 
     def get_context(self, user, report_date):
         user_server_reports = self.get_user_server_monthly_reports(
@@ -976,10 +1392,12 @@ def get_context(self, user, report_date):
 
     def send_monthly_report_to_user(self, user, report_date):
         """
+        邮件保存为待发送的邮件记录，由发件箱批量发送
+
         :return:
             None        # 已发送过邮件，或者不满足发送条件
-            True        # 发送成功
-            False       # 发送失败
+            Email()     # 已保存的待发送邮件
+            False       # 保存邮件失败
 
         :raises: Exception
         """
@@ -1007,7 +1425,7 @@ def send_monthly_report_to_user(self, user, report_date):
         html_message = self.html_minify(html_message)
         subject = f'{self.website_brand}资源用量结算账单（{self.report_period_date.month}月）'
 
-        # 先保存邮件记录
+        # 保存待发送邮件记录
         try:
             with transaction.atomic():
                 monthly_report.notice_time = timezone.now()
@@ -1017,7 +1435,8 @@ def send_monthly_report_to_user(self, user, report_date):
                     sender=settings.EMAIL_HOST_USER,
                     email_host=settings.EMAIL_HOST,
                     tag=Email.Tag.MONTH.value, is_html=True,
-                    status=Email.Status.WAIT.value, status_desc='', success_time=None
+                    status=Email.Status.WAIT.value, status_desc='', success_time=None,
+                    next_retry_time=timezone.now()      # 加入发件箱
                 )
                 email.save(force_insert=True)
         except Exception as exc:
@@ -1025,23 +1444,7 @@ def send_monthly_report_to_user(self, user, report_date):
                 f"User {user.username} monthly({report_date}) report email save to db failed {str(exc)}.")
             return False
 
-        try:
-            ok = send_mail(
-                subject=subject,  # 标题
-                message='',  # 内容
-                from_email=settings.EMAIL_HOST_USER,  # 发送者
-                recipient_list=[user.username],  # 接收者
-                html_message=html_message,    # 内容
-                fail_silently=False,
-            )
-            if ok == 0:
-                raise Exception('failed')
-        except Exception as exc:
-            email.set_send_failed(desc=str(exc), save_db=True)
-            return False
-
-        email.set_send_success(desc='', save_db=True)
-        return True
+        return email
 
     @staticmethod
     def is_need_email(monthly_reports: list):
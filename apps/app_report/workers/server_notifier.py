@@ -12,6 +12,7 @@
 from apps.app_servers.models import ServiceConfig, Server
 from apps.app_servers.managers import ServerManager
 from apps.app_users.models import Email, UserProfile
+from apps.app_users.email_outbox import EmailOutbox
 from apps.app_vo.models import VirtualOrganization, VoMember
 from utils.model import PayType, OwnerType
 from core import site_configs_manager as site_configs
@@ -300,13 +301,19 @@ class BaseNotifier:
     def __init__(self, filter_out_notified: bool, log_stdout: bool = False):
         self.logger = config_script_logger(name='script-server-logger', filename="server_notice.log", stdout=log_stdout)
         self.querier = ServerQuerier(filter_out_notified=filter_out_notified)
+        self.pending_notices = {}   # {email_id: [server_id, ]}，邮件发送成功后设置这些云主机的通知时间
 
-    def do_email_notice(self, subject: str, html_message: str, username: str):
+    def do_email_notice(self, subject: str, html_message: str, username: str, server_ids: list):
+        """
+        保存待发送邮件记录，由发件箱send_queued_emails()批量发送，邮件发送成功后才设置云主机的通知时间
+
+        :param server_ids: 邮件通知的云主机
+        """
         html_message = self.html_minify(html_message)
         try:
             email = Email.send_email(
                 subject=subject, receivers=[username], message='', html_message=html_message,
-                tag=Email.Tag.RES_EXP.value, save_db=True, is_feint=False
+                tag=Email.Tag.RES_EXP.value, save_db=True, is_feint=False, queued=True
             )
             if email is None:
                 self.logger.warning(
@@ -317,8 +324,31 @@ def do_email_notice(self, subject: str, html_message: str, username: str):
                 f"User {username} servers expired email save to db failed {str(exc)}.")
             return False
 
+        self.pending_notices[email.id] = server_ids
         return True
 
+    def send_queued_emails(self):
+        """
+        通过发件箱批量发送待发送的过期通知邮件，设置发送成功的邮件通知的云主机的通知时间；
+        未发送成功的邮件通知的云主机不设置通知时间，下次通知时重新通知
+        """
+        stats = EmailOutbox(logger=self.logger).drain(tag=Email.Tag.RES_EXP.value)
+        email_ids = list(self.pending_notices.keys())
+        if email_ids:
+            sent_ids = Email.objects.filter(
+                id__in=email_ids, status=Email.Status.SUCCESS.value).values_list('id', flat=True)
+            server_ids = set()
+            for email_id in sent_ids:
+                server_ids.update(self.pending_notices.pop(email_id))
+
+            if server_ids:
+                self.set_notice_time(server_ids=list(server_ids), expire_notice_time=timezone.now())
+
+        return stats
+
+    def set_notice_time(self, server_ids: list, expire_notice_time: datetime):
+        return self.querier.set_servers_notice_time(server_ids=server_ids, expire_notice_time=expire_notice_time)
+
     @staticmethod
     def html_minify(_html: str):
         """
@@ -341,6 +371,7 @@ def __init__(self, filter_out_notified: bool, log_stdout: bool = False):
 
     def run(self):
         self.loop_already_expired_personal()
+        self.send_queued_emails()
 
     def loop_already_expired_personal(self):
         """
@@ -393,11 +424,9 @@ def notice_personal_expired_servers(self, user_id: str, username: str):
 
         if website_brand:
             subject += f'（{website_brand}）'
-        if self.do_email_notice(subject=subject, html_message=html_message, username=username):
-            self.querier.set_servers_notice_time(server_ids=server_ids, expire_notice_time=timezone.now())
-            return True
 
-        return False
+        return self.do_email_notice(
+            subject=subject, html_message=html_message, username=username, server_ids=server_ids)
 
 
 class ServerNotifier(BaseNotifier):
@@ -419,11 +448,9 @@ def run(self, after_days: int = 0):
         """
         # ok_count, failed_count = self.loop_all_users(after_days=after_days)
         ok_count, failed_count = self.notice_only_need_users(after_days=after_days)
-        print(f'OK email: {ok_count}, failed email: {failed_count}.')
-
-        # 统一更新vo组的server邮件发送时间
-        if self.is_update_server_email_time:
-            self.set_vo_servers_email_lasttime(after_days=after_days, expire_notice_time=timezone.now())
+        # 邮件发送成功后更新个人和vo组的server邮件发送时间
+        stats = self.send_queued_emails()
+        print(f'OK email: {ok_count}, failed email: {failed_count}, sent email: {stats["sent"]}.')
 
     def notice_only_need_users(self, after_days: int):
         """
@@ -544,7 +571,7 @@ def notice_personal_vo_expired_servers(self, user_id: str, username: str, after_
         if not context['user_servers'] and not context['vo_servers']:
             return None
 
-        user_server_ids = [s.id for s in context['user_servers']]
+        server_ids = [s.id for s in context['user_servers']] + [s.id for s in context['vo_servers']]
         html_message = self.expired_template.render(context, request=None)
         subject = '云服务器过期提醒'
         try:
@@ -554,11 +581,9 @@ def notice_personal_vo_expired_servers(self, user_id: str, username: str, after_
 
         if website_brand:
             subject += f'（{website_brand}）'
-        if self.do_email_notice(subject=subject, html_message=html_message, username=username):
-            self.set_servers_email_lasttime(server_ids=user_server_ids, expire_notice_time=timezone.now())
-            return True
 
-        return False
+        return self.do_email_notice(
+            subject=subject, html_message=html_message, username=username, server_ids=server_ids)
 
     def get_personal_vo_expired_servers_context(self, user_id: str, username: str, after_days: int):
         # 个人的
@@ -608,15 +633,8 @@ def set_servers_email_lasttime(
 
         return r
 
-    def set_vo_servers_email_lasttime(
-            self, after_days: int, expire_notice_time: datetime
-    ):
-        try:
-            r = self.querier.set_vo_servers_notice_time(after_days=after_days, expire_notice_time=expire_notice_time)
-        except Exception as exc:
-            return -1
-
-        return r
+    def set_notice_time(self, server_ids: list, expire_notice_time: datetime):
+        return self.set_servers_email_lasttime(server_ids=server_ids, expire_notice_time=expire_notice_time)
 
 
 class BaseServerArrear:
@@ -9,6 +9,7 @@
 
 from apps.app_wallet.managers.payment import PaymentManager
 from apps.app_storage.models import Bucket, BucketArchive, ObjectsService
+from apps.app_storage.adapter.stats_collector import BucketStatsCollector
 from apps.app_report.models import BucketStatsMonthly
 from apps.app_report.managers import ArrearBucketManager
 from apps.app_metering.managers import MeteringStorageManager
@@ -25,7 +26,11 @@ def wrapper(*args, **kwargs):
 
 
 class StorageSizeCounter:
-    def __init__(self, target_date: datetime.date = None):
+    def __init__(self, target_date: datetime.date = None, refresh_stats: bool = False):
+        """
+        :param refresh_stats: True(统计前并发异步查询存储桶当前的容量和对象数量)
+        """
+        self.refresh_stats = refresh_stats
         self.period_start, self.period_end = get_report_period_start_and_end(target_date=target_date)
         self.period_date = datetime.date(
             year=self.period_end.year, month=self.period_end.month, day=1)
@@ -75,6 +80,9 @@ def metering_loop(self, deleted: bool):
                 if buckets[len(buckets) - 1].id == last_id:
                     break
 
+                if self.refresh_stats and not deleted:
+                    self.refresh_buckets_stats(buckets=[b for b in buckets if b.id != last_id])
+
                 for b in buckets:
                     if b.id == last_id:
                         continue
@@ -89,6 +97,38 @@ def metering_loop(self, deleted: bool):
                 if continuous_error_count > 100:  # 连续错误次数后报错退出
                     raise e
 
+    def refresh_buckets_stats(self, buckets: list):
+        """
+        并发异步查询桶当前的统计信息，更新桶的容量和对象数量，查询失败的桶使用原有的统计信息
+        """
+        stated_ids = set(BucketStatsMonthly.objects.filter(
+            bucket_id__in=[b.id for b in buckets], date=self.period_date).values_list('bucket_id', flat=True))
+        buckets = [b for b in buckets if b.id not in stated_ids and b.creation_time <= self.period_end_time]
+        try:
+            stats = BucketStatsCollector().collect(buckets=buckets)
+        except Exception as exc:
+            print(f'Error refresh buckets stats, {str(exc)}')
+            return
+
+        now = timezone.now()
+        updated_buckets = []
+        for bucket in buckets:
+            r = stats.get(bucket.id)
+            if r is None or not r.ok:
+                continue
+
+            # 桶记录和对象存储服务中桶数据可能不一致
+            if r.username and bucket.user and r.username != bucket.user.username:
+                continue
+
+            bucket.storage_size = r.bucket_size_byte
+            bucket.object_count = r.objects_count
+            bucket.stats_time = r.stats_time or now
+            updated_buckets.append(bucket)
+
+        if updated_buckets:
+            Bucket.objects.bulk_update(updated_buckets, fields=['storage_size', 'object_count', 'stats_time'])
+
     def stats_one_bucket(self, bucket_or_archive):
         # 本周期后创建的
         if bucket_or_archive.creation_time > self.period_end_time:
@@ -34,9 +34,12 @@ class VtScannerAdmin(BaseModelAdmin):
 
 @admin.register(VtReport)
 class VtReportAdmin(BaseModelAdmin):
-    list_display = ['filename', 'type', 'create_time']
+    list_display = ['filename', 'type', 'size', 'file_ref', 'create_time']
     search_fields = ('filename',)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('content')
+
 
 @admin.register(VtTask)
 class VtTaskAdmin(BaseModelAdmin):
@@ -46,3 +49,6 @@ class VtTaskAdmin(BaseModelAdmin):
     list_filter = ('type', 'task_status', 'running_status')
     search_fields = ('name', 'remark', 'user__username')
     raw_id_fields = ('user', 'scanner')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('report__content')
@@ -1,5 +1,3 @@
-from io import BytesIO
-
 from django.http import FileResponse
 from django.utils.translation import gettext_lazy as _
 
@@ -9,11 +7,25 @@
 from apps.app_scan.models import VtTask
 
 
+class ReportContentReader:
+    """
+    报告内容读取，不支持seek，FileResponse不会为计算长度读取整个文件
+    """
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+
+    def read(self, size=-1):
+        return self.fileobj.read(size)
+
+    def close(self):
+        self.fileobj.close()
+
+
 class ReportHandler:
     @staticmethod
     def download_task_report(view: CustomGenericViewSet, request, kwargs):
         """
-        下载安全扫描任务报告
+        下载安全扫描任务报告，报告内容从报告文件存储流式读取
         """
         try:
             task_id = kwargs.get("task_id", None)
@@ -22,23 +34,16 @@ def download_task_report(view: CustomGenericViewSet, request, kwargs):
                 raise errors.BadRequest(message=_("任务ID无效"), code="InvalidTaskID")
             if task.task_status != VtTask.Status.DONE:
                 raise errors.BadRequest(message=_("任务未完成"), code="ScanTaskNotDone")
-            if task.report.type == VtReport.FileType.HTML:
-                html_bytes = task.report.content
-                response = FileResponse(
-                    BytesIO(html_bytes),
-                    as_attachment=True,
-                    filename=task.report.filename,
-                )
-                response["Content-Type"] = "application/octet-stream"
-                return response
-            if task.report.type == VtReport.FileType.PDF:
-                pdf_bytes = task.report.content
+            if task.report.type in [VtReport.FileType.HTML, VtReport.FileType.PDF]:
+                report = task.report
                 response = FileResponse(
-                    BytesIO(pdf_bytes),
+                    ReportContentReader(report.open_content()),
                     as_attachment=True,
-                    filename=task.report.filename,
+                    filename=report.filename,
                 )
                 response["Content-Type"] = "application/octet-stream"
+                if report.file_ref:
+                    response["Content-Length"] = str(report.size)
                 return response
         except Exception as exc:
             return view.exception_response(exc)
@@ -7,6 +7,7 @@
 
 from core import errors
 from apps.app_scan.models import VtReport, VtScanner, VtTask
+from apps.app_scan.report_store import ReportFileStore
 
 
 class ScanManager:
@@ -43,6 +44,31 @@ def get_queued_tasks(scan_type: str, num: int):
             task_status=VtTask.Status.QUEUED, type=scan_type
         ).order_by('-priority', 'create_time')[:num]
 
+    @staticmethod
+    def discard_report_file(file_ref: str):
+        """
+        报告保存到数据库失败时，删除没有被任何报告引用的报告文件
+
+        :return: True(已删除)；False(未删除)
+        """
+        try:
+            if VtReport.objects.filter(file_ref=file_ref).exists():
+                return False
+
+            return ReportFileStore().delete(file_ref)
+        except Exception as e:
+            return False
+
+    @staticmethod
+    def cleanup_orphan_report_files(min_age: float = 3600):
+        """
+        清理没有被报告引用的报告文件，如任务失败、报告记录删除后遗留的文件
+
+        :return: 删除的文件数
+        """
+        referenced_refs = set(VtReport.objects.exclude(file_ref='').values_list('file_ref', flat=True))
+        return ReportFileStore().cleanup_orphans(referenced_refs=referenced_refs, min_age=min_age)
+
 
 class ScanGvmManager:
     @staticmethod
@@ -60,16 +86,21 @@ def reset_host_task_status(task: VtTask):
             return False
 
     @staticmethod
-    def host_create_report_and_save(task: VtTask, content):
+    def host_create_report_and_save(task: VtTask, content=None, file_ref: str = None, size: int = None):
         """
         创建任务报告并更新任务状态
+
+        :param content: 报告内容，压缩保存到报告文件存储
+        :param file_ref, size: 报告内容已保存到报告文件存储时的文件引用和内容大小
         """
         try:
+            if not file_ref:
+                file_ref, size = ReportFileStore().save(content)
+
             time = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
             filename = task.name + "_" + time + '.pdf'
-            size = len(content)
             report = VtReport(
-                filename=filename, type=VtReport.FileType.PDF, content=content, size=size
+                filename=filename, type=VtReport.FileType.PDF, content=None, file_ref=file_ref, size=size
             )
             with transaction.atomic():
                 report.save(force_insert=True)
@@ -99,18 +130,21 @@ def set_host_task_running(task: VtTask, scanner: VtScanner, running_id: str):
 
 class ScanZapManager:
     @staticmethod
-    def web_create_report_and_save(task: VtTask, content):
+    def web_create_report_and_save(task: VtTask, content=None, file_ref: str = None, size: int = None):
         """
         创建任务报告并更新任务状态
+
+        :param content: 报告内容，压缩保存到报告文件存储
+        :param file_ref, size: 报告内容已保存到报告文件存储时的文件引用和内容大小
         """
         try:
-            if isinstance(content, str):
-                content = content.encode('utf-8')
-            size = len(content)
+            if not file_ref:
+                file_ref, size = ReportFileStore().save(content)
+
             time = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
             filename = task.name + "_" + time + '.html'
             report = VtReport(
-                filename=filename, type=VtReport.FileType.HTML, content=content, size=size
+                filename=filename, type=VtReport.FileType.HTML, content=None, file_ref=file_ref, size=size
             )
             with transaction.atomic():
                 report.save(force_insert=True)
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-17 05:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scan', '0005_remove_vtscanservice_host_scan_price_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vtreport',
+            name='file_ref',
+            field=models.CharField(blank=True, default='', help_text='报告内容压缩存储在本地文件存储中的文件引用，为空时报告内容在content字段', max_length=128, verbose_name='报告文件引用'),
+        ),
+    ]
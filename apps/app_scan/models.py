@@ -1,3 +1,5 @@
+from io import BytesIO
+
 from django.db import models
 from django.db import transaction
 from django.utils.translation import gettext, gettext_lazy as _
@@ -6,6 +8,7 @@
 from django.contrib.auth import get_user_model
 
 from utils.model import UuidModel
+from apps.app_scan.report_store import ReportFileStore
 from core import errors
 from core import site_configs_manager
 
@@ -172,6 +175,9 @@ class FileType(models.TextChoices):
     filename = models.CharField(verbose_name=_('文件名'), max_length=255)
     type = models.CharField(verbose_name=_('漏扫报告类型'), max_length=8, choices=FileType.choices, default=FileType.HTML.value)
     content = models.BinaryField(verbose_name=_('漏扫报告内容'), null=True)
+    file_ref = models.CharField(
+        verbose_name=_('报告文件引用'), max_length=128, blank=True, default='',
+        help_text=_('报告内容压缩存储在本地文件存储中的文件引用，为空时报告内容在content字段'))
     size = models.IntegerField(verbose_name=_('文件大小'), default=0)
     create_time = models.DateTimeField(verbose_name=_('修改时间'), auto_now_add=True)
 
@@ -183,6 +189,21 @@ class Meta:
     def __str__(self):
         return f'{self.filename}.{self.type}'
 
+    def open_content(self):
+        """
+        打开报告内容，文件存储的报告从磁盘流式读取
+
+        :raises: OSError
+        """
+        if self.file_ref:
+            return ReportFileStore().open(self.file_ref)
+
+        return BytesIO(self.content or b'')
+
+    def get_content(self) -> bytes:
+        with self.open_content() as f:
+            return f.read()
+
     
 class VtTask(UuidModel):
 
@@ -0,0 +1,136 @@
+import os
+import time
+import gzip
+import hashlib
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+
+class ReportFileStore:
+    """
+    漏扫报告本地文件存储
+
+    报告内容gzip压缩后按内容sha256哈希值存储，相同内容只存储一份；数据库中只保存文件引用（相对路径）和文件大小
+    """
+    SUFFIX = '.gz'
+    COMPRESS_LEVEL = 6
+
+    def __init__(self, root_dir=None):
+        """
+        :param root_dir: 存储目录，默认settings.SCAN_REPORT_STORE_DIR，未设置时为MEDIA_ROOT/scan_reports
+        """
+        if not root_dir:
+            root_dir = getattr(settings, 'SCAN_REPORT_STORE_DIR', None)
+        if not root_dir:
+            root_dir = Path(settings.MEDIA_ROOT).joinpath('scan_reports')
+
+        self.root_dir = Path(root_dir)
+
+    @classmethod
+    def build_ref(cls, content: bytes) -> str:
+        content_hash = hashlib.sha256(content).hexdigest()
+        return f'{content_hash[0:2]}/{content_hash[2:4]}/{content_hash}{cls.SUFFIX}'
+
+    def get_path(self, ref: str) -> Path:
+        path = self.root_dir.joinpath(ref).resolve()
+        if self.root_dir.resolve() not in path.parents:
+            raise ValueError(f'Invalid report file ref "{ref}"')
+
+        return path
+
+    def save(self, content: bytes):
+        """
+        压缩保存报告内容，内容已存在时不重复写入
+
+        :return: (ref, size)    # 文件引用，未压缩的内容大小
+        :raises: OSError
+        """
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+
+        ref = self.build_ref(content)
+        path = self.get_path(ref)
+        if path.exists():
+            os.utime(path)  # 更新修改时间，清理遗留文件时不会删除
+            return ref, len(content)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=self.COMPRESS_LEVEL, mtime=0) as gz:
+                    gz.write(content)
+
+            os.replace(tmp_path, path)
+        except Exception as exc:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise exc
+
+        return ref, len(content)
+
+    def open(self, ref: str):
+        """
+        打开报告文件，读取解压后的内容
+
+        :raises: OSError
+        """
+        return gzip.open(self.get_path(ref), mode='rb')
+
+    def read(self, ref: str) -> bytes:
+        with self.open(ref) as f:
+            return f.read()
+
+    def exists(self, ref: str) -> bool:
+        return self.get_path(ref).exists()
+
+    def stored_size(self, ref: str) -> int:
+        """
+        压缩后的文件大小
+        """
+        return self.get_path(ref).stat().st_size
+
+    def delete(self, ref: str) -> bool:
+        """
+        :return: True(已删除)；False(文件不存在)
+        """
+        try:
+            self.get_path(ref).unlink()
+        except FileNotFoundError:
+            return False
+
+        return True
+
+    def cleanup_orphans(self, referenced_refs: set, min_age: float = 3600) -> int:
+        """
+        删除没有被引用的报告文件和残留的临时文件
+
+        只删除修改时间超过min_age秒的文件，不会删除刚保存、还未写入数据库引用的报告文件
+
+        :param referenced_refs: 数据库中引用的文件引用
+        :return: 删除的文件数
+        """
+        if not self.root_dir.is_dir():
+            return 0
+
+        deadline = time.time() - min_age
+        count = 0
+        for path in self.root_dir.rglob('*'):
+            if not path.is_file() or path.is_symlink():
+                continue
+
+            ref = path.relative_to(self.root_dir).as_posix()
+            is_tmp = path.name.startswith('.') and path.name.endswith('.tmp')
+            if not is_tmp and (not ref.endswith(self.SUFFIX) or ref in referenced_refs):
+                continue
+
+            try:
+                if path.stat().st_mtime < deadline:
+                    path.unlink()
+                    count += 1
+            except FileNotFoundError:
+                pass
+
+        return count
@@ -1,14 +1,23 @@
 import base64
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
-import requests
+from django.conf import settings
 
+from core.adapters.sessions import session_pool
 from apps.app_scan.managers import ScanGvmManager, ScanManager, ScanZapManager, TaskManager
 from apps.app_scan.models import VtScanner, VtTask
+from apps.app_scan.report_store import ReportFileStore
 
 
 class Scanner:
-    def __init__(self, vtscanner: VtScanner) -> None:
+    DEFAULT_POLL_WORKERS = 8
+
+    def __init__(self, vtscanner: VtScanner, poll_workers: int = None) -> None:
+        """
+        :param poll_workers: 每个扫描器并发请求的线程数，查询任务状态、下载报告、创建和删除任务；
+                             默认settings.SCAN_WORKER_POLL_WORKERS
+        """
         self.vtscanner = vtscanner
         self.name = vtscanner.name
         self.ipaddr = vtscanner.ipaddr
@@ -17,10 +26,53 @@ def __init__(self, vtscanner: VtScanner) -> None:
         self.max_concurrency = vtscanner.max_concurrency
         self.type = vtscanner.type
         self.tasks = []
+        if poll_workers is None:
+            poll_workers = getattr(settings, 'SCAN_WORKER_POLL_WORKERS', self.DEFAULT_POLL_WORKERS)
+        self.poll_workers = max(poll_workers, 1)
+        self.report_store = ReportFileStore()
 
     def build_url(self, ip, port):
         return f"http://{ip}:{port}/"
 
+    def request(self, method: str, path: str, params: dict):
+        """
+        请求扫描器接口，同一个扫描器地址复用保持的连接
+
+        :return: dict
+        :raises: Exception
+        """
+        response = session_pool.request(
+            method=method, url=self.url + path, params=params, headers={'secret-key': self.key})
+        response.raise_for_status()
+        return response.json()
+
+    def map_concurrent(self, func, items: list) -> list:
+        """
+        扫描器的有界线程池中并发执行，func中不能访问数据库
+
+        :return: [func(item)]
+        """
+        items = list(items)
+        if self.poll_workers <= 1 or len(items) <= 1:
+            return [func(item) for item in items]
+
+        with ThreadPoolExecutor(max_workers=min(self.poll_workers, len(items))) as pool:
+            return list(pool.map(func, items))
+
+    def save_report(self, content: bytes):
+        """
+        报告内容压缩保存到报告文件存储
+
+        :return:
+            (file_ref, size)
+            None    # 保存失败
+        """
+        try:
+            return self.report_store.save(content)
+        except Exception as e:
+            logging.error(f"Save report of scanner {self.url} failed, {str(e)}")
+            return None
+
     def get_own_tasks(self):
         vttasks = ScanManager.get_own_tasks(scanner=self.vtscanner)
         self.tasks = list(vttasks)
@@ -41,8 +93,8 @@ class ZapStatus:
         DONE = 'done'
         FAILED = 'failed'
 
-    def __init__(self, vtscanner: VtScanner) -> None:
-        super().__init__(vtscanner)
+    def __init__(self, vtscanner: VtScanner, poll_workers: int = None) -> None:
+        super().__init__(vtscanner, poll_workers=poll_workers)
         self.url = self.build_url(self.ipaddr, self.port)
 
     def get_task_status(self, running_status: str, target: str, task_id:str):
@@ -55,13 +107,10 @@ def get_task_status(self, running_status: str, target: str, task_id:str):
             }
         """
         try:
-            response = requests.get(
-                self.url + 'zap/get_task',
-                params={'running_status': running_status, 'target': target, 'task_id':task_id},
-                headers={'secret-key': self.key},
+            data = self.request(
+                'get', 'zap/get_task',
+                params={'running_status': running_status, 'target': target, 'task_id': task_id},
             )
-            response.raise_for_status()
-            data = response.json()
             if not data['ok']:
                 logging.error(f"Get task from zap {self.url} failed, {data['errmsg']}")
                 return None, None
@@ -82,13 +131,7 @@ def get_report(self, task_id:str):
             }
         """
         try:
-            response = requests.get(
-                self.url + 'zap/get_report', 
-                headers={'secret-key': self.key},
-                params={'task_id': task_id},
-            )
-            response.raise_for_status()
-            data = response.json()
+            data = self.request('get', 'zap/get_report', params={'task_id': task_id})
             if not data['ok']:
                 logging.error(
                     f"Get report from zap {self.url} failed, {data['errmsg']}"
@@ -111,13 +154,7 @@ def create_task(self, target: str, task_id: str):
             }
         """
         try:
-            response = requests.post(
-                self.url + 'zap/create_task',
-                headers={'secret-key': self.key},
-                params={'target': target, 'task_id': task_id},
-            )
-            response.raise_for_status()
-            data = response.json()
+            data = self.request('post', 'zap/create_task', params={'target': target, 'task_id': task_id})
             if not data['ok']:
                 logging.error(f"Create task of zap {self.url} failed, {data['errmsg']}")
                 return None
@@ -136,13 +173,7 @@ def delete_task(self, task_id: str):
             }
         """
         try:
-            response = requests.delete(
-                self.url + 'zap/delete_task', 
-                headers={'secret-key': self.key}, 
-                params={'task_id': task_id},
-            )
-            response.raise_for_status()
-            data = response.json()
+            data = self.request('delete', 'zap/delete_task', params={'task_id': task_id})
             if not data['ok']:
                 logging.error(
                     f"Delete task from gvm {self.url} failed, {data['errmsg']}"
@@ -150,53 +181,74 @@ def delete_task(self, task_id: str):
         except Exception as e:
             logging.error(f"Delete task from gvm {self.url} failed, {str(e)}")
 
-    def create_task_and_update_vtwebtask(self, vttask: VtTask):
-        running_status = self.create_task(target=vttask.target, task_id=vttask.id)
-        if running_status:
-            if not ScanZapManager.set_web_task_running(
-                task=vttask, scanner=self.vtscanner, running_status=running_status
-            ):
-                self.delete_task(task_id=vttask.id)
+    def poll_running_task(self, task: VtTask):
+        """
+        查询任务状态，任务完成时下载报告并保存到报告文件存储，不访问数据库
+
+        :return: (task, running_status, errmsg, report)     # report: (file_ref, size) or None
+        """
+        running_status, errmsg = self.get_task_status(
+            running_status=task.running_status, target=task.target, task_id=task.id
+        )
+        report = None
+        if running_status == self.ZapStatus.DONE:
+            content = self.get_report(task_id=task.id)
+            if content is not None:
+                report = self.save_report(content)
+
+        return task, running_status, errmsg, report
 
     def process_running_tasks(self):
         """
         处理运行中的任务， ZAP扫描引擎的并发度为1
-            1. 获取任务状态
-            2. 如果任务完成，则下载报告并更新状态
+            1. 并发获取任务状态，任务完成的下载报告
+            2. 如果任务完成，则保存报告并更新状态
             3. 任务未完成则更新内部状态
+            4. 并发删除扫描器中已结束的任务
         """
         self.get_own_tasks()
-        for task in self.tasks:
-            running_status, errmsg = self.get_task_status(
-                running_status=task.running_status, target=task.target, task_id=task.id
-            )
+        delete_task_ids = []
+        for task, running_status, errmsg, report in self.map_concurrent(self.poll_running_task, self.tasks):
             if running_status is None:
                 continue
             elif running_status == self.ZapStatus.FAILED:
                 if ScanZapManager.set_web_task_status(
                     task=task, running_status=running_status, errmsg=errmsg
                 ):
-                    self.delete_task(task_id=task.id)
+                    delete_task_ids.append(task.id)
             elif running_status == self.ZapStatus.DONE:
-                content = self.get_report(task_id=task.id)
-                if content is not None:
+                if report is not None:
+                    file_ref, size = report
                     if ScanZapManager.web_create_report_and_save(
-                        task=task, content=content
+                        task=task, file_ref=file_ref, size=size
                     ):
-                        self.delete_task(task_id=task.id)
+                        delete_task_ids.append(task.id)
+                    else:
+                        ScanManager.discard_report_file(file_ref)
             elif running_status != task.running_status:
                 ScanZapManager.set_web_task_status(
                     task=task, running_status=running_status
                 )
 
+        self.map_concurrent(lambda task_id: self.delete_task(task_id=task_id), delete_task_ids)
+
     def process_new_tasks(self):
         self.get_own_tasks()
         allowed_num = self.max_concurrency - len(self.tasks)
         if allowed_num <= 0:
             return
         vttasks = ScanManager.get_queued_tasks(scan_type=self.type, num=allowed_num)
-        for vttask in vttasks:
-            self.create_task_and_update_vtwebtask(vttask=vttask)
+        results = self.map_concurrent(
+            lambda vttask: (vttask, self.create_task(target=vttask.target, task_id=vttask.id)), vttasks)
+        delete_task_ids = []
+        for vttask, running_status in results:
+            if running_status:
+                if not ScanZapManager.set_web_task_running(
+                    task=vttask, scanner=self.vtscanner, running_status=running_status
+                ):
+                    delete_task_ids.append(vttask.id)
+
+        self.map_concurrent(lambda task_id: self.delete_task(task_id=task_id), delete_task_ids)
 
 
 class HostGvmScanner(Scanner):
@@ -208,8 +260,8 @@ class GvmStatus:
         FAILED = 'Failed'
         INTERAPTED = 'Interapted'
 
-    def __init__(self, vtscanner: VtScanner) -> None:
-        super().__init__(vtscanner)
+    def __init__(self, vtscanner: VtScanner, poll_workers: int = None) -> None:
+        super().__init__(vtscanner, poll_workers=poll_workers)
         self.url = self.build_url(self.ipaddr, self.port)
 
     def get_task_status(self, running_id):
@@ -222,13 +274,7 @@ def get_task_status(self, running_id):
             }
         """
         try:
-            response = requests.get(
-                self.url + 'gvm/get_task',
-                params={'running_id': running_id},
-                headers={'secret-key': self.key},
-            )    
-            response.raise_for_status()
-            data = response.json()
+            data = self.request('get', 'gvm/get_task', params={'running_id': running_id})
             if not data['ok']:
                 logging.error(f"Get task from gvm {self.url} failed, {data['errmsg']}")
                 return None
@@ -248,13 +294,7 @@ def get_report(self, running_id):
             }
         """
         try:
-            response = requests.get(
-                self.url + 'gvm/get_report',
-                params={'running_id': running_id},
-                headers={'secret-key': self.key},
-            )
-            response.raise_for_status()
-            data = response.json()
+            data = self.request('get', 'gvm/get_report', params={'running_id': running_id})
             if not data['ok']:
                 logging.error(
                     f"Get report from gvm {self.url} failed, {data['errmsg']}"
@@ -276,13 +316,7 @@ def delete_task(self, running_id):
             }
         """
         try:
-            response = requests.delete(
-                self.url + 'gvm/delete_task',
-                params={'running_id': running_id},
-                headers={'secret-key': self.key},
-            )
-            response.raise_for_status()
-            data = response.json()
+            data = self.request('delete', 'gvm/delete_task', params={'running_id': running_id})
             if not data['ok']:
                 logging.error(
                     f"Delete task from gvm {self.url} failed, {data['errmsg']}"
@@ -300,13 +334,7 @@ def create_task(self, id: str, target: str):
             }
             """
         try:
-            response = requests.post(
-                self.url + 'gvm/create_task',
-                headers={'secret-key': self.key},
-                params={'target': target, 'id': id},
-            )
-            response.raise_for_status()
-            data = response.json()
+            data = self.request('post', 'gvm/create_task', params={'target': target, 'id': id})
             if not data['ok']:
                 logging.error(f"Create task of gvm {self.url} failed, {data['errmsg']}")
                 return None
@@ -316,40 +344,44 @@ def create_task(self, id: str, target: str):
             logging.error(f"Create task of gvm {self.url} failed, {str(e)}")
             return None
 
-    def create_task_and_update_vthosttask(self, vttask: VtTask):
+    def poll_running_task(self, task: VtTask):
         """
-        远程扫描引擎任务创建
-        如果任务状态更新失败，删除扫描器中的任务
+        查询任务状态，任务完成时下载报告并保存到报告文件存储，不访问数据库
+
+        :return: (task, status, report)     # report: (file_ref, size) or None
         """
-        running_id = self.create_task(id=vttask.id, target=vttask.target)
-        if running_id:
-            if not ScanGvmManager.set_host_task_running(
-                task=vttask, scanner=self.vtscanner, running_id=running_id
-            ):
-                self.delete_task(runnig_id=running_id)
+        status = self.get_task_status(running_id=task.running_id)
+        report = None
+        if status == self.GvmStatus.DONE:
+            content = self.get_report(running_id=task.running_id)
+            if content is not None:
+                report = self.save_report(content)
+
+        return task, status, report
 
     def process_running_tasks(self):
         """
         处理运行中的任务
         TODO: 在多扫描器场景下，自动将无法正常工作的扫描器status设置为DISABLE
             1. 获得所有任务
-            2. 遍历所有任务并做相同操作
-            3. 获取任务状态
-            4.1. 如果任务完成则更新状态并下载报告
-            4.2. 如果任务失败则重新运行任务, 即设置为Queuing
-            4.3. 任务依然运行中处理下一个任务
+            2. 并发获取任务状态，任务完成的下载报告
+            3.1. 如果任务完成则保存报告并更新状态
+            3.2. 如果任务失败则重新运行任务, 即设置为Queuing
+            3.3. 任务依然运行中处理下一个任务
+            4. 并发删除扫描器中已完成的任务
         """
         self.get_own_tasks()
-        for task in self.tasks:
-            status = self.get_task_status(running_id=task.running_id)
+        delete_running_ids = []
+        for task, status, report in self.map_concurrent(self.poll_running_task, self.tasks):
             if status is None:
                 continue
             elif status == self.GvmStatus.DONE:
-                content = self.get_report(running_id=task.running_id)
-                if content is not None and ScanGvmManager.host_create_report_and_save(
-                    task=task, content=content
-                ):
-                    self.delete_task(running_id=task.running_id)
+                if report is None:
+                    continue
+                elif ScanGvmManager.host_create_report_and_save(task=task, file_ref=report[0], size=report[1]):
+                    delete_running_ids.append(task.running_id)
+                else:
+                    ScanManager.discard_report_file(report[0])
             elif status in [self.GvmStatus.FAILED, self.GvmStatus.INTERAPTED]:
                 ScanGvmManager.reset_host_task_status(task=task)
             elif status in [
@@ -359,6 +391,8 @@ def process_running_tasks(self):
             ]:
                 continue
 
+        self.map_concurrent(lambda running_id: self.delete_task(running_id=running_id), delete_running_ids)
+
     def process_new_tasks(self):
         """
         运行新的任务
@@ -371,19 +405,31 @@ def process_new_tasks(self):
         if allowed_num <= 0:
             return
         vttasks = ScanManager.get_queued_tasks(self.type, allowed_num)
-        for vttask in vttasks:
-            self.create_task_and_update_vthosttask(vttask=vttask)
+        results = self.map_concurrent(
+            lambda vttask: (vttask, self.create_task(id=vttask.id, target=vttask.target)), vttasks)
+        delete_running_ids = []
+        for vttask, running_id in results:
+            if running_id:
+                if not ScanGvmManager.set_host_task_running(
+                    task=vttask, scanner=self.vtscanner, running_id=running_id
+                ):
+                    delete_running_ids.append(running_id)
+
+        self.map_concurrent(lambda running_id: self.delete_task(running_id=running_id), delete_running_ids)
 
 
 class ScanWorker:
-    def __init__(self) -> None:
+    def __init__(self, poll_workers: int = None) -> None:
+        """
+        :param poll_workers: 每个扫描器并发请求的线程数
+        """
         vtscanners = ScanManager.get_enabled_scanners()
         self.scanners = []
         for vtscanner in vtscanners:
             if vtscanner.engine == VtScanner.ScannerEngine.GVM:
-                self.scanners.append(HostGvmScanner(vtscanner))
+                self.scanners.append(HostGvmScanner(vtscanner, poll_workers=poll_workers))
             if vtscanner.engine == VtScanner.ScannerEngine.ZAP:
-                self.scanners.append(WebZapScanner(vtscanner))
+                self.scanners.append(WebZapScanner(vtscanner, poll_workers=poll_workers))
 
     def process_running_tasks(self):
         for scanner in self.scanners:
@@ -399,7 +445,18 @@ def process_disable_scanner_task(self):
         for task in disable_scanner_tasks:
             TaskManager.reset_task_status(task)
 
+    @staticmethod
+    def cleanup_orphan_reports():
+        """清理任务失败、报告记录删除后遗留的报告文件"""
+        try:
+            count = ScanManager.cleanup_orphan_report_files()
+            if count:
+                logging.warning(f"Cleanup {count} orphan scan report files")
+        except Exception as e:
+            logging.error(f"Cleanup orphan scan report files failed, {str(e)}")
+
     def run(self):
         self.process_running_tasks()
         self.process_new_tasks()
         self.process_disable_scanner_task()
+        self.cleanup_orphan_reports()
@@ -1,15 +1,22 @@
+import os
+import time
 import hashlib
 import collections
 import io
 import random
+import shutil
+import tempfile
 from string import printable
 
 from django.urls import reverse
+from django.test import override_settings
 from utils.test import (
     get_or_create_user,
     MyAPITestCase,
 )
 from apps.app_scan.models import VtReport, VtTask
+from apps.app_scan.managers import ScanManager, ScanZapManager
+from apps.app_scan.report_store import ReportFileStore
 
 
 def random_string(length: int = 10):
@@ -128,3 +135,69 @@ def test_report(self):
         # actual_content = io.BytesIO(r.content).getvalue()
         actual_content = b"".join(r.streaming_content)
         self.assertEqual(actual_content, file_byte)
+
+    def test_report_file_store(self):
+        store_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, store_dir, True)
+        with override_settings(SCAN_REPORT_STORE_DIR=store_dir):
+            store = ReportFileStore()
+            content = b'<html>report</html>' * 10000
+            ref, size = store.save(content)
+            self.assertEqual(size, len(content))
+            self.assertEqual(ref, ReportFileStore.build_ref(content))
+            self.assertLess(store.stored_size(ref), size // 10)
+            self.assertEqual(store.read(ref), content)
+            # 相同内容只存储一份
+            self.assertEqual(store.save(content), (ref, size))
+            with self.assertRaises(ValueError):
+                store.get_path('../../etc/passwd')
+
+            task = VtTask(name="user_task", target="http://test.com/", type="web", user=self.user)
+            task.save(force_insert=True)
+            self.assertTrue(ScanZapManager.web_create_report_and_save(task=task, content=content))
+            task.refresh_from_db()
+            report = task.report
+            self.assertIsNone(report.content)
+            self.assertEqual(report.file_ref, ref)
+            self.assertEqual(report.size, size)
+            self.assertEqual(report.get_content(), content)
+
+            base_url = reverse("scan-api:report-detail", kwargs={"task_id": task.id})
+            self.client.force_login(self.user)
+            r = self.client.get(path=base_url)
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual(r["Content-Type"], "application/octet-stream")
+            self.assertEqual(r["Content-Length"], str(size))
+            self.assertEqual(b"".join(r.streaming_content), content)
+
+    def test_cleanup_orphan_report_files(self):
+        store_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, store_dir, True)
+        with override_settings(SCAN_REPORT_STORE_DIR=store_dir):
+            store = ReportFileStore()
+            ref1, size1 = store.save(b'report1')
+            ref2, size2 = store.save(b'report2')
+            ref3, size3 = store.save(b'report3')
+            task = VtTask(name="user_task", target="http://test.com/", type="web", user=self.user)
+            task.save(force_insert=True)
+            self.assertTrue(ScanZapManager.web_create_report_and_save(task=task, file_ref=ref1, size=size1))
+
+            # 报告保存到数据库失败时，删除没有被引用的报告文件
+            self.assertFalse(ScanManager.discard_report_file(ref1))
+            self.assertTrue(store.exists(ref1))
+            self.assertTrue(ScanManager.discard_report_file(ref2))
+            self.assertFalse(store.exists(ref2))
+
+            # 遗留文件和临时文件，只清理超过时间的
+            tmp_path = store.get_path(ref3).parent.joinpath(f'.{ref3.rsplit("/", 1)[-1]}.abc.tmp')
+            tmp_path.write_bytes(b'tmp')
+            self.assertEqual(ScanManager.cleanup_orphan_report_files(), 0)
+            old = time.time() - 7200
+            for path in [store.get_path(ref1), store.get_path(ref3), tmp_path]:
+                os.utime(path, (old, old))
+
+            self.assertEqual(ScanManager.cleanup_orphan_report_files(), 2)
+            self.assertTrue(store.exists(ref1))
+            self.assertFalse(store.exists(ref3))
+            self.assertFalse(tmp_path.exists())
+            self.assertEqual(task.report.get_content(), b'report1')
@@ -0,0 +1,116 @@
+import json
+import time
+import shutil
+import tempfile
+import threading
+from urllib import parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from django.test import override_settings
+
+from utils.test import get_or_create_user, MyAPITestCase
+from apps.app_scan.scan_worker import WebZapScanner
+from apps.app_scan.models import VtScanner, VtTask
+
+
+class StubZapHandler(BaseHTTPRequestHandler):
+    """
+    模拟ZAP扫描器接口，每个请求延迟 delay 秒
+    """
+    delay = 0.2
+    deleted = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, data: dict):
+        time.sleep(self.delay)
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def get_task_id(self):
+        query = parse.parse_qs(parse.urlsplit(self.path).query)
+        return query.get('task_id', [''])[0]
+
+    def do_GET(self):
+        path = parse.urlsplit(self.path).path
+        if path == '/zap/get_task':
+            self.reply({'ok': True, 'running_status': 'done'})
+        elif path == '/zap/get_report':
+            self.reply({'ok': True, 'content': f'<html>{self.get_task_id()}</html>' * 100})
+        else:
+            self.send_error(404)
+
+    def do_DELETE(self):
+        StubZapHandler.deleted.append(self.get_task_id())
+        self.reply({'ok': True})
+
+
+class ScanPollTests(MyAPITestCase):
+    def setUp(self):
+        self.user = get_or_create_user(password="password")
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubZapHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        host, port = self.server.server_address
+        StubZapHandler.deleted = []
+
+        self.store_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(SCAN_REPORT_STORE_DIR=self.store_dir)
+        self.settings_override.enable()
+
+        self.vtscanner = VtScanner(
+            name="zap", type="web", engine="zaproxy", ipaddr=host, port=port,
+            status="enable", key="key", max_concurrency=8,
+        )
+        self.vtscanner.save(force_insert=True)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.store_dir, ignore_errors=True)
+        self.server.shutdown()
+        self.server.server_close()
+
+    def create_running_tasks(self, num: int):
+        tasks = []
+        for i in range(num):
+            task = VtTask(
+                name=f"task{i}", target=f"http://test{i}.com/", type="web", user=self.user,
+                task_status=VtTask.Status.RUNNING.value, running_status="spider", scanner=self.vtscanner
+            )
+            task.save(force_insert=True)
+            tasks.append(task)
+
+        return tasks
+
+    def poll(self, poll_workers: int):
+        scanner = WebZapScanner(self.vtscanner, poll_workers=poll_workers)
+        start = time.monotonic()
+        scanner.process_running_tasks()
+        return time.monotonic() - start
+
+    def test_concurrent_poll(self):
+        tasks = self.create_running_tasks(num=6)
+        # 每个任务查询状态、下载报告、删除任务3个请求
+        seconds = self.poll(poll_workers=6)
+        self.assertLess(seconds, 6 * 3 * StubZapHandler.delay)
+        self.assertEqual(sorted(StubZapHandler.deleted), sorted(t.id for t in tasks))
+        for task in tasks:
+            task.refresh_from_db()
+            self.assertEqual(task.task_status, VtTask.Status.DONE)
+            self.assertIsNone(task.report.content)
+            self.assertEqual(task.report.get_content(), f'<html>{task.id}</html>'.encode('utf-8') * 100)
+
+        # 顺序查询
+        StubZapHandler.deleted = []
+        tasks = self.create_running_tasks(num=3)
+        seconds = self.poll(poll_workers=1)
+        self.assertGreaterEqual(seconds, 3 * 3 * StubZapHandler.delay)
+        self.assertEqual(len(StubZapHandler.deleted), 3)
+        for task in tasks:
+            task.refresh_from_db()
+            self.assertEqual(task.task_status, VtTask.Status.DONE)
@@ -1,6 +1,9 @@
 import base64
+import shutil
+import tempfile
 
 import responses
+from django.test import override_settings
 
 from utils.test import (
     get_or_create_user,
@@ -14,6 +17,13 @@ class ScanWorkerTests(MyAPITestCase):
     def setUp(self):
         self.user = get_or_create_user(password="password")
         self.user2 = get_or_create_user(username="tom@cnic.cn", password="password")
+        self.store_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(SCAN_REPORT_STORE_DIR=self.store_dir)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.store_dir, ignore_errors=True)
 
     @responses.activate
     def test_scanner_get(self):
@@ -347,11 +357,12 @@ def test_scanner_get(self):
         user_scan_task1.refresh_from_db()
         self.assertEqual(user_scan_task1.task_status, "done")
         self.assertNotEqual(user_scan_task1.report, None)
-        self.assertEqual(user_scan_task1.report.content, content.encode("utf-8"))
+        self.assertIsNone(user_scan_task1.report.content)
+        self.assertEqual(user_scan_task1.report.get_content(), content.encode("utf-8"))
         user_scan_task2.refresh_from_db()
         self.assertEqual(user_scan_task2.task_status, "done")
         self.assertNotEqual(user_scan_task2.report, None)
-        new_content = base64.b64encode(user_scan_task2.report.content)
+        new_content = base64.b64encode(user_scan_task2.report.get_content())
         size = user_scan_task2.report.size
         self.assertEqual(size, len(base64.b64decode(content)))
         self.assertEqual(new_content, content.encode("utf-8"))
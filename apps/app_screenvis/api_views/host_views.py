@@ -8,7 +8,9 @@
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
-from apps.app_screenvis.managers import HostQueryChoices, MetricQueryManager, HostQueryRangeChoices
+from apps.app_screenvis.managers import (
+    HostQueryChoices, MetricQueryManager, HostQueryRangeChoices, HostNetflowManager
+)
 from apps.app_screenvis.utils import errors
 from apps.app_screenvis.models import MetricMonitorUnit, HostNetflow
 from apps.app_screenvis.tasks import try_host_netflow
@@ -235,6 +237,98 @@ def filter_netflow_qs(unit_id: int, timestamp: int, limit: int):
         qs = HostNetflow.objects.filter(**lookups).order_by('-timestamp')
         return qs[0:limit]
 
+    @swagger_auto_schema(
+        operation_summary=gettext_lazy('查询主机单元时间段内网络流量时序数据'),
+        manual_parameters=[
+            openapi.Parameter(
+                name='unit_id',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                required=True,
+                description=_('主机单元id')
+            ),
+            openapi.Parameter(
+                name='start',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                required=True,
+                description=_('查询起始时间点')
+            ),
+            openapi.Parameter(
+                name='end',
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_INTEGER,
+                required=False,
+                description=_('查询截止时间点, 默认是当前时间')
+            ),
+        ],
+        responses={
+            200: ''
+        }
+    )
+    @action(methods=['get'], detail=False, url_path='query/netflow/range', url_name='query-netflow-range')
+    def query_netflow_range(self, request, *args, **kwargs):
+        """
+        查询主机单元时间段内网络流量时序数据，按时间段长度选择数据精度：
+        1天内原始数据，7天内5分钟降采样数据，超过7天1小时降采样数据
+
+            Http Code 200:
+            {
+                "resolution": "5m",     # raw, 5m, 1h
+                "step": 300,            # 降采样时间段长度，秒，原始数据为0
+                "results": [
+                    {
+                        "timestamp": 1446758400,    # 降采样时间段开始时间
+                        "flow_in": 2442.3456,       # 平均进流量 B/s
+                        "flow_in_min": 1024.0,
+                        "flow_in_max": 3000.1,
+                        "flow_out": 5252.654,       # 平均出流量 B/s
+                        "flow_out_min": 2048.0,
+                        "flow_out_max": 6000.3
+                    }
+                ]
+            }
+        """
+        unit_id = request.query_params.get('unit_id', None)
+        start = request.query_params.get('start', None)
+        end = request.query_params.get('end', int(time.time()))
+
+        try:
+            if unit_id is None:
+                raise errors.BadRequest(message=_('必须指定主机单元'))
+
+            try:
+                unit_id = int(unit_id)
+                if unit_id <= 0:
+                    raise ValueError
+            except ValueError:
+                raise errors.InvalidArgument(message=_('指定监控单元id无效'))
+
+            if start is None:
+                raise errors.BadRequest(message=_('参数"start"必须提交'))
+
+            try:
+                start = int(start)
+                if start < 0:
+                    raise ValueError
+            except ValueError:
+                raise errors.InvalidArgument(message=_('起始时间"start"的值无效, 请尝试一个正整数'))
+
+            try:
+                end = int(end)
+                if end < 0:
+                    raise ValueError
+            except ValueError:
+                raise errors.InvalidArgument(message=_('截止时间"end"的值无效, 请尝试一个正整数'))
+
+            if end < start:
+                raise errors.BadRequest(message=_('截止时间必须大于起始时间'))
+        except errors.Error as exc:
+            return self.exception_response(exc)
+
+        data = HostNetflowManager.query_range(unit_id=unit_id, start_ts=start, end_ts=end)
+        return Response(data=data, status=200)
+
     @swagger_auto_schema(
         operation_summary=gettext_lazy('查询主机单元时间段内指标信息'),
         manual_parameters=[
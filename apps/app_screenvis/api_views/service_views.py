@@ -1,18 +1,30 @@
 from django.utils.translation import gettext_lazy
+from django.db.models import Sum
 from rest_framework.decorators import action
 from rest_framework.serializers import Serializer
 from rest_framework.response import Response
 from drf_yasg.utils import swagger_auto_schema
 
 from apps.app_screenvis.models import (
-    ServerService, ServerServiceTimedStats, VPNTimedStats,
-    ObjectService, ObjectServiceTimedStats
+    ServerService, ServerServiceLatestStats, VPNLatestStats,
+    ObjectService, ObjectServiceLatestStats
 )
 from apps.app_screenvis.tasks import try_stats_service
 from apps.app_screenvis.permissions import ScreenAPIIPPermission
 from . import NormalGenericViewSet
 
 
+def sum_units_latest_stats(latest_model, service_model) -> dict:
+    """
+    各服务单元最新统计数据快照的合计，一次查询
+    """
+    fields = latest_model.STATS_FIELDS
+    data = latest_model.objects.filter(
+        service__status__in=[service_model.Status.ENABLE.value, service_model.Status.DISABLE.value]
+    ).aggregate(**{f: Sum(f) for f in fields})
+    return {f: data[f] or 0 for f in fields}
+
+
 class ServerServiceViewSet(NormalGenericViewSet):
     queryset = []
     permission_classes = [ScreenAPIIPPermission]
@@ -55,56 +67,8 @@ def get_server_stats_response():
         except Exception as exc:
             pass
 
-        unit_ids = ServerService.objects.filter(
-            status__in=[ServerService.Status.ENABLE.value, ServerService.Status.DISABLE.value]
-        ).values_list('id', flat=True)
-
-        obj_list = []
-        for unit_id in set(unit_ids):
-            obj = ServerServiceTimedStats.objects.filter(service_id=unit_id).order_by('-timestamp').first()
-            if obj:
-                obj_list.append(obj)
-
-        server_count = 0
-        disk_count = 0
-        ip_count = 0
-        ip_used_count = 0
-        pub_ip_count = 0
-        pub_ip_used_count = 0
-        pri_ip_count = 0
-        pri_ip_used_count = 0
-        mem_size = 0
-        mem_used_size = 0
-        cpu_count = 0
-        cpu_used_count = 0
-        for obj in obj_list:
-            server_count = server_count + obj.server_count
-            disk_count = disk_count + obj.disk_count
-            ip_count = ip_count + obj.ip_count
-            ip_used_count = ip_used_count + obj.ip_used_count
-            pub_ip_count += obj.pub_ip_count
-            pub_ip_used_count += obj.pub_ip_used_count
-            pri_ip_count += obj.pri_ip_count
-            pri_ip_used_count += obj.pri_ip_used_count
-            mem_size = mem_size + obj.mem_size
-            mem_used_size = mem_used_size + obj.mem_used_size
-            cpu_count = cpu_count + obj.cpu_count
-            cpu_used_count = cpu_used_count + obj.cpu_used_count
-
-        return Response(data={
-            'server_count': server_count,
-            'disk_count': disk_count,
-            'ip_count': ip_count,
-            'ip_used_count': ip_used_count,
-            'pub_ip_count': pub_ip_count,
-            'pub_ip_used_count': pub_ip_used_count,
-            'pri_ip_count': pri_ip_count,
-            'pri_ip_used_count': pri_ip_used_count,
-            'mem_size': mem_size,
-            'mem_used_size': mem_used_size,
-            'cpu_count': cpu_count,
-            'cpu_used_count': cpu_used_count
-        })
+        data = sum_units_latest_stats(latest_model=ServerServiceLatestStats, service_model=ServerService)
+        return Response(data=data)
 
     def get_serializer_class(self):
         return Serializer
@@ -143,29 +107,8 @@ def get_vpn_stats_response():
         except Exception as exc:
             pass
 
-        unit_ids = ServerService.objects.filter(
-            status__in=[ServerService.Status.ENABLE.value, ServerService.Status.DISABLE.value]
-        ).values_list('id', flat=True)
-
-        obj_list = []
-        for unit_id in set(unit_ids):
-            obj = VPNTimedStats.objects.filter(service_id=unit_id).order_by('-timestamp').first()
-            if obj:
-                obj_list.append(obj)
-
-        vpn_online_count = 0
-        vpn_active_count = 0
-        vpn_count = 0
-        for obj in obj_list:
-            vpn_online_count = vpn_online_count + obj.vpn_online_count
-            vpn_active_count = vpn_active_count + obj.vpn_active_count
-            vpn_count = vpn_count + obj.vpn_count
-
-        return Response(data={
-            'vpn_online_count': vpn_online_count,
-            'vpn_active_count': vpn_active_count,
-            'vpn_count': vpn_count
-        })
+        data = sum_units_latest_stats(latest_model=VPNLatestStats, service_model=ServerService)
+        return Response(data=data)
 
     def get_serializer_class(self):
         return Serializer
@@ -206,35 +149,8 @@ def get_object_stats_response():
         except Exception as exc:
             pass
 
-        unit_ids = ObjectService.objects.filter(
-            status__in=[ObjectService.Status.ENABLE.value, ObjectService.Status.DISABLE.value]
-        ).values_list('id', flat=True)
-
-        obj_list = []
-        for unit_id in set(unit_ids):
-            obj = ObjectServiceTimedStats.objects.filter(service_id=unit_id).order_by('-timestamp').first()
-            if obj:
-                obj_list.append(obj)
-
-        bucket_count = 0
-        bucket_storage = 0
-        storage_used = 0
-        storage_capacity = 0
-        user_count = 0
-        for obj in obj_list:
-            bucket_count = bucket_count + obj.bucket_count
-            bucket_storage = bucket_storage + obj.bucket_storage
-            storage_used = storage_used + obj.storage_used
-            storage_capacity = storage_capacity + obj.storage_capacity
-            user_count += obj.user_count
-
-        return Response(data={
-            'bucket_count': bucket_count,
-            'bucket_storage': bucket_storage,
-            'storage_used': storage_used,
-            'storage_capacity': storage_capacity,
-            'user_count': user_count
-        })
+        data = sum_units_latest_stats(latest_model=ObjectServiceLatestStats, service_model=ObjectService)
+        return Response(data=data)
 
     def get_serializer_class(self):
         return Serializer
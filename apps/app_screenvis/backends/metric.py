@@ -4,6 +4,8 @@
 import requests
 import aiohttp
 
+from core.adapters.async_sessions import async_session_pool
+from core.prom_cache import prom_query_cache
 from apps.app_screenvis.utils import errors
 
 
@@ -153,9 +155,16 @@ def query_range_tag(
             query_render = BaseExpressionQuery
 
         expression_query = query_render.render_expression(tmpl=tag_tmpl, job=job)
-        api_url = self._build_query_range_api(
-            endpoint_url=endpoint_url, expression_query=expression_query, start=start, end=end, step=step)
-        return self.request_query_api(api_url)
+        def fetch(fetch_start: int, fetch_end: int):
+            api_url = self._build_query_range_api(
+                endpoint_url=endpoint_url, expression_query=expression_query, start=fetch_start, end=fetch_end,
+                step=step)
+            return self.request_query_api(api_url)
+
+        return prom_query_cache.query_range(
+            endpoint_url=endpoint_url, params={'query': expression_query}, start=start, end=end, step=step,
+            fetch=fetch
+        )
 
     def query_tag(self, endpoint_url: str, tag_tmpl: str, job: str, query_render: BaseExpressionQuery = None):
         if not query_render:
@@ -163,7 +172,10 @@ def query_tag(self, endpoint_url: str, tag_tmpl: str, job: str, query_render: Ba
 
         expression_query = query_render.render_expression(tmpl=tag_tmpl, job=job)
         api_url = self._build_query_url(endpoint_url=endpoint_url, querys={'query': expression_query})
-        return self.request_query_api(url=api_url)
+        return prom_query_cache.query(
+            endpoint_url=endpoint_url, params={'query': expression_query},
+            fetch=lambda: self.request_query_api(url=api_url)
+        )
 
     async def async_query_tag(
             self, endpoint_url: str, tag_tmpl: str, job: str, query_render: BaseExpressionQuery = None
@@ -173,7 +185,10 @@ async def async_query_tag(
 
         expression_query = query_render.render_expression(tmpl=tag_tmpl, job=job)
         api_url = self._build_query_url(endpoint_url=endpoint_url, querys={'query': expression_query})
-        return await self.async_request_query_api(url=api_url)
+        return await prom_query_cache.async_query(
+            endpoint_url=endpoint_url, params={'query': expression_query},
+            fetch=lambda: self.async_request_query_api(url=api_url)
+        )
 
     @staticmethod
     async def async_request_query_api(url: str):
@@ -181,7 +196,7 @@ async def async_request_query_api(url: str):
         :raises: Error
         """
         try:
-            async with aiohttp.ClientSession() as client:
+            async with async_session_pool.session(url) as client:
                 r = await client.get(url=url, timeout=aiohttp.ClientTimeout(sock_connect=10, total=60))
                 await r.read()
         except aiohttp.ClientConnectionError:
@@ -5,6 +5,7 @@
 import requests
 import aiohttp
 
+from core.adapters.async_sessions import async_session_pool
 from apps.app_screenvis.utils import errors
 
 
@@ -73,7 +74,7 @@ async def async_request_query_api(url: str):
         :raises: Error
         """
         try:
-            async with aiohttp.ClientSession() as client:
+            async with async_session_pool.session(url) as client:
                 r = await client.get(url=url, timeout=aiohttp.ClientTimeout(sock_connect=6, total=30))
                 await r.read()
         except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
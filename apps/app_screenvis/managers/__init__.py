@@ -1,8 +1,9 @@
 from .metrics import CephQueryChoices, TiDBQueryChoices, HostQueryChoices, MetricQueryManager, HostQueryRangeChoices
 from .web_monitor import ScreenWebMonitorManager, WebQueryChoices
+from .netflow import HostNetflowManager
 
 
 __all__ = [
     'CephQueryChoices', 'TiDBQueryChoices', 'HostQueryChoices', 'MetricQueryManager',
-    'ScreenWebMonitorManager', 'HostQueryRangeChoices', 'WebQueryChoices'
+    'ScreenWebMonitorManager', 'HostQueryRangeChoices', 'WebQueryChoices', 'HostNetflowManager'
 ]
@@ -3,6 +3,7 @@
 from django.db import models
 from django.utils.translation import gettext_lazy, gettext as _
 
+from core.adapters.async_sessions import async_session_pool
 from apps.app_screenvis.utils import errors
 from apps.app_screenvis.utils import build_metric_provider, MetricProvider
 from apps.app_screenvis.serializers import MetricMntrUnitSimpleSerializer
@@ -192,7 +193,7 @@ def async_query_together(
                 tag=tag, tag_tmpl=tag_map[tag]
             ) for tag in tags
         ]
-        results = asyncio.run(self.do_async_requests(tasks))
+        results = async_session_pool.run_sync(self.do_async_requests(tasks))
         data = {}
         errs = {}
         for r in results:
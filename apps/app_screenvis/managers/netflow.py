@@ -0,0 +1,245 @@
+from datetime import datetime, timedelta
+
+from django.db import transaction
+
+from utils.model import bulk_upsert
+
+from apps.app_screenvis.models import HostNetflow, HostNetflow5m, HostNetflow1h
+
+
+class HostNetflowManager:
+    """
+    主机单元网络流量时序数据，原始数据和5分钟、1小时降采样数据
+    """
+    RESOLUTION_RAW = 'raw'
+    RESOLUTION_5M = '5m'
+    RESOLUTION_1H = '1h'
+    ROLLUP_MODELS = {
+        RESOLUTION_5M: HostNetflow5m,
+        RESOLUTION_1H: HostNetflow1h,
+    }
+    # 查询时间段长度上限（秒）和使用的数据精度，超过时使用1小时降采样数据
+    RESOLUTION_RANGES = (
+        (24 * 3600, RESOLUTION_RAW),
+        (7 * 24 * 3600, RESOLUTION_5M),
+    )
+    # 分级保留天数
+    RETENTION_DAYS = {
+        RESOLUTION_RAW: 200,
+        RESOLUTION_5M: 400,
+        RESOLUTION_1H: 365 * 3,
+    }
+    DELETE_CHUNK_SIZE = 5000
+    ROLLUP_BATCH_SIZE = 500
+    BACKFILL_CHUNK_SECONDS = 24 * 3600
+
+    @classmethod
+    def rollup(cls, start_ts: int, end_ts: int, unit_ids: list = None) -> dict:
+        """
+        重新汇总时间范围内的降采样数据，时间范围扩展到包含它的完整时间段
+
+        :param start_ts: 原始数据的开始时间戳（包含）
+        :param end_ts: 原始数据的结束时间戳（包含）
+        :param unit_ids: 只汇总这些主机单元，None(所有)
+        :return: {resolution: 降采样数据数}
+        """
+        ret = {}
+        for resolution, model in cls.ROLLUP_MODELS.items():
+            step = model.STEP
+            bucket_start = start_ts - start_ts % step
+            bucket_end = end_ts - end_ts % step + step
+            objs = cls.build_rollup_objs(model=model, start_ts=bucket_start, end_ts=bucket_end, unit_ids=unit_ids)
+            with transaction.atomic():
+                bulk_upsert(
+                    model=model, objs=objs, unique_fields=['unit', 'timestamp'],
+                    update_fields=[
+                        'count', 'flow_in_min', 'flow_in_max', 'flow_in_avg',
+                        'flow_out_min', 'flow_out_max', 'flow_out_avg'
+                    ],
+                    batch_size=cls.ROLLUP_BATCH_SIZE
+                )
+
+            ret[resolution] = len(objs)
+
+        return ret
+
+    @classmethod
+    def backfill(cls, start_ts: int = None, end_ts: int = None, chunk_seconds: int = None,
+                 unit_ids: list = None) -> dict:
+        """
+        按时间段分批汇总已有原始数据的降采样数据，每批一天，用于降采样之前已存在的历史数据
+
+        :param start_ts: 开始时间戳，None(最早的原始数据)
+        :param end_ts: 结束时间戳，None(最新的原始数据)
+        :param chunk_seconds: 每批时间段长度（秒），按1小时对齐
+        :return: {resolution: 降采样数据数}
+        """
+        qs = HostNetflow.objects.order_by()
+        if start_ts is None:
+            start_ts = qs.order_by('timestamp').values_list('timestamp', flat=True).first()
+        if end_ts is None:
+            end_ts = qs.order_by('-timestamp').values_list('timestamp', flat=True).first()
+
+        ret = {resolution: 0 for resolution in cls.ROLLUP_MODELS}
+        if start_ts is None or end_ts is None:
+            return ret
+
+        step = HostNetflow1h.STEP
+        chunk_seconds = chunk_seconds if chunk_seconds and chunk_seconds > 0 else cls.BACKFILL_CHUNK_SECONDS
+        chunk_seconds = max(chunk_seconds - chunk_seconds % step, step)
+        chunk_start = start_ts - start_ts % step
+        while chunk_start <= end_ts:
+            chunk_end = min(chunk_start + chunk_seconds - 1, end_ts)
+            r = cls.rollup(start_ts=chunk_start, end_ts=chunk_end, unit_ids=unit_ids)
+            for resolution, count in r.items():
+                ret[resolution] += count
+
+            chunk_start += chunk_seconds
+
+        return ret
+
+    @staticmethod
+    def build_rollup_objs(model, start_ts: int, end_ts: int, unit_ids: list = None) -> list:
+        """
+        原始数据[start_ts, end_ts)按时间段汇总
+        """
+        step = model.STEP
+        qs = HostNetflow.objects.filter(
+            timestamp__gte=start_ts, timestamp__lt=end_ts, flow_in__gte=0, flow_out__gte=0)
+        if unit_ids is not None:
+            qs = qs.filter(unit_id__in=unit_ids)
+
+        buckets = {}    # {(unit_id, bucket_ts): [count, in_min, in_max, in_sum, out_min, out_max, out_sum]}
+        for unit_id, ts, flow_in, flow_out in qs.order_by().values_list('unit_id', 'timestamp', 'flow_in', 'flow_out'):
+            key = (unit_id, ts - ts % step)
+            b = buckets.get(key)
+            if b is None:
+                buckets[key] = [1, flow_in, flow_in, flow_in, flow_out, flow_out, flow_out]
+                continue
+
+            b[0] += 1
+            b[1] = min(b[1], flow_in)
+            b[2] = max(b[2], flow_in)
+            b[3] += flow_in
+            b[4] = min(b[4], flow_out)
+            b[5] = max(b[5], flow_out)
+            b[6] += flow_out
+
+        objs = []
+        for (unit_id, bucket_ts), b in buckets.items():
+            count = b[0]
+            objs.append(model(
+                unit_id=unit_id, timestamp=bucket_ts, count=count,
+                flow_in_min=b[1], flow_in_max=b[2], flow_in_avg=b[3] / count,
+                flow_out_min=b[4], flow_out_max=b[5], flow_out_avg=b[6] / count
+            ))
+
+        return objs
+
+    @classmethod
+    def get_resolution(cls, start_ts: int, end_ts: int) -> str:
+        seconds = end_ts - start_ts
+        for max_seconds, resolution in cls.RESOLUTION_RANGES:
+            if seconds <= max_seconds:
+                return resolution
+
+        return cls.RESOLUTION_1H
+
+    @classmethod
+    def query_range(cls, unit_id: int, start_ts: int, end_ts: int, resolution: str = None) -> dict:
+        """
+        查询主机单元时间段内网络流量，按时间段长度选择数据精度
+
+        :param resolution: 指定数据精度，None(按时间段长度选择)
+        :return: {
+            'resolution': '5m',
+            'step': 300,        # 降采样时间段长度，原始数据为0
+            'results': [
+                {'timestamp': 1446758400, 'flow_in': 2442.3, 'flow_in_min': 1.0, 'flow_in_max': 3000.1,
+                 'flow_out': 5252.6, 'flow_out_min': 2.0, 'flow_out_max': 6000.3}
+            ]
+        }
+        """
+        if resolution is None:
+            resolution = cls.get_resolution(start_ts=start_ts, end_ts=end_ts)
+
+        results = []
+        if resolution == cls.RESOLUTION_RAW:
+            step = 0
+            qs = HostNetflow.objects.filter(
+                unit_id=unit_id, timestamp__gte=start_ts, timestamp__lte=end_ts, flow_in__gte=0, flow_out__gte=0
+            ).order_by('timestamp').values_list('timestamp', 'flow_in', 'flow_out')
+            for ts, flow_in, flow_out in qs:
+                results.append({
+                    'timestamp': ts, 'flow_in': flow_in, 'flow_in_min': flow_in, 'flow_in_max': flow_in,
+                    'flow_out': flow_out, 'flow_out_min': flow_out, 'flow_out_max': flow_out
+                })
+        else:
+            model = cls.ROLLUP_MODELS[resolution]
+            step = model.STEP
+            qs = model.objects.filter(
+                unit_id=unit_id, timestamp__gte=start_ts - start_ts % step, timestamp__lte=end_ts
+            ).order_by('timestamp').values_list(
+                'timestamp', 'flow_in_avg', 'flow_in_min', 'flow_in_max', 'flow_out_avg', 'flow_out_min', 'flow_out_max')
+            rows = list(qs)
+            # 降采样之前的历史数据未汇总时，缺少的时间段从原始数据临时汇总
+            bucket_start = start_ts - start_ts % step
+            missing_end = rows[0][0] if rows else end_ts + 1
+            if missing_end > bucket_start:
+                objs = cls.build_rollup_objs(
+                    model=model, start_ts=bucket_start, end_ts=min(missing_end, end_ts + 1), unit_ids=[unit_id])
+                objs.sort(key=lambda o: o.timestamp)
+                rows = [(
+                    o.timestamp, o.flow_in_avg, o.flow_in_min, o.flow_in_max,
+                    o.flow_out_avg, o.flow_out_min, o.flow_out_max
+                ) for o in objs] + rows
+
+            for ts, in_avg, in_min, in_max, out_avg, out_min, out_max in rows:
+                results.append({
+                    'timestamp': ts, 'flow_in': in_avg, 'flow_in_min': in_min, 'flow_in_max': in_max,
+                    'flow_out': out_avg, 'flow_out_min': out_min, 'flow_out_max': out_max
+                })
+
+        return {'resolution': resolution, 'step': step, 'results': results}
+
+    @classmethod
+    def delete_before(cls, model, timestamp: int, chunk_size: int = None) -> int:
+        """
+        分批删除时间戳之前的数据，每批一个短事务
+
+        :return: 删除的数据数
+        """
+        chunk_size = chunk_size if chunk_size and chunk_size > 0 else cls.DELETE_CHUNK_SIZE
+        deleted_count = 0
+        while True:
+            ids = list(model.objects.filter(
+                timestamp__lt=timestamp).order_by().values_list('id', flat=True)[0:chunk_size])
+            if not ids:
+                break
+
+            count, d = model.objects.filter(id__in=ids).delete()
+            deleted_count += count
+            if len(ids) < chunk_size:
+                break
+
+        return deleted_count
+
+    @classmethod
+    def purge(cls, retention_days: dict = None, chunk_size: int = None) -> dict:
+        """
+        按分级保留天数删除过期数据
+
+        :param retention_days: {resolution: days}，默认RETENTION_DAYS
+        :return: {resolution: 删除的数据数}
+        """
+        days_map = dict(cls.RETENTION_DAYS)
+        if retention_days:
+            days_map.update(retention_days)
+
+        models_map = {cls.RESOLUTION_RAW: HostNetflow, **cls.ROLLUP_MODELS}
+        ret = {}
+        for resolution, model in models_map.items():
+            ts = int((datetime.utcnow() - timedelta(days=days_map[resolution])).timestamp())
+            ret[resolution] = cls.delete_before(model=model, timestamp=ts, chunk_size=chunk_size)
+
+        return ret
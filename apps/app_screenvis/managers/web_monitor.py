@@ -5,6 +5,7 @@
 
 from core import errors
 from core.web_monitor import WebMonitorTaskClient
+from core.adapters.async_sessions import async_session_pool
 from apps.app_screenvis.configs_manager import screen_configs
 from apps.app_screenvis.models import ScreenConfig
 from apps.app_screenvis.backends.website import WebMonitorQueryAPI, WebsiteExpressionQuery
@@ -147,7 +148,7 @@ def async_query_together(self, endpoint_url: str):
         tasks = [
             self.req_tag(endpoint_url=endpoint_url, tag=tag, tag_tmpl=self.query_tag_tmpl_map[tag]) for tag in tags
         ]
-        results = asyncio.run(self.do_async_requests(tasks))
+        results = async_session_pool.run_sync(self.do_async_requests(tasks))
         data = {}
         errs = {}
         for r in results:
@@ -0,0 +1,98 @@
+# Generated by Django 4.2.16 on 2026-10-17 05:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_latest_stats(apps, schema_editor):
+    """
+    从时序统计数据中查询每个服务单元最新的统计数据，生成最新统计数据快照
+    """
+    items = [
+        ('ServerService', 'ServerServiceTimedStats', 'ServerServiceLatestStats'),
+        ('ServerService', 'VPNTimedStats', 'VPNLatestStats'),
+        ('ObjectService', 'ObjectServiceTimedStats', 'ObjectServiceLatestStats'),
+    ]
+    for service_name, timed_name, latest_name in items:
+        service_model = apps.get_model('app_screenvis', service_name)
+        timed_model = apps.get_model('app_screenvis', timed_name)
+        latest_model = apps.get_model('app_screenvis', latest_name)
+        field_names = [f.attname for f in latest_model._meta.concrete_fields]
+        objs = []
+        for service_id in service_model.objects.values_list('id', flat=True):
+            timed_obj = timed_model.objects.filter(service_id=service_id).order_by('-timestamp').first()
+            if timed_obj:
+                objs.append(latest_model(**{name: getattr(timed_obj, name) for name in field_names}))
+
+        latest_model.objects.bulk_create(objs, batch_size=200)
+
+
+def reverse_copy_latest_stats(apps, schema_editor):
+    return None
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_screenvis', '0013_objectservicetimedstats_user_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ObjectServiceLatestStats',
+            fields=[
+                ('bucket_count', models.IntegerField(blank=True, default=0, verbose_name='存储桶总数')),
+                ('bucket_storage', models.BigIntegerField(blank=True, default=0, verbose_name='存储桶总数据量(GiB)')),
+                ('storage_used', models.BigIntegerField(blank=True, default=0, verbose_name='已用容量(GiB)')),
+                ('storage_capacity', models.BigIntegerField(blank=True, default=0, verbose_name='总容量(GiB)')),
+                ('user_count', models.IntegerField(blank=True, default=0, verbose_name='用户数')),
+                ('service', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='+', serialize=False, to='app_screenvis.objectservice', verbose_name='服务单元')),
+                ('timestamp', models.PositiveBigIntegerField(verbose_name='统计时间')),
+            ],
+            options={
+                'verbose_name': '对象存储服务单元最新统计数据',
+                'verbose_name_plural': '对象存储服务单元最新统计数据',
+                'db_table': 'screenvis_object_lateststats',
+            },
+        ),
+        migrations.CreateModel(
+            name='ServerServiceLatestStats',
+            fields=[
+                ('server_count', models.IntegerField(blank=True, default=0, verbose_name='云主机数')),
+                ('disk_count', models.IntegerField(blank=True, default=0, verbose_name='云硬盘数')),
+                ('ip_count', models.IntegerField(blank=True, default=0, verbose_name='IP总数')),
+                ('ip_used_count', models.IntegerField(blank=True, default=0, verbose_name='已用IP数')),
+                ('pub_ip_count', models.IntegerField(blank=True, default=0, verbose_name='公网IP总数')),
+                ('pub_ip_used_count', models.IntegerField(blank=True, default=0, verbose_name='已用公网IP数')),
+                ('pri_ip_count', models.IntegerField(blank=True, default=0, verbose_name='私IP总数')),
+                ('pri_ip_used_count', models.IntegerField(blank=True, default=0, verbose_name='已用私网IP数')),
+                ('mem_size', models.IntegerField(blank=True, default=0, verbose_name='内存总数(GiB)')),
+                ('mem_used_size', models.IntegerField(blank=True, default=0, verbose_name='已用内存总数(GiB)')),
+                ('cpu_count', models.IntegerField(blank=True, default=0, verbose_name='CPU总数')),
+                ('cpu_used_count', models.IntegerField(blank=True, default=0, verbose_name='已用CPU总数')),
+                ('service', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='+', serialize=False, to='app_screenvis.serverservice', verbose_name='服务单元')),
+                ('timestamp', models.PositiveBigIntegerField(verbose_name='统计时间')),
+            ],
+            options={
+                'verbose_name': '云主机服务单元最新统计数据',
+                'verbose_name_plural': '云主机服务单元最新统计数据',
+                'db_table': 'screenvis_server_lateststats',
+            },
+        ),
+        migrations.CreateModel(
+            name='VPNLatestStats',
+            fields=[
+                ('vpn_online_count', models.IntegerField(blank=True, default=0, verbose_name='VPN账户在线数')),
+                ('vpn_active_count', models.IntegerField(blank=True, default=0, verbose_name='VPN有效数')),
+                ('vpn_count', models.IntegerField(blank=True, default=0, verbose_name='VPN总数')),
+                ('service', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='+', serialize=False, to='app_screenvis.serverservice', verbose_name='服务单元')),
+                ('timestamp', models.PositiveBigIntegerField(verbose_name='统计时间')),
+            ],
+            options={
+                'verbose_name': 'VPN最新统计数据',
+                'verbose_name_plural': 'VPN最新统计数据',
+                'db_table': 'screenvis_vpn_lateststats',
+            },
+        ),
+        migrations.RunPython(copy_latest_stats, reverse_code=reverse_copy_latest_stats),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 4.2.16 on 2026-10-17 05:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_screenvis', '0014_service_lateststats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HostNetflow1h',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('timestamp', models.PositiveBigIntegerField(verbose_name='时间段开始时间')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='原始数据数')),
+                ('flow_in_min', models.FloatField(default=0, verbose_name='最小进流量(B/s)')),
+                ('flow_in_max', models.FloatField(default=0, verbose_name='最大进流量(B/s)')),
+                ('flow_in_avg', models.FloatField(default=0, verbose_name='平均进流量(B/s)')),
+                ('flow_out_min', models.FloatField(default=0, verbose_name='最小出流量(B/s)')),
+                ('flow_out_max', models.FloatField(default=0, verbose_name='最大出流量(B/s)')),
+                ('flow_out_avg', models.FloatField(default=0, verbose_name='平均出流量(B/s)')),
+            ],
+            options={
+                'verbose_name': '主机指标单元网络流量1小时降采样',
+                'verbose_name_plural': '主机指标单元网络流量1小时降采样',
+                'db_table': 'screenvis_hostnetflow_1h',
+                'ordering': ['-timestamp'],
+            },
+        ),
+        migrations.CreateModel(
+            name='HostNetflow5m',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('timestamp', models.PositiveBigIntegerField(verbose_name='时间段开始时间')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='原始数据数')),
+                ('flow_in_min', models.FloatField(default=0, verbose_name='最小进流量(B/s)')),
+                ('flow_in_max', models.FloatField(default=0, verbose_name='最大进流量(B/s)')),
+                ('flow_in_avg', models.FloatField(default=0, verbose_name='平均进流量(B/s)')),
+                ('flow_out_min', models.FloatField(default=0, verbose_name='最小出流量(B/s)')),
+                ('flow_out_max', models.FloatField(default=0, verbose_name='最大出流量(B/s)')),
+                ('flow_out_avg', models.FloatField(default=0, verbose_name='平均出流量(B/s)')),
+            ],
+            options={
+                'verbose_name': '主机指标单元网络流量5分钟降采样',
+                'verbose_name_plural': '主机指标单元网络流量5分钟降采样',
+                'db_table': 'screenvis_hostnetflow_5m',
+                'ordering': ['-timestamp'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='hostnetflow',
+            index=models.Index(fields=['unit', 'timestamp'], name='idx_screen_netflow_unit_ts'),
+        ),
+        migrations.AddField(
+            model_name='hostnetflow5m',
+            name='unit',
+            field=models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='app_screenvis.metricmonitorunit', verbose_name='指标单元ID'),
+        ),
+        migrations.AddField(
+            model_name='hostnetflow1h',
+            name='unit',
+            field=models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='app_screenvis.metricmonitorunit', verbose_name='指标单元ID'),
+        ),
+        migrations.AddIndex(
+            model_name='hostnetflow5m',
+            index=models.Index(fields=['timestamp'], name='idx_screen_netflow5m_ts'),
+        ),
+        migrations.AddConstraint(
+            model_name='hostnetflow5m',
+            constraint=models.UniqueConstraint(fields=('unit', 'timestamp'), name='unique_screen_netflow5m_unit_ts'),
+        ),
+        migrations.AddIndex(
+            model_name='hostnetflow1h',
+            index=models.Index(fields=['timestamp'], name='idx_screen_netflow1h_ts'),
+        ),
+        migrations.AddConstraint(
+            model_name='hostnetflow1h',
+            constraint=models.UniqueConstraint(fields=('unit', 'timestamp'), name='unique_screen_netflow1h_unit_ts'),
+        ),
+    ]
@@ -211,10 +211,10 @@ def clean(self):
             raise ValidationError({'timestamp': f'无效的时间戳，{str(exc)}，当前时间戳为:{int(dj_timezone.now().timestamp())}'})
 
 
-class ServerServiceTimedStats(BaseTimed):
-    service = models.ForeignKey(
-        to=ServerService, verbose_name='服务单元', on_delete=models.DO_NOTHING, null=True, blank=False,
-        db_constraint=False, db_index=False)
+class BaseServerStats(models.Model):
+    """
+    云主机服务单元统计数据字段
+    """
     server_count = models.IntegerField(verbose_name=_('云主机数'), blank=True, default=0)
     disk_count = models.IntegerField(verbose_name=_('云硬盘数'), blank=True, default=0)
     ip_count = models.IntegerField(verbose_name=_('IP总数'), blank=True, default=0)
@@ -228,6 +228,50 @@ class ServerServiceTimedStats(BaseTimed):
     cpu_count = models.IntegerField(verbose_name=_('CPU总数'), blank=True, default=0)
     cpu_used_count = models.IntegerField(verbose_name=_('已用CPU总数'), blank=True, default=0)
 
+    STATS_FIELDS = [
+        'server_count', 'disk_count', 'ip_count', 'ip_used_count', 'pub_ip_count', 'pub_ip_used_count',
+        'pri_ip_count', 'pri_ip_used_count', 'mem_size', 'mem_used_size', 'cpu_count', 'cpu_used_count'
+    ]
+
+    class Meta:
+        abstract = True
+
+
+class BaseVPNStats(models.Model):
+    """
+    VPN统计数据字段
+    """
+    vpn_online_count = models.IntegerField(verbose_name=_('VPN账户在线数'), blank=True, default=0)
+    vpn_active_count = models.IntegerField(verbose_name=_('VPN有效数'), blank=True, default=0)
+    vpn_count = models.IntegerField(verbose_name=_('VPN总数'), blank=True, default=0)
+
+    STATS_FIELDS = ['vpn_online_count', 'vpn_active_count', 'vpn_count']
+
+    class Meta:
+        abstract = True
+
+
+class BaseObjectStats(models.Model):
+    """
+    对象存储服务单元统计数据字段
+    """
+    bucket_count = models.IntegerField(verbose_name=_('存储桶总数'), blank=True, default=0)
+    bucket_storage = models.BigIntegerField(verbose_name=_('存储桶总数据量(GiB)'), blank=True, default=0)
+    storage_used = models.BigIntegerField(verbose_name=_('已用容量(GiB)'), blank=True, default=0)
+    storage_capacity = models.BigIntegerField(verbose_name=_('总容量(GiB)'), blank=True, default=0)
+    user_count = models.IntegerField(verbose_name=_('用户数'), blank=True, default=0)
+
+    STATS_FIELDS = ['bucket_count', 'bucket_storage', 'storage_used', 'storage_capacity', 'user_count']
+
+    class Meta:
+        abstract = True
+
+
+class ServerServiceTimedStats(BaseTimed, BaseServerStats):
+    service = models.ForeignKey(
+        to=ServerService, verbose_name='服务单元', on_delete=models.DO_NOTHING, null=True, blank=False,
+        db_constraint=False, db_index=False)
+
     class Meta:
         db_table = 'screenvis_server_timedstats'
         ordering = ['-timestamp']
@@ -238,13 +282,10 @@ class Meta:
         ]
 
 
-class VPNTimedStats(BaseTimed):
+class VPNTimedStats(BaseTimed, BaseVPNStats):
     service = models.ForeignKey(
         to=ServerService, verbose_name='服务单元', on_delete=models.DO_NOTHING, null=True, blank=False,
         db_constraint=False, db_index=False)
-    vpn_online_count = models.IntegerField(verbose_name=_('VPN账户在线数'), blank=True, default=0)
-    vpn_active_count = models.IntegerField(verbose_name=_('VPN有效数'), blank=True, default=0)
-    vpn_count = models.IntegerField(verbose_name=_('VPN总数'), blank=True, default=0)
 
     class Meta:
         db_table = 'screenvis_vpn_timedstats'
@@ -256,15 +297,10 @@ class Meta:
         ]
 
 
-class ObjectServiceTimedStats(BaseTimed):
+class ObjectServiceTimedStats(BaseTimed, BaseObjectStats):
     service = models.ForeignKey(
         to=ObjectService, verbose_name='服务单元', on_delete=models.DO_NOTHING, null=True, blank=False,
         db_constraint=False, db_index=False)
-    bucket_count = models.IntegerField(verbose_name=_('存储桶总数'), blank=True, default=0)
-    bucket_storage = models.BigIntegerField(verbose_name=_('存储桶总数据量(GiB)'), blank=True, default=0)
-    storage_used = models.BigIntegerField(verbose_name=_('已用容量(GiB)'), blank=True, default=0)
-    storage_capacity = models.BigIntegerField(verbose_name=_('总容量(GiB)'), blank=True, default=0)
-    user_count = models.IntegerField(verbose_name=_('用户数'), blank=True, default=0)
 
     class Meta:
         db_table = 'screenvis_object_timedstats'
@@ -276,6 +312,51 @@ class Meta:
         ]
 
 
+class ServerServiceLatestStats(BaseServerStats):
+    """
+    云主机服务单元最新统计数据快照，每个服务单元一条记录，统计时更新
+    """
+    service = models.OneToOneField(
+        to=ServerService, verbose_name='服务单元', on_delete=models.DO_NOTHING, primary_key=True,
+        db_constraint=False, related_name='+')
+    timestamp = models.PositiveBigIntegerField(null=False, blank=False, verbose_name="统计时间")
+
+    class Meta:
+        db_table = 'screenvis_server_lateststats'
+        verbose_name = _('云主机服务单元最新统计数据')
+        verbose_name_plural = verbose_name
+
+
+class VPNLatestStats(BaseVPNStats):
+    """
+    VPN最新统计数据快照，每个服务单元一条记录，统计时更新
+    """
+    service = models.OneToOneField(
+        to=ServerService, verbose_name='服务单元', on_delete=models.DO_NOTHING, primary_key=True,
+        db_constraint=False, related_name='+')
+    timestamp = models.PositiveBigIntegerField(null=False, blank=False, verbose_name="统计时间")
+
+    class Meta:
+        db_table = 'screenvis_vpn_lateststats'
+        verbose_name = _('VPN最新统计数据')
+        verbose_name_plural = verbose_name
+
+
+class ObjectServiceLatestStats(BaseObjectStats):
+    """
+    对象存储服务单元最新统计数据快照，每个服务单元一条记录，统计时更新
+    """
+    service = models.OneToOneField(
+        to=ObjectService, verbose_name='服务单元', on_delete=models.DO_NOTHING, primary_key=True,
+        db_constraint=False, related_name='+')
+    timestamp = models.PositiveBigIntegerField(null=False, blank=False, verbose_name="统计时间")
+
+    class Meta:
+        db_table = 'screenvis_object_lateststats'
+        verbose_name = _('对象存储服务单元最新统计数据')
+        verbose_name_plural = verbose_name
+
+
 class ServiceUserOperateLog(UuidModel):
     """对象存储/云主机服务单元用户操作日志"""
     username = models.CharField(verbose_name=_('用户'), max_length=255)
@@ -330,7 +411,8 @@ class Meta:
         verbose_name = _('主机指标单元网络流量')
         verbose_name_plural = verbose_name
         indexes = [
-            models.Index(fields=['timestamp'], name='idx_screen_netflow_ts')
+            models.Index(fields=['timestamp'], name='idx_screen_netflow_ts'),
+            models.Index(fields=['unit', 'timestamp'], name='idx_screen_netflow_unit_ts')
         ]
 
     def __str__(self):
@@ -343,6 +425,64 @@ def clean(self):
             raise ValidationError({'timestamp': f'无效的时间戳，{str(exc)}，当前时间戳为:{int(dj_timezone.now().timestamp())}'})
 
 
+class BaseHostNetflowRollup(models.Model):
+    """
+    主机指标单元网络流量降采样数据，由原始时序数据按时间段汇总，只汇总有效（非负）的数据
+    """
+    STEP = 0    # 降采样时间段长度，秒
+
+    id = models.BigAutoField(primary_key=True)
+    timestamp = models.PositiveBigIntegerField(verbose_name=_('时间段开始时间'))
+    unit = models.ForeignKey(
+        to=MetricMonitorUnit, verbose_name=_('指标单元ID'), on_delete=models.DO_NOTHING, null=True, blank=False,
+        db_constraint=False, db_index=False, related_name='+')
+    count = models.PositiveIntegerField(verbose_name=_('原始数据数'), default=0)
+    flow_in_min = models.FloatField(verbose_name=_('最小进流量(B/s)'), default=0)
+    flow_in_max = models.FloatField(verbose_name=_('最大进流量(B/s)'), default=0)
+    flow_in_avg = models.FloatField(verbose_name=_('平均进流量(B/s)'), default=0)
+    flow_out_min = models.FloatField(verbose_name=_('最小出流量(B/s)'), default=0)
+    flow_out_max = models.FloatField(verbose_name=_('最大出流量(B/s)'), default=0)
+    flow_out_avg = models.FloatField(verbose_name=_('平均出流量(B/s)'), default=0)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return f'{self.unit_id}(flow in {self.flow_in_avg}, out {self.flow_out_avg}, {self.timestamp})'
+
+
+class HostNetflow5m(BaseHostNetflowRollup):
+    STEP = 300
+
+    class Meta:
+        db_table = 'screenvis_hostnetflow_5m'
+        ordering = ['-timestamp']
+        verbose_name = _('主机指标单元网络流量5分钟降采样')
+        verbose_name_plural = verbose_name
+        constraints = [
+            models.UniqueConstraint(fields=['unit', 'timestamp'], name='unique_screen_netflow5m_unit_ts')
+        ]
+        indexes = [
+            models.Index(fields=['timestamp'], name='idx_screen_netflow5m_ts')
+        ]
+
+
+class HostNetflow1h(BaseHostNetflowRollup):
+    STEP = 3600
+
+    class Meta:
+        db_table = 'screenvis_hostnetflow_1h'
+        ordering = ['-timestamp']
+        verbose_name = _('主机指标单元网络流量1小时降采样')
+        verbose_name_plural = verbose_name
+        constraints = [
+            models.UniqueConstraint(fields=['unit', 'timestamp'], name='unique_screen_netflow1h_unit_ts')
+        ]
+        indexes = [
+            models.Index(fields=['timestamp'], name='idx_screen_netflow1h_ts')
+        ]
+
+
 class WebsiteMonitorTask(UuidModel):
     """
     网站监控任务
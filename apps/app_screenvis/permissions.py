@@ -1,13 +1,10 @@
 from rest_framework.permissions import BasePermission
 
-from apps.app_global.configs_manager import IPAccessWhiteListManager
-from utils.iprestrict import IPRestrictor
+from apps.app_global.configs_manager import IPAccessWhiteListManager, ModuleIPRestrictor
 
 
-class ScreenAPIIPRestrictor(IPRestrictor):
-    def load_ip_rules(self):
-        return IPAccessWhiteListManager.get_module_ip_whitelist(
-            module_name=IPAccessWhiteListManager.ModuleName.SCREEN.value)
+class ScreenAPIIPRestrictor(ModuleIPRestrictor):
+    module_name = IPAccessWhiteListManager.ModuleName.SCREEN.value
 
     @staticmethod
     def clear_cache():
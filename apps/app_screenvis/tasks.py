@@ -4,7 +4,7 @@
 
 from django.utils import timezone as dj_timezone
 
-from core.taskqueue import submit_task
+from core.taskqueue import submit_task, QueueName
 from apps.app_global.task_locks import (
     screen_user_operate_log_lock, screen_service_stats_lock, screen_host_netflow_lock
 )
@@ -23,7 +23,10 @@ def try_sync_service_log() -> Union[Future, None]:
     nt = dj_timezone.now()
     # 上次同步时间大于指定同步周期，提交异步任务同步
     if not start_time or (nt - start_time) >= timedelta(minutes=timed_minutes):
-        return submit_task(task_service_log_use_lock, kwargs={'timed_minutes': timed_minutes})
+        return submit_task(
+            task_service_log_use_lock, kwargs={'timed_minutes': timed_minutes}, queue=QueueName.SCREENVIS,
+            run_on_reject=False     # 队列已满时抛出错误，跳过本次同步
+        )
 
     return None
 
@@ -59,7 +62,10 @@ def try_stats_service() -> Union[Future, None]:
     nt = dj_timezone.now()
     # 上次同步时间大于指定同步周期，提交异步任务同步
     if not start_time or (nt - start_time) >= timedelta(minutes=timed_minutes):
-        return submit_task(task_service_stats_use_lock, kwargs={'timed_minutes': timed_minutes})
+        return submit_task(
+            task_service_stats_use_lock, kwargs={'timed_minutes': timed_minutes}, queue=QueueName.SCREENVIS,
+            run_on_reject=False     # 队列已满时抛出错误，跳过本次同步
+        )
 
     return None
 
@@ -96,7 +102,10 @@ def try_host_netflow() -> Union[Future, None]:
     nt = dj_timezone.now()
     # 上次同步时间大于指定同步周期，提交异步任务同步
     if not start_time or (nt - start_time) >= timedelta(minutes=timed_minutes):
-        return submit_task(task_host_netflow_use_lock, kwargs={'timed_minutes': timed_minutes})
+        return submit_task(
+            task_host_netflow_use_lock, kwargs={'timed_minutes': timed_minutes}, queue=QueueName.SCREENVIS,
+            run_on_reject=False     # 队列已满时抛出错误，跳过本次同步
+        )
 
     return None
 
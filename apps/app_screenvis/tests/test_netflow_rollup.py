@@ -0,0 +1,214 @@
+import time
+from unittest import mock
+from urllib import parse
+
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone as dj_timezone
+
+from apps.app_screenvis.managers import HostNetflowManager
+from apps.app_screenvis.models import MetricMonitorUnit, HostNetflow, HostNetflow5m, HostNetflow1h
+from apps.app_screenvis.permissions import ScreenAPIIPRestrictor
+from . import MyAPITestCase
+
+
+class HostNetflowRollupTests(MyAPITestCase):
+    def setUp(self):
+        ScreenAPIIPRestrictor.clear_cache()
+        now_time = dj_timezone.now()
+        self.unit1 = MetricMonitorUnit(
+            name='name1', name_en='name_en1', job_tag='tag1', unit_type=MetricMonitorUnit.UnitType.HOST.value,
+            creation_time=now_time, update_time=now_time
+        )
+        self.unit1.save(force_insert=True)
+        self.unit2 = MetricMonitorUnit(
+            name='name2', name_en='name_en2', job_tag='tag2', unit_type=MetricMonitorUnit.UnitType.HOST.value,
+            creation_time=now_time, update_time=now_time
+        )
+        self.unit2.save(force_insert=True)
+
+    @staticmethod
+    def create_netflow(unit_id, start_ts: int, end_ts: int, interval: int):
+        objs = []
+        for ts in range(start_ts, end_ts + 1, interval):
+            obj = HostNetflow(timestamp=ts, unit_id=unit_id, flow_in=ts % 1000, flow_out=ts % 100)
+            obj.enforce_id()
+            objs.append(obj)
+
+        HostNetflow.objects.bulk_create(objs, batch_size=1000)
+        return objs
+
+    def test_rollup(self):
+        base_ts = 1699999200    # 整点
+        self.create_netflow(unit_id=self.unit1.id, start_ts=base_ts, end_ts=base_ts + 3600 - 1, interval=60)
+        self.create_netflow(unit_id=self.unit2.id, start_ts=base_ts, end_ts=base_ts + 600 - 1, interval=120)
+        HostNetflow(timestamp=base_ts + 30, unit_id=self.unit1.id, flow_in=-1, flow_out=-1).save(force_insert=True)
+
+        ret = HostNetflowManager.rollup(start_ts=base_ts + 100, end_ts=base_ts + 200)
+        self.assertEqual(ret, {'5m': 2, '1h': 2})
+        ret = HostNetflowManager.rollup(start_ts=base_ts, end_ts=base_ts + 3600 - 1)
+        self.assertEqual(ret, {'5m': 12 + 2, '1h': 2})
+        self.assertEqual(HostNetflow5m.objects.count(), 14)
+        self.assertEqual(HostNetflow1h.objects.count(), 2)
+
+        obj = HostNetflow5m.objects.get(unit_id=self.unit1.id, timestamp=base_ts)
+        values_in = [ts % 1000 for ts in range(base_ts, base_ts + 300, 60)]
+        values_out = [ts % 100 for ts in range(base_ts, base_ts + 300, 60)]
+        self.assertEqual(obj.count, 5)
+        self.assertEqual(obj.flow_in_min, min(values_in))
+        self.assertEqual(obj.flow_in_max, max(values_in))
+        self.assertAlmostEqual(obj.flow_in_avg, sum(values_in) / 5)
+        self.assertEqual(obj.flow_out_max, max(values_out))
+        obj = HostNetflow1h.objects.get(unit_id=self.unit1.id, timestamp=base_ts)
+        self.assertEqual(obj.count, 60)
+        obj = HostNetflow1h.objects.get(unit_id=self.unit2.id, timestamp=base_ts)
+        self.assertEqual(obj.count, 5)
+
+        # 新数据更新已有的降采样数据
+        HostNetflow(timestamp=base_ts + 1, unit_id=self.unit2.id, flow_in=5000, flow_out=0).save(force_insert=True)
+        HostNetflowManager.rollup(start_ts=base_ts + 1, end_ts=base_ts + 1, unit_ids=[self.unit2.id])
+        obj = HostNetflow5m.objects.get(unit_id=self.unit2.id, timestamp=base_ts)
+        self.assertEqual(obj.count, 4)
+        self.assertEqual(obj.flow_in_max, 5000)
+        self.assertEqual(HostNetflow5m.objects.count(), 14)
+
+    def test_rollup_without_conflict_target(self):
+        """
+        数据库不支持冲突目标和冲突更新时（按唯一键查询后更新或插入），降采样数据也能更新
+        """
+        base_ts = 1699999200
+        self.create_netflow(unit_id=self.unit1.id, start_ts=base_ts, end_ts=base_ts + 600 - 1, interval=60)
+        features = connection.features
+        with mock.patch.object(features, 'supports_update_conflicts_with_target', False), \
+                mock.patch.object(features, 'supports_update_conflicts', False):
+            ret = HostNetflowManager.rollup(start_ts=base_ts, end_ts=base_ts + 600 - 1)
+            self.assertEqual(ret, {'5m': 2, '1h': 1})
+            HostNetflow(timestamp=base_ts + 1, unit_id=self.unit1.id, flow_in=5000, flow_out=0).save(force_insert=True)
+            self.create_netflow(unit_id=self.unit2.id, start_ts=base_ts, end_ts=base_ts + 60, interval=60)
+            HostNetflowManager.rollup(start_ts=base_ts, end_ts=base_ts + 600 - 1)
+
+        self.assertEqual(HostNetflow5m.objects.count(), 3)
+        self.assertEqual(HostNetflow1h.objects.count(), 2)
+        obj = HostNetflow5m.objects.get(unit_id=self.unit1.id, timestamp=base_ts)
+        self.assertEqual(obj.count, 6)
+        self.assertEqual(obj.flow_in_max, 5000)
+        self.assertEqual(HostNetflow1h.objects.get(unit_id=self.unit1.id, timestamp=base_ts).count, 11)
+
+    def test_query_range_and_purge(self):
+        """
+        200天历史数据，按查询时间段长度选择数据精度
+        """
+        now_ts = int(time.time())
+        now_ts -= now_ts % 3600
+        start_ts = now_ts - 210 * 24 * 3600
+        self.create_netflow(unit_id=self.unit1.id, start_ts=start_ts, end_ts=now_ts, interval=1800)
+        self.create_netflow(unit_id=self.unit2.id, start_ts=now_ts - 24 * 3600, end_ts=now_ts, interval=1800)
+        HostNetflowManager.rollup(start_ts=start_ts, end_ts=now_ts)
+
+        r = HostNetflowManager.query_range(unit_id=self.unit1.id, start_ts=now_ts - 12 * 3600, end_ts=now_ts)
+        self.assertEqual(r['resolution'], 'raw')
+        self.assertEqual(len(r['results']), 25)
+        r = HostNetflowManager.query_range(unit_id=self.unit1.id, start_ts=now_ts - 3 * 24 * 3600, end_ts=now_ts)
+        self.assertEqual(r['resolution'], '5m')
+        self.assertEqual(r['step'], 300)
+        self.assertEqual(len(r['results']), 3 * 48 + 1)
+
+        queries = []
+        with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+            r = HostNetflowManager.query_range(
+                unit_id=self.unit1.id, start_ts=now_ts - 200 * 24 * 3600, end_ts=now_ts)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(r['resolution'], '1h')
+        self.assertEqual(len(r['results']), 200 * 24 + 1)
+        self.assertEqual(r['results'][0]['timestamp'], now_ts - 200 * 24 * 3600)
+        item = r['results'][-1]
+        self.assertEqual(item['flow_in'], now_ts % 1000)
+        self.assertEqual(item['flow_in_min'], now_ts % 1000)
+
+        # 分批删除，原始数据保留200天，降采样数据保留更久
+        raw_count = HostNetflow.objects.count()
+        ret = HostNetflowManager.purge(chunk_size=100)
+        self.assertEqual(ret['5m'], 0)
+        self.assertEqual(ret['1h'], 0)
+        self.assertGreater(ret['raw'], 9 * 48)
+        self.assertEqual(HostNetflow.objects.count(), raw_count - ret['raw'])
+        min_ts = HostNetflow.objects.order_by('timestamp').values_list('timestamp', flat=True).first()
+        self.assertGreaterEqual(min_ts, now_ts - 200 * 24 * 3600 - 3600)
+
+        ret = HostNetflowManager.purge(retention_days={'5m': 100}, chunk_size=1000)
+        self.assertEqual(ret['raw'], 0)
+        self.assertGreater(ret['5m'], 0)
+        self.assertFalse(HostNetflow5m.objects.filter(timestamp__lt=now_ts - 101 * 24 * 3600).exists())
+
+    def test_backfill_and_fallback(self):
+        """
+        降采样之前已存在的历史数据，回填前查询时从原始数据临时汇总，分批回填
+        """
+        now_ts = int(time.time())
+        now_ts -= now_ts % 3600
+        start_ts = now_ts - 20 * 24 * 3600
+        self.create_netflow(unit_id=self.unit1.id, start_ts=start_ts, end_ts=now_ts, interval=1800)
+        # 只有最近一天的数据已降采样
+        HostNetflowManager.rollup(start_ts=now_ts - 24 * 3600, end_ts=now_ts)
+
+        r = HostNetflowManager.query_range(unit_id=self.unit1.id, start_ts=start_ts, end_ts=now_ts)
+        self.assertEqual(r['resolution'], '1h')
+        self.assertEqual(len(r['results']), 20 * 24 + 1)
+        self.assertEqual(r['results'][0]['timestamp'], start_ts)
+        self.assertEqual([i['timestamp'] for i in r['results']], list(range(start_ts, now_ts + 1, 3600)))
+        values_in = [start_ts % 1000, (start_ts + 1800) % 1000]
+        self.assertEqual(r['results'][0]['flow_in_max'], max(values_in))
+        self.assertAlmostEqual(r['results'][0]['flow_in'], sum(values_in) / 2)
+        fallback_results = r['results']
+
+        r = HostNetflowManager.query_range(
+            unit_id=self.unit1.id, start_ts=start_ts, end_ts=start_ts + 3 * 24 * 3600)
+        self.assertEqual(r['resolution'], '5m')
+        self.assertEqual(len(r['results']), 3 * 48 + 1)
+        r = HostNetflowManager.query_range(
+            unit_id=self.unit2.id, start_ts=start_ts, end_ts=start_ts + 3 * 24 * 3600)
+        self.assertEqual(r['results'], [])
+
+        ret = HostNetflowManager.backfill(chunk_seconds=5 * 24 * 3600 + 100)
+        self.assertEqual(ret, {'5m': 20 * 48 + 1, '1h': 20 * 24 + 1})
+        self.assertEqual(HostNetflow5m.objects.count(), 20 * 48 + 1)
+        self.assertEqual(HostNetflow1h.objects.count(), 20 * 24 + 1)
+        self.assertEqual(HostNetflowManager.backfill(start_ts=now_ts - 3600), {'5m': 3, '1h': 2})
+        self.assertEqual(HostNetflow1h.objects.count(), 20 * 24 + 1)
+
+        queries = []
+        with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+            r = HostNetflowManager.query_range(unit_id=self.unit1.id, start_ts=start_ts, end_ts=now_ts)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(r['results'], fallback_results)
+
+    def test_api(self):
+        now_ts = int(time.time())
+        self.create_netflow(unit_id=self.unit1.id, start_ts=now_ts - 3600, end_ts=now_ts, interval=60)
+        HostNetflowManager.rollup(start_ts=now_ts - 3600, end_ts=now_ts)
+
+        url = reverse('screenvis-api:host-query-netflow-range')
+        response = self.client.get(url)
+        self.assertErrorResponse(status_code=403, code='AccessDenied', response=response)
+        ScreenAPIIPRestrictor.add_ip_rule(ip_value='127.0.0.1')
+        ScreenAPIIPRestrictor.clear_cache()
+
+        response = self.client.get(url)
+        self.assertErrorResponse(status_code=400, code='BadRequest', response=response)
+        query = parse.urlencode(query={'unit_id': self.unit1.id, 'start': now_ts, 'end': now_ts - 1})
+        response = self.client.get(f'{url}?{query}')
+        self.assertErrorResponse(status_code=400, code='BadRequest', response=response)
+
+        query = parse.urlencode(query={'unit_id': self.unit1.id, 'start': now_ts - 1800})
+        response = self.client.get(f'{url}?{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['resolution'], 'raw')
+        self.assertEqual(len(response.data['results']), 31)
+        self.assertKeysIn(['timestamp', 'flow_in', 'flow_in_min', 'flow_in_max', 'flow_out', 'flow_out_min',
+                           'flow_out_max'], response.data['results'][0])
+
+        query = parse.urlencode(query={'unit_id': self.unit1.id, 'start': now_ts - 2 * 24 * 3600, 'end': now_ts})
+        response = self.client.get(f'{url}?{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['resolution'], '5m')
+        self.assertIn(len(response.data['results']), [12, 13])
@@ -6,6 +6,7 @@
     ObjectService, ObjectServiceTimedStats
 )
 from apps.app_screenvis.permissions import ScreenAPIIPRestrictor
+from apps.app_screenvis.workers.service_stats import ServerServiceStatsWorker, ObjectServiceStatsWorker
 from . import MyAPITestCase
 
 
@@ -91,6 +92,8 @@ def test_list(self):
             cpu_count=6786, cpu_used_count=877
         )
         site4_obj1.save(force_insert=True)
+        # 最新统计数据快照
+        ServerServiceStatsWorker.rebuild_all_latest_stats()
 
         base_url = reverse('screenvis-api:server-stats-list')
         response = self.client.get(base_url)
@@ -203,6 +206,8 @@ def test_list(self):
             vpn_online_count=224, vpn_active_count=644, vpn_count=5654
         )
         site4_obj1.save(force_insert=True)
+        # 最新统计数据快照
+        ServerServiceStatsWorker.rebuild_all_latest_stats()
 
         url = reverse('screenvis-api:vpn-stats-list')
         response = self.client.get(url)
@@ -293,6 +298,8 @@ def test_list(self):
             storage_capacity=4646, storage_used=674, user_count=395
         )
         site4_obj1.save(force_insert=True)
+        # 最新统计数据快照
+        ObjectServiceStatsWorker.rebuild_all_latest_stats()
 
         url = reverse('screenvis-api:object-stats-list')
         response = self.client.get(url)
@@ -1,13 +1,31 @@
 import random
+from unittest import mock
 from datetime import datetime, timedelta
 
+from django.db import connection
 from django.test.testcases import TransactionTestCase
 
 from apps.app_screenvis.workers import ServerServiceStatsWorker, ObjectServiceStatsWorker
 from apps.app_screenvis.models import (
     ServerService, ServerServiceTimedStats, VPNTimedStats,
-    ObjectService, ObjectServiceTimedStats
+    ObjectService, ObjectServiceTimedStats,
+    ServerServiceLatestStats, VPNLatestStats, ObjectServiceLatestStats
 )
+from apps.app_screenvis.api_views.service_views import sum_units_latest_stats
+
+
+def assert_latest_stats_equal(testcase, latest_model, timed_model):
+    """
+    最新统计数据快照和各服务单元最新的时序统计数据一致
+    """
+    latest_objs = list(latest_model.objects.all())
+    service_ids = {obj.service_id for obj in timed_model.objects.all()}
+    testcase.assertEqual(len(latest_objs), len(service_ids))
+    for obj in latest_objs:
+        timed_obj = timed_model.objects.filter(service_id=obj.service_id).order_by('-timestamp').first()
+        testcase.assertEqual(obj.timestamp, timed_obj.timestamp)
+        for name in latest_model.STATS_FIELDS:
+            testcase.assertEqual(getattr(obj, name), getattr(timed_obj, name))
 
 
 class ServerServiceStatsWorkerTests(TransactionTestCase):
@@ -77,6 +95,8 @@ async def async_request(api_url: str, username: str, password: str):
         self.assertEqual(ret['vpn_count'], 3)
         self.assertEqual(ServerServiceTimedStats.objects.count(), 3)
         self.assertEqual(VPNTimedStats.objects.count(), 3)
+        assert_latest_stats_equal(self, ServerServiceLatestStats, ServerServiceTimedStats)
+        assert_latest_stats_equal(self, VPNLatestStats, VPNTimedStats)
 
         # 删除N天前的数据测试
         ago_days = 200
@@ -136,6 +156,108 @@ async def async_request(api_url: str, username: str, password: str):
         self.assertEqual(ret['vpn_deleted_count'], 1)
         self.assertEqual(ServerServiceTimedStats.objects.count(), 6 + 3 - 2)
         self.assertEqual(VPNTimedStats.objects.count(), 5 + 3 - 1)
+        self.assertEqual(ServerServiceLatestStats.objects.count(), 3)
+        self.assertEqual(VPNLatestStats.objects.count(), 3)
+        assert_latest_stats_equal(self, ServerServiceLatestStats, ServerServiceTimedStats)
+        # site4停用，不更新；快照重建后包含site4
+        self.assertEqual(ServerServiceStatsWorker.rebuild_all_latest_stats(), (3, 4))
+        assert_latest_stats_equal(self, VPNLatestStats, VPNTimedStats)
+
+    def test_latest_stats_history(self):
+        """
+        200天历史数据，大屏查询最新统计数据只需一次查询，和按服务单元逐个查询最新时序数据的结果一致
+        """
+        units = list(self.init_data())
+        now_ts = int(datetime.utcnow().timestamp())
+        objs = []
+        for unit in units:
+            for i in range(200 * 24):
+                obj = ServerServiceTimedStats(
+                    service_id=unit.id, timestamp=now_ts - i * 3600, server_count=random.randint(1, 100),
+                    disk_count=random.randint(1, 100), mem_size=random.randint(1, 100), cpu_count=i
+                )
+                obj.enforce_id()
+                objs.append(obj)
+
+        ServerServiceTimedStats.objects.bulk_create(objs, batch_size=1000)
+        ServerServiceStatsWorker.upsert_latest_stats(
+            latest_model=ServerServiceLatestStats,
+            timed_objs=[o for o in objs if o.timestamp == now_ts]
+        )
+
+        expected = dict.fromkeys(ServerServiceLatestStats.STATS_FIELDS, 0)
+        for unit in units:
+            obj = ServerServiceTimedStats.objects.filter(service_id=unit.id).order_by('-timestamp').first()
+            for name in expected:
+                expected[name] += getattr(obj, name)
+
+        queries = []
+        with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+            data = sum_units_latest_stats(latest_model=ServerServiceLatestStats, service_model=ServerService)
+
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(data, expected)
+        self.assertEqual(data['cpu_count'], 0)
+
+    def test_rebuild_latest_stats(self):
+        """
+        从时序统计数据重建最新统计数据快照，重建失败时不会删除已有的快照
+        """
+        units = list(self.init_data())
+        for ts in [1700000000, 1700000600]:
+            for unit in units[0:3]:
+                obj = ServerServiceTimedStats(
+                    service_id=unit.id, timestamp=ts, server_count=ts % 100, disk_count=1, mem_size=2, cpu_count=3)
+                obj.enforce_id()
+                obj.save(force_insert=True)
+
+        count = ServerServiceStatsWorker.rebuild_latest_stats(
+            service_model=ServerService, timed_model=ServerServiceTimedStats, latest_model=ServerServiceLatestStats)
+        self.assertEqual(count, 3)
+        assert_latest_stats_equal(self, ServerServiceLatestStats, ServerServiceTimedStats)
+
+        with mock.patch.object(
+                ServerServiceStatsWorker, 'upsert_latest_stats', side_effect=Exception('upsert error')):
+            with self.assertRaises(Exception):
+                ServerServiceStatsWorker.rebuild_latest_stats(
+                    service_model=ServerService, timed_model=ServerServiceTimedStats,
+                    latest_model=ServerServiceLatestStats)
+
+        self.assertEqual(ServerServiceLatestStats.objects.count(), 3)
+        assert_latest_stats_equal(self, ServerServiceLatestStats, ServerServiceTimedStats)
+
+    def test_upsert_without_conflict_target(self):
+        """
+        数据库不支持冲突目标和冲突更新时（按唯一键查询后更新或插入），最新统计数据快照也能更新
+        """
+        units = list(self.init_data())
+        features = connection.features
+        with mock.patch.object(features, 'supports_update_conflicts_with_target', False), \
+                mock.patch.object(features, 'supports_update_conflicts', False):
+            for ts in [1700000000, 1700000600]:
+                objs = []
+                for unit in units[0:2]:
+                    obj = ServerServiceTimedStats(
+                        service_id=unit.id, timestamp=ts, server_count=ts % 100, disk_count=1, mem_size=2,
+                        cpu_count=3
+                    )
+                    obj.enforce_id()
+                    objs.append(obj)
+
+                ServerServiceTimedStats.objects.bulk_create(objs)
+                ServerServiceStatsWorker.upsert_latest_stats(latest_model=ServerServiceLatestStats, timed_objs=objs)
+                self.assertEqual(ServerServiceLatestStats.objects.count(), 2)
+                self.assertEqual(
+                    set(ServerServiceLatestStats.objects.values_list('timestamp', 'server_count')), {(ts, ts % 100)})
+
+            obj = ServerServiceTimedStats(
+                service_id=units[2].id, timestamp=1700001200, server_count=8, disk_count=1, mem_size=2, cpu_count=3)
+            obj.enforce_id()
+            obj.save(force_insert=True)
+            ServerServiceStatsWorker.upsert_latest_stats(latest_model=ServerServiceLatestStats, timed_objs=[obj])
+
+        self.assertEqual(ServerServiceLatestStats.objects.count(), 3)
+        assert_latest_stats_equal(self, ServerServiceLatestStats, ServerServiceTimedStats)
 
 
 class ObjectServiceStatsWorkerTests(TransactionTestCase):
@@ -185,6 +307,7 @@ async def async_request(api_url: str, username: str, password: str):
         self.assertEqual(ret['unit_count'], 3)
         self.assertEqual(ret['new_ok_count'], 3)
         self.assertEqual(ObjectServiceTimedStats.objects.count(), 3)
+        assert_latest_stats_equal(self, ObjectServiceLatestStats, ObjectServiceTimedStats)
 
         # 删除N天前的数据测试
         ago_days = 200
@@ -5,9 +5,11 @@
 
 from django.utils import timezone as dj_timezone
 
+from core.adapters.async_sessions import async_session_pool
 from apps.app_screenvis.models import MetricMonitorUnit, HostNetflow
 from apps.app_screenvis.utils import build_metric_provider, MetricProvider, screen_logger
 from apps.app_screenvis.backends import MetricQueryAPI
+from apps.app_screenvis.managers.netflow import HostNetflowManager
 
 
 NetFlowValue = namedtuple('NetFlowValue', ['ts', 'in_val', 'out_val'])
@@ -23,6 +25,7 @@ def __init__(self, minutes: int = 3):
         :param minutes: 统计当前时间前n分钟cpu使用率，== 定时统计周期
         """
         self.cycle_minutes = minutes
+        self.fill_min_ts = None     # 补充的数据中最早的时间戳
 
     def run(self, now_timestamp: int = None):
         if not now_timestamp:
@@ -39,10 +42,22 @@ def run(self, now_timestamp: int = None):
         for s in fill_ret:
             print(s)
 
-        # 删除以前的记录
+        # 更新本周期和补充数据时间段的降采样数据
+        rollup_start_ts = now_timestamp - 60 * self.cycle_minutes
+        if self.fill_min_ts is not None:
+            rollup_start_ts = min(rollup_start_ts, self.fill_min_ts)
+
+        try:
+            rollup_ret = HostNetflowManager.rollup(start_ts=rollup_start_ts, end_ts=now_timestamp)
+            print(f'rollup records: {rollup_ret}')
+        except Exception as exc:
+            screen_logger.error(f'主机单元网络流量降采样数据汇总错误，{str(exc)}')
+
+        # 分级删除以前的记录
         ago_days = 200
-        dlt_count = self.delete_ago_days_records(ago_days=ago_days)
-        print(f'deleted {ago_days} days ago records: {dlt_count}')
+        purge_ret = HostNetflowManager.purge(retention_days={HostNetflowManager.RESOLUTION_RAW: ago_days})
+        dlt_count = purge_ret[HostNetflowManager.RESOLUTION_RAW]
+        print(f'deleted {ago_days} days ago records: {dlt_count}, rollup records: {purge_ret}')
         ret['deleted_count'] = dlt_count
 
         return ret
@@ -64,7 +79,7 @@ def async_generate_netflow(self, now_timestamp: int):
         return len(units), ok_unit_ids, objs
 
     def do_tasks(self, tasks: list):
-        results = asyncio.run(self.do_async_requests(tasks))
+        results = async_session_pool.run_sync(self.do_async_requests(tasks))
 
         ok_unit_ids = []
         objs = []
@@ -193,7 +208,7 @@ def fill_data_for_unit(self, unit: MetricMonitorUnit, start_ts: int, end_ts: int
                 provider=provider, cycle_minutes=cycle_minutes
             )
         ]
-        results = asyncio.run(self.do_async_requests(tasks))
+        results = async_session_pool.run_sync(self.do_async_requests(tasks))
         fill_count = 0
         for r in results:
             if isinstance(r, tuple) and len(r) == 3:
@@ -210,6 +225,9 @@ def fill_data_for_unit(self, unit: MetricMonitorUnit, start_ts: int, end_ts: int
                     if objs:
                         objs = HostNetflow.objects.bulk_create(objs)
                         fill_count = len(objs)
+                        min_ts = min(o.timestamp for o in objs)
+                        if self.fill_min_ts is None or min_ts < self.fill_min_ts:
+                            self.fill_min_ts = min_ts
                 else:
                     screen_logger.error(
                         f'数据补漏[ts {start_ts} - {end_ts}]，主机单元({unit.name})网络流量时序数据查询失败，{r_values}')
@@ -334,5 +352,4 @@ def get_unit_last_objs(unit_id, limit: int) -> List:
     def delete_ago_days_records(ago_days: int = 200):
         dt_ago_days = datetime.utcnow() - timedelta(days=ago_days)
         ts_ago_days = int(dt_ago_days.timestamp())
-        dlt_count, d = HostNetflow.objects.filter(timestamp__lt=ts_ago_days).delete()
-        return dlt_count
+        return HostNetflowManager.delete_before(model=HostNetflow, timestamp=ts_ago_days)
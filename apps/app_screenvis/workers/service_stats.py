@@ -2,13 +2,16 @@
 from typing import List, Tuple
 from datetime import datetime, timedelta
 
+from django.db import transaction
 from django.utils import timezone as dj_timezone
 import aiohttp
 
 from apps.app_screenvis.models import (
     ServerService, BaseService, ServerServiceTimedStats, VPNTimedStats,
-    ObjectService, ObjectServiceTimedStats
+    ObjectService, ObjectServiceTimedStats,
+    ServerServiceLatestStats, VPNLatestStats, ObjectServiceLatestStats
 )
+from utils.model import bulk_upsert
 from apps.app_screenvis.utils import screen_logger
 
 
@@ -27,6 +30,41 @@ def __init__(self, minutes: int = 10):
         """
         self.cycle_minutes = minutes
 
+    @staticmethod
+    def build_latest_stats_objs(latest_model, timed_objs: list) -> list:
+        field_names = [f.attname for f in latest_model._meta.concrete_fields]
+        return [latest_model(**{name: getattr(obj, name) for name in field_names}) for obj in timed_objs]
+
+    @classmethod
+    def upsert_latest_stats(cls, latest_model, timed_objs: list):
+        """
+        用本次的统计数据更新（插入）各服务单元的最新统计数据快照
+        """
+        objs = cls.build_latest_stats_objs(latest_model=latest_model, timed_objs=timed_objs)
+        update_fields = [f.name for f in latest_model._meta.concrete_fields if not f.primary_key]
+        bulk_upsert(
+            model=latest_model, objs=objs, unique_fields=['service'], update_fields=update_fields, batch_size=200)
+
+    @classmethod
+    def rebuild_latest_stats(cls, service_model, timed_model, latest_model) -> int:
+        """
+        从时序统计数据重建各服务单元的最新统计数据快照
+
+        :return: 快照记录数
+        """
+        timed_objs = []
+        for service_id in service_model.objects.values_list('id', flat=True):
+            obj = timed_model.objects.filter(service_id=service_id).order_by('-timestamp').first()
+            if obj:
+                timed_objs.append(obj)
+
+        # 删除和重建在一个事务中，查询不会看到空的快照
+        with transaction.atomic():
+            latest_model.objects.all().delete()
+            cls.upsert_latest_stats(latest_model=latest_model, timed_objs=timed_objs)
+
+        return len(timed_objs)
+
     @staticmethod
     async def do_async_requests(tasks):
         return await asyncio.gather(*tasks, return_exceptions=True)
@@ -136,12 +174,22 @@ def do_tasks(self, tasks: list):
             except Exception as exc:
                 unit_err_map['server_bulk_create'] = exc
 
+            try:
+                self.upsert_latest_stats(latest_model=ServerServiceLatestStats, timed_objs=compute_objs)
+            except Exception as exc:
+                unit_err_map['server_latest_upsert'] = exc
+
         if vpn_objs:
             try:
                 vpn_objs = VPNTimedStats.objects.bulk_create(objs=vpn_objs, batch_size=200)
             except Exception as exc:
                 unit_err_map['vpn_bulk_create'] = exc
 
+            try:
+                self.upsert_latest_stats(latest_model=VPNLatestStats, timed_objs=vpn_objs)
+            except Exception as exc:
+                unit_err_map['vpn_latest_upsert'] = exc
+
         try:
             for err in unit_err_map.values():
                 screen_logger.error(msg=str(err))
@@ -202,6 +250,19 @@ async def get_unit_stats_data(self, unit: BaseService) -> dict:
 
         return result['quota']
 
+    @classmethod
+    def rebuild_all_latest_stats(cls):
+        """
+        从时序统计数据重建云主机和VPN最新统计数据快照
+        """
+        return (
+            cls.rebuild_latest_stats(
+                service_model=ServerService, timed_model=ServerServiceTimedStats,
+                latest_model=ServerServiceLatestStats),
+            cls.rebuild_latest_stats(
+                service_model=ServerService, timed_model=VPNTimedStats, latest_model=VPNLatestStats)
+        )
+
     @staticmethod
     def delete_ago_days_records(ago_days: int = 200):
         dt_ago_days = datetime.utcnow() - timedelta(days=ago_days)
@@ -270,6 +331,11 @@ def do_tasks(self, tasks: list):
             except Exception as exc:
                 unit_err_map['obj_bulk_create'] = exc
 
+            try:
+                self.upsert_latest_stats(latest_model=ObjectServiceLatestStats, timed_objs=objs)
+            except Exception as exc:
+                unit_err_map['obj_latest_upsert'] = exc
+
         try:
             for err in unit_err_map.values():
                 screen_logger.error(msg=str(err))
@@ -302,6 +368,14 @@ async def get_unit_stats_data(self, unit: BaseService) -> dict:
 
         return result['stats']
 
+    @classmethod
+    def rebuild_all_latest_stats(cls):
+        """
+        从时序统计数据重建对象存储最新统计数据快照
+        """
+        return cls.rebuild_latest_stats(
+            service_model=ObjectService, timed_model=ObjectServiceTimedStats, latest_model=ObjectServiceLatestStats)
+
     @staticmethod
     def delete_ago_days_records(ago_days: int = 200):
         dt_ago_days = datetime.utcnow() - timedelta(days=ago_days)
@@ -14,7 +14,7 @@
 
 from core import errors as exceptions
 from core import site_configs_manager
-from core.taskqueue import submit_task
+from core.taskqueue import submit_task, QueueName, Priority
 from utils.model import PayType, OwnerType
 from apps.api.viewsets import CustomGenericViewSet
 from apps.api.paginations import NewPageNumberPagination100
@@ -65,7 +65,10 @@ def create_task(
         return task
 
     def async_do_task_submit(self, res_task: ResourceOrderDeliverTask, auth_user):
-        return submit_task(task=self.res_task_handler, kwargs={'task': res_task, 'auth_user': auth_user})
+        return submit_task(
+            task=self.res_task_handler, kwargs={'task': res_task, 'auth_user': auth_user},
+            queue=QueueName.DELIVERY, priority=Priority.HIGH
+        )
 
     def res_task_handler(self, task: ResourceOrderDeliverTask, auth_user):
         """
@@ -4,7 +4,7 @@
 
 from core.adapters import inputs
 from core.request import request_service
-from core.taskqueue import submit_task
+from core.taskqueue import submit_task, QueueName
 from apps.app_servers.models import Server, ServiceConfig, EVCloudPermsLog
 from apps.app_vo.managers import VoMemberManager
 
@@ -141,7 +141,8 @@ def do_when_evcloud_servers_change(self, servers: List[Server], remarks: str = '
         """
         return submit_task(
             self.task_sync_servers_perm_to_evcloud,
-            kwargs={'servers': servers, 'remarks': remarks}
+            kwargs={'servers': servers, 'remarks': remarks},
+            queue=QueueName.DELIVERY
         )
 
     @staticmethod
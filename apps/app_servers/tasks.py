@@ -51,4 +51,7 @@ def update_services_server_count(service: ServiceConfig = None, update_ago_minut
             pass
 
     if all_services:
-        taskqueue.submit_task(task_update_service_server_count, kwargs={'services': all_services})
+        taskqueue.submit_task(
+            task_update_service_server_count, kwargs={'services': all_services},
+            queue=taskqueue.QueueName.BACKGROUND, priority=taskqueue.Priority.LOW
+        )
@@ -0,0 +1,88 @@
+import time
+import threading
+
+from django.test import TransactionTestCase
+
+from apps.app_servers.models import Server
+from apps.app_servers.tests import create_server_metadata
+from core.taskqueue.build_status_poller import BuildStatusPoller, BuildItem
+from utils.test import get_or_create_user, get_or_create_service
+
+
+class StubBuildStatusPoller(BuildStatusPoller):
+    """
+    不请求服务单元，按实例id返回创建状态
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.poll_counts = {}
+        self.active = 0
+        self.max_active = 0
+
+    def build_status(self, item: BuildItem) -> str:
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            count = self.poll_counts[item.obj.id] = self.poll_counts.get(item.obj.id, 0) + 1
+
+        time.sleep(0.02)
+        with self.lock:
+            self.active -= 1
+
+        if item.obj.instance_id.startswith('failed'):
+            return 'failed'
+
+        return 'created' if count >= 3 else 'building'
+
+    def update_detail(self, item: BuildItem) -> bool:
+        server = item.obj
+        server.task_status = server.TASK_CREATED_OK
+        server.save(update_fields=['task_status'])
+        return True
+
+
+class BuildStatusPollerTests(TransactionTestCase):
+    def setUp(self):
+        self.user = get_or_create_user()
+        self.service = get_or_create_service()
+
+    def create_servers(self, prefix: str, num: int):
+        servers = []
+        for i in range(num):
+            server = create_server_metadata(service=self.service, user=self.user)
+            server.instance_id = f'{prefix}{i}'
+            server.task_status = Server.TASK_IN_CREATING
+            server.save(update_fields=['instance_id', 'task_status'])
+            servers.append(server)
+
+        return servers
+
+    def test_poll(self):
+        ok_servers = self.create_servers(prefix='ok', num=30)
+        failed_servers = self.create_servers(prefix='failed', num=5)
+        poller = StubBuildStatusPoller(per_service_limit=4, max_workers=8, min_delay=0.05, max_delay=0.2)
+        thread_count = threading.active_count()
+        futures = [poller.add_server(s) for s in ok_servers + failed_servers]
+        for f in futures:
+            f.result(timeout=30)
+
+        # 线程数不随轮询的资源数增长，同一服务单元并发受限
+        self.assertLessEqual(threading.active_count(), thread_count + 1 + 8)
+        self.assertLessEqual(poller.max_active, 4)
+        self.assertEqual(poller.pending_count(), 0)
+        for s in ok_servers:
+            s.refresh_from_db()
+            self.assertEqual(s.task_status, Server.TASK_CREATED_OK)
+            self.assertEqual(poller.poll_counts[s.id], 3)
+
+        for s in failed_servers:
+            s.refresh_from_db()
+            self.assertEqual(s.task_status, Server.TASK_CREATE_FAILED)
+            self.assertEqual(poller.poll_counts[s.id], BuildStatusPoller.FAILED_LIMIT)
+
+        # 空闲后再加入的资源
+        server = self.create_servers(prefix='ok-again', num=1)[0]
+        poller.add_server(server).result(timeout=10)
+        server.refresh_from_db()
+        self.assertEqual(server.task_status, Server.TASK_CREATED_OK)
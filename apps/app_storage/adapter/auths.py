@@ -1,66 +1,89 @@
-from datetime import datetime
-from threading import local
-
-from apps.app_storage.adapter import inputs, client
+from apps.app_storage.adapter import inputs, outputs, client
+from core.auth_cache import AuthTokenCache
 from apps.app_storage.models import ObjectsService
 from core import errors
 
 
 class AuthCacheHandler:
+    """
+    服务认证信息缓存，进程内线程共享，token类认证信息在多进程间共享，认证信息过期或失效时单飞刷新
+    """
     def __init__(self):
-        self._auths = local()
+        self._auths = AuthTokenCache(namespace='storage')
 
     def __getitem__(self, key):
-        if hasattr(self._auths, key):
-            return getattr(self._auths, key)
-
-        return None
+        return self._auths.get(key)
 
     def __setitem__(self, key, value):
-        setattr(self._auths, key, value)
+        self._auths.set(key, value)
 
     def __delitem__(self, key):
-        delattr(self._auths, key)
+        self._auths.delete(key)
 
-    def get_auth(self, service: ObjectsService, refresh=False):
+    def metrics(self) -> dict:
+        """
+        缓存命中率和认证次数
+        """
+        return self._auths.metrics()
+
+    @staticmethod
+    def auth_to_dict(auth: outputs.AuthenticateOutput):
+        """
+        :return:
+            dict    # 不包含密码
+            None    # 不可共享
+        """
+        if not auth.token or auth.secret_key:
+            return None
+
+        return {
+            'style': auth.style, 'token': auth.token, 'expire': auth.expire,
+            'header': list(auth.header) if auth.header else None, 'username': auth.username
+        }
+
+    @staticmethod
+    def auth_from_dict(data: dict, username: str, password: str):
+        return outputs.AuthenticateOutput(
+            style=data['style'], token=data['token'], expire=data['expire'],
+            header=outputs.AuthenticateOutputHeader(*data['header']) if data['header'] else None,
+            username=username, password=password
+        )
+
+    def get_auth(self, service: ObjectsService, refresh=False, stale_auth=None):
         """
         获取身份认证信息
 
         :param service:
         :param refresh:
+        :param stale_auth: 刷新时，失效的认证信息，其他线程或进程已刷新时直接使用新的认证信息
         :return:
 
         :raises: AuthenticationFailed
         """
-        now = datetime.utcnow().timestamp()
-        key = self.get_service_key(service)
-
-        if refresh:
-            del self[key]
-        else:
-            auth = self[key]
-            if auth:
-                expire = auth.expire
-                if now < expire:
-                    return auth
-
-        s_client = client.get_service_client(service)
-        try:
-            password = service.raw_password
-            if password is None:
-                raise errors.AuthenticationFailed(f'Invalid password of service "{str(service)}"')
-
-            params = inputs.AuthenticateInput(username=service.username, password=password)
-            auth = s_client.authenticate(params)
-            if not auth.ok:
+        def authenticate():
+            s_client = client.get_service_client(service)
+            try:
+                password = service.raw_password
+                if password is None:
+                    raise errors.AuthenticationFailed(f'Invalid password of service "{str(service)}"')
+
+                params = inputs.AuthenticateInput(username=service.username, password=password)
+                auth = s_client.authenticate(params)
+                if not auth.ok:
+                    raise errors.AuthenticationFailed(
+                        f'Authentication failed to service "{str(service)}", error: {str(auth.error)}')
+            except errors.AuthenticationFailed as exc:
                 raise errors.AuthenticationFailed(
-                    f'Authentication failed to service "{str(service)}", error: {str(auth.error)}')
-        except errors.AuthenticationFailed as exc:
-            raise errors.AuthenticationFailed(
-                f'Authentication failed to service "{str(service)}", error: {str(exc)}')
+                    f'Authentication failed to service "{str(service)}", error: {str(exc)}')
 
-        self[key] = auth
-        return auth
+            return auth
+
+        return self._auths.get_or_authenticate(
+            key=self.get_service_key(service), authenticate=authenticate,
+            dumps=self.auth_to_dict,
+            loads=lambda data: self.auth_from_dict(data, username=service.username, password=service.raw_password),
+            refresh=refresh, stale_auth=stale_auth
+        )
 
     def auth_to_cache(self, service, auth):
         key = self.get_service_key(service)
@@ -71,11 +94,12 @@ def auth_from_cache(self, service):
         return self[key]
 
     def auth_delete_from_cache(self, service):
-        delattr(self._auths, service.id)
+        key = self.get_service_key(service)
+        del self[key]
 
     @staticmethod
     def get_service_key(service):
-        return f'service_{service.id}'
+        return f'service_{service.id}_{service.endpoint_url}_{service.username}'
 
 
 auth_handler = AuthCacheHandler()
@@ -1,9 +1,10 @@
 from datetime import datetime
-import requests
+import aiohttp
 
 from apps.app_storage.adapter import inputs
 from apps.app_storage.adapter import outputs
 from core import errors
+from core.adapters.sessions import session_pool
 from .builders import APIBuilder
 from .converters import OutputConverter
 
@@ -91,7 +92,7 @@ def do_request(method: str, url: str, ok_status_codes=(200,), headers=None, **kw
         :raises: Error, AuthenticationFailed, APIError
         """
         try:
-            r = requests.request(method=method, url=url, headers=headers, **kwargs)
+            r = session_pool.request(method=method, url=url, headers=headers, **kwargs)
         except Exception as e:
             raise errors.Error(str(e))
 
@@ -126,7 +127,7 @@ def authenticate(self, params: inputs.AuthenticateInput, **kwargs) -> outputs.Au
     def authenticate_jwt(self, username, password):
         url = self.api_builder.jwt_base_url()
         try:
-            r = requests.post(url, data={'username': username, 'password': password}, timeout=(6, 60))
+            r = session_pool.post(url, data={'username': username, 'password': password}, timeout=(6, 60))
         except Exception as e:
             return OutputConverter().to_authenticate_output_error(error=errors.Error(str(e)), style='jwt')
 
@@ -247,6 +248,52 @@ def bucket_stats(self, params: inputs.BucketStatsInput) -> outputs.BucketStatsOu
 
         return OutputConverter.to_bucket_stats_output_error(error)
 
+    async def async_bucket_stats(
+            self, session: aiohttp.ClientSession, params: inputs.BucketStatsInput, headers: dict,
+            timeout: aiohttp.ClientTimeout = None
+    ) -> outputs.BucketStatsOutput:
+        """
+        异步查询桶统计信息，不自动刷新认证token，认证失败返回AuthenticationFailed错误
+
+        :param session: 共享连接池的会话
+        :param headers: 认证头
+        :param timeout: 请求超时时间，None使用会话的超时时间
+        :error: AuthenticationFailed, AccessDenied, BucketNotExist, APIException
+        """
+        url = self.api_builder.bucket_stats_url(bucket_name=params.bucket_name)
+        try:
+            kwargs = {} if timeout is None else {'timeout': timeout}
+            async with session.get(url=url, headers=headers, **kwargs) as r:
+                status_code = r.status
+                try:
+                    data = await r.json(content_type=None)
+                except Exception:
+                    data = {}
+        except Exception as e:
+            return OutputConverter.to_bucket_stats_output_error(errors.Error(str(e)))
+
+        if status_code == 200:
+            try:
+                return OutputConverter.to_bucket_stats_output(data)
+            except Exception as e:
+                return OutputConverter.to_bucket_stats_output_error(errors.Error(str(e)))
+
+        if not isinstance(data, dict):
+            data = {}
+
+        err_code = data.get('code', '')
+        msg = data.get('message', '')
+        if status_code == 401:
+            error = errors.AuthenticationFailed()
+        elif status_code == 403 and err_code == 'AccessDenied':
+            error = errors.AccessDenied(message=msg)
+        elif status_code == 404 and err_code == 'NoSuchBucket':
+            error = errors.BucketNotExist(message=msg)
+        else:
+            error = errors.APIException(message=msg, status_code=status_code, code=err_code)
+
+        return OutputConverter.to_bucket_stats_output_error(error)
+
     def get_version(self):
         url = self.api_builder.version_url()
         try:
@@ -0,0 +1,112 @@
+import asyncio
+from typing import Dict
+
+import aiohttp
+
+from core import errors
+from core.adapters.async_sessions import async_session_pool
+from . import inputs, outputs, client
+from .auths import auth_handler
+from .converters import OutputConverter
+
+
+class BucketStatsCollector:
+    """
+    并发异步批量查询存储桶统计信息
+
+    * 每个服务单元只认证一次，共用一个token
+    * 在共享事件循环中执行，每个服务单元使用共享的保持连接的会话，每个服务单元的并发请求数受限
+    * iHarbor目前没有一次查询多个桶统计信息的接口，每个桶一个请求
+    """
+
+    def __init__(self, per_service_limit: int = 16, timeout: float = 60):
+        """
+        :param per_service_limit: 每个服务单元的最大并发请求数
+        :param timeout: 单个请求超时时间，秒
+        """
+        self.per_service_limit = per_service_limit
+        self.timeout = timeout
+
+    def collect(self, buckets: list) -> Dict[str, outputs.BucketStatsOutput]:
+        """
+        查询多个桶的统计信息
+
+        :param buckets: Bucket()列表，需要有id、name、service属性
+        :return:
+            {bucket_id: BucketStatsOutput()}
+        """
+        results = {}
+        service_items = []
+        for service, service_buckets in self.group_by_service(buckets).values():
+            try:
+                auth = auth_handler.get_auth(service)
+            except errors.AuthenticationFailed as exc:
+                err = OutputConverter.to_bucket_stats_output_error(exc)
+                for bucket in service_buckets:
+                    results[bucket.id] = err
+
+                continue
+
+            h = auth.header
+            cli = client.get_service_client(service)
+            service_items.append((service, cli, {h.header_name: h.header_value}, service_buckets))
+
+        if service_items:
+            results.update(async_session_pool.run_sync(self.async_collect(service_items=service_items)))
+
+        return results
+
+    @staticmethod
+    def group_by_service(buckets: list):
+        """
+        :return:
+            {service_id: (service, [bucket])}
+        """
+        service_buckets = {}
+        for bucket in buckets:
+            if bucket.service_id not in service_buckets:
+                service_buckets[bucket.service_id] = (bucket.service, [])
+
+            service_buckets[bucket.service_id][1].append(bucket)
+
+        return service_buckets
+
+    async def async_collect(self, service_items: list):
+        """
+        :param service_items: [(service, service_client, auth_headers, [bucket])]
+        :return:
+            {bucket_id: BucketStatsOutput()}
+        """
+        timeout = aiohttp.ClientTimeout(sock_connect=5, total=self.timeout)
+        tasks = [
+            self.service_buckets_stats(service=service, cli=cli, headers=headers, buckets=buckets, timeout=timeout)
+            for service, cli, headers, buckets in service_items
+        ]
+        results = {}
+        for items in await asyncio.gather(*tasks):
+            results.update(items)
+
+        return results
+
+    async def service_buckets_stats(self, service, cli, headers: dict, buckets: list, timeout: aiohttp.ClientTimeout):
+        """
+        一个服务单元的桶，共用服务单元共享的会话
+
+        :return:
+            [(bucket_id, BucketStatsOutput())]
+        """
+        semaphore = asyncio.Semaphore(self.per_service_limit)
+        async with async_session_pool.session(service.endpoint_url) as session:
+            return await asyncio.gather(*[
+                self.bucket_stats(
+                    session=session, semaphore=semaphore, cli=cli, headers=headers, bucket=bucket, timeout=timeout)
+                for bucket in buckets
+            ])
+
+    @staticmethod
+    async def bucket_stats(session, semaphore: asyncio.Semaphore, cli, headers: dict, bucket, timeout=None):
+        params = inputs.BucketStatsInput(bucket_name=bucket.name)
+        async with semaphore:
+            r = await cli.async_bucket_stats(session=session, params=params, headers=headers, timeout=timeout)
+
+        return bucket.id, r
@@ -41,7 +41,7 @@ def request_service(service, method: str, raise_exception=True, **kwargs):
                 return r
         except errors.AuthenticationFailed:
             try:
-                auth_obj = auth_handler.get_auth(service, refresh=True)
+                auth_obj = auth_handler.get_auth(service, refresh=True, stale_auth=auth_obj)
             except errors.AuthenticationFailed as exc:
                 raise_exc = errors.APIException(
                     code='Adapter.AuthenticationFailed',
@@ -0,0 +1,154 @@
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from django.test import TestCase
+
+from utils.test import get_or_create_org_data_center
+from apps.app_storage.models import ObjectsService
+from apps.app_storage.adapter.stats_collector import BucketStatsCollector
+from apps.app_storage.adapter.auths import auth_handler
+from apps.app_storage.adapter import inputs
+from apps.app_storage import request
+from core import errors
+from core.adapters.sessions import SessionPool
+from core.adapters.async_sessions import async_session_pool
+
+
+class StubIHarborHandler(BaseHTTPRequestHandler):
+    """
+    模拟iHarbor的认证和桶统计接口，每个统计请求延迟
+    """
+    delay = 0.05
+    auth_count = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, data: dict):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        StubIHarborHandler.auth_count += 1
+        time.sleep(self.delay)
+        self.send_json(200, {'access': f'stub-token-{StubIHarborHandler.auth_count}'})
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        if not self.headers.get('Authorization', '').startswith('Bearer stub-token'):
+            self.send_json(401, {'code': 'NotAuthenticated', 'message': ''})
+            return
+
+        bucket_name = self.path.rstrip('/').rsplit('/', 1)[-1]
+        if bucket_name.startswith('notexist'):
+            self.send_json(404, {'code': 'NoSuchBucket', 'message': 'bucket not exist'})
+            return
+
+        self.send_json(200, {
+            'bucket_name': bucket_name, 'username': 'tom@cnic.cn',
+            'stats': {'space': len(bucket_name) * 1024, 'count': len(bucket_name)},
+            'stats_time': '2023-06-01T00:00:00.000000+00:00'
+        })
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class BucketStatsCollectorTests(TestCase):
+    def setUp(self):
+        self.server = StubHTTPServer(('127.0.0.1', 0), StubIHarborHandler)
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+        host, port = self.server.server_address
+        odc = get_or_create_org_data_center()
+        self.service = ObjectsService(
+            name='stub', name_en='stub', org_data_center=odc, endpoint_url=f'http://{host}:{port}',
+            username='admin', service_type=ObjectsService.ServiceType.IHARBOR.value, api_version='v1'
+        )
+        self.service.set_password('password')
+        self.service.save(force_insert=True)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        del auth_handler[auth_handler.get_service_key(self.service)]
+
+    def test_collect(self):
+        buckets = [
+            SimpleNamespace(id=f'id{i}', name=f'bucket{i}', service=self.service, service_id=self.service.id)
+            for i in range(40)
+        ]
+        buckets.append(
+            SimpleNamespace(id='notexist', name='notexist', service=self.service, service_id=self.service.id))
+
+        # 逐个同步请求
+        sync_results = {}
+        for b in buckets[0:-1]:
+            r = request.request_service(
+                service=self.service, method='bucket_stats', params=inputs.BucketStatsInput(bucket_name=b.name))
+            sync_results[b.id] = r
+
+        # 在共享事件循环中使用共享的会话
+        pool_stats = async_session_pool.stats()
+        results = BucketStatsCollector(per_service_limit=10).collect(buckets=buckets)
+        self.assertEqual(async_session_pool.stats()['temp_sessions'], pool_stats['temp_sessions'])
+        BucketStatsCollector(per_service_limit=10).collect(buckets=buckets[0:2])
+        self.assertEqual(async_session_pool.stats()['new_sessions'], pool_stats['new_sessions'] + 1)
+
+        self.assertEqual(len(results), 41)
+        for b in buckets[0:-1]:
+            r = results[b.id]
+            self.assertTrue(r.ok)
+            self.assertEqual(r.bucket_name, b.name)
+            self.assertEqual(r.username, 'tom@cnic.cn')
+            self.assertEqual(r.bucket_size_byte, sync_results[b.id].bucket_size_byte)
+            self.assertEqual(r.objects_count, sync_results[b.id].objects_count)
+            self.assertEqual(r.stats_time, sync_results[b.id].stats_time)
+
+        r = results['notexist']
+        self.assertFalse(r.ok)
+        self.assertIsInstance(r.error, errors.BucketNotExist)
+
+
+class SessionPoolTests(TestCase):
+    def setUp(self):
+        StubIHarborHandler.auth_count = 0
+        StubIHarborHandler.protocol_version = 'HTTP/1.1'
+        self.server = StubHTTPServer(('127.0.0.1', 0), StubIHarborHandler)
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+        host, port = self.server.server_address
+        self.endpoint_url = f'http://{host}:{port}'
+
+    def tearDown(self):
+        StubIHarborHandler.protocol_version = 'HTTP/1.0'
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive(self):
+        pool = SessionPool(pool_maxsize=4)
+        token = pool.post(f'{self.endpoint_url}/api/v1/jwt/', data={'username': 'admin'}).json()['access']
+        headers = {'Authorization': f'Bearer {token}'}
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            rs = list(executor.map(
+                lambda i: pool.request('get', f'{self.endpoint_url}/api/v1/stats/bucket/bucket{i}', headers=headers),
+                range(40)))
+
+        self.assertTrue(all(r.status_code == 200 for r in rs))
+        self.assertIs(pool.get_session(f'{self.endpoint_url}/api/'), pool.get_session(self.endpoint_url))
+        stats = pool.stats()[self.endpoint_url]
+        self.assertEqual(stats['requests'], 41)
+        self.assertLessEqual(stats['connections'], 4)
+        self.assertEqual(stats['reused'], 41 - stats['connections'])
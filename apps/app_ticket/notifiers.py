@@ -34,7 +34,8 @@ def new_ticket_notice(ticket: Ticket):
             TicketEmailNotifier.thread_send_email,
             kwargs={
                 'subject': '新工单提交通知', 'receivers': receivers, 'message': message
-            }
+            },
+            queue=taskqueue.QueueName.NOTIFY
         )
         return future
 
@@ -62,6 +63,7 @@ def new_followup_notice(receivers: list, ticket: Ticket, folowup: FollowUp):
             TicketEmailNotifier.thread_send_email,
             kwargs={
                 'subject': '工单跟进动态通知', 'receivers': receivers, 'message': message
-            }
+            },
+            queue=taskqueue.QueueName.NOTIFY
         )
         return future
@@ -5,7 +5,7 @@
 from django.utils import timezone as dj_timezone
 from django.urls import reverse
 
-from core.taskqueue import submit_task
+from core.taskqueue import submit_task, QueueName
 from utils.model import BaseModelAdmin
 from utils.report_file import CSVFileInMemory, wrap_csv_file_response
 from .models import UserProfile, Email
@@ -90,4 +90,4 @@ def resend_failed_email(self, request, queryset):
             if email.status == email.Status.SUCCESS.value:
                 continue
 
-            submit_task(Email.do_send_email, kwargs={'email': email, 'save_db': True})
+            submit_task(Email.do_send_email, kwargs={'email': email, 'save_db': True}, queue=QueueName.NOTIFY)
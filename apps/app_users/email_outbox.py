@@ -0,0 +1,248 @@
+import time
+import logging
+import threading
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.mail import get_connection, EmailMultiAlternatives
+from django.db.models import Q
+from django.utils import timezone as dj_timezone
+
+from apps.app_users.models import Email
+
+
+class RateLimiter:
+    """
+    多个线程共享的发送速率限制
+    """
+    def __init__(self, rate: float):
+        """
+        :param rate: 每秒最多发送的邮件数，<=0不限制
+        """
+        self.interval = 1 / rate if rate and rate > 0 else 0
+        self.next_time = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if self.interval <= 0:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            if self.next_time > now:
+                time.sleep(self.next_time - now)
+                now = self.next_time
+
+            self.next_time = now + self.interval
+
+
+class EmailOutbox:
+    """
+    待发送邮件发件箱
+
+    邮件先保存为待发送(wait)且设置了下次发送时间的邮件记录（加入发件箱），发件箱分批取出到期的待发送邮件，每批用少量长连接的SMTP连接逐封发送，
+    每封邮件单独记录发送结果；发送失败的邮件按指数退避时间重试，超过最大重试次数标记为发送失败。
+
+    取出一批邮件时设置一个租约时间（下次发送时间），并发的发件箱不会取到同一封邮件，
+    发件箱异常退出时，租约过期后邮件可以被重新发送。
+
+    没有下次发送时间的待发送邮件不是加入发件箱的邮件（如已提交到任务队列发送的邮件、历史遗留的邮件），发件箱不发送。
+    """
+    BATCH_SIZE = 100
+    MAX_RETRIES = 3
+    RETRY_BACKOFF = 60          # 秒，第n次重试等待 RETRY_BACKOFF * 2^(n-1)
+    LEASE_SECONDS = 600         # 取出邮件的租约时间
+
+    def __init__(
+            self, connections: int = 2, batch_size: int = None, max_retries: int = None,
+            retry_backoff: int = None, rate_limit: float = 0, logger=None
+    ):
+        """
+        :param connections: SMTP连接数，每个连接一个发送线程
+        :param batch_size: 每批取出的邮件数
+        :param max_retries: 最大发送次数
+        :param retry_backoff: 重试退避基础时间，秒
+        :param rate_limit: 每秒最多发送的邮件数，所有连接共享，<=0不限制
+        """
+        self.connections = max(connections, 1)
+        self.batch_size = batch_size if batch_size and batch_size > 0 else self.BATCH_SIZE
+        self.max_retries = max_retries if max_retries and max_retries > 0 else self.MAX_RETRIES
+        self.retry_backoff = self.RETRY_BACKOFF if retry_backoff is None else retry_backoff
+        self.rate_limiter = RateLimiter(rate=rate_limit)
+        self.logger = logger if logger else logging.getLogger(__name__)
+
+        self.sent_count = 0
+        self.retry_count = 0
+        self.failed_count = 0
+        self.batch_count = 0
+        self.seconds = 0.0
+
+    def drain(self, tag: str = None, email_ids: list = None) -> dict:
+        """
+        发送所有到期的待发送邮件
+
+        :param tag: 只发送此标签的邮件
+        :param email_ids: 只发送这些邮件
+        :return: 发送统计，stats()
+        """
+        start_time = time.monotonic()
+        while True:
+            emails = self.claim_batch(tag=tag, email_ids=email_ids)
+            if not emails:
+                break
+
+            self.batch_count += 1
+            results = self.send_batch(emails)
+            self.save_results(results)
+
+        self.seconds = time.monotonic() - start_time
+        stats = self.stats()
+        if self.batch_count > 0:
+            self.logger.warning(
+                f'Email outbox, sent {stats["sent"]}, retry {stats["retry"]}, failed {stats["failed"]}, '
+                f'{stats["batches"]} batches, {stats["seconds"]:.3f}s')
+
+        return stats
+
+    def claim_batch(self, tag: str = None, email_ids: list = None):
+        """
+        取出一批到期的待发送邮件，并设置租约；只取加入发件箱（设置了下次发送时间）的邮件
+        """
+        now = dj_timezone.now()
+        due_q = Q(next_retry_time__isnull=False, next_retry_time__lte=now)
+        queryset = Email.objects.filter(status=Email.Status.WAIT.value, is_feint=False).filter(due_q)
+        if tag:
+            queryset = queryset.filter(tag=tag)
+        if email_ids is not None:
+            queryset = queryset.filter(id__in=email_ids)
+
+        ids = list(queryset.order_by('send_time').values_list('id', flat=True)[0:self.batch_size])
+        if not ids:
+            return []
+
+        lease_time = now + timedelta(seconds=self.LEASE_SECONDS)
+        Email.objects.filter(
+            id__in=ids, status=Email.Status.WAIT.value).filter(due_q).update(next_retry_time=lease_time)
+        # 只有租约时间是本次设置的邮件才是本次取到的，其他的已被并发的发件箱取走
+        return list(Email.objects.filter(id__in=ids, next_retry_time=lease_time).order_by('send_time'))
+
+    def send_batch(self, emails: list):
+        """
+        邮件分给多个连接发送
+
+        :return: [(email, error, retryable)]   # error: None(发送成功)
+        """
+        chunks = [emails[i::self.connections] for i in range(self.connections)]
+        chunks = [c for c in chunks if c]
+        if len(chunks) == 1:
+            return self.send_over_connection(chunks[0])
+
+        results = []
+        with ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+            for chunk_results in pool.map(self.send_over_connection, chunks):
+                results += chunk_results
+
+        return results
+
+    def send_over_connection(self, emails: list):
+        """
+        一个SMTP连接逐封发送邮件，连接出错后重新建立连接
+
+        :return: [(email, error, retryable)]   # error: None(发送成功)
+        """
+        results = []
+        connection = get_connection(fail_silently=False)
+        is_open = False
+        try:
+            for email in emails:
+                try:
+                    message = self.build_message(email=email, connection=connection)
+                except Exception as exc:
+                    results.append((email, str(exc), False))    # 邮件记录无效，不重试
+                    continue
+
+                try:
+                    if not is_open:
+                        connection.open()
+                        is_open = True
+
+                    self.rate_limiter.wait()
+                    if connection.send_messages([message]) == 0:
+                        raise Exception('failed')
+                except Exception as exc:
+                    results.append((email, str(exc), True))
+                    if is_open:
+                        self.close_connection(connection)
+                        is_open = False
+
+                    continue
+
+                results.append((email, None, False))
+        finally:
+            if is_open:
+                self.close_connection(connection)
+
+        return results
+
+    @staticmethod
+    def close_connection(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def build_message(email: Email, connection):
+        receivers = [r for r in email.receiver.split(';') if r]
+        if not receivers:
+            raise ValueError('no receivers')
+
+        if email.is_html:
+            message = ''
+            html_message = email.message
+        else:
+            message = email.message
+            html_message = ''
+
+        mail = EmailMultiAlternatives(
+            subject=email.subject, body=message, from_email=email.sender or None, to=receivers,
+            connection=connection
+        )
+        if html_message:
+            mail.attach_alternative(html_message, 'text/html')
+
+        return mail
+
+    def save_results(self, results: list):
+        now = dj_timezone.now()
+        success_ids = [email.id for email, error, _ in results if error is None]
+        if success_ids:
+            Email.objects.filter(id__in=success_ids).update(
+                status=Email.Status.SUCCESS.value, success_time=now, status_desc='', next_retry_time=None)
+            self.sent_count += len(success_ids)
+
+        for email, error, retryable in results:
+            if error is None:
+                continue
+
+            email.retry_count += 1
+            email.status_desc = error[:255]
+            if not retryable or email.retry_count >= self.max_retries:
+                email.status = Email.Status.FAILED.value
+                email.next_retry_time = None
+                self.failed_count += 1
+            else:
+                backoff = self.retry_backoff * 2 ** (email.retry_count - 1)
+                email.next_retry_time = now + timedelta(seconds=backoff)
+                self.retry_count += 1
+
+            email.save(update_fields=['status', 'status_desc', 'retry_count', 'next_retry_time'])
+
+    def stats(self) -> dict:
+        return {
+            'sent': self.sent_count,
+            'retry': self.retry_count,
+            'failed': self.failed_count,
+            'batches': self.batch_count,
+            'seconds': self.seconds
+        }
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.16 on 2026-10-17 05:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_userprofile_organization'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='email',
+            name='next_retry_time',
+            field=models.DateTimeField(blank=True, default=None, null=True, verbose_name='下次发送时间'),
+        ),
+        migrations.AddField(
+            model_name='email',
+            name='retry_count',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='重试次数'),
+        ),
+        migrations.AddIndex(
+            model_name='email',
+            index=models.Index(fields=['status', 'next_retry_time'], name='idx_status_next_retry'),
+        ),
+    ]
@@ -117,15 +117,21 @@ class Status(models.TextChoices):
     success_time = models.DateTimeField(verbose_name=_('成功发送时间'), null=True, blank=True, default=None)
     remote_ip = models.CharField(max_length=64, verbose_name=_('客户端ip'), default='')
     is_feint = models.BooleanField(verbose_name=_('假动作，不真实发送'), default=False)
+    retry_count = models.PositiveSmallIntegerField(verbose_name=_('重试次数'), default=0)
+    next_retry_time = models.DateTimeField(verbose_name=_('下次发送时间'), null=True, blank=True, default=None)
 
     class Meta:
         ordering = ['-send_time']
         verbose_name = _('邮件')
         verbose_name_plural = verbose_name
+        indexes = [
+            models.Index(fields=('status', 'next_retry_time'), name='idx_status_next_retry')
+        ]
 
     @staticmethod
     def send_email(subject: str, receivers: list, message: str, tag: str, html_message: str = None,
-                   fail_silently=True, save_db: bool = True, remote_ip: str = '', is_feint: bool = False):
+                   fail_silently=True, save_db: bool = True, remote_ip: str = '', is_feint: bool = False,
+                   queued: bool = False):
         """
         发送邮件
 
@@ -138,22 +144,29 @@ def send_email(subject: str, receivers: list, message: str, tag: str, html_messa
         :param save_db: True(保存邮件记录到数据库)；False(不保存)
         :param remote_ip: 客户端ip地址
         :param is_feint: True(假动作，只入库不真实发送)；False(真实发送邮件)
+        :param queued: True(只保存为待发送邮件记录，由EmailOutbox批量发送)；False(立即发送)；需要save_db=True
         :return:
-            Email()     # 发送成功
+            Email()     # 发送成功，或者已保存为待发送
             None        # 发送失败
         """
         email = Email.build_save_email(
             subject=subject, receivers=receivers, message=message, tag=tag, html_message=html_message,
-            save_db=save_db, remote_ip=remote_ip, is_feint=is_feint
+            save_db=save_db, remote_ip=remote_ip, is_feint=is_feint, queued=queued
         )
+        if queued and save_db:
+            return email
+
         email = Email.do_send_email(email=email, save_db=save_db, receivers=receivers, fail_silently=fail_silently)
         return email
 
     @classmethod
     def build_save_email(
             cls, subject: str, receivers: list, message: str, tag: str, html_message: str = None,
-            save_db: bool = True, remote_ip: str = '', is_feint: bool = False
+            save_db: bool = True, remote_ip: str = '', is_feint: bool = False, queued: bool = False
     ):
+        """
+        :param queued: True(加入发件箱，设置下次发送时间，由EmailOutbox发送)
+        """
         receiver_str = ';'.join(receivers)
         if len(receiver_str) >= 254:
             receiver_str = receiver_str[:254]
@@ -166,6 +179,9 @@ def build_save_email(
             tag=tag, is_html=False, status=cls.Status.WAIT.value, status_desc='', success_time=None,
             remote_ip=remote_ip, is_feint=is_feint
         )
+        if queued:
+            email.next_retry_time = dj_timezone.now()
+
         if html_message:
             email.message = html_message
             email.is_html = True
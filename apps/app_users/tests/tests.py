@@ -1,7 +1,32 @@
+import time
+from datetime import timedelta
+
 from django.test import TestCase
+from django.test.utils import override_settings
 from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.utils import timezone as dj_timezone
 
 from apps.app_users.models import Email
+from apps.app_users.email_outbox import EmailOutbox
+
+
+class FlakyEmailBackend(LocmemEmailBackend):
+    """
+    发送给 fail@cnic.cn 的邮件失败，记录打开连接次数
+    """
+    open_count = 0
+
+    def open(self):
+        FlakyEmailBackend.open_count += 1
+        return True
+
+    def send_messages(self, messages):
+        for msg in messages:
+            if 'fail@cnic.cn' in msg.to:
+                raise ConnectionError('connection unexpectedly closed')
+
+        return super().send_messages(messages)
 
 
 class EmailTest(TestCase):
@@ -58,3 +83,95 @@ def test_send_email(self):
         self.assertEqual(email4.tag, Email.Tag.COUPON.value)
         self.assertIsNone(email4.success_time)
         self.assertIs(email4.is_html, True)
+
+
+@override_settings(EMAIL_BACKEND='apps.app_users.tests.tests.FlakyEmailBackend')
+class EmailOutboxTest(TestCase):
+    @staticmethod
+    def queue_email(receivers: list, html: bool = False):
+        return Email.send_email(
+            subject='test发件箱', receivers=receivers, message='message邮件内容',
+            html_message='<p>html邮件内容</p>' if html else None, tag=Email.Tag.MONTH.value, queued=True
+        )
+
+    def test_drain(self):
+        FlakyEmailBackend.open_count = 0
+        emails = [self.queue_email([f'user{i}@cnic.cn'], html=bool(i % 2)) for i in range(10)]
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(Email.objects.filter(status=Email.Status.WAIT.value).count(), 10)
+        fail_email = self.queue_email(['fail@cnic.cn'])
+        no_receiver_email = self.queue_email([])
+        feint_email = Email.send_email(
+            subject='test', receivers=['feint@cnic.cn'], message='message', tag=Email.Tag.MONTH.value,
+            is_feint=True, queued=True)
+        other_tag_email = Email.send_email(
+            subject='test', receivers=['other@cnic.cn'], message='message', tag=Email.Tag.OPS.value, queued=True)
+
+        outbox = EmailOutbox(connections=2, batch_size=5, retry_backoff=60)
+        stats = outbox.drain(tag=Email.Tag.MONTH.value)
+        self.assertEqual(stats['sent'], 10)
+        self.assertEqual(stats['retry'], 1)
+        self.assertEqual(stats['failed'], 1)
+        self.assertEqual(stats['batches'], 3)
+        self.assertEqual(len(mail.outbox), 10)
+        # 每批每个连接只打开一次，失败后重新打开
+        self.assertLessEqual(FlakyEmailBackend.open_count, 3 * 2)
+        for email in emails:
+            email.refresh_from_db()
+            self.assertEqual(email.status, Email.Status.SUCCESS.value)
+            self.assertIsNotNone(email.success_time)
+            self.assertIsNone(email.next_retry_time)
+
+        html_mail = [m for m in mail.outbox if m.to == [emails[1].receiver]][0]
+        self.assertEqual(html_mail.alternatives[0][0], '<p>html邮件内容</p>')
+
+        no_receiver_email.refresh_from_db()
+        self.assertEqual(no_receiver_email.status, Email.Status.FAILED.value)
+        fail_email.refresh_from_db()
+        self.assertEqual(fail_email.status, Email.Status.WAIT.value)
+        self.assertEqual(fail_email.retry_count, 1)
+        self.assertIn('connection', fail_email.status_desc)
+        self.assertGreater(fail_email.next_retry_time, dj_timezone.now() + timedelta(seconds=50))
+        feint_email.refresh_from_db()
+        self.assertEqual(feint_email.status, Email.Status.WAIT.value)
+        other_tag_email.refresh_from_db()
+        self.assertEqual(other_tag_email.status, Email.Status.WAIT.value)
+
+        # 退避时间未到不重试
+        stats = EmailOutbox().drain(tag=Email.Tag.MONTH.value)
+        self.assertEqual(stats['batches'], 0)
+
+        # 重试超过最大次数标记失败
+        Email.objects.filter(id=fail_email.id).update(next_retry_time=dj_timezone.now() - timedelta(seconds=1))
+        stats = EmailOutbox(retry_backoff=0, max_retries=3).drain(email_ids=[fail_email.id])
+        self.assertEqual(stats['retry'], 1)
+        self.assertEqual(stats['failed'], 1)
+        fail_email.refresh_from_db()
+        self.assertEqual(fail_email.status, Email.Status.FAILED.value)
+        self.assertEqual(fail_email.retry_count, 3)
+
+        stats = EmailOutbox().drain()
+        self.assertEqual(stats['sent'], 1)
+        self.assertEqual(len(mail.outbox), 11)
+
+    def test_claim_lease(self):
+        email = self.queue_email(['user1@cnic.cn'])
+        self.assertIsNotNone(email.next_retry_time)
+        # 未加入发件箱的待发送邮件（已提交到任务队列发送、历史遗留的）不会被发件箱取到
+        Email.build_save_email(
+            subject='test', receivers=['taskq@cnic.cn'], message='message', tag=Email.Tag.API.value)
+        outbox = EmailOutbox()
+        claimed = outbox.claim_batch()
+        self.assertEqual([e.id for e in claimed], [email.id])
+        # 已被取走的邮件租约期内不会被再次取到
+        self.assertEqual(EmailOutbox().claim_batch(), [])
+        self.assertEqual(EmailOutbox().drain()['batches'], 0)
+
+    def test_rate_limit(self):
+        for i in range(6):
+            self.queue_email([f'user{i}@cnic.cn'])
+
+        t0 = time.monotonic()
+        stats = EmailOutbox(connections=3, rate_limit=20).drain()
+        self.assertEqual(stats['sent'], 6)
+        self.assertGreaterEqual(time.monotonic() - t0, 5 / 20)
@@ -160,6 +160,27 @@ def create_transaction_bill(
             owner_type: str, owner_id: str, owner_name: str, app_service_id: str, app_id: str,
             remark: str, creation_time: datetime, operator: str = ''
     ):
+        bill = TransactionBillManager.build_transaction_bill(
+            subject=subject, account=account, trade_type=trade_type, trade_id=trade_id,
+            out_trade_no=out_trade_no, trade_amounts=trade_amounts, amounts=amounts,
+            coupon_amount=coupon_amount, after_balance=after_balance, owner_type=owner_type,
+            owner_id=owner_id, owner_name=owner_name, app_service_id=app_service_id, app_id=app_id,
+            remark=remark, creation_time=creation_time, operator=operator
+        )
+        bill.save(force_insert=True)
+        return bill
+
+    @staticmethod
+    def build_transaction_bill(
+            subject: str, account: str, trade_type: str, trade_id: str,
+            out_trade_no: str, trade_amounts: Decimal,
+            amounts: Decimal, coupon_amount: Decimal, after_balance: Decimal,
+            owner_type: str, owner_id: str, owner_name: str, app_service_id: str, app_id: str,
+            remark: str, creation_time: datetime, operator: str = ''
+    ):
+        """
+        构建交易流水账单对象，不保存到数据库
+        """
         if trade_type not in TransactionBill.TradeType.values:
             raise errors.Error(message=_('创建交易流水账单记录错误，无效的交易类型"%(value)s"。') % {'value': trade_type})
 
@@ -182,7 +203,6 @@ def create_transaction_bill(
             creation_time=creation_time,
             operator=operator
         )
-        bill.save(force_insert=True)
         return bill
 
     def get_user_transaction_bill_queryset(
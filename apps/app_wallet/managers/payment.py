@@ -332,6 +332,50 @@ def _pay_by_user_or_vo(
             app_id=app_id, order_id=order_id
         )
 
+        before_payment = account.balance
+        pay_history, cc_historys, tbill = self.build_payment_records(
+            account=account, usable_coupons=usable_coupons, payer_id=payer_id, payer_name=payer_name,
+            payer_type=payer_type, app_id=app_id, subject=subject, amounts=amounts, executor=executor,
+            remark=remark, order_id=order_id, app_service_id=app_service_id, instance_id=instance_id,
+            only_coupon=only_coupon, required_enough_balance=required_enough_balance
+        )
+        # 账户扣款
+        if account.balance != before_payment:
+            account.save(update_fields=['balance'])
+
+        # 支付记录
+        pay_history.save(force_insert=True)
+        for ccph in cc_historys:
+            ccph.cash_coupon.save(update_fields=['balance'])
+            ccph.save(force_insert=True)
+
+        # 交易流水
+        tbill.save(force_insert=True)
+        return pay_history
+
+    def build_payment_records(
+            self, account, usable_coupons: List[CashCoupon],
+            payer_id: str, payer_name: str, payer_type: str,
+            app_id: str,
+            subject: str,
+            amounts: Decimal,
+            executor: str,
+            remark: str,
+            order_id: str,
+            app_service_id: str,
+            instance_id: str,
+            only_coupon: bool = False,
+            required_enough_balance: bool = True
+    ):
+        """
+        计算支付扣款，构建支付记录、资源券扣款记录和交易流水
+
+        * 只修改内存中账户和资源券的余额，不保存到数据库，由调用者保存（可批量写入）
+
+        :return:
+            (PaymentHistory(), [CashCouponPaymentHistory()], TransactionBill())
+        :raises: Error, BalanceNotEnough
+        """
         total_coupon_balance = Decimal(0)
         for c in usable_coupons:
             total_coupon_balance += c.balance
@@ -363,13 +407,6 @@ def _pay_by_user_or_vo(
             account_amount = amounts - coupon_amount
             payment_account = account.id
 
-        # 账户扣款
-        before_payment = account.balance
-        after_payment = before_payment - account_amount
-        if account.balance != after_payment:
-            account.balance = after_payment
-            account.save(update_fields=['balance'])
-
         # 支付记录
         pay_history = PaymentHistory(
             payment_account=payment_account,
@@ -392,12 +429,18 @@ def _pay_by_user_or_vo(
             creation_time=timezone.now(),
             payment_time=timezone.now()
         )
-        pay_history.save(force_insert=True)
+        pay_history.enforce_id()
+        cc_historys = []
         if coupon_amount > Decimal('0'):
-            self._deduct_form_coupons(coupons=usable_coupons, money_amount=coupon_amount, pay_history_id=pay_history.id)
+            cc_historys = self._calculate_deduct_form_coupons(
+                coupons=usable_coupons, money_amount=coupon_amount, pay_history_id=pay_history.id)
+
+        # 账户扣款
+        after_payment = account.balance - account_amount
+        account.balance = after_payment
 
         # 交易流水
-        tbill = TransactionBillManager.create_transaction_bill(
+        tbill = TransactionBillManager.build_transaction_bill(
             subject=subject, account=payment_account, trade_type=TransactionBill.TradeType.PAYMENT.value,
             trade_id=pay_history.id, out_trade_no=pay_history.order_id, trade_amounts=-pay_history.payable_amounts,
             amounts=pay_history.amounts, coupon_amount=pay_history.coupon_amount,
@@ -405,7 +448,8 @@ def _pay_by_user_or_vo(
             owner_name=pay_history.payer_name, app_service_id=pay_history.app_service_id, app_id=pay_history.app_id,
             remark=remark, creation_time=pay_history.payment_time, operator=pay_history.executor
         )
-        return pay_history
+        tbill.enforce_id()
+        return pay_history, cc_historys, tbill
 
     @staticmethod
     def _deduct_form_coupons(coupons: List[CashCoupon], money_amount: Decimal, pay_history_id: str):
@@ -420,6 +464,27 @@ def _deduct_form_coupons(coupons: List[CashCoupon], money_amount: Decimal, pay_h
         :return:
             [CashCouponPaymentHistory()]
 
+        :raises: Error(Conflict、CouponBalanceNotEnough、CouponBalanceNotEnough)
+        """
+        cc_historys = PaymentManager._calculate_deduct_form_coupons(
+            coupons=coupons, money_amount=money_amount, pay_history_id=pay_history_id)
+        for ccph in cc_historys:
+            ccph.cash_coupon.save(update_fields=['balance'])
+            ccph.save(force_insert=True)
+
+        return cc_historys
+
+    @staticmethod
+    def _calculate_deduct_form_coupons(coupons: List[CashCoupon], money_amount: Decimal, pay_history_id: str):
+        """
+        顺序从指定资源券中扣除金额，只修改内存中资源券的余额，不保存到数据库
+
+        :param coupons: 资源券列表
+        :param money_amount: 扣除金额
+        :param pay_history_id: 支付记录id
+        :return:
+            [CashCouponPaymentHistory()]     # cash_coupon为扣款后的资源券对象，未保存
+
         :raises: Error(Conflict、CouponBalanceNotEnough、CouponBalanceNotEnough)
         """
         if money_amount <= Decimal(0):
@@ -451,16 +516,15 @@ def _deduct_form_coupons(coupons: List[CashCoupon], money_amount: Decimal, pay_h
                 remain_pay_amount = remain_pay_amount - pay_amount
 
             coupon.balance = after_payment
-            coupon.save(update_fields=['balance'])
             ccph = CashCouponPaymentHistory(
                 payment_history_id=pay_history_id,
                 refund_history_id=None,
-                cash_coupon_id=coupon.id,
+                cash_coupon=coupon,
                 amounts=-pay_amount,
                 before_payment=before_payment,
                 after_payment=after_payment
             )
-            ccph.save(force_insert=True)
+            ccph.enforce_id()
             cc_historys.append(ccph)
 
             if remain_pay_amount <= Decimal('0'):
@@ -0,0 +1,186 @@
+import os
+import atexit
+import asyncio
+import threading
+from urllib import parse
+from contextlib import asynccontextmanager
+
+import aiohttp
+from django.conf import settings
+
+
+def get_async_pool_settings() -> dict:
+    """
+    settings.ADAPTER_ASYNC_HTTP_POOL，例如：
+    {
+        'limit': 100,               # 每个服务地址的最大连接数
+        'ttl_dns_cache': 300,       # DNS解析缓存时间，秒
+        'keepalive_timeout': 30     # 空闲连接保持时间，秒
+    }
+    """
+    configs = {'limit': 100, 'ttl_dns_cache': 300, 'keepalive_timeout': 30}
+    configs.update(getattr(settings, 'ADAPTER_ASYNC_HTTP_POOL', None) or {})
+    return configs
+
+
+class AsyncSessionPool:
+    """
+    进程内按服务地址（scheme://host:port）共享的aiohttp.ClientSession，连接保持复用
+
+    * aiohttp的session只能在创建它的事件循环中使用，进程内有一个后台线程运行的共享事件循环，
+      通过run_sync()在共享事件循环中执行协程，多个请求（线程）共用session和连接
+    * 在其他事件循环中（比如asyncio.run()）使用session()时，每次创建临时的session，用完关闭
+    * 不保存响应的cookie，请求之间无状态
+    * 进程fork后重新创建事件循环和session，不与父进程共用连接
+    * 进程退出时关闭所有session和事件循环
+    """
+
+    def __init__(self, limit: int = None, ttl_dns_cache: int = None, keepalive_timeout: float = None):
+        configs = get_async_pool_settings()
+        self.limit = configs['limit'] if limit is None else limit
+        self.ttl_dns_cache = configs['ttl_dns_cache'] if ttl_dns_cache is None else ttl_dns_cache
+        self.keepalive_timeout = configs['keepalive_timeout'] if keepalive_timeout is None else keepalive_timeout
+        self._loop = None
+        self._thread = None
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._atexit_registered = False
+        self.new_session_count = 0      # 创建的共享session数
+        self.temp_session_count = 0     # 创建的临时session数
+
+    @staticmethod
+    def get_base_url(url: str) -> str:
+        scheme, netloc, _, _, _ = parse.urlsplit(url)
+        return f'{scheme}://{netloc}'.lower()
+
+    def new_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.limit, ttl_dns_cache=self.ttl_dns_cache, keepalive_timeout=self.keepalive_timeout)
+        return aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.DummyCookieJar())
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        """
+        共享的事件循环，第一次使用时在后台线程中启动
+        """
+        pid = os.getpid()
+        loop = self._loop
+        if loop is not None and self._pid == pid and not loop.is_closed():
+            return loop
+
+        with self._lock:
+            if self._pid != pid:    # fork后的子进程，不使用父进程的事件循环和连接
+                self._loop = None
+                self._thread = None
+                self._sessions = {}
+                self._pid = pid
+
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self._run_loop, args=(loop,), name='async-session-pool', daemon=True)
+                thread.start()
+                self._loop = loop
+                self._thread = thread
+                self._sessions = {}
+                if not self._atexit_registered:
+                    atexit.register(self.close)
+                    self._atexit_registered = True
+
+            return self._loop
+
+    @staticmethod
+    def _run_loop(loop: asyncio.AbstractEventLoop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    def is_pool_loop(self) -> bool:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+
+        return loop is self._loop and self._pid == os.getpid()
+
+    def run_sync(self, coro, timeout: float = None):
+        """
+        在共享事件循环中执行协程，等待返回结果
+
+        :raises: 协程抛出的错误
+        """
+        loop = self.get_loop()
+        if self.is_pool_loop():
+            coro.close()
+            raise RuntimeError('run_sync() can not be called in the pool event loop')
+
+        future = asyncio.run_coroutine_threadsafe(coro, loop)
+        return future.result(timeout=timeout)
+
+    def get_session(self, url: str) -> aiohttp.ClientSession:
+        """
+        共享的session，只能在共享事件循环中调用
+        """
+        base_url = self.get_base_url(url)
+        session = self._sessions.get(base_url)
+        if session is None or session.closed:
+            session = self._sessions[base_url] = self.new_session()
+            self.new_session_count += 1
+
+        return session
+
+    @asynccontextmanager
+    async def session(self, url: str):
+        """
+        async with async_session_pool.session(url) as client:
+            r = await client.get(url=url)
+            await r.read()
+
+        在共享事件循环中使用共享的session，在其他事件循环中使用临时的session
+        """
+        if self.is_pool_loop():
+            yield self.get_session(url)
+            return
+
+        self.temp_session_count += 1
+        async with aiohttp.ClientSession(cookie_jar=aiohttp.DummyCookieJar()) as client:
+            yield client
+
+    async def _close_sessions(self):
+        sessions = list(self._sessions.values())
+        self._sessions = {}
+        for session in sessions:
+            await session.close()
+
+    def close(self, timeout: float = 5):
+        """
+        关闭所有共享的session和事件循环，进程退出时调用
+        """
+        with self._lock:
+            loop = self._loop
+            thread = self._thread
+            if loop is None or loop.is_closed() or self._pid != os.getpid():
+                return
+
+            self._loop = None
+            self._thread = None
+
+        try:
+            asyncio.run_coroutine_threadsafe(self._close_sessions(), loop).result(timeout=timeout)
+        except Exception:
+            pass
+
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None:
+            thread.join(timeout=timeout)
+
+        if not loop.is_running():
+            loop.close()
+
+    def stats(self) -> dict:
+        return {
+            'sessions': len(self._sessions),
+            'new_sessions': self.new_session_count,
+            'temp_sessions': self.temp_session_count
+        }
+
+
+async_session_pool = AsyncSessionPool()
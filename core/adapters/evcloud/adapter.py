@@ -1,9 +1,9 @@
 from datetime import datetime
-import requests
 
 from ..base import BaseAdapter
 from .. import inputs, outputs
 from ..params import GenericAdapterParams
+from ..sessions import session_pool
 from .builders import APIBuilder
 from . import exceptions
 from .validators import InputValidator
@@ -111,7 +111,7 @@ def do_request(method: str, url: str, ok_status_codes=(200,), headers=None, **kw
         :raises: Error, AuthenticationFailed, APIError
         """
         try:
-            r = requests.request(method=method, url=url, headers=headers, **kwargs)
+            r = session_pool.request(method=method, url=url, headers=headers, **kwargs)
         except Exception as e:
             raise exceptions.Error(str(e))
 
@@ -146,7 +146,7 @@ def authenticate(self, params: inputs.AuthenticateInput, **kwargs) -> outputs.Au
     def authenticate_jwt(self, username, password):
         url = self.api_builder.jwt_base_url()
         try:
-            r = requests.post(url, data={'username': username, 'password': password}, timeout=(6, 60))
+            r = session_pool.post(url, data={'username': username, 'password': password}, timeout=(6, 60))
         except Exception as e:
             return OutputConverter().to_authenticate_output_error(error=exceptions.Error(str(e)), style='jwt')
 
@@ -161,7 +161,7 @@ def authenticate_jwt(self, username, password):
     def authenticate_token(self, username, password):
         url = self.api_builder.token_base_url()
         try:
-            r = requests.post(url, data={'username': username, 'password': password}, timeout=(6, 60))
+            r = session_pool.post(url, data={'username': username, 'password': password}, timeout=(6, 60))
         except Exception as e:
             return OutputConverter().to_authenticate_output_error(error=exceptions.Error(str(e)), style='token')
 
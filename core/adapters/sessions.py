@@ -0,0 +1,118 @@
+import os
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from urllib import parse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+
+
+def get_pool_settings() -> dict:
+    """
+    settings.ADAPTER_HTTP_POOL，例如：
+    {
+        'pool_maxsize': 16,     # 每个服务地址保持的最大连接数
+        'max_retries': 1,       # 连接错误重试次数，只重试幂等请求
+        'backoff_factor': 0.3,  # 重试等待时间因子
+        'timeout': (6, 60)      # 默认超时时间，(连接超时，读超时)
+    }
+    """
+    configs = {'pool_maxsize': 16, 'max_retries': 1, 'backoff_factor': 0.3, 'timeout': (6, 60)}
+    configs.update(getattr(settings, 'ADAPTER_HTTP_POOL', None) or {})
+    return configs
+
+
+class SessionPool:
+    """
+    进程内按服务地址（scheme://host:port）共享的requests.Session，连接保持复用
+
+    * 不保存响应的cookie，请求之间无状态
+    * 进程fork后重新创建session，不与父进程共用连接
+    """
+
+    def __init__(self, pool_maxsize: int = None, max_retries: int = None, backoff_factor: float = None,
+                 timeout=None):
+        configs = get_pool_settings()
+        self.pool_maxsize = configs['pool_maxsize'] if pool_maxsize is None else pool_maxsize
+        self.max_retries = configs['max_retries'] if max_retries is None else max_retries
+        self.backoff_factor = configs['backoff_factor'] if backoff_factor is None else backoff_factor
+        self.timeout = configs['timeout'] if timeout is None else timeout
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    @staticmethod
+    def get_base_url(url: str) -> str:
+        scheme, netloc, _, _, _ = parse.urlsplit(url)
+        return f'{scheme}://{netloc}'.lower()
+
+    def new_session(self) -> requests.Session:
+        session = requests.Session()
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        retry = Retry(
+            total=self.max_retries, connect=self.max_retries, read=0, status=0, redirect=0,
+            backoff_factor=self.backoff_factor, raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=retry)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def get_session(self, url: str) -> requests.Session:
+        base_url = self.get_base_url(url)
+        pid = os.getpid()
+        session = self._sessions.get(base_url)
+        if session is not None and self._pid == pid:
+            return session
+
+        with self._lock:
+            if self._pid != pid:
+                self._sessions = {}
+                self._pid = pid
+
+            session = self._sessions.get(base_url)
+            if session is None:
+                session = self._sessions[base_url] = self.new_session()
+
+        return session
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        未指定timeout时使用默认超时时间
+
+        :raises: requests.RequestException
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        return self.get_session(url).request(method=method, url=url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request(method='post', url=url, **kwargs)
+
+    def stats(self) -> dict:
+        """
+        连接复用统计
+
+        :return:
+            {
+                base_url: {'connections': 新建连接数, 'requests': 请求数, 'reused': 复用连接的请求数}
+            }
+        """
+        data = {}
+        for base_url, session in list(self._sessions.items()):
+            num_connections = num_requests = 0
+            adapter = session.get_adapter(base_url)
+            for pool in list(adapter.poolmanager.pools._container.values()):
+                num_connections += pool.num_connections
+                num_requests += pool.num_requests
+
+            data[base_url] = {
+                'connections': num_connections, 'requests': num_requests,
+                'reused': max(num_requests - num_connections, 0)
+            }
+
+        return data
+
+
+session_pool = SessionPool()
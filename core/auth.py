@@ -1,99 +1,125 @@
-from datetime import datetime
-from threading import local
-
 from core.adapters import exceptions as os_exceptions, client
-from core.adapters import inputs
+from core.adapters import inputs, outputs
+from core.auth_cache import AuthTokenCache
 from apps.app_servers.models import ServiceConfig
 from . import errors as exceptions
 
 
 class AuthCacheHandler:
+    """
+    服务认证信息缓存，进程内线程共享，token类认证信息在多进程间共享，认证信息过期或失效时单飞刷新
+    """
     def __init__(self):
-        self._auths = local()
+        self._auths = AuthTokenCache(namespace='server')
 
     def __getitem__(self, key):
-        if hasattr(self._auths, key):
-            return getattr(self._auths, key)
-
-        return None
+        return self._auths.get(key)
 
     def __setitem__(self, key, value):
-        setattr(self._auths, key, value)
+        self._auths.set(key, value)
 
     def __delitem__(self, key):
-        delattr(self._auths, key)
+        self._auths.delete(key)
+
+    def metrics(self) -> dict:
+        """
+        缓存命中率和认证次数
+        """
+        return self._auths.metrics()
+
+    @staticmethod
+    def auth_to_dict(auth: outputs.AuthenticateOutput):
+        """
+        只有token类认证信息可以在进程间共享，不包含密码
+
+        :return:
+            dict
+            None    # 包含连接对象或密钥，不可共享
+        """
+        if not auth.token or auth.kwargs or auth.secret_key:
+            return None
+
+        return {
+            'style': auth.style, 'token': auth.token, 'expire': auth.expire,
+            'header': list(auth.header) if auth.header else None,
+            'query': list(auth.query) if auth.query else None,
+            'username': auth.username
+        }
 
-    def get_auth(self, service: ServiceConfig, refresh=False):
+    @staticmethod
+    def auth_from_dict(data: dict, username: str, password: str):
+        return outputs.AuthenticateOutput(
+            style=data['style'], token=data['token'], expire=data['expire'],
+            header=outputs.AuthenticateOutputHeader(*data['header']) if data['header'] else None,
+            query=outputs.AuthenticateOutputQuery(*data['query']) if data['query'] else None,
+            username=username, password=password
+        )
+
+    def get_auth(self, service: ServiceConfig, refresh=False, stale_auth=None):
         """
         获取身份认证信息
 
         :param service:
         :param refresh:
+        :param stale_auth: 刷新时，失效的认证信息，其他线程或进程已刷新时直接使用新的认证信息
         :return:
 
         :raises: AuthenticationFailed
         """
-        now = datetime.utcnow().timestamp()
-        key = self.get_service_key(service)
-
-        if refresh:
-            del self[key]
-        else:
-            auth = self[key]
-            if auth:
-                expire = auth.expire
-                if now < expire:
-                    return auth
-
-        s_client = client.get_service_client(service)
-        try:
-            password = service.raw_password()
-            if password is None:
-                raise exceptions.AuthenticationFailed(f'Invalid password of service "{str(service)}"')
-
-            params = inputs.AuthenticateInput(username=service.username, password=password)
-            auth = s_client.authenticate(params)
-            if not auth.ok:
+        def authenticate():
+            s_client = client.get_service_client(service)
+            try:
+                password = service.raw_password()
+                if password is None:
+                    raise exceptions.AuthenticationFailed(f'Invalid password of service "{str(service)}"')
+
+                params = inputs.AuthenticateInput(username=service.username, password=password)
+                auth = s_client.authenticate(params)
+                if not auth.ok:
+                    raise exceptions.AuthenticationFailed(
+                        f'Authentication failed to service "{str(service)}", error: {str(auth.error)}')
+            except os_exceptions.AuthenticationFailed as exc:
                 raise exceptions.AuthenticationFailed(
-                    f'Authentication failed to service "{str(service)}", error: {str(auth.error)}')
-        except os_exceptions.AuthenticationFailed as exc:
-            raise exceptions.AuthenticationFailed(
-                f'Authentication failed to service "{str(service)}", error: {str(exc)}')
+                    f'Authentication failed to service "{str(service)}", error: {str(exc)}')
 
-        self[key] = auth
-        return auth
+            return auth
+
+        return self._auths.get_or_authenticate(
+            key=self.get_service_key(service), authenticate=authenticate,
+            dumps=self.auth_to_dict,
+            loads=lambda data: self.auth_from_dict(
+                data, username=service.username, password=service.raw_password()),
+            refresh=refresh, stale_auth=stale_auth
+        )
 
-    def get_vpn_auth(self, service: ServiceConfig, refresh=False):
+    def get_vpn_auth(self, service: ServiceConfig, refresh=False, stale_auth=None):
         if service.service_type == service.ServiceType.EVCLOUD:
-            return self.get_auth(service=service, refresh=refresh)
-
-        now = datetime.utcnow().timestamp()
-        key = self.get_service_vpn_key(service)
-
-        if refresh:
-            del self[key]
-        else:
-            auth = self[key]
-            if auth:
-                expire = auth.expire
-                if now < expire:
-                    return auth
-
-        cli = client.get_service_vpn_client(service)
-        try:
-            vpn_password = service.raw_vpn_password()
-            if vpn_password is None:
-                raise exceptions.AuthenticationFailed(f'Invalid vpn_password of service "{str(service)}"')
-
-            params = inputs.AuthenticateInput(username=service.vpn_username, password=vpn_password)
-            auth = cli.authenticate(params)
-            if not auth.ok:
+            return self.get_auth(service=service, refresh=refresh, stale_auth=stale_auth)
+
+        def authenticate():
+            cli = client.get_service_vpn_client(service)
+            try:
+                vpn_password = service.raw_vpn_password()
+                if vpn_password is None:
+                    raise exceptions.AuthenticationFailed(f'Invalid vpn_password of service "{str(service)}"')
+
+                params = inputs.AuthenticateInput(username=service.vpn_username, password=vpn_password)
+                auth = cli.authenticate(params)
+                if not auth.ok:
+                    raise exceptions.AuthenticationFailed(
+                        f'Authentication failed to vpn of service "{str(service)}"')
+            except os_exceptions.AuthenticationFailed:
                 raise exceptions.AuthenticationFailed(f'Authentication failed to vpn of service "{str(service)}"')
-        except os_exceptions.AuthenticationFailed:
-            raise exceptions.AuthenticationFailed(f'Authentication failed to vpn of service "{str(service)}"')
 
-        self[key] = auth
-        return auth
+            return auth
+
+        return self._auths.get_or_authenticate(
+            key=self.get_service_vpn_key(service), authenticate=authenticate,
+            dumps=self.auth_to_dict,
+            loads=lambda data: self.auth_from_dict(
+                data, username=service.vpn_username, password=service.raw_vpn_password()),
+            refresh=refresh, stale_auth=stale_auth
+        )
 
     def auth_to_cache(self, service, auth):
         key = self.get_service_key(service)
@@ -104,15 +130,16 @@ def auth_from_cache(self, service):
         return self[key]
 
     def auth_delete_from_cache(self, service):
-        delattr(self._auths, service.id)
+        key = self.get_service_key(service)
+        del self[key]
 
     @staticmethod
     def get_service_key(service):
-        return f'service_{service.id}'
+        return f'service_{service.id}_{service.endpoint_url}_{service.username}'
 
     @staticmethod
     def get_service_vpn_key(service):
-        return f'vpn_{service.id}'
+        return f'vpn_{service.id}_{service.vpn_endpoint_url}_{service.vpn_username}'
 
 
 auth_handler = AuthCacheHandler()
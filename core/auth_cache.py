@@ -0,0 +1,259 @@
+import os
+import stat
+import json
+import hashlib
+import tempfile
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+from typing import Callable
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:     # 非posix系统，不使用文件在进程间共享
+    fcntl = None
+
+
+def get_default_cache_dir():
+    cache_dir = getattr(settings, 'ADAPTER_AUTH_CACHE_DIR', None)
+    if cache_dir is None:
+        cache_dir = os.path.join(settings.BASE_DIR, 'var', 'adapter_auth')
+
+    return str(cache_dir)
+
+
+def ensure_private_dir(dir_path: str) -> bool:
+    """
+    确保目录存在，是当前用户所有、只有当前用户可访问(0700)的真实目录（不是符号链接）
+
+    :return: True(安全可用)；False(不可用)
+    """
+    try:
+        os.makedirs(dir_path, mode=0o700, exist_ok=True)
+        st = os.lstat(dir_path)
+        if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid():
+            return False
+
+        if stat.S_IMODE(st.st_mode) & 0o077:
+            os.chmod(dir_path, 0o700)
+    except OSError:
+        return False
+
+    return True
+
+
+class AuthTokenCache:
+    """
+    服务认证信息缓存，进程内所有线程共享，token类认证信息通过文件在多进程间共享
+
+    * 按key缓存，认证信息的过期时间为auth.expire
+    * 单飞刷新：同一个key同时只有一个线程认证，进程间通过文件锁保证同时只有一个进程认证，
+      其他线程（进程）等待后直接使用新的认证信息
+    * 只有可序列化的认证信息存入文件，包含连接对象、密钥的认证信息只在进程内共享
+    * 文件目录必须是当前用户所有的0700目录，否则只在进程内共享；文件名是key的哈希值，不跟随符号链接
+    """
+
+    def __init__(self, namespace: str, file_dir: str = None, use_file: bool = True):
+        """
+        :param namespace: 文件名前缀，区分不同的缓存
+        :param file_dir: 进程间共享的文件目录，默认settings.ADAPTER_AUTH_CACHE_DIR或项目目录下var/adapter_auth
+        :param use_file: False(只在进程内共享)
+        """
+        self.namespace = namespace
+        self._auths = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._file_dir = file_dir
+        self._file_dir_ok = None
+        self.use_file = use_file and fcntl is not None
+        self.hit_count = 0  # 使用缓存的次数
+        self.file_hit_count = 0  # 使用其他进程认证信息的次数
+        self.auth_count = 0  # 认证的次数
+
+    @property
+    def file_dir(self):
+        if self._file_dir is None:
+            self._file_dir = get_default_cache_dir()
+
+        return self._file_dir
+
+    def is_file_dir_ok(self) -> bool:
+        if self._file_dir_ok is None:
+            self._file_dir_ok = ensure_private_dir(self.file_dir)
+
+        return self._file_dir_ok
+
+    @staticmethod
+    def is_valid(auth) -> bool:
+        return auth is not None and datetime.utcnow().timestamp() < auth.expire
+
+    def get(self, key: str):
+        """
+        :return:
+            auth    # 有效的认证信息
+            None
+        """
+        auth = self._auths.get(key)
+        if self.is_valid(auth):
+            return auth
+
+        return None
+
+    def set(self, key: str, auth):
+        self._auths[key] = auth
+
+    def delete(self, key: str):
+        self._auths.pop(key, None)
+
+    def get_or_authenticate(
+            self, key: str, authenticate: Callable, dumps: Callable = None, loads: Callable = None,
+            refresh: bool = False, stale_auth=None
+    ):
+        """
+        获取缓存的有效认证信息，没有时认证
+
+        :param authenticate: 认证函数，返回认证信息，认证失败抛出错误
+        :param dumps: 认证信息转为可json序列化的dict的函数，返回None不存入文件
+        :param loads: 从dict还原认证信息的函数
+        :param refresh: True(弃用缓存的认证信息重新认证)
+        :param stale_auth: 要刷新的失效认证信息，缓存的认证信息已不是它时（其他线程或进程已刷新），直接使用
+        :raises: 认证函数抛出的错误
+        """
+        if not refresh:
+            auth = self.get(key)
+            if auth is not None:
+                self._count(hit=1)
+                return auth
+
+        with self._key_lock(key):
+            auth = self.get(key)
+            if auth is not None and not self._is_stale(auth, refresh=refresh, stale_auth=stale_auth):
+                self._count(hit=1)
+                return auth
+
+            with self._file_lock(key):
+                auth = self._load_file(key=key, loads=loads)
+                if auth is not None and not self._is_stale(
+                        auth, refresh=refresh, stale_auth=stale_auth, compare_token=True):
+                    self._count(hit=1, file_hit=1)
+                    self.set(key, auth)
+                    return auth
+
+                self._count(auth=1)
+                auth = authenticate()
+                self.set(key, auth)
+                self._dump_file(key=key, auth=auth, dumps=dumps)
+
+        return auth
+
+    @staticmethod
+    def _is_stale(auth, refresh: bool, stale_auth, compare_token: bool = False) -> bool:
+        """
+        刷新时，认证信息是否是要刷新的失效认证信息
+
+        :param compare_token: True(按token比较，用于文件中其他进程的认证信息)
+        """
+        if not refresh:
+            return False
+
+        if stale_auth is None or auth is stale_auth:
+            return True
+
+        if compare_token:
+            token = getattr(auth, 'token', '')
+            return not token or token == getattr(stale_auth, 'token', '')
+
+        return False
+
+    def _count(self, hit: int = 0, file_hit: int = 0, auth: int = 0):
+        with self._lock:
+            self.hit_count += hit
+            self.file_hit_count += file_hit
+            self.auth_count += auth
+
+    def metrics(self) -> dict:
+        total = self.hit_count + self.auth_count
+        return {
+            'hit_count': self.hit_count,
+            'file_hit_count': self.file_hit_count,
+            'auth_count': self.auth_count,
+            'hit_ratio': self.hit_count / total if total else 0.0
+        }
+
+    def _filename(self, key: str, suffix: str):
+        key_hash = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.file_dir, f'{self.namespace}_{key_hash}.{suffix}')
+
+    @contextmanager
+    def _key_lock(self, key: str):
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+
+        with lock:
+            yield
+
+    @contextmanager
+    def _file_lock(self, key: str):
+        if not self.use_file or not self.is_file_dir_ok():
+            yield
+            return
+
+        try:
+            fd = os.open(self._filename(key=key, suffix='lock'), os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+        except OSError:
+            yield
+            return
+
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _load_file(self, key: str, loads: Callable):
+        if not self.use_file or loads is None or not self.is_file_dir_ok():
+            return None
+
+        try:
+            fd = os.open(self._filename(key=key, suffix='json'), os.O_RDONLY | os.O_NOFOLLOW)
+            with os.fdopen(fd, 'r') as f:
+                data = json.load(f)
+
+            auth = loads(data)
+        except Exception:
+            return None
+
+        if self.is_valid(auth):
+            return auth
+
+        return None
+
+    def _dump_file(self, key: str, auth, dumps: Callable):
+        if not self.use_file or dumps is None or not self.is_file_dir_ok():
+            return
+
+        data = dumps(auth)
+        if data is None:
+            return
+
+        filename = self._filename(key=key, suffix='json')
+        try:
+            fd, tmp_filename = tempfile.mkstemp(dir=self.file_dir, prefix=f'{self.namespace}_', suffix='.tmp')
+        except OSError:
+            return
+
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+
+            os.replace(tmp_filename, filename)
+        except Exception:
+            try:
+                os.remove(tmp_filename)
+            except OSError:
+                pass
@@ -5,16 +5,16 @@
 from django.http.response import HttpResponseForbidden
 
 from core import errors
-from apps.app_global.configs_manager import IPAccessWhiteListManager
-from utils.iprestrict import IPRestrictor
+from apps.app_global.configs_manager import IPAccessWhiteListManager, ModuleIPRestrictor
 
 
-class AdminIPRestrictor(IPRestrictor):
+class AdminIPRestrictor(ModuleIPRestrictor):
+    module_name = IPAccessWhiteListManager.ModuleName.ADMIN.value
+
     def load_ip_rules(self):
-        whitelist = IPAccessWhiteListManager.get_module_ip_whitelist(
-            module_name=IPAccessWhiteListManager.ModuleName.ADMIN.value)
+        whitelist = super().load_ip_rules()
         if not whitelist:
-            whitelist = [ipaddress.IPv4Network('0.0.0.0/0')]
+            whitelist = [ipaddress.IPv4Network('0.0.0.0/0'), ipaddress.IPv6Network('::/0')]
 
         return whitelist
 
@@ -0,0 +1,286 @@
+import copy
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable
+
+from django.conf import settings
+
+
+def get_prom_cache_settings() -> dict:
+    """
+    settings.PROM_QUERY_CACHE，例如：
+    {
+        'max_size': 2048,       # 最多缓存的查询数
+        'max_points': 200000,   # 所有查询最多缓存的数据点数，每个数据点约占120字节内存
+        'instant_ttl': 15,      # 即时查询结果缓存时间，秒
+        'live_ttl': 15,         # 范围查询未完成的最新时间段缓存时间，秒
+        'history_ttl': 3600,    # 范围查询已完成的历史时间段缓存时间，秒
+        'live_delay': 60        # 距当前时间多久以内的数据点可能还会变化，秒
+    }
+    """
+    configs = {
+        'max_size': 2048, 'max_points': 200000, 'instant_ttl': 15, 'live_ttl': 15, 'history_ttl': 3600,
+        'live_delay': 60
+    }
+    configs.update(getattr(settings, 'PROM_QUERY_CACHE', None) or {})
+    return configs
+
+
+class _RangeEntry:
+    """
+    一个范围查询（查询服务、PromQL、步长）已缓存的时间段[start, end]的数据点
+    """
+    def __init__(self, start: int, end: int):
+        self.start = start
+        self.end = end
+        self.final_end = start - 1      # 此时间之前（包含）的数据点不会再变化
+        self.fetched_at = 0.0
+        self.series = {}                # {labels_key: (metric, {ts: value})}
+
+    def count_points(self) -> int:
+        return sum(len(values) for metric, values in self.series.values())
+
+
+class PromQueryCache:
+    """
+    Prometheus/Thanos查询结果缓存，进程内所有线程共享
+
+    * 即时查询按(查询服务，查询参数)缓存instant_ttl时间
+    * 范围查询按(查询服务，查询参数，步长)缓存，开始和结束时间按步长向下对齐，相同时间窗口的请求是相同的查询
+    * 范围查询已完成的历史数据点缓存history_ttl时间，最新的live_delay时间内的数据点只缓存live_ttl时间，
+      过期后只查询缓存之后的新数据点，与缓存的数据合并
+    * 有界LRU，按缓存的查询数(max_size)和所有查询缓存的数据点总数(max_points)淘汰，查询失败不缓存；
+      每个进程一个缓存，内存占用约为 max_points * 120字节
+    * 返回的结果是缓存数据的副本，可以修改
+    """
+    MAX_POINTS = 11000      # 一个范围查询缓存的最多数据点数，和Prometheus单次查询的限制相同
+
+    def __init__(self, max_size: int = None, max_points: int = None, instant_ttl: float = None,
+                 live_ttl: float = None, history_ttl: float = None, live_delay: int = None):
+        configs = get_prom_cache_settings()
+        self.max_size = max(configs['max_size'] if max_size is None else max_size, 0)
+        self.max_points = max(configs['max_points'] if max_points is None else max_points, 0)
+        self.instant_ttl = configs['instant_ttl'] if instant_ttl is None else instant_ttl
+        self.live_ttl = configs['live_ttl'] if live_ttl is None else live_ttl
+        self.history_ttl = configs['history_ttl'] if history_ttl is None else history_ttl
+        self.live_delay = configs['live_delay'] if live_delay is None else live_delay
+        self._items = OrderedDict()     # {key: (expire, result or _RangeEntry, points)}
+        self._points = 0                # 缓存的数据点总数
+        self._lock = threading.Lock()
+        self.hit_count = 0
+        self.partial_hit_count = 0
+        self.miss_count = 0
+
+    @staticmethod
+    def build_key(kind: str, endpoint_url: str, params: dict) -> str:
+        return json.dumps([kind, endpoint_url.rstrip('/'), params], sort_keys=True, default=str)
+
+    @staticmethod
+    def align_window(start: int, end: int, step: int):
+        """
+        时间窗口按步长向下对齐
+
+        :return: (start, end)
+        """
+        start = int(start)
+        end = int(end)
+        start -= start % step
+        end -= end % step
+        return start, max(start, end)
+
+    def _get(self, key: str):
+        item = self._items.get(key)
+        if item is None:
+            return None
+
+        expire, value, points = item
+        if expire <= time.monotonic():
+            self._pop(key)
+            return None
+
+        self._items.move_to_end(key)
+        return value
+
+    def _pop(self, key: str):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self._points -= item[2]
+
+    def _set(self, key: str, value, ttl: float, points: int):
+        """
+        :param points: 缓存的数据点数
+        """
+        self._pop(key)
+        if self.max_size <= 0 or ttl <= 0 or points > self.max_points:
+            return
+
+        self._items[key] = (time.monotonic() + ttl, value, points)
+        self._points += points
+        while len(self._items) > self.max_size or self._points > self.max_points:
+            _, (_, _, evicted_points) = self._items.popitem(last=False)
+            self._points -= evicted_points
+
+    def get_instant(self, endpoint_url: str, params: dict):
+        """
+        :return: (key, True, result) or (key, False, None)
+        """
+        key = self.build_key('query', endpoint_url=endpoint_url, params=params)
+        with self._lock:
+            result = self._get(key)
+            if result is None:
+                self.miss_count += 1
+                return key, False, None
+
+            self.hit_count += 1
+
+        return key, True, copy.deepcopy(result)
+
+    def set_instant(self, key: str, result):
+        with self._lock:
+            points = len(result) if isinstance(result, list) else 1
+            self._set(key, copy.deepcopy(result), ttl=self.instant_ttl, points=points)
+
+    def query(self, endpoint_url: str, params: dict, fetch: Callable):
+        """
+        即时查询
+
+        :param params: 查询参数，缓存键的一部分
+        :param fetch: 查询函数，fetch() -> result
+        :raises: 查询函数抛出的错误
+        """
+        key, ok, result = self.get_instant(endpoint_url=endpoint_url, params=params)
+        if ok:
+            return result
+
+        result = fetch()
+        self.set_instant(key, result)
+        return result
+
+    async def async_query(self, endpoint_url: str, params: dict, fetch: Callable):
+        """
+        即时查询，fetch是协程函数
+        """
+        key, ok, result = self.get_instant(endpoint_url=endpoint_url, params=params)
+        if ok:
+            return result
+
+        result = await fetch()
+        self.set_instant(key, result)
+        return result
+
+    def query_range(self, endpoint_url: str, params: dict, start: int, end: int, step: int, fetch: Callable):
+        """
+        范围查询
+
+        :param params: 除开始和结束时间外的查询参数，缓存键的一部分
+        :param fetch: 查询函数，fetch(start, end) -> [{'metric': {}, 'values': [[ts, value], ]}, ]
+        :raises: 查询函数抛出的错误
+        """
+        step = int(step)
+        if step <= 0:
+            return fetch(start, end)
+
+        start, end = self.align_window(start=start, end=end, step=step)
+        key = self.build_key('query_range', endpoint_url=endpoint_url, params={**params, 'step': step})
+        now = time.time()
+        with self._lock:
+            entry = self._get(key)
+            fetch_start = self._get_fetch_start(entry=entry, start=start, end=end, step=step)
+            if fetch_start is None:
+                self.hit_count += 1
+                return self._build_result(entry=entry, start=start, end=end)
+            elif fetch_start > start:
+                self.partial_hit_count += 1
+            else:
+                self.miss_count += 1
+
+        result = fetch(fetch_start, end)
+        with self._lock:
+            entry = self._merge(key=key, result=result, start=fetch_start, end=end, step=step, now=now)
+            return self._build_result(entry=entry, start=start, end=end)
+
+    def _get_fetch_start(self, entry: _RangeEntry, start: int, end: int, step: int):
+        """
+        需要查询的开始时间
+
+        :return: None(缓存命中，不需要查询)
+        """
+        if entry is None or start < entry.start or start > entry.end + step:
+            return start
+
+        if end <= entry.final_end:
+            return None
+
+        if end <= entry.end and time.time() - entry.fetched_at < self.live_ttl:
+            return None
+
+        # 从已完成的数据点之后查询，包括请求开始时间之前缓存的未完成数据点，合并后它们也会成为已完成的数据点
+        return entry.final_end + step
+
+    def _merge(self, key: str, result: list, start: int, end: int, step: int, now: float) -> _RangeEntry:
+        """
+        查询时间段[start, end]的结果合并到缓存的数据
+        """
+        entry = self._get(key)
+        if entry is None or start < entry.start or start > entry.end + step:
+            entry = _RangeEntry(start=start, end=end)
+        else:
+            for metric, values in entry.series.values():
+                for ts in [ts for ts in values if ts >= start]:
+                    values.pop(ts)
+
+            entry.end = end
+
+        for item in result:
+            metric = item.get('metric', {})
+            labels_key = json.dumps(metric, sort_keys=True)
+            s = entry.series.get(labels_key)
+            if s is None:
+                s = entry.series[labels_key] = (metric, {})
+
+            for ts, value in item.get('values', []):
+                s[1][ts] = value
+
+        # 限制缓存的数据点数
+        min_ts = end - self.MAX_POINTS * step
+        if entry.start < min_ts:
+            entry.start = min_ts - min_ts % step
+            for metric, values in entry.series.values():
+                for ts in [ts for ts in values if ts < entry.start]:
+                    values.pop(ts)
+
+        entry.series = {k: v for k, v in entry.series.items() if v[1]}
+        final_ts = int(now) - self.live_delay
+        entry.final_end = min(end, final_ts - final_ts % step)
+        entry.fetched_at = time.time()
+        self._set(key, entry, ttl=self.history_ttl, points=entry.count_points())
+        return entry
+
+    @staticmethod
+    def _build_result(entry: _RangeEntry, start: int, end: int) -> list:
+        ret = []
+        for metric, values in entry.series.values():
+            vals = [[ts, v] for ts, v in sorted(values.items()) if start <= ts <= end]
+            if vals:
+                ret.append({'metric': dict(metric), 'values': vals})
+
+        return ret
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._points = 0
+
+    def stats(self) -> dict:
+        return {
+            'hit': self.hit_count,
+            'partial_hit': self.partial_hit_count,
+            'miss': self.miss_count,
+            'size': len(self._items),
+            'points': self._points
+        }
+
+
+prom_query_cache = PromQueryCache()
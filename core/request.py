@@ -40,7 +40,7 @@ def request_service(service, method: str, raise_exception=True, **kwargs):
                 return r
         except apt_exceptions.AuthenticationFailed:
             try:
-                auth_obj = auth_handler.get_auth(service, refresh=True)
+                auth_obj = auth_handler.get_auth(service, refresh=True, stale_auth=auth_obj)
             except apt_exceptions.AuthenticationFailed as exc:
                 raise_exc = exceptions.APIException(message='adapter authentication failed', extend_msg=exc.message)
                 break
@@ -115,7 +115,7 @@ def request_vpn_service(service, method: str, raise_exception=True, **kwargs):
                 return r
         except apt_exceptions.AuthenticationFailed:
             try:
-                auth_obj = auth_handler.get_vpn_auth(service, refresh=True)
+                auth_obj = auth_handler.get_vpn_auth(service, refresh=True, stale_auth=auth_obj)
             except apt_exceptions.AuthenticationFailed as exc:
                 raise_exc = exceptions.APIException(message='vpn adapter authentication failed', extend_msg=exc.message)
                 break
@@ -357,7 +357,7 @@ def disk_build_status(disk):
         "error"         # 查询状态失败
     """
     try:
-        out_disk, _ = adapter_detail_disk(disk)
+        out_disk = adapter_detail_disk(disk)
     except Exception as e:
         return "error"
 
@@ -1,11 +1,14 @@
+import logging
 import functools
-from typing import Union
-from concurrent.futures import ThreadPoolExecutor, Future
+from queue import Full
+from concurrent.futures import Future
 
 from django.db import connections
 
+from .queues import task_queues, Priority, QueueName
 
-_thread_pool_executor = ThreadPoolExecutor()
+
+logger = logging.getLogger(__name__)
 
 
 def before_close_old_connections(func):
@@ -19,9 +22,35 @@ def wrapper(*args, **kwargs):
     return wrapper
 
 
-def submit_task(task, kwargs: dict = None) -> Union[Future, None]:
+def submit_task(
+        task, kwargs: dict = None, queue: str = QueueName.DEFAULT, priority: int = Priority.NORMAL,
+        run_on_reject: bool = True
+) -> Future:
+    """
+    提交异步任务到指定的任务队列
+
+    :param queue: 队列名称，QueueName
+    :param priority: 优先级，Priority，值越小越优先
+    :param run_on_reject: 队列已满拒绝任务时，True(在当前线程同步执行任务)；False(抛出queue.Full)
+    :return:
+        Future()    # 同步执行时是已完成的Future
+    :raises: queue.Full     # run_on_reject=False时，队列已满
+    """
     task = before_close_old_connections(task)
     try:
-        return _thread_pool_executor.submit(task, **kwargs)
-    except Exception as e:
-        return None
+        return task_queues.get_queue(queue).submit(task, kwargs=kwargs, priority=priority)
+    except Full:
+        if not run_on_reject:
+            logger.error(f'Task queue "{queue}" is full, task {getattr(task, "__name__", task)} rejected')
+            raise
+
+        logger.error(f'Task queue "{queue}" is full, task {getattr(task, "__name__", task)} run synchronously')
+
+    future = Future()
+    future.set_running_or_notify_cancel()
+    try:
+        future.set_result(task(**(kwargs or {})))
+    except Exception as exc:
+        future.set_exception(exc)
+
+    return future
@@ -0,0 +1,282 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, List, Tuple
+
+from django.db import connections
+
+from core import request
+from apps.app_servers.models import Server, Disk
+
+
+def close_old_connections(func, *args):
+    for conn in connections.all(initialized_only=True):
+        conn.close_if_unusable_or_obsolete()
+
+    return func(*args)
+
+
+class BuildItem:
+    """
+    一个轮询创建状态的云主机或云硬盘
+    """
+    KIND_SERVER = 'server'
+    KIND_DISK = 'disk'
+
+    STAGE_BUILDING = 'building'    # 查询创建状态
+    STAGE_DETAIL = 'detail'        # 创建完成，更新详细信息
+
+    def __init__(self, kind: str, obj, future: Future, delay: float):
+        self.kind = kind
+        self.obj = obj
+        self.future = future
+        self.stage = self.STAGE_BUILDING
+        self.delay = delay
+        self.next_time = time.monotonic()
+        self.failed_count = 0   # 连续查询到创建失败的次数
+        self.error_count = 0    # 查询状态出错的次数
+        self.detail_error_count = 0     # 更新详细信息出错的次数
+
+    @property
+    def service_id(self):
+        return self.obj.service_id
+
+    def schedule(self, delay: float = None, backoff: bool = False, max_delay: float = None):
+        """
+        :param delay: 指定下次查询的等待时间，默认当前等待时间
+        :param backoff: True(等待时间指数增加)
+        """
+        if delay is not None:
+            self.delay = delay
+        elif backoff:
+            self.delay = min(self.delay * 2, max_delay) if max_delay else self.delay * 2
+
+        self.next_time = time.monotonic() + self.delay
+
+
+class BuildStatusPoller:
+    """
+    异步轮询云主机和云硬盘的创建状态，创建完成后更新详细信息和创建状态
+
+    * 一个后台线程运行事件循环，所有资源的轮询在其中调度，不再每个资源占用一个线程
+    * 到期的资源按服务单元分组并发查询，每个服务单元的并发请求数受限，
+      适配器请求是同步的，在有限线程数的线程池中执行
+    * 查询间隔指数退避，创建失败的资源批量更新创建状态
+    """
+
+    FAILED_LIMIT = 3    # 连续查询到创建失败的次数达到后，标记创建失败
+    ERROR_LIMIT = 10    # 查询状态出错次数超过后，不再等待，直接尝试更新详细信息
+    DETAIL_ERROR_LIMIT = 3  # 更新详细信息出错次数超过后放弃
+
+    def __init__(self, per_service_limit: int = 4, max_workers: int = 8,
+                 min_delay: float = 1, max_delay: float = 30):
+        """
+        :param per_service_limit: 每个服务单元的最大并发请求数
+        :param max_workers: 执行适配器请求的线程数
+        :param min_delay: 初始查询间隔，秒
+        :param max_delay: 最大查询间隔，秒
+        """
+        self.per_service_limit = per_service_limit
+        self.max_workers = max_workers
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self._items: List[BuildItem] = []
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wakeup = None
+        self._executor = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def add_server(self, server: Server) -> Future:
+        return self._add(BuildItem.KIND_SERVER, server)
+
+    def add_disk(self, disk: Disk) -> Future:
+        return self._add(BuildItem.KIND_DISK, disk)
+
+    def pending_count(self) -> int:
+        return len(self._items)
+
+    def _add(self, kind: str, obj) -> Future:
+        future = Future()
+        item = BuildItem(kind=kind, obj=obj, future=future, delay=self.min_delay)
+        with self._lock:
+            self._start()
+            self._loop.call_soon_threadsafe(self._add_item, item)
+
+        return future
+
+    def _add_item(self, item: BuildItem):
+        self._items.append(item)
+        self._wakeup.set()
+
+    def _start(self):
+        if self._loop is not None:
+            return
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='build_status')
+        self._loop = asyncio.new_event_loop()
+        self._wakeup = asyncio.Event()
+        started = threading.Event()
+
+        def run_loop():
+            asyncio.set_event_loop(self._loop)
+            self._loop.call_soon(started.set)
+            self._loop.run_until_complete(self._run())
+
+        threading.Thread(target=run_loop, name='build_status_poller', daemon=True).start()
+        started.wait()
+
+    async def _run(self):
+        while True:
+            if not self._items:
+                await self._wakeup.wait()
+
+            self._wakeup.clear()
+            now = time.monotonic()
+            due_items = [i for i in self._items if i.next_time <= now]
+            if not due_items:
+                wait_seconds = min(i.next_time for i in self._items) - now
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+                continue
+
+            await self.poll_items(due_items)
+
+    async def poll_items(self, items: List[BuildItem]):
+        """
+        并发查询一批到期的资源，完成的资源移出轮询，创建失败的资源批量更新状态
+        """
+        results = await asyncio.gather(*[self._poll_item(item) for item in items], return_exceptions=True)
+        failed_items = []
+        done_items = []
+        for item, result in zip(items, results):
+            if isinstance(result, BaseException):
+                result = 'error'
+
+            state = self.handle_result(item=item, result=result)
+            if state == 'failed':
+                failed_items.append(item)
+            elif state == 'done':
+                done_items.append(item)
+
+        if failed_items:
+            try:
+                await self._run_sync(self.bulk_mark_failed, failed_items)
+            except Exception as exc:
+                pass
+
+        for item in failed_items + done_items:
+            self._items.remove(item)
+            item.future.set_result(item.obj)
+
+    def handle_result(self, item: BuildItem, result) -> str:
+        """
+        :param result: 查询状态时"created"、"failed"、"building"、"error"；更新详细信息时True、False
+        :return:
+            'polling'   # 继续轮询
+            'failed'    # 创建失败
+            'done'      # 完成或放弃
+        """
+        if item.stage == BuildItem.STAGE_DETAIL:
+            if result is True:
+                return 'done'
+
+            item.detail_error_count += 1
+            if item.detail_error_count > self.DETAIL_ERROR_LIMIT:
+                return 'done'
+
+            item.schedule(delay=self.min_delay)
+            return 'polling'
+
+        if result == 'created':
+            item.stage = BuildItem.STAGE_DETAIL
+            item.schedule(delay=0)
+            return 'polling'
+        elif result == 'failed':
+            item.failed_count += 1
+            if item.failed_count >= self.FAILED_LIMIT:
+                return 'failed'
+
+            item.schedule(delay=self.min_delay)
+            return 'polling'
+        elif result == 'error':
+            item.error_count += 1
+            if item.error_count > self.ERROR_LIMIT:  # 多次查询失败，放弃等待
+                item.stage = BuildItem.STAGE_DETAIL
+                item.schedule(delay=0)
+                return 'polling'
+        else:
+            item.failed_count = 0
+
+        item.schedule(backoff=True, max_delay=self.max_delay)
+        return 'polling'
+
+    async def _poll_item(self, item: BuildItem):
+        semaphore = self._semaphores.get(item.service_id)
+        if semaphore is None:
+            semaphore = self._semaphores[item.service_id] = asyncio.Semaphore(self.per_service_limit)
+
+        async with semaphore:
+            if item.stage == BuildItem.STAGE_DETAIL:
+                return await self._run_sync(self.update_detail, item)
+
+            return await self._run_sync(self.build_status, item)
+
+    async def _run_sync(self, func, *args):
+        return await self._loop.run_in_executor(self._executor, close_old_connections, func, *args)
+
+    @staticmethod
+    def build_status(item: BuildItem) -> str:
+        if item.kind == BuildItem.KIND_SERVER:
+            return request.server_build_status(item.obj)
+
+        return request.disk_build_status(item.obj)
+
+    @staticmethod
+    def update_detail(item: BuildItem) -> bool:
+        obj = item.obj
+        try:
+            if item.kind == BuildItem.KIND_SERVER:
+                obj = request.update_server_detail(obj, task_status=obj.TASK_CREATED_OK)
+            else:
+                obj = request.update_disk_detail(obj, task_status=obj.TaskStatus.OK.value)
+        except Exception as exc:
+            return False
+
+        return bool(obj)
+
+    @staticmethod
+    def bulk_mark_failed(items: List[BuildItem]):
+        """
+        仍在创建中的资源批量标记为创建失败
+        """
+        server_ids, disk_ids = BuildStatusPoller.split_ids(items)
+        if server_ids:
+            Server.objects.filter(id__in=server_ids, task_status=Server.TASK_IN_CREATING).update(
+                task_status=Server.TASK_CREATE_FAILED)
+
+        if disk_ids:
+            Disk.objects.filter(id__in=disk_ids, task_status=Disk.TaskStatus.CREATING.value).update(
+                task_status=Disk.TaskStatus.FAILED.value)
+
+        for item in items:
+            item.obj.refresh_from_db(fields=['task_status'])
+
+    @staticmethod
+    def split_ids(items: List[BuildItem]) -> Tuple[List[str], List[str]]:
+        server_ids = []
+        disk_ids = []
+        for item in items:
+            if item.kind == BuildItem.KIND_SERVER:
+                server_ids.append(item.obj.id)
+            else:
+                disk_ids.append(item.obj.id)
+
+        return server_ids, disk_ids
+
+
+build_status_poller = BuildStatusPoller()
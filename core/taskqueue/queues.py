@@ -0,0 +1,221 @@
+import os
+import time
+import bisect
+import threading
+import itertools
+from collections import deque
+from enum import IntEnum
+from queue import PriorityQueue, Full
+from concurrent.futures import Future
+from typing import Dict
+
+from django.conf import settings
+
+
+class Priority(IntEnum):
+    """
+    任务优先级，值越小越优先执行
+    """
+    HIGH = 0
+    NORMAL = 5
+    LOW = 9
+
+
+class QueueName:
+    DEFAULT = 'default'
+    DELIVERY = 'delivery'       # 订单资源交付及后续任务
+    NOTIFY = 'notify'           # 邮件通知
+    SCREENVIS = 'screenvis'     # 大屏数据同步
+    BACKGROUND = 'background'   # 其他后台维护任务
+
+
+DEFAULT_QUEUE_CONFIGS = {
+    QueueName.DEFAULT: {'max_workers': 8, 'max_depth': 1000},
+    QueueName.DELIVERY: {'max_workers': 8, 'max_depth': 1000},
+    QueueName.NOTIFY: {'max_workers': 4, 'max_depth': 5000},
+    QueueName.SCREENVIS: {'max_workers': 4, 'max_depth': 100},
+    QueueName.BACKGROUND: {'max_workers': 4, 'max_depth': 1000},
+}
+
+
+class TaskTimingStats:
+    """
+    任务耗时统计，直方图累计所有任务，分位数按最近的任务计算
+    """
+    BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+    def __init__(self, window: int = 1024):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.recent = deque(maxlen=window)
+        self.total = 0
+        self.sum = 0.0
+
+    def add(self, seconds: float):
+        self.counts[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        self.recent.append(seconds)
+        self.total += 1
+        self.sum += seconds
+
+    def percentile(self, p: float):
+        if not self.recent:
+            return None
+
+        values = sorted(self.recent)
+        index = min(int(len(values) * p / 100), len(values) - 1)
+        return values[index]
+
+    def to_dict(self) -> dict:
+        histogram = {f'le_{b}': c for b, c in zip(self.BUCKETS, self.counts)}
+        histogram['le_inf'] = self.counts[-1]
+        return {
+            'count': self.total,
+            'avg': self.sum / self.total if self.total else None,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'histogram': histogram
+        }
+
+
+class TaskQueue:
+    """
+    有界的优先级任务队列，固定数量的工作线程按优先级执行任务
+
+    * 队列满时，提交任务最多等待put_timeout秒（背压），仍满则拒绝，抛出queue.Full
+    * 统计任务等待时间、执行时间、执行中和排队的任务数
+    """
+
+    PUT_TIMEOUT = 5
+
+    def __init__(self, name: str, max_workers: int = 8, max_depth: int = 1000, put_timeout: float = PUT_TIMEOUT):
+        """
+        :param max_workers: 工作线程数
+        :param max_depth: 最多排队的任务数
+        :param put_timeout: 队列满时提交任务的最长等待时间，秒，<=0不等待
+        """
+        self.name = name
+        self.max_workers = max_workers
+        self.max_depth = max_depth
+        self.put_timeout = put_timeout
+        self._queue = PriorityQueue(maxsize=max_depth)
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._pid = None
+        self.in_flight = 0
+        self.submitted_count = 0
+        self.rejected_count = 0
+        self.failed_count = 0
+        self.wait_stats = TaskTimingStats()
+        self.run_stats = TaskTimingStats()
+
+    def submit(self, task, kwargs: dict = None, priority: int = Priority.NORMAL, timeout: float = None) -> Future:
+        """
+        :param timeout: 队列满时的最长等待时间，默认put_timeout
+        :raises: queue.Full
+        """
+        self._start_workers()
+        future = Future()
+        timeout = self.put_timeout if timeout is None else timeout
+        item = (int(priority), next(self._counter), time.monotonic(), task, kwargs or {}, future)
+        try:
+            if timeout > 0:
+                self._queue.put(item, block=True, timeout=timeout)
+            else:
+                self._queue.put(item, block=False)
+        except Full:
+            with self._lock:
+                self.rejected_count += 1
+            raise
+
+        with self._lock:
+            self.submitted_count += 1
+
+        return future
+
+    def _start_workers(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+
+        with self._lock:
+            if self._pid == pid:
+                return
+
+            self._pid = pid     # fork后的子进程中没有父进程的工作线程，重新启动
+            for i in range(self.max_workers):
+                threading.Thread(target=self._worker, name=f'taskqueue_{self.name}_{i}', daemon=True).start()
+
+    def _worker(self):
+        while True:
+            _, _, put_time, task, kwargs, future = self._queue.get()
+            start_time = time.monotonic()
+            with self._lock:
+                self.in_flight += 1
+                self.wait_stats.add(start_time - put_time)
+
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(task(**kwargs))
+                    except BaseException as exc:
+                        with self._lock:
+                            self.failed_count += 1
+                        future.set_exception(exc)
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+                    self.run_stats.add(time.monotonic() - start_time)
+
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'name': self.name,
+                'max_workers': self.max_workers,
+                'max_depth': self.max_depth,
+                'depth': self._queue.qsize(),
+                'in_flight': self.in_flight,
+                'submitted': self.submitted_count,
+                'rejected': self.rejected_count,
+                'failed': self.failed_count,
+                'wait_time': self.wait_stats.to_dict(),
+                'run_time': self.run_stats.to_dict()
+            }
+
+
+class TaskQueueManager:
+    """
+    命名任务队列，按settings.TASK_QUEUES配置，未配置的使用默认配置，例如：
+    {
+        'delivery': {'max_workers': 8, 'max_depth': 1000, 'put_timeout': 5}
+    }
+    """
+
+    def __init__(self):
+        self._queues: Dict[str, TaskQueue] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_queue_config(name: str) -> dict:
+        configs = dict(DEFAULT_QUEUE_CONFIGS.get(name, DEFAULT_QUEUE_CONFIGS[QueueName.DEFAULT]))
+        custom_configs = getattr(settings, 'TASK_QUEUES', None) or {}
+        configs.update(custom_configs.get(name, {}))
+        return configs
+
+    def get_queue(self, name: str = QueueName.DEFAULT) -> TaskQueue:
+        queue = self._queues.get(name)
+        if queue is not None:
+            return queue
+
+        with self._lock:
+            queue = self._queues.get(name)
+            if queue is None:
+                queue = self._queues[name] = TaskQueue(name=name, **self.get_queue_config(name))
+
+        return queue
+
+    def stats(self) -> list:
+        return [q.stats() for q in list(self._queues.values())]
+
+
+task_queues = TaskQueueManager()
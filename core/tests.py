@@ -0,0 +1,116 @@
+import os
+import stat
+import shutil
+import tempfile
+import threading
+from datetime import datetime
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+from django.test import SimpleTestCase
+
+from core.auth_cache import AuthTokenCache
+
+
+class AuthTokenCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.tmp_dir, 'auth')
+        self.auth_count = 0
+        self._lock = threading.Lock()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def authenticate(self):
+        with self._lock:
+            self.auth_count += 1
+            token = f'token-{self.auth_count}'
+
+        return SimpleNamespace(token=token, expire=datetime.utcnow().timestamp() + 3600, password='password')
+
+    @staticmethod
+    def dumps(auth):
+        return {'token': auth.token, 'expire': auth.expire}
+
+    @staticmethod
+    def loads(data):
+        return SimpleNamespace(token=data['token'], expire=data['expire'], password='password')
+
+    def get_auth(self, cache: AuthTokenCache, key: str, refresh: bool = False, stale_auth=None):
+        return cache.get_or_authenticate(
+            key=key, authenticate=self.authenticate, dumps=self.dumps, loads=self.loads,
+            refresh=refresh, stale_auth=stale_auth
+        )
+
+    def test_single_flight(self):
+        key = 'service_1_http://127.0.0.1/_admin'
+        cache = AuthTokenCache(namespace='test', file_dir=self.cache_dir)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            auths = list(executor.map(lambda _: self.get_auth(cache, key=key), range(16)))
+
+        self.assertEqual(self.auth_count, 1)
+        self.assertEqual(len({id(a) for a in auths}), 1)
+        metrics = cache.metrics()
+        self.assertEqual(metrics['auth_count'], 1)
+        self.assertEqual(metrics['hit_count'], 15)
+
+        # 多个线程同时刷新同一个失效认证信息，只认证一次
+        stale_auth = auths[0]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            auths = list(executor.map(
+                lambda _: self.get_auth(cache, key=key, refresh=True, stale_auth=stale_auth), range(8)))
+
+        self.assertEqual(self.auth_count, 2)
+        self.assertEqual(len({id(a) for a in auths}), 1)
+        self.assertIsNot(auths[0], stale_auth)
+
+        # 另一个进程的缓存，使用文件中共享的认证信息
+        cache2 = AuthTokenCache(namespace='test', file_dir=self.cache_dir)
+        auth = self.get_auth(cache2, key=key)
+        self.assertEqual(self.auth_count, 2)
+        self.assertEqual(auth.token, auths[0].token)
+        self.assertEqual(cache2.metrics()['file_hit_count'], 1)
+
+        # 服务地址或用户名不同是不同的key
+        self.get_auth(cache2, key='service_1_http://127.0.0.1/_other')
+        self.assertEqual(self.auth_count, 3)
+
+    def test_file_security(self):
+        key = '../service_1_http://127.0.0.1/_admin'
+        cache = AuthTokenCache(namespace='test', file_dir=self.cache_dir)
+        self.get_auth(cache, key=key)
+        self.assertEqual(stat.S_IMODE(os.lstat(self.cache_dir).st_mode), 0o700)
+        filenames = os.listdir(self.cache_dir)
+        self.assertEqual(len(filenames), 2)     # json和lock文件，文件名是key的哈希值
+        self.assertEqual(os.listdir(self.tmp_dir), ['auth'])
+        for name in filenames:
+            self.assertTrue(name.startswith('test_'))
+            self.assertNotIn('127.0.0.1', name)
+            self.assertEqual(stat.S_IMODE(os.stat(os.path.join(self.cache_dir, name)).st_mode), 0o600)
+
+        # 目录权限过宽时收紧
+        os.chmod(self.cache_dir, 0o777)
+        cache2 = AuthTokenCache(namespace='test', file_dir=self.cache_dir)
+        self.get_auth(cache2, key=key)
+        self.assertEqual(cache2.metrics()['file_hit_count'], 1)
+        self.assertEqual(stat.S_IMODE(os.lstat(self.cache_dir).st_mode), 0o700)
+
+        # 目录是符号链接时不使用文件共享
+        link_dir = os.path.join(self.tmp_dir, 'link')
+        os.symlink(self.cache_dir, link_dir)
+        cache3 = AuthTokenCache(namespace='test', file_dir=link_dir)
+        self.get_auth(cache3, key=key)
+        self.assertEqual(self.auth_count, 2)
+        self.assertEqual(cache3.metrics()['file_hit_count'], 0)
+
+        # 缓存文件是符号链接时不跟随
+        json_name = [n for n in filenames if n.endswith('.json')][0]
+        json_path = os.path.join(self.cache_dir, json_name)
+        target = os.path.join(self.tmp_dir, 'target.json')
+        os.rename(json_path, target)
+        os.symlink(target, json_path)
+        cache4 = AuthTokenCache(namespace='test', file_dir=self.cache_dir)
+        self.get_auth(cache4, key=key)
+        self.assertEqual(cache4.metrics()['file_hit_count'], 0)
+        self.assertEqual(self.auth_count, 3)
@@ -157,6 +157,41 @@
     }
 }
 
+# 服务认证token在多进程之间共享的缓存文件目录（当前用户所有的0700目录），None使用项目目录下var/adapter_auth
+ADAPTER_AUTH_CACHE_DIR = None
+
+# 服务单元适配器请求的http连接池，每个服务地址共享一个保持连接的会话
+ADAPTER_HTTP_POOL = {
+    'pool_maxsize': 16,     # 每个服务地址保持的最大连接数
+    'max_retries': 1,       # 连接错误重试次数
+    'backoff_factor': 0.3,
+    'timeout': (6, 60)      # 默认超时时间，(连接超时，读超时)，秒
+}
+
+# 监控查询（Prometheus/Thanos）异步http连接池，进程内每个服务地址共享一个保持连接的aiohttp会话
+ADAPTER_ASYNC_HTTP_POOL = {
+    'limit': 100,               # 每个服务地址的最大连接数
+    'ttl_dns_cache': 300,       # DNS解析缓存时间，秒
+    'keepalive_timeout': 30     # 空闲连接保持时间，秒
+}
+
+# 监控查询（Prometheus/Thanos）结果缓存，范围查询时间窗口按步长对齐，见core.prom_cache
+# 每个进程一个缓存，每个数据点约占120字节，默认配置每个进程最多约24MB（200000 * 120字节）
+PROM_QUERY_CACHE = {
+    'max_size': 2048,       # 最多缓存的查询数
+    'max_points': 200000,   # 所有查询最多缓存的数据点数，超过时按LRU淘汰
+    'instant_ttl': 15,      # 即时查询结果缓存时间，秒
+    'live_ttl': 15,         # 范围查询最新时间段缓存时间，秒
+    'history_ttl': 3600,    # 范围查询历史时间段缓存时间，秒
+    'live_delay': 60        # 距当前时间多久以内的数据点可能还会变化，秒
+}
+
+# 后台任务队列配置，未配置的队列使用默认值，见core.taskqueue.queues.DEFAULT_QUEUE_CONFIGS
+# 队列：default、delivery(资源交付)、notify(邮件通知)、screenvis(大屏数据同步)、background(后台维护)
+TASK_QUEUES = {
+    # 'delivery': {'max_workers': 8, 'max_depth': 1000, 'put_timeout': 0},
+}
+
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 # 在文件security.py中配置
@@ -442,6 +477,8 @@
      'python3 /home/uwsgi/zhongkun/apps/app_net_flow/scripts/netflow_update_element.py >> /var/log/zhongkun/netflow_update_element.log'),
     ('task14_failed_vo_perm_to_evcloud', '*/2 * * * *',
      'python3 /home/uwsgi/zhongkun/scripts/run_failed_vo_perm_to_evcloud.py >> /var/log/zhongkun/failed_vo_perm_to_evcloud.log'),
+    ('task15_email_outbox', '*/5 * * * *',
+     'python3 /home/uwsgi/zhongkun/scripts/run_email_outbox.py >> /var/log/zhongkun/task_email_outbox.log'),
 ]
 
 
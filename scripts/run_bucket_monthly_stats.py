@@ -34,7 +34,7 @@ def run_task_use_lock():
             or (nt - bucket_monthly_lock.start_time) >= timedelta(hours=24)    # 定时周期
         ):
             bucket_monthly_lock.mark_start_task()  # 更新任务执行信息
-            StorageSizeCounter().run()
+            StorageSizeCounter(refresh_stats=True).run()
     except Exception as exc:
         run_desc = str(exc)
     finally:
@@ -0,0 +1,24 @@
+"""
+发件箱发送待发送和待重试的邮件
+"""
+
+import os
+import sys
+from pathlib import Path
+
+from django import setup
+
+
+# 将项目路径添加到系统搜寻路径当中，查找方式为从当前脚本开始，找到要调用的django项目的路径
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_site.settings')
+setup()
+
+
+from core.loggers import config_script_logger
+from apps.app_users.email_outbox import EmailOutbox
+
+
+if __name__ == "__main__":
+    logger = config_script_logger(name='script-email-outbox-logger', filename='email_outbox.log', stdout=True)
+    EmailOutbox(logger=logger).drain()
@@ -25,7 +25,7 @@ def run_task():
     except Exception as exc:
         pass
 
-    mrg = MonthlyReportGenerator(log_stdout=True)
+    mrg = MonthlyReportGenerator(log_stdout=True, batch=True)
     ok = mrg.run()
     if ok:
         MonthlyReportNotifier(report_data=mrg.report_period_date, log_stdout=True).run()
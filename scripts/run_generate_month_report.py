@@ -17,4 +17,4 @@
 from apps.app_report.workers.report_generator import MonthlyReportGenerator
 
 if __name__ == "__main__":
-    MonthlyReportGenerator(log_stdout=True).run()
+    MonthlyReportGenerator(log_stdout=True, batch=True).run()
@@ -0,0 +1,37 @@
+"""
+主机单元网络流量降采样数据回填，汇总降采样之前已存在的原始数据，升级后执行一次
+
+python3 scripts/run_netflow_rollup_backfill.py [days]
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+
+from django import setup
+
+
+# 将项目路径添加到系统搜寻路径当中，查找方式为从当前脚本开始，找到要调用的django项目的路径
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_site.settings')
+setup()
+
+from apps.app_screenvis.managers.netflow import HostNetflowManager
+
+
+def run_backfill(days: int = None):
+    """
+    :param days: 只回填最近n天的原始数据，None(所有)
+    """
+    start_ts = None
+    if days:
+        start_ts = int(time.time()) - days * 24 * 3600
+
+    print(f'Start backfill host netflow rollup, days: {days}')
+    ret = HostNetflowManager.backfill(start_ts=start_ts)
+    print(f'End backfill host netflow rollup, records: {ret}')
+
+
+if __name__ == "__main__":
+    run_backfill(days=int(sys.argv[1]) if len(sys.argv) > 1 else None)
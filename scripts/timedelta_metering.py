@@ -24,48 +24,50 @@
 
 
 def server_metering_pay(app_id: str, metering_date: date):
-    from apps.app_metering.measurers import ServerMeasurer
+    from apps.app_metering.measurers import ServerMeasurer, ShardedMeasurer
     from apps.app_metering.pay_metering import PayMeteringServer
     from apps.app_metering.statement_generators import GenerateDailyStatementServer
 
     print(f'Metring Server {metering_date}')
 
     try:
-        ServerMeasurer(metering_date=metering_date).run(raise_exception=True)
+        ShardedMeasurer(measurer_class=ServerMeasurer, metering_date=metering_date, raise_exception=True).run()
         GenerateDailyStatementServer(statement_date=metering_date).run(raise_exception=True)
-        PayMeteringServer(app_id=app_id, pay_date=metering_date).run()
+        PayMeteringServer(app_id=app_id, pay_date=metering_date, batch=True).run()
         print(f'OK, {metering_date}')
     except Exception as e:
         print(f'FAILED, {metering_date}, {str(e)}')
 
 
 def disk_metering_pay(app_id: str, metering_date: date):
-    from apps.app_metering.measurers import DiskMeasurer
+    from apps.app_metering.measurers import DiskMeasurer, ShardedMeasurer
     from apps.app_metering.pay_metering import PayMeteringDisk
     from apps.app_metering.statement_generators import DiskDailyStatementGenerater
 
     print(f'Metring Disk {metering_date}')
 
     try:
-        DiskMeasurer(metering_date=metering_date).run(raise_exception=True)
+        ShardedMeasurer(measurer_class=DiskMeasurer, metering_date=metering_date, raise_exception=True).run()
         DiskDailyStatementGenerater(statement_date=metering_date).run(raise_exception=True)
-        PayMeteringDisk(app_id=app_id, pay_date=metering_date).run()
+        PayMeteringDisk(app_id=app_id, pay_date=metering_date, batch=True).run()
         print(f'OK, {metering_date}')
     except Exception as e:
         print(f'FAILED, {metering_date}, {str(e)}')
 
 
 def storage_metering_pay(app_id: str, metering_date: date):
-    from apps.app_metering.measurers import StorageMeasurer
+    from apps.app_metering.measurers import StorageMeasurer, ShardedMeasurer
     from apps.app_metering.pay_metering import PayMeteringObjectStorage
     from apps.app_metering.statement_generators import GenerateDailyStatementObjectStorage
 
     # 对象存储只计量前天的
     print(f'Metering Storage [{metering_date}]')
     try:
-        StorageMeasurer(metering_date=metering_date).run()
+        ShardedMeasurer(
+            measurer_class=StorageMeasurer, metering_date=metering_date, measurer_kwargs={'async_stats': True}
+        ).run()
         GenerateDailyStatementObjectStorage(statement_date=metering_date).run()
-        PayMeteringObjectStorage(app_id=app_id, pay_date=metering_date).run()
+        PayMeteringObjectStorage(app_id=app_id, pay_date=metering_date, batch=True).run()
         print(f'OK, {metering_date}')
     except Exception as e:
         print(f'FAILED, {metering_date}, {str(e)}')
@@ -80,7 +82,7 @@ def website_monitor_metering_pay(app_id: str, metering_date: date):
     try:
         MonitorWebsiteMeasurer(metering_date=metering_date).run()
         WebsiteMonitorStatementGenerater(statement_date=metering_date).run()
-        PayMeteringWebsite(app_id=app_id, pay_date=metering_date).run()
+        PayMeteringWebsite(app_id=app_id, pay_date=metering_date, batch=True).run()
         print(f'OK, {metering_date}')
     except Exception as e:
         print(f'FAILED, {metering_date}, {str(e)}')
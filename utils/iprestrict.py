@@ -1,21 +1,32 @@
+import uuid
+import bisect
 import ipaddress
 from collections import namedtuple
-from typing import List, Union
+from typing import List, Union, Tuple, Callable
 
 from django.conf import settings
+from django.core.cache import cache as dj_cache
 from django.utils.translation import gettext as _
 
 from core import errors
 
 
 IPRange = namedtuple('IPRange', ['start', 'end'])
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
 
 
-def convert_iprange(ip_str: str) -> Union[ipaddress.IPv4Network, IPRange]:
+def convert_iprange(ip_str: str) -> Union[IPNetwork, IPRange]:
+    """
+    解析IP白名单规则，支持IPv4和IPv6
+
+        子网：'10.0.0.0/24'、'2001:db8::/64'
+        网段：'10.0.0.1-10.0.1.100'
+        单个IP：'10.0.0.1'
+    """
     if '/' in ip_str:
         try:
-            return ipaddress.IPv4Network(ip_str, strict=False)
-        except (ipaddress.AddressValueError, ipaddress.NetmaskValueError):
+            return ipaddress.ip_network(ip_str.strip(' '), strict=False)
+        except ValueError:
             raise Exception(_('无效的IP子网'))
     elif '-' in ip_str:
         items = ip_str.split('-')
@@ -25,23 +36,121 @@ def convert_iprange(ip_str: str) -> Union[ipaddress.IPv4Network, IPRange]:
         start = items[0].strip(' ')
         end = items[1].strip(' ')
         try:
-            start = ipaddress.IPv4Address(start)
-            end = ipaddress.IPv4Address(end)
-            if end >= start:
-                return IPRange(start=start, end=end)
-
-            raise Exception(_('无效的IP网段，地址无效'))
-        except (ipaddress.AddressValueError, ipaddress.NetmaskValueError):
+            start = ipaddress.ip_address(start)
+            end = ipaddress.ip_address(end)
+        except ValueError:
             raise Exception(_('无效的IP网段，地址无效'))
+
+        if start.version == end.version and end >= start:
+            return IPRange(start=start, end=end)
+
+        raise Exception(_('无效的IP网段，地址无效'))
     else:
         try:
-            start = ipaddress.IPv4Address(ip_str)
+            start = ipaddress.ip_address(ip_str.strip(' '))
             return IPRange(start=start, end=start)
-        except (ipaddress.AddressValueError, ipaddress.NetmaskValueError):
+        except ValueError:
             raise Exception(_('无效的IP地址'))
 
 
-def load_allowed_ips(setting_key: str) -> List[Union[ipaddress.IPv4Network, IPRange]]:
+class IPRangeMatcher:
+    """
+    编译的IP白名单匹配器
+
+    规则合并为IPv4、IPv6各自有序不重叠的整数区间，二分查找判断IP是否在白名单中
+    """
+
+    def __init__(self, ip_rules: List[Union[IPNetwork, IPRange]]):
+        intervals = {4: [], 6: []}
+        for rule in ip_rules:
+            if isinstance(rule, IPRange):
+                intervals[rule.start.version].append((int(rule.start), int(rule.end)))
+            else:
+                intervals[rule.version].append((int(rule.network_address), int(rule.broadcast_address)))
+
+        self._starts = {}
+        self._ends = {}
+        for version, items in intervals.items():
+            starts, ends = self.merge_intervals(items)
+            self._starts[version] = starts
+            self._ends[version] = ends
+
+    @staticmethod
+    def merge_intervals(intervals: List[Tuple[int, int]]) -> Tuple[List[int], List[int]]:
+        """
+        合并重叠和相邻的区间
+
+        :return: (starts, ends)
+        """
+        starts = []
+        ends = []
+        for start, end in sorted(intervals):
+            if ends and start <= ends[-1] + 1:
+                if end > ends[-1]:
+                    ends[-1] = end
+            else:
+                starts.append(start)
+                ends.append(end)
+
+        return starts, ends
+
+    def __len__(self):
+        return len(self._starts[4]) + len(self._starts[6])
+
+    def contains(self, ip: Union[ipaddress.IPv4Address, ipaddress.IPv6Address]) -> bool:
+        starts = self._starts[ip.version]
+        index = bisect.bisect_right(starts, int(ip)) - 1
+        return index >= 0 and int(ip) <= self._ends[ip.version][index]
+
+
+class IPMatcherCache:
+    """
+    进程内缓存编译的IP匹配器，版本戳变化时重新编译
+    """
+
+    def __init__(self):
+        self._matchers = {}
+
+    def get(self, key: str, version: str, load_rules: Callable[[], list]) -> IPRangeMatcher:
+        """
+        :param version: 规则的版本戳
+        :param load_rules: 版本变化时加载规则的函数
+        """
+        item = self._matchers.get(key)
+        if item is not None and item[0] == version:
+            return item[1]
+
+        matcher = IPRangeMatcher(load_rules())
+        self._matchers[key] = (version, matcher)
+        return matcher
+
+    def clear(self):
+        self._matchers = {}
+
+
+ip_matcher_cache = IPMatcherCache()
+
+
+def get_rules_version(cache_key: str, timeout: int = 60) -> str:
+    """
+    django缓存中的规则版本戳，不存在时生成新的
+
+    :param timeout: 与规则缓存时间一致，过期后重新加载规则
+    """
+    version = dj_cache.get(cache_key)
+    if version is None:
+        version = new_rules_version(cache_key=cache_key, timeout=timeout)
+
+    return version
+
+
+def new_rules_version(cache_key: str, timeout: int = 60) -> str:
+    version = uuid.uuid4().hex
+    dj_cache.set(cache_key, version, timeout=timeout)
+    return version
+
+
+def load_allowed_ips(setting_key: str) -> List[Union[IPNetwork, IPRange]]:
     ips = getattr(settings, setting_key, [])
     allowed_ips = []
     for ip_str in ips:
@@ -57,29 +166,57 @@ def load_allowed_ips(setting_key: str) -> List[Union[ipaddress.IPv4Network, IPRa
 
 
 class IPRestrictor:
+    """
+    IP白名单访问限制
+
+    子类设置了matcher_cache_key并实现get_rules_version()时，编译的匹配器在进程内缓存，规则版本变化时重新编译
+    """
+    matcher_cache_key = None
+
     def __init__(self):
         self._allowed_ip_rules = None
+        self._ip_matcher = None
 
-    def load_ip_rules(self) -> List[Union[ipaddress.IPv4Network, IPRange]]:
+    def load_ip_rules(self) -> List[Union[IPNetwork, IPRange]]:
         raise NotImplementedError('继承类IPRestrictor的子类没有实现类方法“load_ip_rules”')
 
+    def get_rules_version(self) -> Union[str, None]:
+        """
+        规则的版本戳，None不缓存匹配器
+        """
+        return None
+
     def reload_ip_rules(self):
         self._allowed_ip_rules = self.load_ip_rules()
+        self._ip_matcher = None
 
     @property
-    def allowed_ips(self) -> List[Union[ipaddress.IPv4Network, IPRange]]:
+    def allowed_ips(self) -> List[Union[IPNetwork, IPRange]]:
         if self._allowed_ip_rules is None:
             self._allowed_ip_rules = self.load_ip_rules()
 
         return self._allowed_ip_rules
 
     @allowed_ips.setter
-    def allowed_ips(self, ips: List[Union[ipaddress.IPv4Network, IPRange]]):
+    def allowed_ips(self, ips: List[Union[IPNetwork, IPRange]]):
         for i in ips:
-            if not isinstance(i, IPRange) and not isinstance(i, ipaddress.IPv4Network):
-                raise ValueError('IP列表数据项类型必须是“IPv4Network”或者“IPRange”')
+            if not isinstance(i, (IPRange, ipaddress.IPv4Network, ipaddress.IPv6Network)):
+                raise ValueError('IP列表数据项类型必须是“IPv4Network”、“IPv6Network”或者“IPRange”')
 
         self._allowed_ip_rules = ips
+        self._ip_matcher = IPRangeMatcher(ips)
+
+    @property
+    def ip_matcher(self) -> IPRangeMatcher:
+        if self._ip_matcher is None:
+            version = self.get_rules_version() if self.matcher_cache_key else None
+            if version is None:
+                self._ip_matcher = IPRangeMatcher(self.allowed_ips)
+            else:
+                self._ip_matcher = ip_matcher_cache.get(
+                    key=self.matcher_cache_key, version=version, load_rules=lambda: self.allowed_ips)
+
+        return self._ip_matcher
 
     def check_restricted(self, request):
         """
@@ -99,17 +236,12 @@ def is_restricted(self, client_ip: str):
         :raises: AccessDenied   # 拒绝访问
         """
         try:
-            client_ip = ipaddress.IPv4Address(client_ip)
-        except (ipaddress.AddressValueError, ipaddress.NetmaskValueError):
-            raise errors.AccessDenied(message=_('无法获取到有效的客户端IPv4地址。') + client_ip)
-
-        for ip_rule in self.allowed_ips:
-            if isinstance(ip_rule, IPRange):
-                if ip_rule.start <= client_ip <= ip_rule.end:
-                    return False
-            else:
-                if client_ip in ip_rule:
-                    return False
+            client_ip = ipaddress.ip_address(client_ip)
+        except ValueError:
+            raise errors.AccessDenied(message=_('无法获取到有效的客户端IP地址。') + client_ip)
+
+        if self.ip_matcher.contains(client_ip):
+            return False
 
         raise errors.AccessDenied(message=_("此API拒绝从IP地址'%s'访问") % (client_ip,))
 
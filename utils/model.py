@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, connections, router
 from django.contrib import admin
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
@@ -81,3 +81,54 @@ class DeriveTypeBase(models.TextChoices):
     OTHER = 'other', _('其他')
     TRIAL = 'trial', _('试用')
     STAFF = 'staff', _('内部员工')
+
+
+def bulk_upsert(model, objs: list, unique_fields: list, update_fields: list, batch_size: int = 500):
+    """
+    批量插入，唯一键冲突时更新
+
+    * 数据库支持冲突目标时（sqlite、postgresql），INSERT ... ON CONFLICT(unique_fields) DO UPDATE
+    * 只支持冲突更新时（mysql、tidb），INSERT ... ON DUPLICATE KEY UPDATE，不能指定unique_fields
+    * 都不支持时，先按唯一键查询已存在的记录，已存在的更新，其他的插入
+
+    :param unique_fields: 唯一键字段名，主键时用主键字段名
+    """
+    if not objs:
+        return
+
+    features = connections[router.db_for_write(model)].features
+    if features.supports_update_conflicts_with_target:
+        model.objects.bulk_create(
+            objs, batch_size=batch_size, update_conflicts=True, unique_fields=unique_fields,
+            update_fields=update_fields)
+    elif features.supports_update_conflicts:
+        model.objects.bulk_create(objs, batch_size=batch_size, update_conflicts=True, update_fields=update_fields)
+    else:
+        _select_and_upsert(
+            model=model, objs=objs, unique_fields=unique_fields, update_fields=update_fields, batch_size=batch_size)
+
+
+def _select_and_upsert(model, objs: list, unique_fields: list, update_fields: list, batch_size: int):
+    attnames = [model._meta.get_field(name).attname for name in unique_fields]
+    pk_attname = model._meta.pk.attname
+    for i in range(0, len(objs), batch_size):
+        batch = objs[i:i + batch_size]
+        lookups = {f'{name}__in': {getattr(obj, name) for obj in batch} for name in attnames}
+        existing = {
+            tuple(row[0:-1]): row[-1]
+            for row in model.objects.filter(**lookups).values_list(*attnames, pk_attname)
+        }
+        to_update = []
+        to_create = []
+        for obj in batch:
+            pk = existing.get(tuple(getattr(obj, name) for name in attnames))
+            if pk is None:
+                to_create.append(obj)
+            else:
+                setattr(obj, pk_attname, pk)
+                to_update.append(obj)
+
+        if to_update and update_fields:
+            model.objects.bulk_update(to_update, fields=update_fields)
+        if to_create:
+            model.objects.bulk_create(to_create)
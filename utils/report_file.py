@@ -1,8 +1,11 @@
 import io
 import csv
+import zlib
 import zipfile
+from typing import Iterable, Sequence
 from urllib.parse import quote as urlquote
 
+from django.db.models import Q
 from django.http import StreamingHttpResponse
 
 
@@ -73,3 +76,114 @@ def wrap_csv_file_response(filename: str, data):
     response['Content-Type'] = content_type
     response['Content-Disposition'] = f"attachment;filename*=utf-8''{filename}"  # 注意filename 这个是下载后的名字
     return response
+
+
+def iter_queryset_by_keyset(queryset, keys: Sequence[str] = ('-creation_time', '-id'), per_page: int = 1000):
+    """
+    按键集分页遍历查询集，每页按上一页最后一行的键值过滤，不使用OFFSET，每页查询代价不随页数增长
+
+    :param keys: 排序字段，最后一个字段须唯一，例如('-creation_time', '-id')
+    """
+    fields = [k.lstrip('-') for k in keys]
+    queryset = queryset.order_by(*keys)
+    cursor = None
+    while True:
+        qs = queryset
+        if cursor is not None:
+            qs = qs.filter(build_keyset_q(keys=keys, values=cursor))
+
+        objs = list(qs[0:per_page])
+        yield from objs
+
+        if len(objs) < per_page:
+            break
+
+        last = objs[-1]
+        cursor = [getattr(last, f) if not isinstance(last, dict) else last[f] for f in fields]
+
+
+def build_keyset_q(keys: Sequence[str], values: list) -> Q:
+    """
+    排序在游标值之后的行，例如keys=('-creation_time', '-id')时：
+        creation_time < v0 OR (creation_time = v0 AND id < v1)
+    """
+    q = Q()
+    equals = {}
+    for key, value in zip(keys, values):
+        field = key.lstrip('-')
+        lookup = 'lt' if key.startswith('-') else 'gt'
+        q |= Q(**equals, **{f'{field}__{lookup}': value})
+        equals[field] = value
+
+    return q
+
+
+class CSVStreamEncoder:
+    """
+    把CSV行编码为bytes块，可选gzip压缩
+    """
+
+    def __init__(self, gzip: bool = False, chunk_size: int = 64 * 1024):
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.chunk_size = chunk_size
+        self._compressor = zlib.compressobj(wbits=31) if gzip else None   # wbits=31: gzip格式
+
+    def write(self, row: list) -> bytes:
+        """
+        :return: 缓冲未满时返回b''
+        """
+        self.writer.writerow(row)
+        if self.buffer.tell() < self.chunk_size:
+            return b''
+
+        return self._take()
+
+    def flush(self) -> bytes:
+        data = self._take()
+        if self._compressor is not None:
+            data += self._compressor.flush()
+
+        return data
+
+    def _take(self) -> bytes:
+        data = self.buffer.getvalue().encode(encoding='utf-8')
+        self.buffer.seek(0)
+        self.buffer.truncate(0)
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+
+        return data
+
+    def iter_encode(self, rows: Iterable[list]):
+        for row in rows:
+            chunk = self.write(row)
+            if chunk:
+                yield chunk
+
+        chunk = self.flush()
+        if chunk:
+            yield chunk
+
+
+def wrap_csv_stream_response(filename: str, rows: Iterable[list], gzip: bool = False):
+    """
+    边生成边发送的CSV文件下载响应，内存占用不随行数增长
+
+    :param filename: 下载文件名，不含后缀
+    :param rows: CSV行的迭代器，在响应发送时才迭代
+    :param gzip: True(gzip压缩，文件名后缀.csv.gz)
+    """
+    encoder = CSVStreamEncoder(gzip=gzip)
+    if gzip:
+        filename = filename + '.csv.gz'
+        content_type = 'application/gzip'
+    else:
+        filename = filename + '.csv'
+        content_type = 'text/csv'
+
+    filename = urlquote(filename)  # 中文文件名需要
+    response = StreamingHttpResponse(encoder.iter_encode(rows), charset='utf-8', status=200)
+    response['Content-Type'] = content_type
+    response['Content-Disposition'] = f"attachment;filename*=utf-8''{filename}"
+    return response